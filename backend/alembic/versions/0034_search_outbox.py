@@ -0,0 +1,45 @@
+"""Add search_outbox table for transactional search-index updates
+
+Revision ID: 0034
+Revises: 0033
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0034'
+down_revision = '0033'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'search_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('index_name', sa.String(64), nullable=False),  # products, persons, invoices, payments
+        sa.Column('doc_id', sa.String(128), nullable=False),
+        sa.Column('op', sa.String(16), nullable=False, server_default='upsert'),  # upsert or delete
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_search_outbox_id', 'search_outbox', ['id'])
+    op.create_index('ix_search_outbox_sent_at', 'search_outbox', ['sent_at'])
+    # the relay only ever scans unsent rows in id order
+    op.create_index(
+        'ix_search_outbox_pending', 'search_outbox', ['id'],
+        postgresql_where=sa.text('sent_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_search_outbox_pending', table_name='search_outbox')
+    op.drop_index('ix_search_outbox_sent_at', table_name='search_outbox')
+    op.drop_index('ix_search_outbox_id', table_name='search_outbox')
+    op.drop_table('search_outbox')
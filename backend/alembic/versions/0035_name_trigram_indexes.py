@@ -0,0 +1,46 @@
+"""Add pg_trgm GIN indexes for substring search on products / persons
+
+Revision ID: 0035
+Revises: 0034
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0035'
+down_revision = '0034'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs searched by app/db_search.py
+TRGM_COLUMNS = [
+    ('products', 'name_norm'),
+    ('products', 'code'),
+    ('persons', 'name_norm'),
+    ('persons', 'code'),
+    ('persons', 'mobile'),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite gets FTS5 trigram tables at startup (db_search.ensure_sqlite_fts)
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # CONCURRENTLY keeps the catalogue writable while large tables are indexed
+    with op.get_context().autocommit_block():
+        for table, column in TRGM_COLUMNS:
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_{column}_trgm '
+                f'ON {table} USING gin ({column} gin_trgm_ops)'
+            )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        for table, column in TRGM_COLUMNS:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS ix_{table}_{column}_trgm')
@@ -0,0 +1,23 @@
+"""Index price_histories by (product_id, effective_at) for latest-price lookups
+
+Revision ID: 0036
+Revises: 0035
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0036'
+down_revision = '0035'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_price_histories_product_effective', 'price_histories', ['product_id', 'effective_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_price_histories_product_effective', table_name='price_histories')
@@ -0,0 +1,38 @@
+"""Index invoice_items for line-item search and per-invoice / per-product lookups
+
+Revision ID: 0037
+Revises: 0036
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0037'
+down_revision = '0036'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # lines are loaded per invoice batch when documents are built, and counted per product
+    op.create_index('ix_invoice_items_invoice_id', 'invoice_items', ['invoice_id'])
+    op.create_index('ix_invoice_items_product_id', 'invoice_items', ['product_id'])
+    if op.get_bind().dialect.name != 'postgresql':
+        # SQLite gets an FTS5 trigram table at startup (db_search.ensure_sqlite_fts)
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_invoice_items_description_trgm '
+            'ON invoice_items USING gin (description gin_trgm_ops)'
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_invoice_items_description_trgm')
+    op.drop_index('ix_invoice_items_product_id', table_name='invoice_items')
+    op.drop_index('ix_invoice_items_invoice_id', table_name='invoice_items')
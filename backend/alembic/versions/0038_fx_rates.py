@@ -0,0 +1,39 @@
+"""Add fx_rates table for the currency / crypto quote time series
+
+Revision ID: 0038
+Revises: 0037
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0038'
+down_revision = '0037'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'fx_rates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(16), nullable=False),  # fx or crypto
+        sa.Column('symbol', sa.String(32), nullable=False),
+        sa.Column('base', sa.String(16), nullable=False),
+        sa.Column('rate', sa.Float(), nullable=False),
+        sa.Column('source', sa.String(64), nullable=True),
+        sa.Column('fetched_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_fx_rates_id', 'fx_rates', ['id'])
+    # latest quote per symbol and history ranges
+    op.create_index('ix_fx_rates_kind_symbol_fetched', 'fx_rates', ['kind', 'symbol', 'fetched_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fx_rates_kind_symbol_fetched', table_name='fx_rates')
+    op.drop_index('ix_fx_rates_id', table_name='fx_rates')
+    op.drop_table('fx_rates')
@@ -0,0 +1,49 @@
+"""Add integration scheduler state and integration_runs
+
+Revision ID: 0039
+Revises: 0038
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0039'
+down_revision = '0038'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('integration_configs', sa.Column('next_run_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('integration_configs', sa.Column('failure_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('integration_configs', sa.Column('last_status', sa.String(64), nullable=True))
+    op.add_column('integration_configs', sa.Column('last_latency_ms', sa.Integer(), nullable=True))
+    op.create_index('ix_integration_configs_next_run_at', 'integration_configs', ['next_run_at'])
+    op.create_table(
+        'integration_runs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('integration_id', sa.Integer(), sa.ForeignKey('integration_configs.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('trigger', sa.String(16), nullable=False, server_default='schedule'),  # schedule or manual
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('latency_ms', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(64), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_integration_runs_id', 'integration_runs', ['id'])
+    op.create_index('ix_integration_runs_integration_started', 'integration_runs', ['integration_id', 'started_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_integration_runs_integration_started', table_name='integration_runs')
+    op.drop_index('ix_integration_runs_id', table_name='integration_runs')
+    op.drop_table('integration_runs')
+    op.drop_index('ix_integration_configs_next_run_at', table_name='integration_configs')
+    op.drop_column('integration_configs', 'last_latency_ms')
+    op.drop_column('integration_configs', 'last_status')
+    op.drop_column('integration_configs', 'failure_count')
+    op.drop_column('integration_configs', 'next_run_at')
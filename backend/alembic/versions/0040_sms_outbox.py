@@ -0,0 +1,50 @@
+"""Add sms_outbox
+
+Revision ID: 0040
+Revises: 0039
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0040'
+down_revision = '0039'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sms_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('to', sa.String(32), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('provider', sa.String(50), nullable=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('kind', sa.String(32), nullable=False, server_default='manual'),
+        sa.Column('priority', sa.Integer(), nullable=False, server_default='5'),
+        sa.Column('status', sa.String(16), nullable=False, server_default='queued'),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('claim', sa.String(32), nullable=True),
+        sa.Column('provider_message_id', sa.String(128), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('delivered_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_sms_outbox_id', 'sms_outbox', ['id'])
+    op.create_index('ix_sms_outbox_status_next', 'sms_outbox', ['status', 'next_attempt_at'])
+    op.create_index('ix_sms_outbox_provider_message_id', 'sms_outbox', ['provider_message_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sms_outbox_provider_message_id', table_name='sms_outbox')
+    op.drop_index('ix_sms_outbox_status_next', table_name='sms_outbox')
+    op.drop_index('ix_sms_outbox_id', table_name='sms_outbox')
+    op.drop_table('sms_outbox')
@@ -0,0 +1,58 @@
+"""Add sms_campaigns and sms_outbox.campaign_id
+
+Revision ID: 0041
+Revises: 0040
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0041'
+down_revision = '0040'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sms_campaigns',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(128), nullable=True),
+        sa.Column('group_id', sa.Integer(), sa.ForeignKey('customer_groups.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('created_by_user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='SET NULL'), nullable=True),
+        sa.Column('template', sa.Text(), nullable=False),
+        sa.Column('options', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(16), nullable=False, server_default='pending'),
+        sa.Column('members', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('recipients', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('queued', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('invalid', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('duplicates', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('filtered', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_sms_campaigns_id', 'sms_campaigns', ['id'])
+    op.create_index('ix_sms_campaigns_group_id', 'sms_campaigns', ['group_id'])
+    op.create_index('ix_sms_campaigns_created_by_user_id', 'sms_campaigns', ['created_by_user_id'])
+    with op.batch_alter_table('sms_outbox') as batch_op:
+        batch_op.add_column(sa.Column('campaign_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_sms_outbox_campaign_id', 'sms_campaigns', ['campaign_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_index('ix_sms_outbox_campaign_id', ['campaign_id'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('sms_outbox') as batch_op:
+        batch_op.drop_index('ix_sms_outbox_campaign_id')
+        batch_op.drop_constraint('fk_sms_outbox_campaign_id', type_='foreignkey')
+        batch_op.drop_column('campaign_id')
+    op.drop_index('ix_sms_campaigns_created_by_user_id', table_name='sms_campaigns')
+    op.drop_index('ix_sms_campaigns_group_id', table_name='sms_campaigns')
+    op.drop_index('ix_sms_campaigns_id', table_name='sms_campaigns')
+    op.drop_table('sms_campaigns')
@@ -0,0 +1,26 @@
+"""Add search_outbox.next_attempt_at for per-row retry backoff
+
+Revision ID: 0042
+Revises: 0041
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0042'
+down_revision = '0041'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('search_outbox') as batch_op:
+        batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('search_outbox') as batch_op:
+        batch_op.drop_column('next_attempt_at')
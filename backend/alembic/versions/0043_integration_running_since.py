@@ -0,0 +1,25 @@
+"""Add integration_configs.running_since (scheduler lease)
+
+Revision ID: 0043
+Revises: 0042
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0043'
+down_revision = '0042'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('integration_configs', sa.Column('running_since', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('integration_configs') as batch_op:
+        batch_op.drop_column('running_since')
@@ -0,0 +1,702 @@
+"""Async counterparts of the crud helpers used by the `async def` endpoints.
+
+Each function mirrors the sync version in `crud.py` (same name, same arguments,
+same return values) but takes an `AsyncSession` so the query is awaited instead
+of blocking the event loop. Relationships that the response schemas serialize
+(`Role.permissions`, `User.role_obj`, `CustomerGroup.members`) are loaded eagerly
+because lazy loads are not allowed on an AsyncSession.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import func
+
+from . import icc_tree, models, schemas
+from .cache import get_cache, set_cache
+from .crud import generate_api_key, hash_api_key
+from .shared_store import get_store
+from .security import encrypt_value, get_password_hash
+
+
+async def _first(session: AsyncSession, stmt):
+    result = await session.execute(stmt)
+    return result.scalars().first()
+
+
+async def _all(session: AsyncSession, stmt) -> list:
+    result = await session.execute(stmt)
+    return list(result.scalars().all())
+
+
+async def _delete(session: AsyncSession, obj) -> bool:
+    if not obj:
+        return False
+    await session.delete(obj)
+    await session.commit()
+    return True
+
+
+# ==================== Role & Permission CRUD ====================
+
+def _role_query():
+    return select(models.Role).options(selectinload(models.Role.permissions))
+
+
+async def get_role(session: AsyncSession, role_id: int) -> Optional[models.Role]:
+    """دریافت نقش بر اساس ID"""
+    return await _first(session, _role_query().where(models.Role.id == role_id))
+
+
+async def get_all_roles(session: AsyncSession) -> List[models.Role]:
+    """دریافت تمام نقش ها"""
+    return await _all(session, _role_query())
+
+
+async def create_role(session: AsyncSession, payload: schemas.RoleCreate) -> models.Role:
+    r = models.Role(name=payload.name, description=payload.description)
+    session.add(r)
+    await session.commit()
+    return await _first(session, _role_query().where(models.Role.id == r.id).execution_options(populate_existing=True))
+
+
+async def update_role(session: AsyncSession, role_id: int, payload: schemas.RoleCreate) -> Optional[models.Role]:
+    r = await get_role(session, role_id)
+    if not r:
+        return None
+    if payload.name:
+        r.name = payload.name
+    r.description = payload.description
+    await session.commit()
+    await _bump_role_version(role_id)
+    return r
+
+
+async def delete_role(session: AsyncSession, role_id: int) -> bool:
+    deleted = await _delete(session, await get_role(session, role_id))
+    await _bump_role_version(role_id)
+    return deleted
+
+
+async def set_role_permissions(session: AsyncSession, role_id: int, permission_ids: List[int]) -> Optional[int]:
+    r = await get_role(session, role_id)
+    if not r:
+        return None
+    perms = await _all(session, select(models.Permission).where(models.Permission.id.in_(permission_ids or [])))
+    r.permissions = perms
+    await session.commit()
+    await _bump_role_version(role_id)
+    return len(perms)
+
+
+# Per-role permission/module lists are cached in-process; the version counter lives in
+# the shared store so a change made on one worker invalidates every worker's copy.
+# The store is blocking (Redis socket / SQLite), so it is called off the event loop.
+ROLE_ACCESS_CACHE_TTL = 300
+
+
+def _read_role_version(role_id: int) -> int:
+    return int(get_store().get(f'role_version:{role_id}') or 0)
+
+
+async def _role_version(role_id: int) -> int:
+    try:
+        return await asyncio.to_thread(_read_role_version, role_id)
+    except Exception:
+        return -1
+
+
+async def _bump_role_version(role_id: int):
+    try:
+        await asyncio.to_thread(lambda: get_store().incr(f'role_version:{role_id}'))
+    except Exception:
+        pass
+
+
+async def get_role_access(session: AsyncSession, role_id: int) -> Optional[dict]:
+    """Return {'permissions': [...], 'modules': [...]} for a role, cached per role version."""
+    version = await _role_version(role_id)
+    key = f'role_access:{role_id}:{version}'
+    cached = get_cache(key) if version >= 0 else None
+    if cached is not None:
+        return cached
+    role = await get_role(session, role_id)
+    if not role:
+        return None
+    permissions = [
+        {'id': p.id, 'name': p.name, 'description': p.description, 'module': p.module}
+        for p in role.permissions
+    ]
+    modules = sorted(set(p['module'] for p in permissions if p['module']))
+    # If the role has any report-related permission, expose the dedicated 'reports' module
+    if 'reports' not in modules and any('report' in (p['name'] or '').lower() for p in permissions):
+        modules.append('reports')
+    access = {'permissions': permissions, 'modules': modules}
+    if version >= 0:
+        set_cache(key, access, ttl_seconds=ROLE_ACCESS_CACHE_TTL)
+    return access
+
+
+async def get_permissions_by_module(session: AsyncSession, module: str) -> List[models.Permission]:
+    """دریافت permissions یک ماژول"""
+    return await _all(session, select(models.Permission).where(models.Permission.module == module))
+
+
+async def get_all_permissions(session: AsyncSession) -> List[models.Permission]:
+    """دریافت تمام permissions"""
+    return await _all(session, select(models.Permission))
+
+
+async def create_permission(session: AsyncSession, payload: schemas.PermissionCreate) -> models.Permission:
+    existing = await _first(session, select(models.Permission).where(models.Permission.name == payload.name))
+    if existing:
+        return existing
+    p = models.Permission(name=payload.name, description=payload.description, module=payload.module)
+    session.add(p)
+    await session.commit()
+    await session.refresh(p)
+    return p
+
+
+# ==================== Users ====================
+
+def _user_query():
+    return select(models.User).options(
+        selectinload(models.User.role_obj).selectinload(models.Role.permissions)
+    )
+
+
+async def get_user(session: AsyncSession, user_id: int) -> Optional[models.User]:
+    return await _first(session, _user_query().where(models.User.id == user_id))
+
+
+async def _reload_user(session: AsyncSession, user_id: int) -> Optional[models.User]:
+    return await _first(session, _user_query().where(models.User.id == user_id).execution_options(populate_existing=True))
+
+
+async def get_user_by_username(session: AsyncSession, username: str) -> Optional[models.User]:
+    return await _first(session, _user_query().where(models.User.username == username))
+
+
+async def get_users(session: AsyncSession, limit: Optional[int] = None, after_id: Optional[int] = None) -> List[models.User]:
+    """Users ordered by id; `after_id` is the keyset cursor (id of the last row already seen)."""
+    stmt = _user_query().order_by(models.User.id)
+    if after_id is not None:
+        stmt = stmt.where(models.User.id > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return await _all(session, stmt)
+
+
+async def create_user(session: AsyncSession, user: schemas.UserCreate) -> models.User:
+    # PBKDF2 is CPU-bound; keep it off the event loop
+    hashed = await asyncio.to_thread(get_password_hash, user.password)
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name,
+        hashed_password=hashed,
+        role_id=user.role_id,
+        role='User',  # Legacy field
+        is_active=True
+    )
+    session.add(db_user)
+    await session.commit()
+    return await _reload_user(session, db_user.id)
+
+
+async def update_user(session: AsyncSession, user_id: int, update: schemas.UserUpdate) -> Optional[models.User]:
+    user = await get_user(session, user_id)
+    if not user:
+        return None
+    for key, value in update.dict(exclude_unset=True).items():
+        setattr(user, key, value)
+    await session.commit()
+    # role_id may have changed; reload the role graph for the response
+    return await _reload_user(session, user_id)
+
+
+async def delete_user(session: AsyncSession, user_id: int) -> bool:
+    return await _delete(session, await get_user(session, user_id))
+
+
+# ==================== User Preferences ====================
+
+async def get_user_preferences(session: AsyncSession, user_id: int) -> Optional[models.UserPreferences]:
+    """دریافت تنظیمات کاربر"""
+    return await _first(session, select(models.UserPreferences).where(models.UserPreferences.user_id == user_id))
+
+
+async def create_user_preferences(session: AsyncSession, user_id: int,
+                                  language: str = 'fa', currency: str = 'irr',
+                                  auto_convert: bool = False) -> models.UserPreferences:
+    """ایجاد تنظیمات کاربر جدید"""
+    prefs = models.UserPreferences(
+        user_id=user_id,
+        language=language,
+        currency=currency,
+        auto_convert_currency=auto_convert
+    )
+    session.add(prefs)
+    await session.commit()
+    await session.refresh(prefs)
+    return prefs
+
+
+async def update_user_preferences(session: AsyncSession, user_id: int,
+                                  update: schemas.UserPreferencesUpdate) -> Optional[models.UserPreferences]:
+    """به‌روزرسانی تنظیمات کاربر"""
+    prefs = await get_user_preferences(session, user_id)
+    if not prefs:
+        return None
+    if update.language is not None:
+        prefs.language = update.language
+    if update.currency is not None:
+        prefs.currency = update.currency
+    if update.auto_convert_currency is not None:
+        prefs.auto_convert_currency = update.auto_convert_currency
+    if update.theme_preference is not None:
+        prefs.theme_preference = update.theme_preference
+    await session.commit()
+    await session.refresh(prefs)
+    return prefs
+
+
+# ==================== Device Login ====================
+
+async def get_user_active_devices(session: AsyncSession, user_id: int) -> List[models.DeviceLogin]:
+    """دریافت دستگاه‌های فعال کاربر"""
+    return await _all(session, select(models.DeviceLogin).where(
+        models.DeviceLogin.user_id == user_id,
+        models.DeviceLogin.is_active == True
+    ))
+
+
+async def get_device_login(session: AsyncSession, device_id: int) -> Optional[models.DeviceLogin]:
+    """دریافت device login"""
+    return await _first(session, select(models.DeviceLogin).where(models.DeviceLogin.id == device_id))
+
+
+async def logout_device(session: AsyncSession, device_id: int) -> bool:
+    """خروج از دستگاه"""
+    device = await get_device_login(session, device_id)
+    if not device:
+        return False
+    device.is_active = False
+    device.logout_at = func.now()
+    await session.commit()
+    return True
+
+
+async def get_login_history(session: AsyncSession, user_id: int, limit: int = 20) -> List[models.DeviceLogin]:
+    return await _all(session, select(models.DeviceLogin).where(
+        models.DeviceLogin.user_id == user_id
+    ).order_by(models.DeviceLogin.login_at.desc()).limit(limit))
+
+
+# ==================== Developer API Keys ====================
+
+async def create_api_key(session: AsyncSession, user_id: int,
+                         payload: schemas.DeveloperApiKeyCreate) -> Tuple[models.DeveloperApiKey, str]:
+    """ایجاد کلید API جدید. برمی‌گرداند (model, plain_key)"""
+    plain_key = generate_api_key()
+    api_key = models.DeveloperApiKey(
+        user_id=user_id,
+        api_key=encrypt_value(plain_key),
+        api_key_hash=hash_api_key(plain_key),
+        name=payload.name,
+        description=payload.description,
+        rate_limit_per_minute=payload.rate_limit_per_minute,
+        endpoints=json.dumps(payload.endpoints) if payload.endpoints else None,
+        enabled=True
+    )
+    session.add(api_key)
+    await session.commit()
+    await session.refresh(api_key)
+    return api_key, plain_key
+
+
+async def get_user_api_keys(session: AsyncSession, user_id: int) -> List[models.DeveloperApiKey]:
+    """دریافت تمام کلیدهای API کاربر"""
+    return await _all(session, select(models.DeveloperApiKey).where(
+        models.DeveloperApiKey.user_id == user_id
+    ).order_by(models.DeveloperApiKey.created_at.desc()))
+
+
+async def get_api_key(session: AsyncSession, key_id: int) -> Optional[models.DeveloperApiKey]:
+    """دریافت کلید API"""
+    return await _first(session, select(models.DeveloperApiKey).where(models.DeveloperApiKey.id == key_id))
+
+
+async def update_api_key(session: AsyncSession, key_id: int,
+                         update: schemas.DeveloperApiKeyUpdate) -> Optional[models.DeveloperApiKey]:
+    """به‌روزرسانی کلید API"""
+    api_key = await get_api_key(session, key_id)
+    if not api_key:
+        return None
+    if update.name is not None:
+        api_key.name = update.name
+    if update.description is not None:
+        api_key.description = update.description
+    if update.enabled is not None:
+        api_key.enabled = update.enabled
+    if update.rate_limit_per_minute is not None:
+        api_key.rate_limit_per_minute = update.rate_limit_per_minute
+    if update.endpoints is not None:
+        api_key.endpoints = json.dumps(update.endpoints) if update.endpoints else None
+    await session.commit()
+    await session.refresh(api_key)
+    return api_key
+
+
+async def rotate_api_key(session: AsyncSession, old_key_id: int) -> Tuple[models.DeveloperApiKey, str]:
+    """تولید کلید API جدید. برمی‌گرداند (new_model, plain_new_key)"""
+    old_key = await get_api_key(session, old_key_id)
+    if not old_key:
+        raise ValueError('کلید API یافت نشد')
+    old_key.revoked_at = func.now()
+    await session.commit()
+    payload = schemas.DeveloperApiKeyCreate(
+        name=old_key.name,
+        description=old_key.description,
+        rate_limit_per_minute=old_key.rate_limit_per_minute,
+        endpoints=json.loads(old_key.endpoints) if old_key.endpoints else None
+    )
+    return await create_api_key(session, old_key.user_id, payload)
+
+
+async def revoke_api_key(session: AsyncSession, key_id: int) -> bool:
+    """لغو کلید API"""
+    api_key = await get_api_key(session, key_id)
+    if not api_key:
+        return False
+    api_key.revoked_at = func.now()
+    await session.commit()
+    return True
+
+
+# ==================== Customer Groups ====================
+
+def _group_query():
+    # membership changes go through CustomerGroupMember rows, so always refresh the collection
+    return select(models.CustomerGroup).options(selectinload(models.CustomerGroup.members)).execution_options(populate_existing=True)
+
+
+async def get_customer_group(session: AsyncSession, group_id: int) -> Optional[models.CustomerGroup]:
+    """دریافت گروه مشتری"""
+    return await _first(session, _group_query().where(models.CustomerGroup.id == group_id))
+
+
+async def create_customer_group(session: AsyncSession, user_id: int,
+                                payload: schemas.CustomerGroupCreate) -> models.CustomerGroup:
+    """ایجاد گروه مشتری جدید"""
+    group = models.CustomerGroup(
+        name=payload.name,
+        description=payload.description,
+        created_by_user_id=user_id,
+        is_shared=payload.is_shared
+    )
+    session.add(group)
+    await session.commit()
+    return await get_customer_group(session, group.id)
+
+
+async def get_user_customer_groups(session: AsyncSession, user_id: int,
+                                   include_shared: bool = True) -> List[models.CustomerGroup]:
+    """دریافت گروه‌های مشتری کاربر"""
+    stmt = _group_query()
+    if include_shared:
+        stmt = stmt.where(or_(models.CustomerGroup.created_by_user_id == user_id, models.CustomerGroup.is_shared == True))
+    else:
+        stmt = stmt.where(models.CustomerGroup.created_by_user_id == user_id)
+    return await _all(session, stmt.order_by(models.CustomerGroup.created_at.desc()))
+
+
+async def update_customer_group(session: AsyncSession, group_id: int,
+                                payload: schemas.CustomerGroupUpdate) -> Optional[models.CustomerGroup]:
+    """به‌روزرسانی گروه مشتری"""
+    group = await get_customer_group(session, group_id)
+    if not group:
+        return None
+    if payload.name is not None:
+        group.name = payload.name
+    if payload.description is not None:
+        group.description = payload.description
+    if payload.is_shared is not None:
+        group.is_shared = payload.is_shared
+    group.updated_at = func.now()
+    await session.commit()
+    return await get_customer_group(session, group_id)
+
+
+async def delete_customer_group(session: AsyncSession, group_id: int) -> bool:
+    """حذف گروه مشتری"""
+    return await _delete(session, await get_customer_group(session, group_id))
+
+
+async def get_person(session: AsyncSession, person_id: str) -> Optional[models.Person]:
+    return await _first(session, select(models.Person).where(models.Person.id == person_id))
+
+
+async def _get_group_member(session: AsyncSession, group_id: int, person_id: str):
+    return await _first(session, select(models.CustomerGroupMember).where(
+        models.CustomerGroupMember.group_id == group_id,
+        models.CustomerGroupMember.person_id == person_id
+    ))
+
+
+async def add_customer_to_group(session: AsyncSession, group_id: int, person_id: str) -> Optional[models.CustomerGroupMember]:
+    """افزودن مشتری به گروه"""
+    existing = await _get_group_member(session, group_id, person_id)
+    if existing:
+        return existing
+    member = models.CustomerGroupMember(group_id=group_id, person_id=person_id)
+    session.add(member)
+    await session.commit()
+    await session.refresh(member)
+    return member
+
+
+async def remove_customer_from_group(session: AsyncSession, group_id: int, person_id: str) -> bool:
+    """حذف مشتری از گروه"""
+    return await _delete(session, await _get_group_member(session, group_id, person_id))
+
+
+# ==================== ICC Shop ====================
+
+async def _create(session: AsyncSession, obj):
+    session.add(obj)
+    await session.commit()
+    await session.refresh(obj)
+    return obj
+
+
+async def _update(session: AsyncSession, obj, payload):
+    if not obj:
+        return None
+    for field, value in payload.dict(exclude_unset=True).items():
+        if value is not None:
+            setattr(obj, field, value)
+    obj.updated_at = func.now()
+    await session.commit()
+    await session.refresh(obj)
+    return obj
+
+
+async def _icc_written(result):
+    # bumps the tree version in the shared store (blocking I/O): off the event loop
+    if result:
+        await asyncio.to_thread(icc_tree.invalidate)
+    return result
+
+
+async def create_icc_category(session: AsyncSession, payload: schemas.IccCategoryCreate) -> models.IccCategory:
+    """ایجاد دسته‌بندی ICC"""
+    return await _icc_written(await _create(session, models.IccCategory(**payload.dict())))
+
+
+async def get_icc_category(session: AsyncSession, category_id: int) -> Optional[models.IccCategory]:
+    """دریافت دسته‌بندی ICC"""
+    return await _first(session, select(models.IccCategory).where(models.IccCategory.id == category_id))
+
+
+async def get_all_icc_categories(session: AsyncSession) -> List[models.IccCategory]:
+    """دریافت تمام دسته‌بندی‌های ICC"""
+    return await _all(session, select(models.IccCategory).order_by(models.IccCategory.name))
+
+
+async def update_icc_category(session: AsyncSession, category_id: int, payload: schemas.IccCategoryUpdate) -> Optional[models.IccCategory]:
+    """به‌روزرسانی دسته‌بندی ICC"""
+    return await _icc_written(await _update(session, await get_icc_category(session, category_id), payload))
+
+
+async def delete_icc_category(session: AsyncSession, category_id: int) -> bool:
+    """حذف دسته‌بندی ICC"""
+    return await _icc_written(await _delete(session, await get_icc_category(session, category_id)))
+
+
+async def create_icc_center(session: AsyncSession, payload: schemas.IccCenterCreate) -> models.IccCenter:
+    """ایجاد مرکز ICC"""
+    return await _icc_written(await _create(session, models.IccCenter(**payload.dict())))
+
+
+async def get_icc_center(session: AsyncSession, center_id: int) -> Optional[models.IccCenter]:
+    """دریافت مرکز ICC"""
+    return await _first(session, select(models.IccCenter).where(models.IccCenter.id == center_id))
+
+
+async def get_icc_centers(session: AsyncSession, category_id: Optional[int] = None) -> List[models.IccCenter]:
+    """دریافت مراکز (در صورت ارسال category_id فقط مراکز آن دسته)"""
+    stmt = select(models.IccCenter)
+    if category_id:
+        stmt = stmt.where(models.IccCenter.category_id == category_id)
+    return await _all(session, stmt.order_by(models.IccCenter.name))
+
+
+async def update_icc_center(session: AsyncSession, center_id: int, payload: schemas.IccCenterUpdate) -> Optional[models.IccCenter]:
+    """به‌روزرسانی مرکز ICC"""
+    return await _icc_written(await _update(session, await get_icc_center(session, center_id), payload))
+
+
+async def delete_icc_center(session: AsyncSession, center_id: int) -> bool:
+    """حذف مرکز ICC"""
+    return await _icc_written(await _delete(session, await get_icc_center(session, center_id)))
+
+
+async def create_icc_unit(session: AsyncSession, payload: schemas.IccUnitCreate) -> models.IccUnit:
+    """ایجاد واحد ICC"""
+    return await _icc_written(await _create(session, models.IccUnit(**payload.dict())))
+
+
+async def get_icc_unit(session: AsyncSession, unit_id: int) -> Optional[models.IccUnit]:
+    """دریافت واحد ICC"""
+    return await _first(session, select(models.IccUnit).where(models.IccUnit.id == unit_id))
+
+
+async def get_icc_units(session: AsyncSession, center_id: Optional[int] = None) -> List[models.IccUnit]:
+    """دریافت واحدها (در صورت ارسال center_id فقط واحدهای آن مرکز)"""
+    stmt = select(models.IccUnit)
+    if center_id:
+        stmt = stmt.where(models.IccUnit.center_id == center_id)
+    return await _all(session, stmt.order_by(models.IccUnit.name))
+
+
+async def update_icc_unit(session: AsyncSession, unit_id: int, payload: schemas.IccUnitUpdate) -> Optional[models.IccUnit]:
+    """به‌روزرسانی واحد ICC"""
+    return await _icc_written(await _update(session, await get_icc_unit(session, unit_id), payload))
+
+
+async def delete_icc_unit(session: AsyncSession, unit_id: int) -> bool:
+    """حذف واحد ICC"""
+    return await _icc_written(await _delete(session, await get_icc_unit(session, unit_id)))
+
+
+async def create_icc_extension(session: AsyncSession, payload: schemas.IccExtensionCreate) -> models.IccExtension:
+    """ایجاد شاخه ICC"""
+    return await _icc_written(await _create(session, models.IccExtension(**payload.dict())))
+
+
+async def get_icc_extension(session: AsyncSession, extension_id: int) -> Optional[models.IccExtension]:
+    """دریافت شاخه ICC"""
+    return await _first(session, select(models.IccExtension).where(models.IccExtension.id == extension_id))
+
+
+async def get_icc_extensions(session: AsyncSession, unit_id: Optional[int] = None) -> List[models.IccExtension]:
+    """دریافت شاخه‌ها (در صورت ارسال unit_id فقط شاخه‌های آن واحد)"""
+    stmt = select(models.IccExtension)
+    if unit_id:
+        stmt = stmt.where(models.IccExtension.unit_id == unit_id)
+    return await _all(session, stmt.order_by(models.IccExtension.name))
+
+
+async def update_icc_extension(session: AsyncSession, extension_id: int, payload: schemas.IccExtensionUpdate) -> Optional[models.IccExtension]:
+    """به‌روزرسانی شاخه ICC"""
+    return await _icc_written(await _update(session, await get_icc_extension(session, extension_id), payload))
+
+
+async def delete_icc_extension(session: AsyncSession, extension_id: int) -> bool:
+    """حذف شاخه ICC"""
+    return await _icc_written(await _delete(session, await get_icc_extension(session, extension_id)))
+
+
+# ==================== System Settings ====================
+
+async def get_system_setting(session: AsyncSession, key: str) -> Optional[models.SystemSettings]:
+    """دریافت تنظیم سیستم بر اساس کلید"""
+    return await _first(session, select(models.SystemSettings).where(models.SystemSettings.key == key))
+
+
+async def get_system_settings_by_category(session: AsyncSession, category: str) -> List[models.SystemSettings]:
+    """دریافت تنظیمات بر اساس دسته"""
+    return await _all(session, select(models.SystemSettings).where(models.SystemSettings.category == category))
+
+
+async def get_all_system_settings(session: AsyncSession) -> List[models.SystemSettings]:
+    """دریافت تمام تنظیمات سیستم"""
+    return await _all(session, select(models.SystemSettings))
+
+
+async def create_system_setting(session: AsyncSession, setting: schemas.SystemSettingCreate, updated_by: int = None) -> models.SystemSettings:
+    """ایجاد تنظیم سیستم جدید"""
+    return await _create(session, models.SystemSettings(updated_by=updated_by, **setting.dict()))
+
+
+async def update_system_setting(session: AsyncSession, key: str, setting: schemas.SystemSettingUpdate, updated_by: int = None) -> Optional[models.SystemSettings]:
+    """به‌روزرسانی تنظیم سیستم"""
+    db_setting = await get_system_setting(session, key)
+    if not db_setting:
+        return None
+    update_data = setting.dict(exclude_unset=True)
+    update_data['updated_by'] = updated_by
+    update_data['updated_at'] = datetime.now(timezone.utc)
+    for field, value in update_data.items():
+        setattr(db_setting, field, value)
+    await session.commit()
+    await session.refresh(db_setting)
+    return db_setting
+
+
+async def delete_system_setting(session: AsyncSession, key: str) -> bool:
+    """حذف تنظیم سیستم"""
+    return await _delete(session, await get_system_setting(session, key))
+
+
+# ==================== Dashboard Widgets ====================
+
+async def get_user_dashboard_widgets(session: AsyncSession, user_id: int) -> List[models.DashboardWidget]:
+    """دریافت تمام widgets کاربر"""
+    return await _all(session, select(models.DashboardWidget).where(models.DashboardWidget.user_id == user_id))
+
+
+async def get_dashboard_widget(session: AsyncSession, widget_id: int) -> Optional[models.DashboardWidget]:
+    """دریافت widget خاص"""
+    return await _first(session, select(models.DashboardWidget).where(models.DashboardWidget.id == widget_id))
+
+
+async def create_dashboard_widget(session: AsyncSession, user_id: int, widget: schemas.DashboardWidgetCreate) -> models.DashboardWidget:
+    """ایجاد widget جدید"""
+    return await _create(session, models.DashboardWidget(user_id=user_id, **widget.dict()))
+
+
+async def update_dashboard_widget(session: AsyncSession, widget_id: int, widget: schemas.DashboardWidgetUpdate) -> Optional[models.DashboardWidget]:
+    """به‌روزرسانی widget"""
+    db_widget = await get_dashboard_widget(session, widget_id)
+    if not db_widget:
+        return None
+    for field, value in widget.dict(exclude_unset=True).items():
+        setattr(db_widget, field, value)
+    await session.commit()
+    await session.refresh(db_widget)
+    return db_widget
+
+
+async def delete_dashboard_widget(session: AsyncSession, widget_id: int) -> bool:
+    """حذف widget"""
+    return await _delete(session, await get_dashboard_widget(session, widget_id))
+
+
+async def reorder_dashboard_widgets(session: AsyncSession, user_id: int, widget_positions: List[dict]) -> bool:
+    """به‌روزرسانی موقعیت و ترتیب widgets در یک کوئری"""
+    try:
+        ids = [pos['widget_id'] for pos in widget_positions]
+        widgets = await _all(session, select(models.DashboardWidget).where(
+            models.DashboardWidget.id.in_(ids),
+            models.DashboardWidget.user_id == user_id
+        ))
+        by_id = {w.id: w for w in widgets}
+        for pos in widget_positions:
+            widget = by_id.get(pos['widget_id'])
+            if widget:
+                widget.position_x = pos.get('position_x', widget.position_x)
+                widget.position_y = pos.get('position_y', widget.position_y)
+                widget.width = pos.get('width', widget.width)
+                widget.height = pos.get('height', widget.height)
+        await session.commit()
+        return True
+    except Exception:
+        await session.rollback()
+        return False
@@ -0,0 +1,330 @@
+"""In-memory product autocomplete for /api/search/live.
+
+Every product contributes a few keys to one sorted array of (key, id):
+its normalized name starting at each word (so "سامس" finds "گوشی سامسونگ")
+and its code. A keystroke is a bisect to the range of keys starting with the
+typed prefix; matches are ranked by how many final sale invoice lines the
+product has (sales frequency), then by shorter name.
+
+Products are also kept in rank order. When the key range is large (one or
+two letter prefixes) walking that order until enough products match is
+cheaper than ranking the whole range; see WALK_FACTOR.
+
+The top MEMO_TOP products of every prefix typed so far are memoized, and each
+write patches the memo entries of its own prefixes instead of clearing them,
+so repeated keystrokes are a dict lookup.
+
+The index is built from the DB at startup and follows product writes, and the
+sale counts of finalized invoices, by tailing search_outbox like local_search.
+"""
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from . import db, models, search, search_outbox
+from .normalizer import normalize_for_search
+
+LOGGER = logging.getLogger(__name__)
+
+ENABLED = os.getenv('AUTOCOMPLETE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+SYNC_INTERVAL = float(os.getenv('AUTOCOMPLETE_SYNC_INTERVAL', '2'))
+
+# keys are cut to this many characters; longer queries are verified against the doc
+KEY_LEN = 48
+# word-start keys per product name (beyond that, words are rarely typed first)
+MAX_WORD_KEYS = 6
+# walk the rank order instead of ranking the key range once range**2 > WALK_FACTOR * limit * products
+# (ranking costs ~range cheap lookups, the walk ~limit * products / range prefix checks)
+WALK_FACTOR = 10
+# memoized top products per prefix (limit above MEMO_TOP bypasses the memo)
+MEMO_TOP = 20
+MEMO_MAX = 50000
+
+_HIGH = '\U0010ffff'
+
+
+def _keys(doc: dict) -> List[str]:
+    name = normalize_for_search(doc.get('name') or '')
+    keys = []
+    start = 0
+    for _ in range(MAX_WORD_KEYS):
+        keys.append(name[start:start + KEY_LEN])
+        nxt = name.find(' ', start)
+        if nxt < 0:
+            break
+        start = nxt + 1
+    code = normalize_for_search(doc.get('code') or '')
+    if code:
+        keys.append(code[:KEY_LEN])
+    return sorted({k for k in keys if k})
+
+
+def sales_counts(session, product_ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Number of final sale invoice lines per product."""
+    q = (
+        session.query(models.InvoiceItem.product_id, func.count(models.InvoiceItem.id))
+        .join(models.Invoice, models.InvoiceItem.invoice_id == models.Invoice.id)
+        .filter(models.Invoice.invoice_type == 'sale', models.Invoice.status == 'final',
+                models.InvoiceItem.product_id.isnot(None))
+    )
+    if product_ids is not None:
+        q = q.filter(models.InvoiceItem.product_id.in_(list(product_ids)))
+    return {pid: int(n) for pid, n in q.group_by(models.InvoiceItem.product_id)}
+
+
+class Autocomplete:
+    def __init__(self):
+        self.entries: List[Tuple[str, Any]] = []  # sorted (key, id)
+        self.docs: Dict[Any, dict] = {}
+        self.doc_keys: Dict[Any, List[str]] = {}
+        self.sales: Dict[Any, int] = {}
+        self.rank_keys: Dict[Any, Tuple[int, int, Any]] = {}  # id -> (-sales, len(name), id)
+        self.ranked: List[Tuple[int, int, Any]] = []  # sorted rank_keys values
+        self.tail = search_outbox.Tail()  # search_outbox rows applied
+        self.ready = False
+        self._memo: Dict[str, List[Any]] = {}  # prefix -> best MEMO_TOP ids (fewer = every match)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    # -- writes ------------------------------------------------------------
+
+    def _rank_key(self, doc_id) -> Tuple[int, int, Any]:
+        return (-self.sales.get(doc_id, 0), len(self.docs[doc_id].get('name') or ''), doc_id)
+
+    def _remove(self, doc_id):
+        if doc_id not in self.docs:
+            return
+        for sorted_list, item in [(self.ranked, self.rank_keys.pop(doc_id))] + [
+                (self.entries, (key, doc_id)) for key in self.doc_keys.pop(doc_id, ())]:
+            i = bisect.bisect_left(sorted_list, item)
+            if i < len(sorted_list) and sorted_list[i] == item:
+                del sorted_list[i]
+        del self.docs[doc_id]
+
+    def _patch_memo(self, doc_id, old_keys: Iterable[str]):
+        """Bring the memoized prefixes of `doc_id`'s old and new keys up to date."""
+        new_keys = self.doc_keys.get(doc_id, ())
+        prefixes = {k[:n] for k in chain(old_keys, new_keys) for n in range(1, len(k) + 1)}
+        rank = self.rank_keys.get(doc_id)
+        for prefix in prefixes:
+            top = self._memo.get(prefix)
+            if top is None:
+                continue
+            was_full = len(top) >= MEMO_TOP
+            top = [i for i in top if i != doc_id]
+            if rank is not None and any(k.startswith(prefix) for k in new_keys):
+                if len(top) < MEMO_TOP or rank < self.rank_keys[top[-1]]:
+                    bisect.insort(top, doc_id, key=self.rank_keys.__getitem__)
+                    del top[MEMO_TOP:]
+            if was_full and len(top) < MEMO_TOP:
+                # whatever ranks next is unknown; rebuild on the next keystroke
+                del self._memo[prefix]
+            else:
+                self._memo[prefix] = top
+
+    def upsert(self, doc: dict, sales: Optional[int] = None):
+        with self._lock:
+            doc_id = doc['id']
+            old_keys = self.doc_keys.get(doc_id, [])
+            self._remove(doc_id)
+            keys = _keys(doc)
+            for key in keys:
+                bisect.insort(self.entries, (key, doc_id))
+            self.docs[doc_id] = doc
+            self.doc_keys[doc_id] = keys
+            if sales is not None:
+                self.sales[doc_id] = sales
+            self.rank_keys[doc_id] = self._rank_key(doc_id)
+            bisect.insort(self.ranked, self.rank_keys[doc_id])
+            self._patch_memo(doc_id, old_keys)
+
+    def delete(self, doc_id):
+        with self._lock:
+            old_keys = self.doc_keys.get(doc_id, [])
+            self._remove(doc_id)
+            self.sales.pop(doc_id, None)
+            self._patch_memo(doc_id, old_keys)
+
+    def load(self, docs: Iterable[dict], sales: Dict[Any, int]):
+        """Bulk load: one sort instead of an insort per key."""
+        entries = []
+        with self._lock:
+            self.sales = dict(sales)
+            for doc in docs:
+                keys = _keys(doc)
+                entries.extend((key, doc['id']) for key in keys)
+                self.docs[doc['id']] = doc
+                self.doc_keys[doc['id']] = keys
+            entries.sort()
+            self.entries = entries
+            self.rank_keys = {doc_id: self._rank_key(doc_id) for doc_id in self.docs}
+            self.ranked = sorted(self.rank_keys.values())
+            self._memo.clear()
+
+    # -- building / syncing ------------------------------------------------
+
+    def build_from_db(self, session, chunk_size: int = 2000):
+        self.tail = search_outbox.Tail.at_head(session)
+        result = session.execute(select(models.Product).execution_options(yield_per=chunk_size)).scalars()
+        docs = (doc for rows in result.partitions() for doc in search.build_docs(session, 'products', rows))
+        self.load(docs, sales_counts(session))
+        self.ready = True
+
+    def sync(self, session, batch: int = 5000) -> int:
+        """Apply product changes from search_outbox rows not applied yet."""
+        # every index is read (other rows are skipped) so gaps in the ids are real
+        rows = (
+            session.query(models.SearchOutbox.id, models.SearchOutbox.index_name, models.SearchOutbox.doc_id)
+            .filter(self.tail.condition())
+            .order_by(models.SearchOutbox.id)
+            .limit(batch)
+            .all()
+        )
+        if not rows:
+            return 0
+        self.tail.advance(row[0] for row in rows)
+        ids = {doc_id for _, index_name, doc_id in rows if index_name == 'products'}
+        if not ids:
+            return len(rows)
+        found = {p.id: p for p in session.query(models.Product).filter(models.Product.id.in_(ids))}
+        counts = sales_counts(session, found) if found else {}
+        for doc in search.build_docs(session, 'products', found.values()):
+            self.upsert(doc, sales=counts.get(doc['id'], 0))
+        for doc_id in ids - found.keys():
+            self.delete(doc_id)
+        return len(rows)
+
+    # -- querying ----------------------------------------------------------
+
+    def _top(self, ids: Iterable[Any], n: int) -> List[Any]:
+        return heapq.nsmallest(n, set(ids), key=self.rank_keys.__getitem__)
+
+    def _walk_ranked(self, prefix: str, n: int) -> List[Any]:
+        top = []
+        for _, _, doc_id in self.ranked:
+            if any(k.startswith(prefix) for k in self.doc_keys[doc_id]):
+                top.append(doc_id)
+                if len(top) == n:
+                    break
+        return top
+
+    def suggest(self, query: str, limit: int = 7) -> List[dict]:
+        qn = normalize_for_search(query or '').strip()
+        if not qn:
+            return []
+        prefix = qn[:KEY_LEN]
+        with self._lock:
+            top = self._memo.get(qn) if limit <= MEMO_TOP else None
+            if top is None:
+                n = max(limit, MEMO_TOP)
+                entries = self.entries
+                lo = bisect.bisect_left(entries, (prefix,))
+                hi = bisect.bisect_left(entries, (prefix + _HIGH,), lo)
+                if len(qn) > KEY_LEN:
+                    top = self._top((i for _, i in entries[lo:hi] if self._matches(i, qn)), limit)
+                else:
+                    if (hi - lo) ** 2 <= WALK_FACTOR * n * len(self.docs):
+                        top = self._top((i for _, i in entries[lo:hi]), n)
+                    else:
+                        top = self._walk_ranked(prefix, n)
+                    if n == MEMO_TOP:
+                        if len(self._memo) >= MEMO_MAX:
+                            self._memo.clear()
+                        self._memo[qn] = top
+            return [dict(self.docs[i], sales=self.sales.get(i, 0)) for i in top[:limit]]
+
+    def _matches(self, doc_id, qn: str) -> bool:
+        doc = self.docs[doc_id]
+        name = normalize_for_search(doc.get('name') or '')
+        code = normalize_for_search(doc.get('code') or '')
+        return name.startswith(qn) or code.startswith(qn) or f' {qn}' in name
+
+
+_INDEX: Optional[Autocomplete] = None
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def get_index() -> Optional[Autocomplete]:
+    return _INDEX
+
+
+def set_index(index: Optional[Autocomplete]):
+    global _INDEX
+    _INDEX = index
+
+
+def is_ready() -> bool:
+    return _INDEX is not None and _INDEX.ready
+
+
+def suggest(query: str, limit: int = 7) -> Optional[List[dict]]:
+    """Product suggestions from the in-memory index, or None while it isn't ready."""
+    index = _INDEX
+    return index.suggest(query, limit) if index is not None and index.ready else None
+
+
+def notify():
+    _WAKE.set()
+
+
+def _run(session_factory):
+    global _INDEX
+    index = Autocomplete()
+    session = session_factory()
+    try:
+        started = time.time()
+        index.build_from_db(session)
+        while index.sync(session):
+            pass
+        LOGGER.info('autocomplete ready in %.1fs (%d products, %d keys)', time.time() - started, len(index), len(index.entries))
+    except Exception as e:
+        LOGGER.warning('autocomplete build failed: %s', e)
+        return
+    finally:
+        session.close()
+    _INDEX = index
+    while not _STOP.is_set():
+        _WAKE.wait(SYNC_INTERVAL)
+        _WAKE.clear()
+        session = session_factory()
+        try:
+            while index.sync(session):
+                pass
+        except Exception as e:
+            session.rollback()
+            LOGGER.warning('autocomplete sync failed: %s', e)
+        finally:
+            session.close()
+
+
+def start(session_factory=None):
+    global _THREAD
+    if not ENABLED or _THREAD is not None:
+        return
+    # product writes must reach the outbox even without Meilisearch
+    search_outbox.KEEP_WITHOUT_MEILI = True
+    search_outbox.add_listener(notify)
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='autocomplete', daemon=True)
+    _THREAD.start()
+
+
+def stop(timeout: float = 10.0):
+    global _THREAD
+    if _THREAD is None:
+        return
+    _STOP.set()
+    _WAKE.set()
+    _THREAD.join(timeout)
+    _THREAD = None
@@ -6,13 +6,12 @@ from sqlalchemy.sql import func
 from datetime import datetime, timezone
 from datetime import timedelta
 import jdatetime
-import requests
 import math
 from .schemas import ProductCreate, ProductOut, PersonCreate
 from .normalizer import normalize_for_search
 import hashlib
 import json
-from . import search as search_client
+from . import db_search, search_outbox
 from .security import encrypt_value
 
 
@@ -94,20 +93,11 @@ def create_product(session: Session, p: ProductCreate) -> models.Product:
     pid = make_hash_id(raw)
     product = models.Product(id=pid, name=p.name, name_norm=norm, code=p.code or '', unit=p.unit, group=p.group, description=p.description)
     session.add(product)
+    # index into search (outbox row commits with the product)
+    search_outbox.record(session, 'products', product.id)
     session.commit()
     session.refresh(product)
-    # index into search
-    try:
-        search_client.index_product({
-            'id': product.id,
-            'name': product.name,
-            'description': product.description,
-            'unit': product.unit,
-            'group': product.group,
-            'inventory': product.inventory,
-        })
-    except Exception:
-        pass
+    search_outbox.notify()
     # activity log
     try:
         from .activity_logger import log_activity
@@ -145,7 +135,10 @@ def create_product_from_external(session: Session, external: dict, unit: Optiona
         if create_price_history and price:
             ph = models.PriceHistory(product_id=prod.id, price=int(price), type='sell', effective_at=datetime.utcnow())
             session.add(ph)
+            # the indexed product carries its last price
+            search_outbox.record(session, 'products', prod.id)
             session.commit()
+            search_outbox.notify()
     except Exception:
         pass
     return prod
@@ -156,8 +149,7 @@ def get_products(session: Session, q: Optional[str] = None, limit: int = 50):
     
     qs = session.query(models.Product)
     if q:
-        qn = normalize_for_search(q)
-        qs = qs.filter(models.Product.name_norm.contains(qn))
+        qs = db_search.filter_by_name(session, qs, models.Product, normalize_for_search(q), rank=True)
     
     products = qs.limit(limit).all()
     
@@ -212,17 +204,10 @@ def create_person(session: Session, p: PersonCreate) -> models.Person:
     pid = make_hash_id(raw)
     person = models.Person(id=pid, name=p.name, name_norm=norm, kind=p.kind, mobile=p.mobile, description=p.description, code=p.code or '')
     session.add(person)
+    search_outbox.record(session, 'persons', person.id)
     session.commit()
     session.refresh(person)
-    try:
-        search_client.index_person({
-            'id': person.id,
-            'name': person.name,
-            'mobile': person.mobile,
-            'description': person.description,
-        })
-    except Exception:
-        pass
+    search_outbox.notify()
     try:
         from .activity_logger import log_activity
         log_activity(session, None, f"ایجاد شخص: {person.name} (id={person.id})", path=f"/api/persons", method='POST', status_code=201, detail={'person_id': person.id})
@@ -234,8 +219,7 @@ def create_person(session: Session, p: PersonCreate) -> models.Person:
 def get_persons(session: Session, q: Optional[str] = None, limit: int = 50):
     qs = session.query(models.Person)
     if q:
-        qn = normalize_for_search(q)
-        qs = qs.filter(models.Person.name_norm.contains(qn))
+        qs = db_search.filter_by_name(session, qs, models.Person, normalize_for_search(q), rank=True)
     return qs.limit(limit).all()
 
 
@@ -416,24 +400,13 @@ def create_invoice_manual(session: Session, inv: schemas.InvoiceCreate) -> model
     invoice.subtotal = subtotal
     invoice.total = subtotal  # simple: no tax calc by default
     session.add(invoice)
+    search_outbox.record(session, 'invoices', invoice.id)
     session.commit()
     session.refresh(invoice)
+    search_outbox.notify()
     # attach items for convenience
     items = session.query(models.InvoiceItem).filter(models.InvoiceItem.invoice_id == invoice.id).all()
     invoice.items = items
-    # index invoice in search
-    try:
-        search_client.index_invoice({
-            'id': invoice.id,
-            'invoice_number': invoice.invoice_number,
-            'invoice_type': invoice.invoice_type,
-            'status': invoice.status,
-            'party_id': invoice.party_id,
-            'party_name': invoice.party_name,
-            'total': invoice.total,
-        })
-    except Exception:
-        pass
     try:
         from .activity_logger import log_activity
         # use party_name or party_id for context
@@ -472,8 +445,10 @@ def update_invoice(session: Session, invoice_id: int, data: dict):
         if hasattr(inv, k):
             setattr(inv, k, v)
     session.add(inv)
+    search_outbox.record(session, 'invoices', inv.id)
     session.commit()
     session.refresh(inv)
+    search_outbox.notify()
     return inv
 
 
@@ -486,6 +461,7 @@ def finalize_invoice(session: Session, invoice_id: int, client_time: Optional[da
         inv.client_time = client_time
     inv.server_time = datetime.now(timezone.utc)
     session.add(inv)
+    search_outbox.record(session, 'invoices', inv.id)
     session.commit()
     session.refresh(inv)
     
@@ -503,10 +479,12 @@ def finalize_invoice(session: Session, invoice_id: int, client_time: Optional[da
                         # Increase inventory for purchases
                         product.inventory = (product.inventory or 0) + item.quantity
                     session.add(product)
+                    search_outbox.record(session, 'products', product.id)
         session.commit()
     except Exception as e:
         print(f"Inventory update error: {e}")
         pass
+    search_outbox.notify()
     
     # Create ledger entries for inventory and revenue based on invoice_type
     try:
@@ -609,21 +587,10 @@ def create_payment_manual(session: Session, p: schemas.PaymentCreate) -> models.
     prefix = pay.direction[:1].upper()
     pay.payment_number = f"{prefix}-{date_part}-{pay.id:06d}"
     session.add(pay)
+    search_outbox.record(session, 'payments', pay.id)
     session.commit()
     session.refresh(pay)
-    try:
-        search_client.index_payment({
-            'id': pay.id,
-            'payment_number': pay.payment_number,
-            'direction': pay.direction,
-            'status': pay.status,
-            'party_id': pay.party_id,
-            'party_name': pay.party_name,
-            'method': pay.method,
-            'amount': pay.amount,
-        })
-    except Exception:
-        pass
+    search_outbox.notify()
     try:
         from .activity_logger import log_activity
         log_activity(session, pay.party_name or None, f"صدور رسید/سند پرداخت {pay.payment_number}", path=f"/api/payments/manual", method='POST', status_code=201, detail={'payment_id': pay.id})
@@ -653,8 +620,10 @@ def finalize_payment(session: Session, payment_id: int, client_time: Optional[da
         pay.client_time = client_time
     pay.server_time = datetime.now(timezone.utc)
     session.add(pay)
+    search_outbox.record(session, 'payments', pay.id)
     session.commit()
     session.refresh(pay)
+    search_outbox.notify()
     
     # Create ledger entry depending on direction/method
     try:
@@ -1079,35 +1048,9 @@ def dashboard_checks_due(session: Session, within_days: int = 14):
 
 
 def dashboard_currency_prices():
-    # Query a couple of public endpoints with fallback
-    from .cache import get_cache, set_cache
-    cache_key = 'dashboard_currency_prices_v1'
-    cached = get_cache(cache_key)
-    if cached is not None:
-        return cached
-    res = {}
-    try:
-        # exchange rate (USD base)
-        r = requests.get('https://api.exchangerate.host/latest?base=USD&symbols=EUR,IRR,USD', timeout=3)
-        if r.status_code == 200:
-            j = r.json()
-            res['fx'] = j.get('rates')
-        else:
-            res['fx'] = None
-    except Exception:
-        res['fx'] = None
-    try:
-        # coin gecko price for BTC/ETH
-        r = requests.get('https://api.coingecko.com/api/v3/simple/price?ids=bitcoin,ethereum&vs_currencies=usd', timeout=3)
-        if r.status_code == 200:
-            res['crypto'] = r.json()
-        else:
-            res['crypto'] = None
-    except Exception:
-        res['crypto'] = None
-    # cache for 5 minutes by default
-    set_cache(cache_key, res, ttl_seconds=300)
-    return res
+    # served from the fx_rates refresher's shared snapshot; never waits on the providers
+    from . import fx_rates
+    return fx_rates.current_prices()
 
 
 # ==================== User SMS Config CRUD ====================
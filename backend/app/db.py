@@ -34,6 +34,39 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def _async_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto the matching asyncio driver."""
+    if url.startswith('postgresql+psycopg2://') or url.startswith('postgresql://'):
+        return 'postgresql+asyncpg://' + url.split('://', 1)[1]
+    if url.startswith('sqlite:///') or url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url.split('://', 1)[1]
+    return url
+
+
+# Async engine used by the `async def` endpoints so DB round-trips don't block the
+# event loop. asyncpg for Postgres, aiosqlite as the local/test stand-in.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+    try:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+    except ModuleNotFoundError as e:
+        import warnings
+
+        warnings.warn(f"Could not create async engine for {ASYNC_DATABASE_URL}; falling back to aiosqlite: {e}")
+        fallback_path = os.path.abspath(os.path.join(base_dir, '..', 'hp_fallback.db'))
+        ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{fallback_path}"
+        async_engine = create_async_engine(ASYNC_DATABASE_URL)
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+except ModuleNotFoundError as e:
+    import warnings
+
+    warnings.warn(f"Async database drivers unavailable; async endpoints disabled: {e}")
+    async_engine = None
+    AsyncSessionLocal = None
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -42,6 +75,13 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("async database driver not installed (asyncpg / aiosqlite)")
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
 def create_test_engine():
     """Helper for tests: create an in-memory sqlite engine and return it."""
     from sqlalchemy import create_engine
@@ -55,3 +95,19 @@ def create_test_session(engine):
     Base.metadata.create_all(bind=engine)
     Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     return Session()
+
+
+def create_test_async_engine():
+    """Helper for tests: in-memory aiosqlite engine sharing a single connection."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import StaticPool
+    return create_async_engine('sqlite+aiosqlite:///:memory:', poolclass=StaticPool)
+
+
+async def create_test_async_session(engine):
+    """Create tables on the async test engine and return an AsyncSession bound to it."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    return Session()
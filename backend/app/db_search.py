@@ -0,0 +1,138 @@
+"""Indexed substring search on name_norm (and codes) without Meilisearch.
+
+`name_norm.contains(q)` compiles to LIKE '%q%', which no B-tree index can
+serve. Per dialect this module swaps it for something that can:
+
+- PostgreSQL: ILIKE '%q%' backed by pg_trgm GIN indexes (migration 0035)
+- SQLite: an external-content FTS5 table with the trigram tokenizer, kept in
+  sync by triggers (created at startup by ensure_sqlite_fts)
+- anything else, or queries shorter than a trigram: the old LIKE
+
+`q` must be in the form the columns store: normalized with normalize_for_search
+for name_norm, as typed for raw columns such as invoice_items.description.
+
+Products also match on `code`, persons on `code` and `mobile` (SEARCH_COLUMNS),
+so a code or phone number typed into the name search finds its row.
+
+With rank=True hits come best first, so a LIMIT keeps the closest names:
+similarity() on PostgreSQL, the FTS5 bm25 rank on SQLite, and exact / prefix /
+shorter matches first on the LIKE path.
+"""
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import case, column, func, literal_column, or_, table, text
+from sqlalchemy.orm import Query, Session
+
+LOGGER = logging.getLogger(__name__)
+
+# table -> columns searched (and indexed) besides the primary name
+SEARCH_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    'products': ('name_norm', 'code'),
+    'persons': ('name_norm', 'code', 'mobile'),
+    'invoice_items': ('description',),
+}
+
+_trgm_available: Dict[int, bool] = {}
+_fts_available: Dict[Tuple[int, str], bool] = {}
+
+
+def _escape_like(q: str) -> str:
+    return q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _has_trgm(session: Session) -> bool:
+    bind = session.get_bind()
+    key = id(bind)
+    if key not in _trgm_available:
+        try:
+            _trgm_available[key] = session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+        except Exception:
+            _trgm_available[key] = False
+    return _trgm_available[key]
+
+
+def _has_fts(session: Session, table_name: str) -> bool:
+    bind = session.get_bind()
+    key = (id(bind), table_name)
+    if key not in _fts_available:
+        row = session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {'n': f'{table_name}_fts'}
+        ).first()
+        _fts_available[key] = row is not None
+    return _fts_available[key]
+
+
+def filter_by_name(session: Session, query: Query, model, qn: str, columns: Optional[Sequence[str]] = None,
+                   rank: bool = False) -> Query:
+    """Restrict `query` to rows of `model` whose search columns (or just `columns`) contain `qn`.
+
+    rank=True orders the hits by how close they are to `qn`; leave it off when
+    the caller applies its own ORDER BY.
+    """
+    table_name = model.__tablename__
+    names = columns or SEARCH_COLUMNS.get(table_name, ('name_norm',))
+    cols = [getattr(model, c) for c in names]
+    dialect = session.get_bind().dialect.name
+    if len(qn) >= 3 and dialect == 'postgresql' and _has_trgm(session):
+        pattern = f'%{_escape_like(qn)}%'
+        query = query.filter(or_(*[c.ilike(pattern, escape='\\') for c in cols]))
+        if rank:
+            score = func.greatest(*[func.similarity(func.coalesce(c, ''), qn) for c in cols])
+            query = query.order_by(score.desc())
+        return query
+    if len(qn) >= 3 and dialect == 'sqlite' and _has_fts(session, table_name):
+        fts = table(f'{table_name}_fts', column('rowid'))
+        phrase = '"' + qn.replace('"', '""') + '"'
+        if columns:
+            phrase = '{' + ' '.join(columns) + '} : ' + phrase
+        query = (
+            query.join(fts, fts.c.rowid == literal_column(f'{table_name}.rowid'))
+            .filter(text(f'{table_name}_fts MATCH :fts_q').bindparams(fts_q=phrase))
+        )
+        # bm25: lower is better
+        return query.order_by(literal_column(f'{table_name}_fts.rank')) if rank else query
+    query = query.filter(or_(*[c.contains(qn) for c in cols]))
+    if rank:
+        # short queries and dialects without an index: exact, then prefix, then shorter names
+        main = cols[0]
+        query = query.order_by(case((main == qn, 0), (main.startswith(qn), 1), else_=2), func.length(main))
+    return query
+
+
+def ensure_sqlite_fts(engine):
+    """Create the FTS5 trigram tables and sync triggers on a SQLite DB (idempotent)."""
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conn:
+        for table_name, cols in SEARCH_COLUMNS.items():
+            fts = f'{table_name}_fts'
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {'n': fts}).first()
+            col_list = ', '.join(cols)
+            new_vals = ', '.join(f'new.{c}' for c in cols)
+            old_vals = ', '.join(f'old.{c}' for c in cols)
+            try:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({col_list}, "
+                    f"content='{table_name}', content_rowid='rowid', tokenize='trigram')"
+                ))
+            except Exception as e:
+                # SQLite older than 3.34 has no trigram tokenizer; keep the LIKE path
+                LOGGER.warning('FTS5 trigram unavailable for %s: %s', table_name, e)
+                return
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+                f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_vals}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_vals}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table_name} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old_vals}); "
+                f"INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new_vals}); END"
+            ))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+    _fts_available.clear()
@@ -1,104 +1,149 @@
 import requests
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from typing import List, Dict, Optional
-import re
+from urllib.parse import urlsplit
+import os
+import threading
+import time
+import json
 import logging
 
+from . import http_client, page_cache, page_extract
+from .page_extract import _PARSER
+
 logger = logging.getLogger(__name__)
 
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120 Safari/537.36'
 }
 
+# whole aggregate_search call; sources/pages still running then are returned partial
+DEADLINE = float(os.getenv('EXTERNAL_SEARCH_DEADLINE', '8'))
+# concurrent requests per marketplace host (be polite, avoid rate limiting)
+PER_HOST_LIMIT = int(os.getenv('EXTERNAL_SEARCH_PER_HOST', '4'))
+FETCH_WORKERS = int(os.getenv('EXTERNAL_SEARCH_WORKERS', '16'))
+# seconds a parsed product page / a complete aggregate result is served from cache
+PAGE_TTL = float(os.getenv('EXTERNAL_CACHE_PAGE_TTL', str(6 * 3600)))
+SEARCH_TTL = float(os.getenv('EXTERNAL_CACHE_SEARCH_TTL', '900'))
+
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_host_slots_lock = threading.Lock()
+# separate pools so site searches waiting on their page fetches can never starve them
+_site_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ext-site')
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='ext-fetch')
+_cache = page_cache.PageCache()
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(PER_HOST_LIMIT)
+        return slot
+
 
-def _fetch(url: str, timeout: int = 6) -> Optional[str]:
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def _host_turn(url: str, deadline: Optional[float] = None):
+    """Hold one of the host's request slots; yields the seconds left before `deadline` or False if none are."""
+    slot = _host_slot(url)
+    left = _remaining(deadline)
+    if left is not None and left <= 0:
+        yield False
+        return
+    if not slot.acquire(timeout=left if left is not None else -1):
+        logger.debug(f"fetch skipped {url}: host busy until deadline")
+        yield False
+        return
     try:
-        r = requests.get(url, headers=HEADERS, timeout=timeout)
-        if r.status_code == 200:
-            return r.text
-    except Exception as e:
-        logger.debug(f"fetch error {url}: {e}")
-    return None
+        left = _remaining(deadline)
+        yield False if left is not None and left <= 0 else left
+    finally:
+        slot.release()
 
 
-def _extract_og(soup: BeautifulSoup) -> Dict:
-    data = {}
-    og_title = soup.find('meta', property='og:title')
-    if og_title and og_title.get('content'):
-        data['title'] = og_title.get('content')
-    og_img = soup.find('meta', property='og:image')
-    if og_img and og_img.get('content'):
-        data['image'] = og_img.get('content')
-    og_desc = soup.find('meta', property='og:description')
-    if og_desc and og_desc.get('content'):
-        data['description'] = og_desc.get('content')
-    return data
-
-
-def _find_price_from_text(text: str) -> Optional[int]:
-    if not text:
-        return None
-    # find numbers like 1,234,567 or ۱۲۳۴۵۶۷ and Persian digits
-    # normalize Persian digits
-    trans = str.maketrans('۰۱۲۳۴۵۶۷۸۹٫،', '0123456789.,')
-    t = text.translate(trans)
-    m = re.search(r"(\d[\d,\.\s]{0,20}\d)", t)
-    if m:
-        num = m.group(1)
-        num = re.sub(r"[^0-9]", "", num)
+def _get(url: str, timeout: int = 6, deadline: Optional[float] = None,
+         headers: Optional[Dict[str, str]] = None) -> Optional[requests.Response]:
+    with _host_turn(url, deadline) as left:
+        if left is False:
+            return None
         try:
-            return int(num)
-        except Exception:
+            # no retries: the deadline is the budget; hosts that error out trip their circuit breaker
+            return http_client.get(url, timeout=timeout if left is None else min(timeout, left),
+                                   headers={**HEADERS, **(headers or {})}, retries=0, deadline_bound=True)
+        except Exception as e:
+            logger.debug(f"fetch error {url}: {e}")
+    return None
+
+
+def _get_page(url: str, timeout: int = 6, deadline: Optional[float] = None,
+              headers: Optional[Dict[str, str]] = None):
+    """(status, headers, extracted fields) for a product page, read with page_extract within the byte budget."""
+    with _host_turn(url, deadline) as left:
+        if left is False:
             return None
+        try:
+            with http_client.get(url, timeout=timeout if left is None else min(timeout, left),
+                                 headers={**HEADERS, **(headers or {})}, retries=0, deadline_bound=True,
+                                 stream=True) as r:
+                if r.status_code != 200:
+                    return r.status_code, r.headers, None
+                # requests assumes ISO-8859-1 for text/* without a charset; the marketplaces serve UTF-8
+                encoding = r.encoding if 'charset=' in r.headers.get('Content-Type', '').lower() else 'utf-8'
+                fields = page_extract.extract(r.iter_content(page_extract.CHUNK_SIZE), encoding or 'utf-8')
+                return r.status_code, r.headers, fields
+        except Exception as e:
+            logger.debug(f"fetch error {url}: {e}")
     return None
 
 
-def _parse_product_page(url: str) -> Dict:
-    html = _fetch(url)
-    out = {'source_url': url}
-    if not html:
-        return out
-    soup = BeautifulSoup(html, 'lxml')
-    og = _extract_og(soup)
-    out.update(og)
-    # attempt to find price by common selectors
-    selectors = [
-        '[itemprop=price]',
-        '.c-price',
-        '.price',
-        '.js-price',
-        '.pd-price',
-        '.dk-product-price',
-    ]
-    text = None
-    for sel in selectors:
-        el = soup.select_one(sel)
-        if el:
-            text = (el.get('content') or el.get_text() or '').strip()
-            if text:
-                break
-    if not text:
-        # fallback: search for text nodes with تومان or ریال
-        txt = soup.get_text(separator=' ', strip=True)
-        # limit length
-        text = txt[:2000]
-    price = _find_price_from_text(text)
-    if price:
-        out['price'] = price
-    # find first large image if no og:image
-    if 'image' not in out or not out.get('image'):
-        img = soup.find('img')
-        if img and img.get('src'):
-            out['image'] = img.get('src')
-    return out
-
-
-def _search_generic_site(search_url: str, query: str, link_host_substrs: List[str], limit: int = 6) -> List[Dict]:
+def _fetch(url: str, timeout: int = 6, deadline: Optional[float] = None) -> Optional[str]:
+    r = _get(url, timeout, deadline)
+    if r is not None and r.status_code == 200:
+        return r.text
+    return None
+
+
+def _parse_product_page(url: str, deadline: Optional[float] = None) -> Dict:
+    entry = _cache.lookup('page', url, PAGE_TTL)
+    if entry is not None and _cache.is_fresh(entry, PAGE_TTL):
+        return dict(entry.value)
+    headers = {}
+    if entry is not None:
+        # stale: let the site answer 304 instead of sending the page again
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    res = _get_page(url, deadline=deadline, headers=headers or None)
+    if entry is not None and res is not None and res[0] == 304:
+        return dict(_cache.revalidated('page', url, entry).value)
+    if res is None or res[0] != 200:
+        # a stale copy beats an empty result when the site is slow or throttling us
+        if entry is not None:
+            return dict(entry.value)
+        left = _remaining(deadline)
+        return {'source_url': url, 'partial': True} if left is not None and left <= 0 else {'source_url': url}
+    _, resp_headers, fields = res
+    out = {'source_url': url, **fields}
+    if fields:
+        _cache.put('page', url, out, etag=resp_headers.get('ETag'), last_modified=resp_headers.get('Last-Modified'))
+    return dict(out)  # callers fill in listing data; keep that out of the cached entry
+
+
+def _search_generic_site(search_url: str, query: str, link_host_substrs: List[str], limit: int = 6,
+                         deadline: Optional[float] = None) -> List[Dict]:
     qurl = search_url.format(q=requests.utils.requote_uri(query))
-    html = _fetch(qurl)
+    html = _fetch(qurl, deadline=deadline)
     if not html:
         return []
-    soup = BeautifulSoup(html, 'lxml')
+    soup = BeautifulSoup(html, _PARSER)
     results = []
     anchors = soup.find_all('a', href=True)
     seen = set()
@@ -122,54 +167,105 @@ def _search_generic_site(search_url: str, query: str, link_host_substrs: List[st
                 break
         if len(results) >= limit:
             break
-    # for each result, try to fetch product page for OG and price
+    # fetch the product pages concurrently for OG data and price; pages that miss the deadline keep the listing data
+    futures = [_fetch_pool.submit(_parse_product_page, r['link'], deadline) for r in results]
+    wait(futures, timeout=_remaining(deadline))
     enriched = []
-    for r in results:
-        try:
-            detail = _parse_product_page(r['link'])
-            if not detail.get('title') and r.get('title'):
-                detail['title'] = r.get('title')
-            if not detail.get('image') and r.get('image'):
-                detail['image'] = r.get('image')
-            detail['link'] = r['link']
-            enriched.append(detail)
-        except Exception as e:
-            logger.debug(f"error parsing detail {r.get('link')}: {e}")
+    for r, fut in zip(results, futures):
+        detail = {'source_url': r['link'], 'partial': True}
+        if fut.done():
+            try:
+                detail = fut.result()
+            except Exception as e:
+                logger.debug(f"error parsing detail {r.get('link')}: {e}")
+        else:
+            fut.cancel()
+        if not detail.get('title') and r.get('title'):
+            detail['title'] = r.get('title')
+        if not detail.get('image') and r.get('image'):
+            detail['image'] = r.get('image')
+        detail['link'] = r['link']
+        enriched.append(detail)
     return enriched
 
 
-def search_digikala(query: str, limit: int = 6) -> List[Dict]:
+def search_digikala(query: str, limit: int = 6, deadline: Optional[float] = None) -> List[Dict]:
     # Digikala search page
     url = 'https://www.digikala.com/search/?q={q}'
-    return _search_generic_site(url, query, ['digikala.com'], limit=limit)
+    return _search_generic_site(url, query, ['digikala.com'], limit=limit, deadline=deadline)
 
 
-def search_torob(query: str, limit: int = 6) -> List[Dict]:
+def search_torob(query: str, limit: int = 6, deadline: Optional[float] = None) -> List[Dict]:
     url = 'https://torob.com/search?q={q}'
-    return _search_generic_site(url, query, ['torob.com'], limit=limit)
+    return _search_generic_site(url, query, ['torob.com'], limit=limit, deadline=deadline)
 
 
-def search_emalls(query: str, limit: int = 6) -> List[Dict]:
+def search_emalls(query: str, limit: int = 6, deadline: Optional[float] = None) -> List[Dict]:
     # try emalls.ir and similar marketplaces
     url = 'https://www.emalls.ir/search?q={q}'
-    return _search_generic_site(url, query, ['emalls.ir', 'emalls.com'], limit=limit)
+    return _search_generic_site(url, query, ['emalls.ir', 'emalls.com'], limit=limit, deadline=deadline)
 
 
-def aggregate_search(query: str, sources: Optional[List[str]] = None, limit: int = 6) -> Dict:
+SOURCES = {
+    'digikala': search_digikala,
+    'torob': search_torob,
+    'emalls': search_emalls,
+}
+SOURCE_ALIASES = {'emall': 'emalls', 'emallz': 'emalls'}
+
+
+def _search_key(query: str, sources: List[str], limit: int) -> str:
+    return json.dumps([' '.join(query.lower().split()), sorted(sources), limit], ensure_ascii=False)
+
+
+def aggregate_search(query: str, sources: Optional[List[str]] = None, limit: int = 6,
+                     timeout: Optional[float] = None, use_cache: bool = True) -> Dict:
+    """Search the marketplaces concurrently; whatever is ready after `timeout` seconds (DEADLINE) is returned.
+
+    Sources that had not answered by then are listed in `timed_out`; product
+    pages still loading come back with their listing data and `partial: True`.
+    Complete results are cached for SEARCH_TTL (`cached: true` in the response).
+    """
     if not sources:
-        sources = ['digikala', 'torob', 'emalls']
+        sources = list(SOURCES)
+    started = time.monotonic()
+    key = _search_key(query, [SOURCE_ALIASES.get(s, s) for s in sources], limit)
+    if use_cache:
+        entry = _cache.lookup('search', key, SEARCH_TTL)
+        if entry is not None and _cache.is_fresh(entry, SEARCH_TTL):
+            return dict(entry.value, query=query, cached=True,
+                        elapsed_ms=int((time.monotonic() - started) * 1000))
+    deadline = started + (timeout if timeout is not None else DEADLINE)
     out = {}
+    futures = {}
     for s in sources:
+        name = SOURCE_ALIASES.get(s, s)
+        if name in SOURCES:
+            futures[name] = _site_pool.submit(SOURCES[name], query, limit, deadline)
+        else:
+            out[s] = []
+    # site searches stop waiting for their pages at the deadline; allow them a moment to assemble results
+    wait(futures.values(), timeout=max(0.0, _remaining(deadline)) + 0.25)
+    timed_out = []
+    failed = False
+    for name, fut in futures.items():
+        if not fut.done():
+            fut.cancel()
+            timed_out.append(name)
+            out[name] = []
+            continue
         try:
-            if s == 'digikala':
-                out['digikala'] = search_digikala(query, limit=limit)
-            elif s == 'torob':
-                out['torob'] = search_torob(query, limit=limit)
-            elif s == 'emalls' or s == 'emall' or s == 'emallz':
-                out['emalls'] = search_emalls(query, limit=limit)
-            else:
-                out[s] = []
+            out[name] = fut.result()
         except Exception as e:
-            logger.debug(f"error searching {s}: {e}")
-            out[s] = []
-    return {'query': query, 'results': out}
+            logger.debug(f"error searching {name}: {e}")
+            out[name] = []
+            failed = True
+    res = {'query': query, 'results': out, 'timed_out': timed_out}
+    complete = not timed_out and not failed and not any(r.get('partial') for rs in out.values() for r in rs)
+    if use_cache and complete and any(out.values()):
+        _cache.put('search', key, res)
+    return dict(res, cached=False, elapsed_ms=int((time.monotonic() - started) * 1000))
+
+
+def cache_stats() -> Dict:
+    return _cache.stats()
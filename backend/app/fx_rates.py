@@ -0,0 +1,209 @@
+"""Currency and crypto quotes for the dashboard, refreshed in the background.
+
+A refresher thread fetches the providers every FX_REFRESH_INTERVAL seconds,
+appends the quotes to the fx_rates table and keeps the latest good snapshot in
+the shared store (shared_store.py), so every worker serves the same values.
+Only one worker refreshes per interval: the first to increment that
+interval's key in the shared store.
+
+Reads (`current_prices`, behind /api/dashboard/prices) never touch the
+network. They return the snapshot, marked `stale` when it is older than
+FX_STALE_AFTER or the last refresh of that kind failed. When the shared store
+is empty, one worker per FX_WAKE_COOLDOWN rebuilds it from the newest fx_rates
+rows or, with nothing recorded yet (the startup fetch failed), wakes its
+refresher to fetch right away instead of at the next interval.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+
+from . import db, http_client, models, shared_store
+
+LOGGER = logging.getLogger(__name__)
+
+ENABLED = os.getenv('FX_REFRESH_ENABLED', '1').lower() not in ('0', 'false', 'no')
+INTERVAL = float(os.getenv('FX_REFRESH_INTERVAL', '300'))
+STALE_AFTER = float(os.getenv('FX_STALE_AFTER', str(INTERVAL * 3)))
+REQUEST_TIMEOUT = float(os.getenv('FX_REQUEST_TIMEOUT', '5'))
+WAKE_COOLDOWN = int(os.getenv('FX_WAKE_COOLDOWN', '30'))  # seconds between out-of-interval fetches, across workers
+
+SNAPSHOT_KEY = 'fx_rates:snapshot'
+WAKE_KEY = 'fx_rates:wake'
+
+
+def _parse_fx(data: dict) -> Dict[str, float]:
+    return {symbol: float(rate) for symbol, rate in (data.get('rates') or {}).items() if rate is not None}
+
+
+def _parse_crypto(data: dict) -> Dict[str, float]:
+    return {coin: float(q['usd']) for coin, q in data.items() if isinstance(q, dict) and q.get('usd') is not None}
+
+
+PROVIDERS = {
+    'fx': {
+        'url': 'https://api.exchangerate.host/latest?base=USD&symbols=EUR,IRR,USD',
+        'source': 'exchangerate.host', 'base': 'USD', 'parse': _parse_fx,
+    },
+    'crypto': {
+        'url': 'https://api.coingecko.com/api/v3/simple/price?ids=bitcoin,ethereum&vs_currencies=usd',
+        'source': 'coingecko', 'base': 'usd', 'parse': _parse_crypto,
+    },
+}
+
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def fetch(kind: str) -> Dict[str, float]:
+    provider = PROVIDERS[kind]
+    r = http_client.get(provider['url'], timeout=REQUEST_TIMEOUT, provider=provider['source'])
+    r.raise_for_status()
+    quotes = provider['parse'](r.json())
+    if not quotes:
+        raise ValueError(f'{provider["source"]} returned no quotes')
+    return quotes
+
+
+def _aware(dt: datetime) -> datetime:
+    # SQLite hands timezone=True columns back naive; they were written in UTC
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def refresh(session, store=None) -> Dict[str, bool]:
+    """Fetch every provider, record the quotes and update the shared snapshot. Returns kind -> success."""
+    store = store or shared_store.get_store()
+    snapshot = store.get(SNAPSHOT_KEY) or {}
+    now = datetime.now(timezone.utc)
+    ok = {}
+    for kind, provider in PROVIDERS.items():
+        try:
+            quotes = fetch(kind)
+        except Exception as e:
+            LOGGER.warning('fx refresh %s failed, keeping the last good quotes: %s', kind, e)
+            if kind in snapshot:
+                snapshot[kind]['error'] = str(e)[:200]
+            ok[kind] = False
+            continue
+        session.add_all([
+            models.FxRate(kind=kind, symbol=symbol, base=provider['base'], rate=rate,
+                          source=provider['source'], fetched_at=now)
+            for symbol, rate in quotes.items()
+        ])
+        snapshot[kind] = {'quotes': quotes, 'base': provider['base'], 'source': provider['source'],
+                          'fetched_at': now.isoformat(), 'error': None}
+        ok[kind] = True
+    session.commit()
+    store.set(SNAPSHOT_KEY, snapshot)
+    return ok
+
+
+def snapshot_from_db(session) -> Dict[str, Any]:
+    """Latest recorded quotes per kind, in the shared snapshot's shape."""
+    snapshot = {}
+    for kind in PROVIDERS:
+        latest = session.query(func.max(models.FxRate.fetched_at)).filter(models.FxRate.kind == kind).scalar()
+        if latest is None:
+            continue
+        rows = session.query(models.FxRate).filter(models.FxRate.kind == kind, models.FxRate.fetched_at == latest).all()
+        snapshot[kind] = {'quotes': {r.symbol: r.rate for r in rows}, 'base': rows[0].base, 'source': rows[0].source,
+                          'fetched_at': _aware(latest).isoformat(), 'error': None}
+    return snapshot
+
+
+def current_prices(store=None, session_factory=None) -> Dict[str, Any]:
+    """Last good quotes without any network call.
+
+    {'fx': {'EUR': .., 'IRR': ..}, 'crypto': {'bitcoin': {'usd': ..}}, 'updated_at': {kind: iso},
+     'stale': bool}; a kind never fetched yet is None and counts as stale.
+    """
+    store = store or shared_store.get_store()
+    snapshot = store.get(SNAPSHOT_KEY)
+    if not snapshot and store.incr(WAKE_KEY, ttl=WAKE_COOLDOWN) == 1:
+        session = (session_factory or db.SessionLocal)()
+        try:
+            snapshot = snapshot_from_db(session)
+        except Exception as e:
+            LOGGER.debug('fx snapshot from the database failed: %s', e)
+            snapshot = {}
+        finally:
+            session.close()
+        if snapshot:
+            store.set(SNAPSHOT_KEY, snapshot)
+        else:
+            _WAKE.set()  # this worker's refresher fetches now, outside the interval claim
+    snapshot = snapshot or {}
+    now = datetime.now(timezone.utc)
+    out: Dict[str, Any] = {'fx': None, 'crypto': None, 'updated_at': {}, 'stale': False}
+    for kind in PROVIDERS:
+        entry = snapshot.get(kind)
+        if not entry:
+            out['stale'] = True
+            continue
+        quotes = entry['quotes']
+        out[kind] = quotes if kind == 'fx' else {coin: {entry['base']: rate} for coin, rate in quotes.items()}
+        out['updated_at'][kind] = entry['fetched_at']
+        age = (now - datetime.fromisoformat(entry['fetched_at'])).total_seconds()
+        if entry.get('error') or age > STALE_AFTER:
+            out['stale'] = True
+    return out
+
+
+def history(session, kind: str, symbol: str, since: Optional[datetime] = None, limit: int = 500) -> List[dict]:
+    q = session.query(models.FxRate).filter(models.FxRate.kind == kind, models.FxRate.symbol == symbol)
+    if since is not None:
+        q = q.filter(models.FxRate.fetched_at >= since)
+    rows = q.order_by(models.FxRate.fetched_at.desc()).limit(limit).all()
+    return [{'rate': r.rate, 'base': r.base, 'fetched_at': _aware(r.fetched_at).isoformat()} for r in reversed(rows)]
+
+
+def _claim(store) -> bool:
+    """True for the one worker that refreshes in the current interval."""
+    slot = int(time.time() // INTERVAL)
+    return store.incr(f'fx_rates:refresh:{slot}', ttl=int(INTERVAL * 2) + 1) == 1
+
+
+def _run(session_factory):
+    woken = False
+    while not _STOP.is_set():
+        try:
+            store = shared_store.get_store()
+            if woken or _claim(store):
+                session = session_factory()
+                try:
+                    refresh(session, store)
+                except Exception as e:
+                    session.rollback()
+                    LOGGER.warning('fx refresh failed: %s', e)
+                finally:
+                    session.close()
+        except Exception as e:
+            LOGGER.warning('fx refresher error: %s', e)
+        # next interval boundary, jittered so workers do not race the store at the same instant
+        woken = _WAKE.wait(INTERVAL - time.time() % INTERVAL + random.uniform(0, 3))
+        _WAKE.clear()
+
+
+def start(session_factory=None):
+    global _THREAD
+    if not ENABLED or _THREAD is not None:
+        return
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='fx-refresher', daemon=True)
+    _THREAD.start()
+
+
+def stop(timeout: float = 10.0):
+    global _THREAD
+    if _THREAD is None:
+        return
+    _STOP.set()
+    _WAKE.set()
+    _THREAD.join(timeout)
+    _THREAD = None
@@ -0,0 +1,277 @@
+"""Shared client for outbound HTTP calls (SMS gateway, FX / crypto providers,
+integrations, marketplaces).
+
+One requests.Session per process, so connections to a host are kept alive
+and reused from a per-host pool instead of paying a TCP + TLS handshake per
+call. On top of it:
+
+- default (connect, read) timeouts
+- retries with exponential backoff and jitter on connection errors and
+  429/502/503/504 (Retry-After is honoured). Non-idempotent calls, and calls
+  flagged idempotent=False such as sending an SMS, are retried only when the
+  connection could not be opened.
+- a circuit breaker per provider (default: the host). After BREAKER_FAILURES
+  consecutive failures the provider is not called for BREAKER_COOLDOWN
+  seconds and CircuitOpenError is raised at once; then a single trial call
+  decides whether to close it again.
+- per-host metrics (`stats()`): requests, errors, retries, status classes,
+  latency.
+
+`stub(prefix, handler)` mounts a local stand-in for every URL under `prefix`,
+for tests and offline development.
+"""
+import io
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+LOGGER = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.25'))
+BACKOFF_MAX = 5.0
+BREAKER_FAILURES = int(os.getenv('HTTP_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('HTTP_BREAKER_COOLDOWN', '30'))
+POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=POOL_SIZE, max_retries=0)
+_session.mount('http://', _adapter)
+_session.mount('https://', _adapter)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The provider failed repeatedly and is not being called for now."""
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.trial:
+                return False
+            self.trial = True  # one call decides
+            return True
+
+    def release(self):
+        """The call ended without telling anything about the provider."""
+        with self._lock:
+            self.trial = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self.trial = False
+            if ok:
+                self.consecutive = 0
+                self.opened_at = None
+                return
+            self.consecutive += 1
+            if self.opened_at is not None or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_metrics: Dict[str, Dict] = {}
+_lock = threading.Lock()
+
+
+def _breaker(provider: str) -> CircuitBreaker:
+    with _lock:
+        b = _breakers.get(provider)
+        if b is None:
+            b = _breakers[provider] = CircuitBreaker()
+        return b
+
+
+def _metric(host: str) -> Dict:
+    m = _metrics.get(host)
+    if m is None:
+        m = _metrics[host] = {'requests': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0,
+                              'status': {}, 'latency_ms_total': 0.0, 'latency_ms_max': 0.0}
+    return m
+
+
+def _record(host: str, latency_ms: float, status: Optional[int], retries: int):
+    with _lock:
+        m = _metric(host)
+        m['requests'] += 1
+        m['retries'] += retries
+        m['latency_ms_total'] += latency_ms
+        m['latency_ms_max'] = max(m['latency_ms_max'], latency_ms)
+        if status is None:
+            m['errors'] += 1
+        else:
+            cls = f'{status // 100}xx'
+            m['status'][cls] = m['status'].get(cls, 0) + 1
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    value = resp.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def request(method: str, url: str, provider: Optional[str] = None, timeout=None, retries: Optional[int] = None,
+            idempotent: Optional[bool] = None, deadline_bound: bool = False, **kwargs) -> requests.Response:
+    """Send through the shared session. Raises requests exceptions (CircuitOpenError when the breaker is open).
+
+    `deadline_bound`: the timeout was cut to the caller's own deadline, so a
+    timeout says nothing about the provider and does not count against its breaker.
+    """
+    method = method.upper()
+    host = urlsplit(url).netloc
+    breaker = _breaker(provider or host)
+    if not breaker.allow():
+        with _lock:
+            _metric(host)['short_circuited'] += 1
+        raise CircuitOpenError(f'{provider or host} is failing; not called for up to {breaker.cooldown:.0f}s')
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    retries = RETRIES if retries is None else retries
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            resp = _session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException as e:
+            # without idempotency only a connection that never opened is safe to repeat
+            retryable = isinstance(e, requests.ConnectTimeout) or (
+                idempotent and isinstance(e, (requests.ConnectionError, requests.Timeout)))
+            if attempt < retries and retryable:
+                time.sleep(_backoff(attempt))
+                attempt += 1
+                continue
+            _record(host, (time.monotonic() - started) * 1000, None, attempt)
+            if deadline_bound and isinstance(e, requests.Timeout):
+                breaker.release()
+            else:
+                breaker.record(False)
+            raise
+        if resp.status_code in RETRY_STATUSES and idempotent and attempt < retries:
+            delay = _retry_after(resp)
+            if delay is None or delay <= BACKOFF_MAX:
+                resp.close()
+                time.sleep(delay if delay is not None else _backoff(attempt))
+                attempt += 1
+                continue
+        _record(host, (time.monotonic() - started) * 1000, resp.status_code, attempt)
+        breaker.record(resp.status_code < 500 and resp.status_code != 429)
+        return resp
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
+
+
+def stats() -> Dict:
+    with _lock:
+        hosts = {}
+        for host, m in _metrics.items():
+            out = dict(m, status=dict(m['status']))
+            out['latency_ms_avg'] = round(m['latency_ms_total'] / m['requests'], 1) if m['requests'] else None
+            out['latency_ms_max'] = round(m['latency_ms_max'], 1)
+            del out['latency_ms_total']
+            hosts[host] = out
+        breakers = {name: {'state': b.state, 'consecutive_failures': b.consecutive} for name, b in _breakers.items()}
+    return {'hosts': hosts, 'breakers': breakers}
+
+
+def reset():
+    """Forget metrics and breaker state (tests)."""
+    with _lock:
+        _metrics.clear()
+        _breakers.clear()
+
+
+class StubAdapter(BaseAdapter):
+    """Answers requests from `handler(request)` instead of the network.
+
+    The handler returns a requests.Response, or (status, body) / (status, body, headers)
+    with a str, bytes or JSON-serializable body, or raises a requests exception.
+    """
+
+    def __init__(self, handler: Callable):
+        super().__init__()
+        self.handler = handler
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        result = self.handler(request)
+        if isinstance(result, requests.Response):
+            return result
+        status, body, headers = (tuple(result) + ({},))[:3]
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+            headers = {'Content-Type': 'application/json', **headers}
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers.update(headers)
+        resp.raw = io.BytesIO(body.encode('utf-8') if isinstance(body, str) else body)
+        resp.url = request.url
+        resp.request = request
+        resp.encoding = 'utf-8'
+        return resp
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def stub(prefix: str, handler: Callable):
+    """Route every outbound request whose URL starts with `prefix` to `handler` while active."""
+    previous = _session.adapters.get(prefix)
+    _session.mount(prefix, StubAdapter(handler))
+    try:
+        yield
+    finally:
+        if previous is not None:
+            _session.mount(prefix, previous)
+        else:
+            _session.adapters.pop(prefix, None)
@@ -0,0 +1,323 @@
+"""Incremental sync of the ICC hierarchy (category > center > unit > extension).
+
+Each level is pulled from the `sync_url` of the rows one level up: the root
+URL (ICC_SYNC_URL) lists the categories, a category's sync_url its centers, a
+center's its units and a unit's its extensions. A source answers
+
+    GET <sync_url>?since=<iso datetime>
+    {"items": [{"external_id": .., "name": .., ..., "sync_url": ..}], "next": <url or null>}
+
+(a bare JSON list is accepted too) with only the children changed after
+`since`; `next` pages through long lists. `since` is the parent's
+last_synced_at, moved to the start time of a successful pull, so a run only
+transfers what changed. A parent whose pull failed keeps its old cursor and
+is asked again next time. The root's cursor is the `icc_sync_root_cursor`
+system setting.
+
+The URLs of a level are fetched concurrently (ICC_SYNC_CONCURRENCY threads
+through http_client). The level is then diffed on external_id against the
+table and applied with one bulk INSERT and one bulk UPDATE in a single
+transaction. Rows missing from a source are left alone. A level that
+changed bumps the ICC tree version (icc_tree.invalidate).
+
+Runs on demand (`run`, the admin endpoint, `python -m app.icc_sync`) and,
+when ICC_SYNC_INTERVAL > 0, on a background thread.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+from sqlalchemy import insert, update
+
+from . import db, http_client, icc_tree, models, shared_store
+
+LOGGER = logging.getLogger(__name__)
+
+ROOT_URL = os.getenv('ICC_SYNC_URL', '')
+CONCURRENCY = int(os.getenv('ICC_SYNC_CONCURRENCY', '8'))
+INTERVAL = float(os.getenv('ICC_SYNC_INTERVAL', '0'))  # seconds; 0 = on demand only
+REQUEST_TIMEOUT = float(os.getenv('ICC_SYNC_TIMEOUT', '15'))
+MAX_PAGES = 1000  # per parent, against a source whose `next` never ends
+CHUNK = 500  # external_ids per lookup query
+
+ROOT_CURSOR_KEY = 'icc_sync_root_cursor'
+
+Level = namedtuple('Level', 'name model parent parent_column fields')
+
+LEVELS = [
+    Level('categories', models.IccCategory, None, None,
+          ('name', 'description', 'parent_external_id', 'sync_url')),
+    Level('centers', models.IccCenter, models.IccCategory, 'category_id',
+          ('name', 'address', 'phone', 'manager_name', 'location_lat', 'location_lng', 'sync_url')),
+    Level('units', models.IccUnit, models.IccCenter, 'center_id',
+          ('name', 'description', 'unit_type', 'capacity', 'sync_url')),
+    Level('extensions', models.IccExtension, models.IccUnit, 'unit_id',
+          ('name', 'responsible_name', 'responsible_mobile', 'status', 'sync_url')),
+]
+
+_RUN_LOCK = threading.Lock()
+_last_result: Optional[Dict] = None
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timezone=True columns back naive; they were written in UTC
+    if dt is None:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def fetch_items(url: str, since: Optional[datetime] = None) -> List[dict]:
+    """Every item listed at `url` (following `next`), changed after `since` when given."""
+    params = {'since': since.isoformat()} if since else None
+    items: List[dict] = []
+    for _ in range(MAX_PAGES):
+        r = http_client.get(url, params=params, timeout=REQUEST_TIMEOUT, provider='icc')
+        r.raise_for_status()
+        data = r.json()
+        if isinstance(data, list):
+            items.extend(data)
+            return items
+        items.extend(data.get('items') or [])
+        if not data.get('next'):
+            return items
+        url = urljoin(url, data['next'])
+        params = None  # the next link carries its own query
+    raise ValueError(f'{url}: more than {MAX_PAGES} pages')
+
+
+def _value(field: str, value):
+    if value is None or value == '':
+        return None
+    if field == 'capacity':
+        return int(value)
+    return str(value)
+
+
+def _row(level: Level, item) -> Optional[dict]:
+    if not isinstance(item, dict):
+        return None
+    external_id = item.get('external_id', item.get('id'))
+    name = item.get('name')
+    if external_id in (None, '') or not name:
+        return None
+    try:
+        row = {field: _value(field, item.get(field)) for field in level.fields}
+    except (TypeError, ValueError):
+        return None
+    if level.name == 'extensions' and row['status'] is None:
+        row['status'] = 'active'
+    row['external_id'] = str(external_id)
+    return row
+
+
+def _root_cursor(session) -> Tuple[Optional[models.SystemSettings], Optional[datetime]]:
+    setting = session.query(models.SystemSettings).filter(models.SystemSettings.key == ROOT_CURSOR_KEY).first()
+    if setting is None or not setting.value:
+        return setting, None
+    try:
+        return setting, _aware(datetime.fromisoformat(setting.value))
+    except ValueError:
+        return setting, None
+
+
+def _parents(session, level: Level, full: bool) -> List[Tuple[Optional[int], str, Optional[datetime]]]:
+    """(parent id, url, since) for every source of `level`."""
+    if level.parent is None:
+        if not ROOT_URL:
+            return []
+        _, since = _root_cursor(session)
+        return [(None, ROOT_URL, None if full else since)]
+    p = level.parent
+    rows = session.query(p.id, p.sync_url, p.last_synced_at).filter(p.sync_url.isnot(None), p.sync_url != '')
+    return [(pid, url, None if full else _aware(synced)) for pid, url, synced in rows.order_by(p.id)]
+
+
+def _fetch_level(parents, pool: ThreadPoolExecutor):
+    futures = [(pid, url, pool.submit(fetch_items, url, since)) for pid, url, since in parents]
+    fetched, failed = [], []
+    for pid, url, fut in futures:
+        try:
+            fetched.append((pid, fut.result()))
+        except Exception as e:
+            LOGGER.warning('icc sync: %s failed: %s', url, e)
+            failed.append({'url': url, 'error': str(e)[:200]})
+    return fetched, failed
+
+
+def _existing(session, level: Level, external_ids: List[str]) -> Dict[str, tuple]:
+    m = level.model
+    columns = [m.id, m.external_id] + [getattr(m, f) for f in level.fields]
+    if level.parent_column:
+        columns.append(getattr(m, level.parent_column))
+    out = {}
+    for i in range(0, len(external_ids), CHUNK):
+        for row in session.query(*columns).filter(m.external_id.in_(external_ids[i:i + CHUNK])):
+            out[row[1]] = tuple(row)
+    return out
+
+
+def sync_level(session, level: Level, pool: ThreadPoolExecutor, full: bool = False) -> Dict:
+    """Pull, diff and apply one level in one transaction."""
+    started = time.monotonic()
+    pulled_at = _now()
+    parents = _parents(session, level, full)
+    fetched, failed = _fetch_level(parents, pool)
+
+    rows: Dict[str, dict] = {}
+    skipped = 0
+    for pid, items in fetched:
+        for item in items:
+            row = _row(level, item)
+            if row is None:
+                skipped += 1
+                continue
+            if level.parent_column:
+                row[level.parent_column] = pid
+            rows[row['external_id']] = row  # the same id under two parents: the last one wins
+
+    keys = list(level.fields) + ([level.parent_column] if level.parent_column else [])
+    existing = _existing(session, level, list(rows))
+    inserts, updates = [], []
+    for external_id, row in rows.items():
+        current = existing.get(external_id)
+        if current is None:
+            inserts.append(row)
+        elif tuple(row[k] for k in keys) != current[2:]:
+            updates.append(dict(row, id=current[0], updated_at=pulled_at))
+
+    try:
+        if inserts:
+            session.execute(insert(level.model), inserts)
+        if updates:
+            session.execute(update(level.model), updates)
+        ok_parents = [pid for pid, _ in fetched]
+        if level.parent is None:
+            if fetched:
+                setting, _ = _root_cursor(session)
+                if setting is None:
+                    setting = models.SystemSettings(key=ROOT_CURSOR_KEY, setting_type='string', category='icc',
+                                                    display_name='ICC sync cursor')
+                    session.add(setting)
+                setting.value = pulled_at.isoformat()
+        elif ok_parents:
+            session.execute(update(level.parent), [{'id': pid, 'last_synced_at': pulled_at} for pid in ok_parents])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    if inserts or updates:
+        icc_tree.invalidate()
+    return {
+        'sources': len(parents), 'failed': len(failed), 'errors': failed[:20], 'fetched': len(rows),
+        'inserted': len(inserts), 'updated': len(updates), 'unchanged': len(rows) - len(inserts) - len(updates),
+        'skipped': skipped, 'ms': int((time.monotonic() - started) * 1000),
+    }
+
+
+def sync(session, full: bool = False, concurrency: int = CONCURRENCY) -> Dict:
+    """Sync every level top-down; a level that fails to apply does not stop the ones below."""
+    started_at = _now()
+    levels = {}
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix='icc-sync') as pool:
+        for level in LEVELS:
+            try:
+                levels[level.name] = sync_level(session, level, pool, full)
+            except Exception as e:
+                LOGGER.exception('icc sync: applying %s failed', level.name)
+                levels[level.name] = {'error': str(e)[:200]}
+    return {'started_at': started_at.isoformat(), 'finished_at': _now().isoformat(), 'full': full, 'levels': levels}
+
+
+def run(session_factory=None, full: bool = False) -> Optional[Dict]:
+    """One sync unless another is running in this process (then None)."""
+    global _last_result
+    if not _RUN_LOCK.acquire(blocking=False):
+        return None
+    try:
+        session = (session_factory or db.SessionLocal)()
+        try:
+            _last_result = sync(session, full=full)
+        finally:
+            session.close()
+        return _last_result
+    finally:
+        _RUN_LOCK.release()
+
+
+def run_in_background(session_factory=None, full: bool = False) -> bool:
+    """Start `run` on a thread; False when a sync is already running."""
+    if _RUN_LOCK.locked():
+        return False
+    threading.Thread(target=run, args=(session_factory, full), name='icc-sync-run', daemon=True).start()
+    return True
+
+
+def status() -> Dict:
+    return {'running': _RUN_LOCK.locked(), 'last': _last_result, 'root_url': ROOT_URL or None, 'interval': INTERVAL}
+
+
+def _claim(store) -> bool:
+    """True for the one worker that syncs in the current interval."""
+    slot = int(time.time() // INTERVAL)
+    return store.incr(f'icc_sync:run:{slot}', ttl=int(INTERVAL * 2) + 1) == 1
+
+
+def _run(session_factory):
+    while not _STOP.is_set():
+        try:
+            if _claim(shared_store.get_store()):
+                run(session_factory)
+        except Exception as e:
+            LOGGER.warning('icc sync failed: %s', e)
+        _WAKE.wait(INTERVAL - time.time() % INTERVAL + random.uniform(0, 3))
+        _WAKE.clear()
+
+
+def start(session_factory=None):
+    global _THREAD
+    if INTERVAL <= 0 or not ROOT_URL or _THREAD is not None:
+        return
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='icc-sync', daemon=True)
+    _THREAD.start()
+
+
+def stop(timeout: float = 10.0):
+    global _THREAD
+    if _THREAD is None:
+        return
+    _STOP.set()
+    _WAKE.set()
+    _THREAD.join(timeout)
+    _THREAD = None
+
+
+def main():
+    global ROOT_URL
+    parser = argparse.ArgumentParser(description='Sync the ICC hierarchy from its sync URLs')
+    parser.add_argument('--url', default=ROOT_URL, help='root URL listing the categories (default ICC_SYNC_URL)')
+    parser.add_argument('--full', action='store_true', help='ignore the cursors and pull everything')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    ROOT_URL = args.url
+    print(json.dumps(run(full=args.full), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""The ICC hierarchy (category > center > unit > extension) as one nested tree.
+
+`build` loads each requested level with one column-only query, filtered to
+the subtree by a nested IN (SELECT ...) on the level above, and links the
+rows in memory: at most four queries whatever the size of the tree.
+
+Serialized trees are cached per process under the ICC version, a counter in
+the shared store that every ICC write bumps (`invalidate`: the async_crud
+writers and icc_sync). The ETag is made from that version and the request
+parameters, so a matching If-None-Match is answered with 304 from the
+version alone, without a query.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from . import models, shared_store
+
+CACHE_SIZE = int(os.getenv('ICC_TREE_CACHE_SIZE', '16'))
+VERSION_KEY = 'icc_tree:version'
+
+Level = namedtuple('Level', 'name model parent_column fields')
+
+LEVELS = [
+    Level('category', models.IccCategory, None, ('parent_external_id',)),
+    Level('center', models.IccCenter, 'category_id', ('phone', 'manager_name')),
+    Level('unit', models.IccUnit, 'center_id', ('unit_type', 'capacity')),
+    Level('extension', models.IccExtension, 'unit_id', ('responsible_name', 'responsible_mobile', 'status')),
+]
+LEVEL_NAMES = [level.name for level in LEVELS]
+
+_cache: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+_lock = threading.Lock()
+
+
+def version(store=None) -> int:
+    store = store or shared_store.get_store()
+    value = store.get(VERSION_KEY)
+    if value is None:
+        # an emptied store must not hand out tags issued before it was emptied
+        value = int(time.time() * 1000)
+        store.set(VERSION_KEY, value)
+    return int(value)
+
+
+def invalidate(store=None):
+    """Call after any write to the ICC tables."""
+    store = store or shared_store.get_store()
+    version(store)
+    store.incr(VERSION_KEY)
+
+
+def build(session, root: Optional[str] = None, root_id: Optional[int] = None,
+          depth: Optional[int] = None) -> Optional[List[Dict]]:
+    """Nested nodes from `root` (a level name and row id; None for every category) down `depth` levels.
+
+    `depth` counts levels including the root's (1: the root nodes only). Returns None when the root does not exist.
+    """
+    start = LEVEL_NAMES.index(root) if root else 0
+    end = len(LEVELS) if depth is None else min(len(LEVELS), start + max(depth, 1))
+    ids = None  # select of the previous level's ids in the subtree
+    nodes_by_level: List[Dict[int, Dict]] = []
+    for i in range(start, end):
+        level = LEVELS[i]
+        m = level.model
+        columns = [m.id, m.external_id, m.name] + [getattr(m, f) for f in level.fields]
+        if level.parent_column:
+            columns.append(getattr(m, level.parent_column))
+        if i == start and root:
+            cond = m.id == root_id
+        elif ids is not None:
+            cond = getattr(m, level.parent_column).in_(ids)
+        else:
+            cond = None
+        stmt = select(*columns) if cond is None else select(*columns).where(cond)
+        ids = select(m.id) if cond is None else select(m.id).where(cond)
+        nodes = {}
+        for row in session.execute(stmt.order_by(m.name, m.id)):
+            node = {'id': row[0], 'level': level.name, 'external_id': row[1], 'name': row[2]}
+            node.update(zip(level.fields, row[3:]))
+            if i + 1 < end:
+                node['children'] = []
+            if nodes_by_level and level.parent_column:
+                parent = nodes_by_level[-1].get(row[-1])
+                if parent is None:
+                    continue
+                parent['children'].append(node)
+            nodes[row[0]] = node
+        if i == start and root and not nodes:
+            return None
+        nodes_by_level.append(nodes)
+    return list(nodes_by_level[0].values()) if nodes_by_level else []
+
+
+def etag(ver: int, root: Optional[str], root_id: Optional[int], depth: Optional[int]) -> str:
+    return f'"icc-{ver}-{root or "all"}-{root_id or 0}-{depth or 0}"'
+
+
+def cached_tree(session, root: Optional[str] = None, root_id: Optional[int] = None,
+                depth: Optional[int] = None, store=None) -> Tuple[str, Optional[bytes]]:
+    """(etag, JSON body) for the tree; body is None when the root does not exist."""
+    ver = version(store)
+    key = (ver, root, root_id, depth)
+    with _lock:
+        body = _cache.get(key)
+        if body is not None:
+            _cache.move_to_end(key)
+            return etag(*key), body
+    tree = build(session, root, root_id, depth)
+    if tree is None:
+        return etag(*key), None
+    body = json.dumps(tree, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    with _lock:
+        _cache[key] = body
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return etag(*key), body
+
+
+def clear():
+    with _lock:
+        _cache.clear()
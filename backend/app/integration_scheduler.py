@@ -0,0 +1,274 @@
+"""Background refresh of enabled integrations on their own intervals.
+
+An IntegrationConfig's `config` JSON may set `interval` (seconds; default
+INTEGRATION_DEFAULT_INTERVAL). The scheduler thread wakes every TICK seconds,
+claims the enabled integrations whose next_run_at has passed and runs them on
+a pool of INTEGRATION_CONCURRENCY threads. Claiming is a conditional UPDATE
+that moves next_run_at forward by a lease and sets running_since, so with
+several app workers each due integration still runs once.
+
+Every run is stored in integration_runs (status, latency, payload sample) and
+summarised on the integration row (last_status, last_latency_ms,
+failure_count). A failed run is retried after a jittered exponential backoff
+instead of the normal interval. Admin pages read these rows; asking for a
+refresh only moves next_run_at earlier: not while a run is in flight, not
+sooner than MIN_INTERVAL after the last run, and not for an integration
+that is backing off.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import or_, update
+
+from . import db, integrations, models
+
+LOGGER = logging.getLogger(__name__)
+
+ENABLED = os.getenv('INTEGRATION_SCHEDULER_ENABLED', '1').lower() not in ('0', 'false', 'no')
+CONCURRENCY = int(os.getenv('INTEGRATION_CONCURRENCY', '4'))
+DEFAULT_INTERVAL = float(os.getenv('INTEGRATION_DEFAULT_INTERVAL', '900'))
+MIN_INTERVAL = 30.0
+BACKOFF_BASE = float(os.getenv('INTEGRATION_BACKOFF_BASE', '60'))
+BACKOFF_MAX = float(os.getenv('INTEGRATION_BACKOFF_MAX', '3600'))
+RUNS_RETENTION_DAYS = int(os.getenv('INTEGRATION_RUNS_RETENTION_DAYS', '30'))
+TICK = 5.0
+# a claimed run that has not finished by then (worker died) becomes due again
+LEASE = 600.0
+PAYLOAD_LIMIT = 4000
+
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+_POOL: Optional[ThreadPoolExecutor] = None
+_INFLIGHT: set = set()
+_INFLIGHT_LOCK = threading.Lock()
+_last_prune = 0.0
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: datetime) -> datetime:
+    # SQLite hands timezone=True columns back naive; they were written in UTC
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def interval_of(integration: models.IntegrationConfig) -> float:
+    try:
+        cfg = json.loads(integration.config) if integration.config else {}
+        value = float(cfg.get('interval') or cfg.get('interval_seconds') or DEFAULT_INTERVAL)
+    except (ValueError, TypeError, AttributeError):
+        value = DEFAULT_INTERVAL
+    return max(value, MIN_INTERVAL)
+
+
+def backoff_delay(failures: int) -> float:
+    """Seconds until the retry after `failures` consecutive failures (full jitter over the upper half)."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(failures - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _payload(sample) -> Optional[str]:
+    if sample is None:
+        return None
+    try:
+        text = json.dumps(sample, ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        text = str(sample)
+    return text[:PAYLOAD_LIMIT]
+
+
+def run_sample(run: models.IntegrationRun):
+    """The recorded payload as JSON, or None when absent or cut off at PAYLOAD_LIMIT."""
+    try:
+        return json.loads(run.payload) if run.payload else None
+    except ValueError:
+        return None
+
+
+def run_integration(session, integration: models.IntegrationConfig, trigger: str = 'schedule') -> models.IntegrationRun:
+    """Call the provider once, record the run and schedule the next one."""
+    started_at = _now()
+    started = time.monotonic()
+    try:
+        stat = integrations.fetch_integration_status(session, integration)
+    except Exception as e:
+        stat = {'status': f'error:{e}'}
+    latency_ms = int((time.monotonic() - started) * 1000)
+    status = str(stat.get('status') or 'unknown')
+    failed = status.startswith('error')
+    run = models.IntegrationRun(
+        integration_id=integration.id, trigger=trigger, started_at=started_at, latency_ms=latency_ms,
+        status=status[:64], error=status if failed else None, payload=_payload(stat.get('sample')),
+    )
+    session.add(run)
+    integration.failure_count = (integration.failure_count or 0) + 1 if failed else 0
+    integration.last_status = status[:64]
+    integration.last_latency_ms = latency_ms
+    integration.last_updated = _now()
+    integration.running_since = None
+    if failed:
+        delay = backoff_delay(integration.failure_count)
+    else:
+        # +-10% so integrations sharing an interval drift apart
+        delay = interval_of(integration) * random.uniform(0.9, 1.1)
+    integration.next_run_at = integration.last_updated + timedelta(seconds=delay)
+    session.commit()
+    return run
+
+
+def _claim(session, integration_id: int, now: datetime) -> bool:
+    ic = models.IntegrationConfig
+    res = session.execute(
+        update(ic)
+        .where(ic.id == integration_id, ic.enabled.is_(True), or_(ic.next_run_at.is_(None), ic.next_run_at <= now))
+        .values(next_run_at=now + timedelta(seconds=LEASE), running_since=now)
+    )
+    session.commit()
+    return res.rowcount == 1
+
+
+def _run_one(session_factory, integration_id: int):
+    session = session_factory()
+    try:
+        integration = session.get(models.IntegrationConfig, integration_id)
+        if integration is not None:
+            run = run_integration(session, integration)
+            LOGGER.debug('integration %s: %s in %d ms', integration.name, run.status, run.latency_ms)
+    except Exception as e:
+        session.rollback()
+        LOGGER.warning('integration %s refresh failed: %s', integration_id, e)
+    finally:
+        session.close()
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.discard(integration_id)
+        _WAKE.set()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix='integration')
+    return _POOL
+
+
+def _prune(session):
+    global _last_prune
+    if time.time() - _last_prune < 3600:
+        return
+    _last_prune = time.time()
+    cutoff = _now() - timedelta(days=RUNS_RETENTION_DAYS)
+    session.query(models.IntegrationRun).filter(models.IntegrationRun.started_at < cutoff).delete(synchronize_session=False)
+    session.commit()
+
+
+def tick(session_factory=None) -> List[int]:
+    """Claim due integrations up to the free concurrency and start them. Returns the claimed ids."""
+    session_factory = session_factory or db.SessionLocal
+    with _INFLIGHT_LOCK:
+        capacity = CONCURRENCY - len(_INFLIGHT)
+    if capacity <= 0:
+        return []
+    ic = models.IntegrationConfig
+    now = _now()
+    session = session_factory()
+    try:
+        due = [
+            iid for (iid,) in session.query(ic.id)
+            .filter(ic.enabled.is_(True), or_(ic.next_run_at.is_(None), ic.next_run_at <= now))
+            .order_by(ic.next_run_at, ic.id).limit(capacity + len(_INFLIGHT))
+        ]
+        claimed = []
+        for iid in due:
+            if len(claimed) >= capacity:
+                break
+            with _INFLIGHT_LOCK:
+                if iid in _INFLIGHT:
+                    continue
+            if _claim(session, iid, now):
+                claimed.append(iid)
+        _prune(session)
+    finally:
+        session.close()
+    pool = _get_pool()
+    for iid in claimed:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.add(iid)
+        pool.submit(_run_one, session_factory, iid)
+    return claimed
+
+
+def request_run(session, integration: models.IntegrationConfig) -> bool:
+    """Bring `integration`'s next run forward to now, or MIN_INTERVAL after its last run.
+
+    A run in flight (possibly on another worker) is left alone, as is the
+    retry of an integration that is backing off. False when nothing moved.
+    """
+    if integration.failure_count:
+        return False
+    ic = models.IntegrationConfig
+    now = _now()
+    due = now
+    if integration.last_updated is not None:
+        due = max(now, _aware(integration.last_updated) + timedelta(seconds=MIN_INTERVAL))
+    res = session.execute(
+        update(ic)
+        .where(ic.id == integration.id, ic.enabled.is_(True), ic.failure_count == 0,
+               or_(ic.running_since.is_(None), ic.running_since < now - timedelta(seconds=LEASE)),
+               or_(ic.next_run_at.is_(None), ic.next_run_at > due))
+        .values(next_run_at=due)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    if res.rowcount:
+        _WAKE.set()
+    return res.rowcount == 1
+
+
+def recent_runs(session, integration_id: int, limit: int = 20) -> List[models.IntegrationRun]:
+    return (
+        session.query(models.IntegrationRun)
+        .filter(models.IntegrationRun.integration_id == integration_id)
+        .order_by(models.IntegrationRun.started_at.desc(), models.IntegrationRun.id.desc())
+        .limit(limit).all()
+    )
+
+
+def _run(session_factory):
+    while not _STOP.is_set():
+        try:
+            tick(session_factory)
+        except Exception as e:
+            LOGGER.warning('integration scheduler tick failed: %s', e)
+        _WAKE.wait(TICK)
+        _WAKE.clear()
+
+
+def start(session_factory=None):
+    global _THREAD
+    if not ENABLED or _THREAD is not None:
+        return
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='integration-scheduler', daemon=True)
+    _THREAD.start()
+
+
+def stop(timeout: float = 10.0):
+    global _THREAD, _POOL
+    if _THREAD is None:
+        return
+    _STOP.set()
+    _WAKE.set()
+    _THREAD.join(timeout)
+    _THREAD = None
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
@@ -1,9 +1,8 @@
-import requests
-import time
 import json
 from typing import Optional, Dict, Any
-from . import db, models
+from . import db, http_client, models
 from .crud import get_ai_reports
+from .security import decrypt_value
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,7 +23,7 @@ def fetch_fx_coinmarketcap(db_session, api_key: Optional[str] = None) -> Dict[st
     url = 'https://pro-api.coinmarketcap.com/v1/cryptocurrency/listings/latest'
     headers = {'X-CMC_PRO_API_KEY': api_key}
     params = {'start': 1, 'limit': 10, 'convert': 'USD'}
-    r = requests.get(url, headers=headers, params=params, timeout=5)
+    r = http_client.get(url, headers=headers, params=params, timeout=5, provider='coinmarketcap')
     r.raise_for_status()
     return r.json()
 
@@ -38,13 +37,13 @@ def fetch_fx_navasan(db_session, api_key: Optional[str] = None) -> Dict[str, Any
     try:
         if api_key:
             url = f'https://api.navasan.com/v1/latest?api_key={api_key}'
-            r = requests.get(url, timeout=5)
+            r = http_client.get(url, timeout=5, provider='navasan')
             r.raise_for_status()
             return r.json()
     except Exception:
         logger.debug('navasan fetch failed, falling back to exchangerate.host')
     # fallback
-    r = requests.get('https://api.exchangerate.host/latest?base=USD', timeout=5)
+    r = http_client.get('https://api.exchangerate.host/latest?base=USD', timeout=5, provider='exchangerate.host')
     r.raise_for_status()
     return r.json()
 
@@ -55,19 +54,21 @@ def fetch_integration_status(db_session, integration: models.IntegrationConfig)
         if not integration.enabled:
             res['status'] = 'disabled'
             return res
+        # keys are stored encrypted by crud.upsert_integration
+        api_key = decrypt_value(integration.api_key)
         if integration.provider == 'coinmarketcap':
-            data = fetch_fx_coinmarketcap(db_session, api_key=integration.api_key)
+            data = fetch_fx_coinmarketcap(db_session, api_key=api_key)
             res['status'] = 'ok'
             res['sample'] = data.get('data', [])[:3]
         elif integration.provider == 'navasan':
-            data = fetch_fx_navasan(db_session, api_key=integration.api_key)
+            data = fetch_fx_navasan(db_session, api_key=api_key)
             res['status'] = 'ok'
             res['sample'] = data
         else:
             # other providers (marketplaces) don't need API key—use health check via GET
             url = integration.config and json.loads(integration.config).get('health_url')
             if url:
-                r = requests.get(url, timeout=5)
+                r = http_client.get(url, timeout=5, provider=integration.provider)
                 res['status'] = 'ok' if r.status_code == 200 else f'error:{r.status_code}'
             else:
                 res['status'] = 'unknown-provider'
@@ -77,14 +78,12 @@ def fetch_integration_status(db_session, integration: models.IntegrationConfig)
 
 
 def refresh_integration(db_session, integration_id: int):
+    """Run one integration now (outside the scheduler) and record it as a manual run."""
+    from .integration_scheduler import run_integration, run_sample
     integration = db_session.query(models.IntegrationConfig).filter(models.IntegrationConfig.id == integration_id).first()
     if not integration:
         return None
-    stat = fetch_integration_status(db_session, integration)
-    # update last_updated
-    from datetime import datetime
-    integration.last_updated = datetime.utcnow()
-    db_session.add(integration)
-    db_session.commit()
-    db_session.refresh(integration)
-    return stat
+    run = run_integration(db_session, integration, trigger='manual')
+    return {'name': integration.name, 'provider': integration.provider, 'enabled': integration.enabled,
+            'status': run.status, 'sample': run_sample(run), 'latency_ms': run.latency_ms,
+            'last_updated': integration.last_updated.isoformat() if integration.last_updated else None}
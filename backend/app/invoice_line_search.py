@@ -0,0 +1,91 @@
+"""Find invoices by their line items: "which invoice sold serial X".
+
+Final invoices are indexed with their lines (search.invoice_doc `lines`), so
+Meilisearch answers with attributesToSearchOn restricted to the line fields.
+Without it the database is used through the indexed paths in db_search
+(pg_trgm / FTS5 on invoice_items.description and products.code).
+
+Each hit is the invoice document plus `matched_lines`, the lines the query
+matched.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import db_search, models, search
+from .normalizer import normalize_for_search
+
+LOGGER = logging.getLogger(__name__)
+
+LINE_FIELDS = ['lines.description', 'lines.product_code']
+# matching lines fetched per requested invoice in the database path
+LINES_PER_INVOICE = 10
+
+
+def matching_lines(doc: Dict[str, Any], q: str) -> List[Dict[str, Any]]:
+    """Lines of `doc` containing every word of `q` (any word, if no line has all)."""
+    words = normalize_for_search(q).split()
+    texts = [
+        (line, normalize_for_search(f"{line.get('description') or ''} {line.get('product_code') or ''}"))
+        for line in doc.get('lines') or []
+    ]
+    full = [line for line, text in texts if all(w in text for w in words)]
+    return full or [line for line, text in texts if any(w in text for w in words)]
+
+
+def _meili(q: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+    idx = search._get_index('invoices')
+    if idx is None:
+        return None
+    params = {'limit': limit, 'filter': 'status = "final"', 'attributesToSearchOn': LINE_FIELDS}
+    try:
+        res = idx.search(q, params)
+    except Exception as e:
+        # attributesToSearchOn needs Meilisearch >= 1.3; without it keep the hits that matched on lines
+        LOGGER.info('invoice line search without attributesToSearchOn: %s', e)
+        try:
+            res = idx.search(q, {'limit': limit, 'filter': 'status = "final"'})
+        except Exception as e:
+            LOGGER.warning('invoice line search error, using the database: %s', e)
+            return None
+    hits = []
+    for doc in res.get('hits', []):
+        lines = matching_lines(doc, q)
+        if lines:
+            hits.append(dict(doc, matched_lines=lines))
+    return hits
+
+
+def _database(session: Session, q: str, limit: int) -> List[Dict[str, Any]]:
+    item, inv = models.InvoiceItem, models.Invoice
+    cap = limit * LINES_PER_INVOICE
+    final = session.query(item).join(inv, item.invoice_id == inv.id).filter(inv.status == 'final')
+    matched = db_search.filter_by_name(session, final, item, q).order_by(item.invoice_id.desc()).limit(cap).all()
+    product_ids = [pid for (pid,) in db_search.filter_by_name(
+        session, session.query(models.Product.id), models.Product, q, columns=('code',)
+    ).limit(200)]
+    if product_ids:
+        matched += final.filter(item.product_id.in_(product_ids)).order_by(item.invoice_id.desc()).limit(cap).all()
+
+    line_ids: Dict[Any, set] = {}
+    for it in matched:
+        line_ids.setdefault(it.invoice_id, set()).add(it.id)
+    invoice_ids = sorted(line_ids, reverse=True)[:limit]
+    if not invoice_ids:
+        return []
+    invoices = session.query(inv).filter(inv.id.in_(invoice_ids)).order_by(inv.id.desc()).all()
+    return [
+        dict(doc, matched_lines=[line for line in doc['lines'] if line['id'] in line_ids[doc['id']]])
+        for doc in search.build_docs(session, 'invoices', invoices)
+    ]
+
+
+def search_invoice_lines(session: Session, q: str, limit: int = 20) -> dict:
+    q = (q or '').strip()
+    if not q:
+        return {'hits': [], 'engine': None}
+    hits = _meili(q, limit)
+    if hits is not None:
+        return {'hits': hits, 'engine': 'meilisearch'}
+    return {'hits': _database(session, q, limit), 'engine': 'database'}
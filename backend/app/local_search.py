@@ -0,0 +1,447 @@
+"""In-process search engine used when Meilisearch is unavailable.
+
+One LocalIndex per search index (products, persons, invoices, payments) holds
+- docs: id -> the same document the outbox relay sends to Meilisearch
+- an inverted index token -> ids over the normalized searchable attributes,
+  plus a sorted token list so prefixes are a bisect away
+- a trigram index trigram -> words for matches in the middle of a word
+
+All text goes through normalize_for_search, so Arabic/Persian letter variants,
+Persian digits and ZWNJ match the same way they do in Meilisearch.
+
+The engine is built from the DB at startup, or loaded from a snapshot file and
+caught up from search_outbox. It then stays current by tailing search_outbox,
+which every entity write already appends to inside its transaction; that also
+picks up writes made by other workers.
+"""
+import bisect
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from . import db, models, search, search_outbox
+from .normalizer import normalize_for_search
+
+LOGGER = logging.getLogger(__name__)
+
+_BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SNAPSHOT_PATH = os.getenv('LOCAL_SEARCH_SNAPSHOT', os.path.join(_BASE_DIR, 'hp_local_search.json.gz'))
+SYNC_INTERVAL = float(os.getenv('LOCAL_SEARCH_SYNC_INTERVAL', '5'))
+SNAPSHOT_INTERVAL = float(os.getenv('LOCAL_SEARCH_SNAPSHOT_INTERVAL', '300'))
+ENABLED = os.getenv('LOCAL_SEARCH_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+# a one-letter prefix can match thousands of words; only expand this many
+MAX_PREFIX_EXPANSION = 500
+# above this many candidates results are picked by match tier instead of scored individually
+FULL_RANK_LIMIT = 1000
+
+_EMPTY: frozenset = frozenset()
+
+_TOKEN_RE = re.compile(r'[\w\-/.]+', re.UNICODE)
+_FILTER_RE = re.compile(r'''^\s*(\w+)\s*=\s*(?:"([^"]*)"|'([^']*)'|(\S+))\s*$''')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize_for_search(text or ''))
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _union(sets: List[Set[Any]]) -> Set[Any]:
+    # avoid copying when a single posting set covers the match
+    if not sets:
+        return _EMPTY
+    if len(sets) == 1:
+        return sets[0]
+    return set().union(*sets)
+
+
+def field_values(doc: dict, field: str) -> List[Any]:
+    """Values at a dotted path; lists along the way (e.g. `lines.description`) are flattened."""
+    values = [doc]
+    for part in field.split('.'):
+        nxt = []
+        for v in values:
+            v = v.get(part) if isinstance(v, dict) else None
+            if isinstance(v, list):
+                nxt.extend(v)
+            elif v is not None:
+                nxt.append(v)
+        values = nxt
+    return values
+
+
+def _parse_filters(filters: Optional[str]) -> List[Tuple[str, str]]:
+    """Supports the `attr = value [AND attr = value ...]` subset of Meili's filter syntax."""
+    out = []
+    for clause in re.split(r'\s+AND\s+', filters or '', flags=re.IGNORECASE):
+        m = _FILTER_RE.match(clause)
+        if m:
+            out.append((m.group(1), next(g for g in m.groups()[1:] if g is not None)))
+    return out
+
+
+class LocalIndex:
+    def __init__(self, name: str, fields: Iterable[str]):
+        self.name = name
+        self.fields = [f for f in fields if f != 'name_norm']
+        self._lock = threading.RLock()
+        self.docs: Dict[Any, dict] = {}
+        self._doc_tokens: Dict[Any, Tuple[str, ...]] = {}
+        self._rank_key: Dict[Any, Tuple[int, str]] = {}  # tie-break: fewer words, then id
+        self._postings: Dict[str, Set[Any]] = {}
+        self._grams: Dict[str, Set[Any]] = {}
+        self._sorted_tokens: List[str] = []
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _add_token(self, token: str, doc_id):
+        ids = self._postings.get(token)
+        if ids is None:
+            ids = self._postings[token] = set()
+            bisect.insort(self._sorted_tokens, token)
+            for g in _trigrams(token):
+                self._grams.setdefault(g, set()).add(token)
+        ids.add(doc_id)
+
+    def _drop_token(self, token: str, doc_id):
+        ids = self._postings.get(token)
+        if ids is None:
+            return
+        ids.discard(doc_id)
+        if not ids:
+            del self._postings[token]
+            i = bisect.bisect_left(self._sorted_tokens, token)
+            if i < len(self._sorted_tokens) and self._sorted_tokens[i] == token:
+                del self._sorted_tokens[i]
+            for g in _trigrams(token):
+                tokens = self._grams.get(g)
+                if tokens is not None:
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._grams[g]
+
+    def upsert(self, doc: dict):
+        doc_id = doc['id']
+        tokens = set()
+        for field in self.fields:
+            for value in field_values(doc, field):
+                tokens.update(tokenize(str(value)))
+        with self._lock:
+            old = self._doc_tokens.get(doc_id, ())
+            for token in set(old) - tokens:
+                self._drop_token(token, doc_id)
+            for token in tokens - set(old):
+                self._add_token(token, doc_id)
+            self.docs[doc_id] = doc
+            self._doc_tokens[doc_id] = tuple(tokens)
+            self._rank_key[doc_id] = (len(tokens), str(doc_id))
+
+    def delete(self, doc_id):
+        with self._lock:
+            for token in self._doc_tokens.pop(doc_id, ()):
+                self._drop_token(token, doc_id)
+            self.docs.pop(doc_id, None)
+            self._rank_key.pop(doc_id, None)
+
+    def _token_matches(self, qtoken: str) -> Tuple[Set[Any], Set[Any], Set[Any]]:
+        """(exact word, word prefix, infix) doc id sets for one query token."""
+        exact = self._postings.get(qtoken, _EMPTY)
+        i = bisect.bisect_left(self._sorted_tokens, qtoken)
+        prefix_tokens = []
+        for token in self._sorted_tokens[i:i + MAX_PREFIX_EXPANSION]:
+            if not token.startswith(qtoken):
+                break
+            if token != qtoken:
+                prefix_tokens.append(self._postings[token])
+        prefix = _union(prefix_tokens)
+        infix = _EMPTY
+        if len(qtoken) >= 3:
+            grams = sorted((self._grams.get(g, _EMPTY) for g in _trigrams(qtoken)), key=len)
+            infix = _union([self._postings[t] for t in grams[0] if qtoken in t and not t.startswith(qtoken)])
+        return exact, prefix, infix
+
+    def search(self, query: str, limit: int = 10, filters: Optional[str] = None) -> dict:
+        started = time.perf_counter()
+        qtokens = sorted(set(tokenize(query)), key=len, reverse=True)
+        conditions = _parse_filters(filters)
+        hits: List[dict] = []
+        total = 0
+        with self._lock:
+            tiers = []
+            candidates: Optional[Set[Any]] = None
+            for qtoken in qtokens:
+                exact, prefix, infix = self._token_matches(qtoken)
+                tiers.append((exact, prefix))
+                matched = _union([m for m in (exact, prefix, infix) if m])
+                candidates = matched if candidates is None else candidates & matched
+                if not candidates:
+                    break
+            candidates = candidates or _EMPTY
+            if conditions:
+                candidates = {
+                    d for d in candidates
+                    if all(str(self.docs[d].get(attr)) == value for attr, value in conditions)
+                }
+            total = len(candidates)
+            hits = [self.docs[d] for d in self._top(candidates, tiers, limit)]
+        return {
+            'hits': hits,
+            'query': query,
+            'limit': limit,
+            'offset': 0,
+            'estimatedTotalHits': total,
+            'processingTimeMs': round((time.perf_counter() - started) * 1000, 3),
+            'engine': 'local',
+        }
+
+    def _top(self, candidates: Set[Any], tiers: List[Tuple[Set[Any], Set[Any]]], limit: int) -> List[Any]:
+        if not candidates:
+            return []
+        if len(candidates) > FULL_RANK_LIMIT:
+            # too many to score one by one: documents with every word matched exactly first
+            strong = candidates
+            for exact, _ in tiers:
+                strong = strong & exact if strong is not exact else strong
+            picked = list(islice(strong, limit))
+            if len(picked) < limit:
+                picked.extend(islice(candidates - strong, limit - len(picked)))
+            return picked
+        # 3 per exact word, 2 per prefix, 1 per infix match; shorter documents first
+        scores = dict.fromkeys(candidates, len(tiers))
+        for exact, prefix in tiers:
+            for d in candidates & exact:
+                scores[d] += 2
+            for d in (candidates & prefix) - exact:
+                scores[d] += 1
+        by_score: Dict[int, List[Any]] = {}
+        for d, score in scores.items():
+            by_score.setdefault(score, []).append(d)
+        picked: List[Any] = []
+        for score in sorted(by_score, reverse=True):
+            picked.extend(heapq.nsmallest(limit - len(picked), by_score[score], key=self._rank_key.__getitem__))
+            if len(picked) >= limit:
+                break
+        return picked
+
+
+class LocalSearch:
+    def __init__(self):
+        self.indexes = {
+            name: LocalIndex(name, search.INDEX_SETTINGS.get(name, {}).get('searchableAttributes', []))
+            for name in search.DOC_SOURCES
+        }
+        self.tail = search_outbox.Tail()  # search_outbox rows applied
+        self.ready = False
+        self.dirty = False
+
+    # -- building ----------------------------------------------------------
+
+    def build_from_db(self, session, chunk_size: int = 2000):
+        # take the position first so writes made while we stream are synced afterwards
+        self.tail = search_outbox.Tail.at_head(session)
+        for name, (model, _) in search.DOC_SOURCES.items():
+            index = self.indexes[name]
+            for rows in session.execute(select(model).execution_options(yield_per=chunk_size)).scalars().partitions():
+                for doc in search.build_docs(session, name, rows):
+                    index.upsert(doc)
+        self.ready = True
+        self.dirty = True
+
+    def sync(self, session, batch: int = 5000) -> int:
+        """Apply search_outbox rows not applied yet (written by any worker)."""
+        rows = (
+            session.query(models.SearchOutbox.id, models.SearchOutbox.index_name, models.SearchOutbox.doc_id)
+            .filter(self.tail.condition())
+            .order_by(models.SearchOutbox.id)
+            .limit(batch)
+            .all()
+        )
+        if not rows:
+            return 0
+        by_index: Dict[str, Set[str]] = {}
+        for _, index_name, doc_id in rows:
+            by_index.setdefault(index_name, set()).add(doc_id)
+        for index_name, ids in by_index.items():
+            if index_name not in search.DOC_SOURCES:
+                continue
+            model, _ = search.DOC_SOURCES[index_name]
+            pk = model.id.type.python_type
+            keys = [pk(i) for i in ids]
+            found = {obj.id: obj for obj in session.query(model).filter(model.id.in_(keys))}
+            index = self.indexes[index_name]
+            for doc in search.build_docs(session, index_name, found.values()):
+                index.upsert(doc)
+            for key in keys:
+                if key not in found:
+                    index.delete(key)
+        self.tail.advance(row[0] for row in rows)
+        self.dirty = True
+        return len(rows)
+
+    # -- snapshot ----------------------------------------------------------
+
+    def save_snapshot(self, path: str = SNAPSHOT_PATH):
+        data = {
+            'version': 1,
+            'saved_at': time.time(),
+            'watermark': self.tail.resume_point(),
+            'docs': {name: list(index.docs.values()) for name, index in self.indexes.items()},
+        }
+        # every worker saves (on its timer and at shutdown): each writes its own temp file, the last rename wins
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as fh:
+                json.dump(data, fh, ensure_ascii=False, default=str)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self.dirty = False
+
+    def load_snapshot(self, path: str = SNAPSHOT_PATH) -> bool:
+        """Load a snapshot that the outbox can still bring up to date; False if unusable."""
+        if not os.path.exists(path):
+            return False
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                data = json.load(fh)
+        except Exception as e:
+            LOGGER.warning('local search snapshot unreadable: %s', e)
+            return False
+        # older than the outbox retention: changes since then may have been pruned
+        if data.get('version') != 1 or time.time() - data.get('saved_at', 0) > search_outbox.RETENTION_DAYS * 86400:
+            return False
+        for name, docs in data.get('docs', {}).items():
+            index = self.indexes.get(name)
+            if index is not None:
+                for doc in docs:
+                    index.upsert(doc)
+        self.tail = search_outbox.Tail(data.get('watermark') or 0)
+        self.ready = True
+        return True
+
+    # -- querying ----------------------------------------------------------
+
+    def search(self, index_name: str, query: str, limit: int = 10, filters: Optional[str] = None) -> Optional[dict]:
+        index = self.indexes.get(index_name)
+        if not self.ready or index is None:
+            return None
+        return index.search(query, limit=limit, filters=filters)
+
+
+_ENGINE: Optional[LocalSearch] = None
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+
+
+def get_engine() -> Optional[LocalSearch]:
+    return _ENGINE
+
+
+def set_engine(engine: Optional[LocalSearch]):
+    """Swap the process-wide engine (tests, benchmarks)."""
+    global _ENGINE
+    _ENGINE = engine
+
+
+def is_ready() -> bool:
+    return _ENGINE is not None and _ENGINE.ready
+
+
+def search_index(index_name: str, query: str, limit: int = 10, filters: Optional[str] = None) -> Optional[dict]:
+    """Meili-shaped result from the local engine, or None while it isn't ready."""
+    engine = _ENGINE
+    return engine.search(index_name, query, limit=limit, filters=filters) if engine else None
+
+
+def notify():
+    _WAKE.set()
+
+
+def _run(session_factory):
+    global _ENGINE
+    engine = LocalSearch()
+    session = session_factory()
+    try:
+        started = time.time()
+        if engine.load_snapshot():
+            source = 'snapshot'
+        else:
+            engine.build_from_db(session)
+            source = 'database'
+        while engine.sync(session):
+            pass
+        LOGGER.info('local search ready from %s in %.1fs (%s)', source, time.time() - started,
+                    ', '.join(f'{n}={len(i)}' for n, i in engine.indexes.items()))
+    except Exception as e:
+        LOGGER.warning('local search build failed: %s', e)
+        return
+    finally:
+        session.close()
+    _ENGINE = engine
+    last_snapshot = last_prune = time.time()
+    while not _STOP.is_set():
+        _WAKE.wait(SYNC_INTERVAL)
+        _WAKE.clear()
+        session = session_factory()
+        try:
+            while engine.sync(session):
+                pass
+            now = time.time()
+            if engine.dirty and now - last_snapshot >= SNAPSHOT_INTERVAL:
+                engine.save_snapshot()
+                last_snapshot = now
+            # without Meilisearch no relay runs, so the outbox is pruned from here
+            if search.client is None and now - last_prune >= 3600:
+                search_outbox.prune(session)
+                last_prune = now
+        except Exception as e:
+            session.rollback()
+            LOGGER.warning('local search sync failed: %s', e)
+        finally:
+            session.close()
+    try:
+        if engine.dirty:
+            engine.save_snapshot()
+    except Exception as e:
+        LOGGER.warning('local search snapshot failed: %s', e)
+
+
+def start(session_factory=None):
+    global _THREAD
+    if not ENABLED or _THREAD is not None:
+        return
+    search_outbox.KEEP_WITHOUT_MEILI = True
+    search_outbox.add_listener(notify)
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='local-search', daemon=True)
+    _THREAD.start()
+
+
+def stop(timeout: float = 10.0):
+    global _THREAD
+    if _THREAD is None:
+        return
+    _STOP.set()
+    _WAKE.set()
+    _THREAD.join(timeout)
+    _THREAD = None
@@ -1,14 +1,16 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, UploadFile, File
 from fastapi.security import OAuth2PasswordRequestForm
-from . import db, crud, schemas, security
+from . import db, crud, async_crud, schemas, security, throttle
 from .ocr_parser import parse_invoice_file
 from .ocr_parser import parse_payment_file
 import tempfile
 import shutil
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timezone, timedelta
 import jdatetime
-from typing import List, Optional
+from typing import List, Optional, Union
 import os
 
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -17,15 +19,16 @@ from . import models
 from .schemas import InvoiceCreate, InvoiceOut
 from .schemas import PaymentCreate, PaymentOut
 from .search import search_multi, suggest_live
+from . import autocomplete, db_search, invoice_line_search, local_search, name_norm_backfill, search, search_facets, search_outbox, search_reindex
 from .schemas import ProductCreate, ProductOut, PersonCreate, PersonOut
-from . import external_search
+from . import external_search, fx_rates, http_client, icc_sync, icc_tree, integration_scheduler, sms_campaigns, sms_outbox
 from .schemas import ExternalSearchRequest, ExternalProduct, SaveExternalProductRequest
 from .schemas import AssistantRequest, AssistantResponse, AssistantToggle, OTPVerifyRequest, OTPSetupResponse, OTPDisableRequest
 from .exports import export_invoice_pdf, export_invoice_csv, export_invoice_excel, EXPORT_DIR
 from .activity_logger import log_activity
 from fastapi.responses import HTMLResponse, FileResponse
 from .version import get_version_info
-from .sms import send_sms, SUPPORTED_PROVIDERS
+from .sms import SUPPORTED_PROVIDERS
 
 DB = db
 
@@ -195,6 +198,27 @@ def require_permissions(permission_names: List[str]):
 def on_startup():
     # Ensure DB tables exist for simple dev setup. Alembic is primary migration tool.
     db.Base.metadata.create_all(bind=db.engine)
+    db_search.ensure_sqlite_fts(db.engine)
+    name_norm_backfill.start_if_needed()
+    search_outbox.start_relay()
+    local_search.start()
+    autocomplete.start()
+    fx_rates.start()
+    integration_scheduler.start()
+    icc_sync.start()
+    sms_outbox.start()
+    sms_campaigns.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    search_outbox.stop_relay()
+    local_search.stop()
+    autocomplete.stop()
+    fx_rates.stop()
+    integration_scheduler.stop()
+    icc_sync.stop()
+    sms_outbox.stop()
 
 
 @app.get("/api/hello")
@@ -264,8 +288,10 @@ def register(user_in: schemas.UserCreate, session: Session = Depends(db.get_db))
 
 
 @app.post('/api/auth/login', response_model=schemas.Token)
-async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(db.get_db)):
-    user = crud.authenticate_user(session, form_data.username, form_data.password)
+async def login(request: Request, _throttle: None = Depends(throttle.by_ip('login_ip')), form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(db.get_db)):
+    await run_in_threadpool(throttle.enforce, 'login_user', (form_data.username or '').strip().lower())
+    # DB lookup + PBKDF2 verification are blocking; run them in the threadpool
+    user = await run_in_threadpool(crud.authenticate_user, session, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail='Incorrect username or password')
     if not user.is_active:
@@ -280,7 +306,7 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
             raise HTTPException(status_code=400, detail='Invalid OTP')
     access_token = security.create_access_token(user.username, expires_delta=timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES))
     refresh_token = security.create_refresh_token(user.username)
-    crud.set_refresh_token(session, user, refresh_token)
+    await run_in_threadpool(crud.set_refresh_token, session, user, refresh_token)
     return schemas.Token(access_token=access_token, refresh_token=refresh_token, otp_required=False)
 
 
@@ -364,18 +390,19 @@ def me(current_user: models.User = Depends(get_current_user)):
 
 
 @app.post('/api/auth/login-phone', response_model=schemas.PhoneLoginResponse)
-def login_phone(payload: schemas.PhoneLoginRequest, session: Session = Depends(db.get_db)):
+def login_phone(payload: schemas.PhoneLoginRequest, _throttle: None = Depends(throttle.by_ip('otp_ip')), session: Session = Depends(db.get_db)):
     """
     درخواست ورود با شماره تلفن.
     OTP را از طریق SMS ارسال می‌کند.
     """
-    from .sms import create_otp_session, send_sms as send_sms_func
+    from .sms import OTP_TTL_SECONDS, create_otp_session
     
     phone = payload.phone.strip()
     
     # بررسی شماره تلفن
     if not phone or len(phone) < 10:
         raise HTTPException(status_code=400, detail='شماره تلفن نامعتبر است')
+    throttle.enforce('otp_phone', phone)
     
     # جستجو برای کاربر با این شماره تلفن
     user: Optional[models.User] = session.query(models.User).filter(
@@ -393,10 +420,7 @@ def login_phone(payload: schemas.PhoneLoginRequest, session: Session = Depends(d
     
     # ارسال OTP
     message = f'کد ورود شما: {otp_code}\nاین کد 5 دقیقه معتبر است.'
-    success, msg = send_sms_func(session, phone, message, user_id=user.id if user else None)
-    
-    if not success:
-        raise HTTPException(status_code=500, detail=f'خطا در ارسال پیام: {msg}')
+    sms_outbox.enqueue(session, phone, message, kind='otp', expires_in=OTP_TTL_SECONDS)
     
     return schemas.PhoneLoginResponse(
         success=True,
@@ -441,17 +465,18 @@ def verify_phone_otp(payload: schemas.PhoneOtpVerifyRequest, session: Session =
 # ==================== موبائل سے نیا صارف بنانا ====================
 
 @app.post('/api/auth/register-mobile-otp', response_model=schemas.MobileOTPResponse)
-def register_mobile_otp(payload: schemas.MobileOTPRequest, session: Session = Depends(db.get_db)):
+def register_mobile_otp(payload: schemas.MobileOTPRequest, _throttle: None = Depends(throttle.by_ip('otp_ip')), session: Session = Depends(db.get_db)):
     """
     موبائل نمبر سے نیا صارف بنانے کے لیے OTP طلب کریں۔
     """
-    from .sms import create_otp_session, send_sms
+    from .sms import OTP_TTL_SECONDS, create_otp_session
     
     phone = payload.mobile.strip()
     
     # فون نمبر کی تصدیق
     if not phone or len(phone) < 10:
         raise HTTPException(status_code=400, detail='فون نمبر غلط ہے')
+    throttle.enforce('otp_phone', phone)
     
     # چیک کریں کہ صارف پہلے سے موجود تو نہیں
     existing_user = session.query(models.User).filter(
@@ -466,10 +491,7 @@ def register_mobile_otp(payload: schemas.MobileOTPRequest, session: Session = De
     
     # OTP بھیجیں
     message = f'آپ کا رجسٹریشن کوڈ: {otp_code}\nیہ کوڈ 5 منٹ تک درست ہے۔'
-    success, msg = send_sms(session, phone, message)
-    
-    if not success:
-        raise HTTPException(status_code=500, detail=f'OTP بھیجنے میں خرابی: {msg}')
+    sms_outbox.enqueue(session, phone, message, kind='otp', expires_in=OTP_TTL_SECONDS)
     
     return schemas.MobileOTPResponse(
         success=True,
@@ -744,25 +766,34 @@ def toggle_integration(iid: int, enabled: bool, session: Session = Depends(db.ge
 
 @app.post('/api/integrations/{iid}/refresh', response_model=schemas.IntegrationRefreshResult)
 def refresh_integration_endpoint(iid: int, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
+    """درخواست به‌روزرسانی فوری؛ اجرا در زمان‌بند پس‌زمینه انجام می‌شود و نتیجه آخرین اجرا برگردانده می‌شود"""
     require_roles(role_names=['Admin', 'Accountant'])(current)
     integ = crud.get_integration(session, iid)
     if not integ:
         raise HTTPException(status_code=404, detail='Integration not found')
-    stat = external_search.aggregate_search if integ.provider in ('digikala', 'torob', 'emalls') else None
-    # prefer specialized integrations client
-    from .integrations import refresh_integration as _refresh
-    stat = _refresh(db, iid)
-    # map to schema
+    if not integ.enabled:
+        raise HTTPException(status_code=409, detail='Integration is disabled')
+    runs = integration_scheduler.recent_runs(session, iid, limit=1)
+    integration_scheduler.request_run(session, integ)
     return {
         'name': integ.name,
         'provider': integ.provider,
         'enabled': integ.enabled,
-        'status': stat.get('status') if isinstance(stat, dict) else str(stat),
-        'sample': stat.get('sample') if isinstance(stat, dict) else None,
+        'status': integ.last_status or 'scheduled',
+        'sample': integration_scheduler.run_sample(runs[0]) if runs else None,
         'last_updated': integ.last_updated,
     }
 
 
+@app.get('/api/integrations/{iid}/runs', response_model=list[schemas.IntegrationRunOut])
+def integration_runs(iid: int, limit: int = 20, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
+    """تاریخچه اجرای یک یکپارچه‌سازی: وضعیت، تأخیر و نمونه پاسخ هر اجرا"""
+    require_roles(role_names=['Admin', 'Accountant'])(current)
+    if not crud.get_integration(session, iid):
+        raise HTTPException(status_code=404, detail='Integration not found')
+    return integration_scheduler.recent_runs(session, iid, min(limit, 200))
+
+
 @app.get('/api/invoices/{invoice_id}', response_model=InvoiceOut)
 def get_invoice(invoice_id: int, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
     require_roles(role_names=['Admin', 'Accountant', 'Manager', 'Viewer'])(current)
@@ -974,6 +1005,11 @@ def finalize_invoice(invoice_id: int, payload: dict = None, session: Session = D
     inv = crud.finalize_invoice(session, invoice_id, client_time=client_time)
     if not inv:
         raise HTTPException(status_code=404, detail='Invoice not found')
+    try:
+        sms_outbox.notify_party(session, current.id, inv.party_id,
+                                f'فاکتور شماره {inv.invoice_number or inv.id} به مبلغ {inv.total or 0:,} ریال برای شما صادر شد.')
+    except Exception:
+        session.rollback()
     items = session.query(models.InvoiceItem).filter(models.InvoiceItem.invoice_id == inv.id).all()
     inv.items = items
     return inv
@@ -1051,6 +1087,12 @@ def finalize_payment_endpoint(payment_id: int, payload: dict = None, session: Se
     p = crud.finalize_payment(session, payment_id, client_time=client_time)
     if not p:
         raise HTTPException(status_code=404, detail='Payment not found')
+    try:
+        kind = 'دریافت' if p.direction == 'in' else 'پرداخت'
+        sms_outbox.notify_party(session, current.id, p.party_id,
+                                f'{kind} مبلغ {p.amount:,} ریال با شماره {p.payment_number or p.id} ثبت شد.')
+    except Exception:
+        session.rollback()
     return p
 
 
@@ -1213,6 +1255,16 @@ def dashboard_prices(session: Session = Depends(db.get_db), current: models.User
     return out
 
 
+@app.get('/api/dashboard/prices/history')
+def dashboard_prices_history(symbol: str, kind: str = 'fx', since: Optional[datetime] = None, limit: int = 500,
+                             session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
+    """سری زمانی نرخ ارز یا رمزارز ذخیره‌شده توسط به‌روزرسان پس‌زمینه (kind: fx یا crypto)"""
+    require_roles(role_names=['Admin', 'Accountant', 'Viewer'])(current)
+    if kind not in fx_rates.PROVIDERS:
+        raise HTTPException(status_code=400, detail='kind must be fx or crypto')
+    return {'kind': kind, 'symbol': symbol, 'points': fx_rates.history(session, kind, symbol, since, min(limit, 5000))}
+
+
 @app.post('/api/search')
 def api_search(payload: dict, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
     require_roles(role_names=['Admin', 'Accountant', 'Manager', 'Viewer'])(current)
@@ -1231,6 +1283,9 @@ def api_search(payload: dict, session: Session = Depends(db.get_db), current: mo
                 return all((not result.get(ix) or len(result.get(ix, {}).get('hits', [])) == 0) for ix in idxs)
             except Exception:
                 return True
+        # the local engine mirrors the DB; prefer it to the ILIKE scans below
+        if _is_all_empty(res) and local_search.is_ready():
+            return {ix: local_search.search_index(ix, q, limit=limit, filters=filters) or {'hits': []} for ix in idxs}
         if _is_all_empty(res):
             out = {}
             qlike = f"%{q}%"
@@ -1308,6 +1363,38 @@ def api_search(payload: dict, session: Session = Depends(db.get_db), current: mo
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get('/api/search/invoice-lines')
+def api_search_invoice_lines(q: Optional[str] = None, limit: Optional[int] = 20, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
+    """جستجو در اقلام فاکتورهای نهایی (شرح ردیف یا کد کالا)؛ فاکتورها به‌همراه ردیف‌های منطبق برگردانده می‌شوند."""
+    require_roles(role_names=['Admin', 'Accountant', 'Manager', 'Viewer'])(current)
+    if not q:
+        raise HTTPException(status_code=400, detail='q required')
+    return invoice_line_search.search_invoice_lines(session, q, limit=min(int(limit or 20), 100))
+
+
+@app.post('/api/search/facets')
+def api_search_facets(payload: dict, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
+    """جستجوی چندوجهی: نتایج به‌همراه تعداد هر گروه/واحد و بازه قیمت و موجودی در یک درخواست.
+
+    payload: {index: products|invoices, q, filters: {group: [...], price: {min, max}}, facets, limit, offset}
+    """
+    require_roles(role_names=['Admin', 'Accountant', 'Manager', 'Viewer'])(current)
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail='invalid payload')
+    try:
+        return search_facets.faceted_search(
+            session,
+            payload.get('index') or 'products',
+            q=payload.get('q') or '',
+            filters=payload.get('filters') or {},
+            facets=payload.get('facets'),
+            limit=min(int(payload.get('limit') or 20), 200),
+            offset=int(payload.get('offset') or 0),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post('/api/admin/ai_reports/run', response_model=schemas.AIReportOut)
 def run_ai_report(start: Optional[str] = None, end: Optional[str] = None, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
     require_roles(role_names=['Admin'])(current)
@@ -1413,11 +1500,57 @@ def review_ai_report(rid: int, payload: schemas.AIReportReview, session: Session
     return rep
 
 
+@app.get('/api/search/index-status')
+def api_search_index_status(current: models.User = Depends(require_roles(role_names=['Admin'])), session: Session = Depends(db.get_db)):
+    """وضعیت ایندکس جستجو: outbox پایگاه داده (عمق، تأخیر و خطاها) و آمار دسته‌ها و توقف‌های relay"""
+    return {'outbox': search_outbox.status(session)}
+
+
+@app.post('/api/search/outbox/replay')
+def api_search_outbox_replay(payload: dict, current: models.User = Depends(require_roles(role_names=['Admin'])), session: Session = Depends(db.get_db)):
+    """ارسال مجدد تغییرات ایندکس از یک شناسه یا زمان مشخص (from_id / since / index)"""
+    since = None
+    if payload.get('since'):
+        try:
+            since = datetime.fromisoformat(payload['since'])
+        except ValueError:
+            raise HTTPException(status_code=400, detail='since must be an ISO datetime')
+    count = search_outbox.replay(session, from_id=payload.get('from_id'), since=since, index_name=payload.get('index'))
+    return {'replayed': count}
+
+
+@app.post('/api/search/reindex')
+def api_search_reindex(payload: dict = None, current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """بازسازی کامل ایندکس‌های جستجو از پایگاه داده در پس‌زمینه (indexes / restart)"""
+    payload = payload or {}
+    indexes = payload.get('indexes') or None
+    if indexes and set(indexes) - set(search.DOC_SOURCES):
+        raise HTTPException(status_code=400, detail='unknown index')
+    if search.client is None:
+        raise HTTPException(status_code=503, detail='Meilisearch is not available')
+    if not search_reindex.start_background(indexes, restart=bool(payload.get('restart'))):
+        raise HTTPException(status_code=409, detail='reindex already running')
+    return {'started': True, 'indexes': indexes or list(search.DOC_SOURCES)}
+
+
+@app.get('/api/search/reindex')
+def api_search_reindex_progress(current: models.User = Depends(require_roles(role_names=['Admin']))):
+    return {
+        'running': search_reindex.is_running(),
+        'indexes': {name: search_reindex.get_progress(name) for name in search.DOC_SOURCES},
+    }
+
+
 @app.get('/api/search/live')
 def api_search_live(q: Optional[str] = None, index: Optional[str] = 'products', limit: Optional[int] = 7, current: models.User = Depends(get_current_user)):
     require_roles(role_names=['Admin', 'Accountant', 'Manager', 'Viewer'])(current)
     if not q:
         return {'hits': []}
+    # products come from the in-process prefix index (ranked by sales); Meili only when it has nothing
+    if index == 'products':
+        hits = autocomplete.suggest(q, limit=limit)
+        if hits:
+            return {'hits': hits}
     hits = suggest_live(q, index=index, limit=limit)
     return {'hits': hits}
 
@@ -1448,12 +1581,24 @@ def api_products_external_search(payload: ExternalSearchRequest, current: models
     sources = payload.sources
     limit = int(payload.limit or 6)
     try:
-        res = external_search.aggregate_search(q, sources=sources, limit=limit)
+        res = external_search.aggregate_search(q, sources=sources, limit=limit, use_cache=not payload.refresh)
         return res
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get('/api/admin/outbound-http')
+def api_admin_outbound_http(current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """آمار درخواست‌های خروجی به تفکیک میزبان (تأخیر، خطا، تلاش مجدد) و وضعیت circuit breaker هر سرویس"""
+    return http_client.stats()
+
+
+@app.get('/api/products/external/cache-stats')
+def api_products_external_cache_stats(current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """آمار کش صفحات و نتایج جستجوی فروشگاه‌های خارجی (hit ratio، اعتبارسنجی مجدد با 304)"""
+    return external_search.cache_stats()
+
+
 @app.post('/api/products/external/save', response_model=ProductOut)
 def api_products_external_save(payload: SaveExternalProductRequest, session: Session = Depends(db.get_db), current: models.User = Depends(get_current_user)):
     """Save an external product result as a local product so it can be used in invoices.
@@ -1566,23 +1711,140 @@ def list_sms_providers(session: Session = Depends(db.get_db), current: models.Us
 
 
 @app.post('/api/sms/send')
-def api_sms_send(payload: dict, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin']))):
+def api_sms_send(payload: dict, _throttle: None = Depends(throttle.by_ip('sms_ip')), session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin']))):
+    throttle.enforce('sms_user', str(current.id))
     to = (payload or {}).get('to')
     msg = (payload or {}).get('message')
     provider = (payload or {}).get('provider')
     if not to or not msg:
         raise HTTPException(status_code=400, detail='to and message required')
-    ok, info = send_sms(session, to, msg, provider)
-    if not ok:
-        raise HTTPException(status_code=502, detail=info)
+    if provider and provider not in SUPPORTED_PROVIDERS:
+        raise HTTPException(status_code=400, detail=f'unsupported provider: {provider}')
+    queued = sms_outbox.enqueue(session, to, msg, kind='manual', provider=provider)
     try:
         log_activity(session, current.username if hasattr(current, 'username') else None, f"ارسال پیامک به {to}")
     except Exception:
         pass
-    return {"ok": True, "detail": info}
+    return {"ok": True, "id": queued.id, "status": queued.status, "detail": "queued"}
+
+
+@app.get('/api/sms/outbox')
+def api_sms_outbox(status: Optional[str] = None, to: Optional[str] = None, limit: int = 100, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """صف پیامک‌ها: تعداد به تفکیک وضعیت و آخرین پیام‌ها (queued, sent, delivered, failed, ...)"""
+    m = models.SmsMessage
+    q = session.query(m)
+    if status:
+        q = q.filter(m.status == status)
+    if to:
+        q = q.filter(m.to == to.strip())
+    rows = q.order_by(m.id.desc()).limit(min(max(limit, 1), 500)).all()
+    return {
+        'summary': sms_outbox.summary(session),
+        'items': [sms_outbox.redact(schemas.SmsMessageOut.from_orm(r)) for r in rows],
+    }
+
+
+@app.get('/api/sms/outbox/{message_id}', response_model=schemas.SmsMessageOut)
+def api_sms_outbox_item(message_id: int, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """وضعیت یک پیامک در صف (ارسال، تلاش‌ها، گزارش تحویل)"""
+    msg = session.get(models.SmsMessage, message_id)
+    if not msg:
+        raise HTTPException(status_code=404, detail='پیامک یافت نشد')
+    return sms_outbox.redact(schemas.SmsMessageOut.from_orm(msg))
+
+
+@app.post('/api/sms/delivery')
+def api_sms_delivery(payload: Union[dict, list], token: Optional[str] = None, session: Session = Depends(db.get_db)):
+    """گزارش تحویل پیامک از سرویس‌دهنده: {message_id, status, recipient?} یا فهرستی از آن‌ها"""
+    if not sms_outbox.valid_dlr_token(token):
+        raise HTTPException(status_code=403, detail='invalid token')
+    reports = payload if isinstance(payload, list) else [payload]
+    updated = 0
+    for r in reports:
+        if isinstance(r, dict) and r.get('message_id') and r.get('status') is not None:
+            updated += sms_outbox.record_delivery(session, r['message_id'], r['status'], r.get('recipient'))
+    return {'updated': updated}
+
+
+def _campaign_group(session: Session, group_id: int, current: models.User) -> models.CustomerGroup:
+    group = session.get(models.CustomerGroup, group_id)
+    if not group:
+        raise HTTPException(status_code=404, detail='گروه یافت نشد')
+    if group.created_by_user_id != current.id and not group.is_shared:
+        raise HTTPException(status_code=403, detail='دسترسی رد شد')
+    return group
+
+
+def _campaign_options(payload: schemas.SmsCampaignCreate) -> dict:
+    if not 1 <= payload.within_days <= 365:
+        raise HTTPException(status_code=400, detail='within_days must be between 1 and 365')
+    return {'within_days': payload.within_days, 'min_balance': payload.min_balance, 'only_due_cheques': payload.only_due_cheques}
+
+
+def _own_campaign(session: Session, campaign_id: int, current: models.User) -> models.SmsCampaign:
+    campaign = session.get(models.SmsCampaign, campaign_id)
+    is_admin = current.role_obj is not None and current.role_obj.name == 'Admin'
+    if not campaign or (campaign.created_by_user_id != current.id and not is_admin):
+        raise HTTPException(status_code=404, detail='کمپین یافت نشد')
+    return campaign
+
+
+@app.post('/api/sms/campaigns/preview')
+def api_sms_campaign_preview(payload: schemas.SmsCampaignCreate, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin', 'Manager']))):
+    """پیش‌نمایش کمپین پیامکی: تعداد گیرندگان و چند نمونه متن، بدون ارسال"""
+    _campaign_group(session, payload.group_id, current)
+    options = _campaign_options(payload)
+    try:
+        rows, counts = sms_campaigns.plan(session, payload.group_id, payload.template, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dict(counts, samples=[{'to': to, 'message': text} for to, text in rows[:5]])
+
+
+@app.post('/api/sms/campaigns', response_model=schemas.SmsCampaignOut, status_code=202)
+def api_sms_campaign_create(payload: schemas.SmsCampaignCreate, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin', 'Manager']))):
+    """ارسال پیامک گروهی به اعضای یک گروه مشتری؛ آماده‌سازی و ارسال در پس‌زمینه انجام می‌شود"""
+    throttle.enforce('sms_user', str(current.id))
+    group = _campaign_group(session, payload.group_id, current)
+    options = _campaign_options(payload)
+    try:
+        campaign = sms_campaigns.create(session, current.id, group.id, payload.template, payload.name, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sms_campaigns.prepare_in_background(campaign.id)
+    try:
+        log_activity(session, current.username, f"کمپین پیامکی برای گروه {group.name}")
+    except Exception:
+        pass
+    return campaign
+
+
+@app.get('/api/sms/campaigns', response_model=List[schemas.SmsCampaignOut])
+def api_sms_campaigns(limit: int = 50, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin', 'Manager']))):
+    """فهرست کمپین‌های پیامکی کاربر"""
+    q = session.query(models.SmsCampaign)
+    if current.role_obj is None or current.role_obj.name != 'Admin':
+        q = q.filter(models.SmsCampaign.created_by_user_id == current.id)
+    return q.order_by(models.SmsCampaign.id.desc()).limit(min(max(limit, 1), 200)).all()
+
+
+@app.get('/api/sms/campaigns/{campaign_id}')
+def api_sms_campaign(campaign_id: int, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin', 'Manager']))):
+    """پیشرفت کمپین: تعداد در صف، ارسال‌شده، تحویل‌شده و ناموفق"""
+    campaign = _own_campaign(session, campaign_id, current)
+    progress = sms_campaigns.progress(session, campaign)
+    return dict(schemas.SmsCampaignOut.from_orm(campaign).dict(), **progress)
 
 
-@app.post('/api/sms/register-user', response_model=schemas.UserOut)
+@app.post('/api/sms/campaigns/{campaign_id}/cancel')
+def api_sms_campaign_cancel(campaign_id: int, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin', 'Manager']))):
+    """توقف کمپین؛ پیامک‌هایی که هنوز ارسال نشده‌اند حذف می‌شوند"""
+    campaign = _own_campaign(session, campaign_id, current)
+    dropped = sms_campaigns.cancel(session, campaign)
+    return {'status': campaign.status, 'dropped': dropped}
+
+
+@app.post('/api/sms/register-user', response_model=schemas.RegisteredUserOut)
 def api_sms_register_user(payload: dict, session: Session = Depends(db.get_db), current: models.User = Depends(require_roles(role_names=['Admin']))):
     import secrets, string
     username = (payload or {}).get('username')
@@ -1598,19 +1860,16 @@ def api_sms_register_user(payload: dict, session: Session = Depends(db.get_db),
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     msg = f"کاربر شما در حساب‌پاک ایجاد شد.\nنام کاربری: {username}\nرمز عبور: {temp_pass}"
-    ok, info = send_sms(session, mobile, msg, None)
-    if not ok:
-        try:
-            session.delete(u)
-            session.commit()
-        except Exception:
-            pass
-        raise HTTPException(status_code=502, detail=f'SMS failed: {info}')
+    queued = sms_outbox.enqueue(session, mobile, msg, kind='credential')
     try:
         log_activity(session, current.username if hasattr(current, 'username') else None, f"ایجاد کاربر {username} و ارسال پیامک")
     except Exception:
         pass
-    return u
+    return dict(
+        schemas.UserOut.from_orm(u).dict(), sms_id=queued.id, sms_status=queued.status,
+        detail=f'رمز عبور موقت فقط با پیامک ارسال می‌شود و ذخیره نمی‌شود. وضعیت ارسال: /api/sms/outbox/{queued.id}؛ '
+               f'اگر ارسال ناموفق بود، کاربر را حذف و دوباره ثبت کنید.',
+    )
 
 
 @app.post('/api/assistant/query', response_model=AssistantResponse)
@@ -1754,121 +2013,101 @@ def create_smart_financial_year(session: Session = Depends(db.get_db), current:
 # ==================== Users Management Endpoints ====================
 
 @app.get('/api/roles', response_model=List[schemas.RoleOut])
-async def list_roles(current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
+async def list_roles(current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
     """لیست تمام نقش ها - فقط Admin"""
-    return crud.get_all_roles(session)
+    return await async_crud.get_all_roles(session)
 
 
 @app.post('/api/roles', response_model=schemas.RoleOut)
-def create_role(payload: schemas.RoleCreate, current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
-    r = models.Role(name=payload.name, description=payload.description)
-    session.add(r)
-    session.commit()
-    session.refresh(r)
-    return r
+async def create_role(payload: schemas.RoleCreate, current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
+    return await async_crud.create_role(session, payload)
 
 
 @app.patch('/api/roles/{rid}', response_model=schemas.RoleOut)
-def update_role(rid: int, payload: schemas.RoleCreate, current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
-    r = session.query(models.Role).filter(models.Role.id == rid).first()
+async def update_role(rid: int, payload: schemas.RoleCreate, current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
+    r = await async_crud.update_role(session, rid, payload)
     if not r:
         raise HTTPException(status_code=404, detail='role not found')
-    if payload.name:
-        r.name = payload.name
-    r.description = payload.description
-    session.add(r)
-    session.commit()
-    session.refresh(r)
     return r
 
 
 @app.delete('/api/roles/{rid}')
-def delete_role(rid: int, current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
-    r = session.query(models.Role).filter(models.Role.id == rid).first()
-    if not r:
+async def delete_role(rid: int, current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
+    if not await async_crud.delete_role(session, rid):
         raise HTTPException(status_code=404, detail='role not found')
-    session.delete(r)
-    session.commit()
     return {"ok": True}
 
 
 @app.get('/api/roles/{rid}/permissions', response_model=List[schemas.PermissionOut])
-def get_role_permissions(rid: int, current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
-    r = session.query(models.Role).filter(models.Role.id == rid).first()
+async def get_role_permissions(rid: int, current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
+    r = await async_crud.get_role(session, rid)
     if not r:
         raise HTTPException(status_code=404, detail='role not found')
     return r.permissions
 
 
 @app.post('/api/roles/{rid}/permissions')
-def set_role_permissions(rid: int, permission_ids: List[int], current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
-    r = session.query(models.Role).filter(models.Role.id == rid).first()
-    if not r:
+async def set_role_permissions(rid: int, permission_ids: List[int], current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
+    count = await async_crud.set_role_permissions(session, rid, permission_ids)
+    if count is None:
         raise HTTPException(status_code=404, detail='role not found')
-    perms = session.query(models.Permission).filter(models.Permission.id.in_(permission_ids or [])).all()
-    r.permissions = perms
-    session.add(r)
-    session.commit()
-    return {"ok": True, "count": len(perms)}
+    return {"ok": True, "count": count}
 
 
 @app.get('/api/permissions', response_model=List[schemas.PermissionOut])
-async def list_permissions(module: Optional[str] = None, current: models.User = Depends(require_roles(role_names=['Admin'])), session: Session = Depends(db.get_db)):
+async def list_permissions(module: Optional[str] = None, current: models.User = Depends(require_roles(role_names=['Admin'])), session: AsyncSession = Depends(db.get_async_db)):
     """لیست تمام permissions - فقط Admin"""
     if module:
-        return crud.get_permissions_by_module(session, module)
-    return crud.get_all_permissions(session)
+        return await async_crud.get_permissions_by_module(session, module)
+    return await async_crud.get_all_permissions(session)
 
 
 @app.post('/api/permissions', response_model=schemas.PermissionOut)
-def create_permission(payload: schemas.PermissionCreate, current: models.User = Depends(require_roles(role_ids=[1])), session: Session = Depends(db.get_db)):
-    existing = session.query(models.Permission).filter(models.Permission.name == payload.name).first()
-    if existing:
-        return existing
-    p = models.Permission(name=payload.name, description=payload.description, module=payload.module)
-    session.add(p)
-    session.commit()
-    session.refresh(p)
-    return p
+async def create_permission(payload: schemas.PermissionCreate, current: models.User = Depends(require_roles(role_ids=[1])), session: AsyncSession = Depends(db.get_async_db)):
+    return await async_crud.create_permission(session, payload)
 
 
 @app.get('/api/users', response_model=List[schemas.UserOut])
-async def list_users(current: models.User = Depends(require_roles(role_names=['Admin'])), session: Session = Depends(db.get_db)):
-    """لیست تمام کاربران - فقط Admin"""
-    from sqlalchemy.orm import joinedload
-    users = session.query(models.User).options(joinedload(models.User.role_obj)).all()
-    return users
+async def list_users(
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+    current: models.User = Depends(require_roles(role_names=['Admin'])),
+    session: AsyncSession = Depends(db.get_async_db)
+):
+    """لیست کاربران - فقط Admin
+
+    Without `limit` every user is returned (legacy behaviour). With `limit` the list
+    is a page ordered by id; pass the `X-Next-Cursor` response header back as
+    `cursor` to fetch the next page. The header is absent on the last page.
+    """
+    if limit is not None:
+        limit = max(1, min(int(limit), 500))
+        users = await async_crud.get_users(session, limit=limit + 1, after_id=cursor)
+        if len(users) > limit:
+            users = users[:limit]
+            response.headers['X-Next-Cursor'] = str(users[-1].id)
+        return users
+    return await async_crud.get_users(session, after_id=cursor)
 
 
 @app.post('/api/users', response_model=schemas.UserOut)
 async def create_user_endpoint(
     user: schemas.UserCreate,
     current: models.User = Depends(require_roles(role_names=['Admin'])),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد کاربر جدید - فقط Admin"""
     
     # بررسی وجود کاربر
-    existing = crud.get_user_by_username(session, user.username)
+    existing = await async_crud.get_user_by_username(session, user.username)
     if existing:
         raise HTTPException(status_code=400, detail='نام کاربری از قبل موجود است')
     
     # ایجاد کاربر جدید
-    from .security import get_password_hash
-    db_user = models.User(
-        username=user.username,
-        email=user.email,
-        full_name=user.full_name,
-        hashed_password=get_password_hash(user.password),
-        role_id=user.role_id,
-        role='User',  # Legacy field
-        is_active=True
-    )
-    session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    db_user = await async_crud.create_user(session, user)
     
-    log_activity(session, current.id, f'/api/users', 'POST', 201, f'کاربر {user.username} ایجاد شد')
+    await run_in_threadpool(log_activity, None, current.id, f'/api/users', 'POST', 201, f'کاربر {user.username} ایجاد شد')
     return db_user
 
 
@@ -1877,22 +2116,15 @@ async def update_user(
     user_id: int,
     update_data: schemas.UserUpdate,
     current: models.User = Depends(require_roles(role_names=['Admin'])),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ویرایش کاربر - فقط Admin"""
     
-    user = session.query(models.User).filter(models.User.id == user_id).first()
+    user = await async_crud.update_user(session, user_id, update_data)
     if not user:
         raise HTTPException(status_code=404, detail='کاربر یافت نشد')
     
-    update_dict = update_data.dict(exclude_unset=True)
-    for key, value in update_dict.items():
-        setattr(user, key, value)
-    
-    session.commit()
-    session.refresh(user)
-    
-    log_activity(session, current.id, f'/api/users/{user_id}', 'PATCH', 200, f'کاربر {user.username} ویرایش شد')
+    await run_in_threadpool(log_activity, None, current.id, f'/api/users/{user_id}', 'PATCH', 200, f'کاربر {user.username} ویرایش شد')
     return user
 
 
@@ -1900,68 +2132,60 @@ async def update_user(
 async def delete_user(
     user_id: int,
     current: models.User = Depends(require_roles(role_names=['Admin'])),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف کاربر - فقط Admin"""
     
     if user_id == current.id:
         raise HTTPException(status_code=400, detail='نمی‌توانید خودتان را حذف کنید')
     
-    user = session.query(models.User).filter(models.User.id == user_id).first()
+    user = await async_crud.get_user(session, user_id)
     if not user:
         raise HTTPException(status_code=404, detail='کاربر یافت نشد')
     
     username = user.username
-    session.delete(user)
-    session.commit()
+    await async_crud.delete_user(session, user_id)
     
-    log_activity(session, current.id, f'/api/users/{user_id}', 'DELETE', 200, f'کاربر {username} حذف شد')
+    await run_in_threadpool(log_activity, None, current.id, f'/api/users/{user_id}', 'DELETE', 200, f'کاربر {username} حذف شد')
     return {'detail': 'کاربر حذف شد'}
 
 
 @app.get('/api/current-user/permissions', response_model=List[schemas.PermissionOut])
 async def get_current_user_permissions(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت permissions کاربر فعلی"""
     if current.role_id:
-        role = crud.get_role(session, current.role_id)
-        if role:
-            return role.permissions
+        access = await async_crud.get_role_access(session, current.role_id)
+        if access:
+            return access['permissions']
     return []
 
 
 @app.get('/api/current-user/modules', response_model=List[str])
 async def get_current_user_modules(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت ماژول های قابل دسترس برای کاربر فعلی"""
     if current.role_id:
-        role = crud.get_role(session, current.role_id)
-        if role:
-            modules = set(p.module for p in role.permissions if p.module)
-            # If user has any report-related permission, expose the dedicated 'reports' module
-            try:
-                if any('report' in (p.name or '').lower() for p in role.permissions):
-                    modules.add('reports')
-            except Exception:
-                pass
-            return list(modules)
+        access = await async_crud.get_role_access(session, current.role_id)
+        if access:
+            return access['modules']
     return []
 
 
 @app.get('/api/users/preferences', response_model=schemas.UserPreferencesOut)
 async def get_user_preferences(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت تنظیمات کاربر فعلی"""
-    prefs = crud.get_user_preferences(session, current.id)
+    prefs = await async_crud.get_user_preferences(session, current.id)
     if not prefs:
         # ایجاد تنظیمات پیش‌فرض اگر وجود نداشته باشد
-        prefs = crud.create_user_preferences(session, current.id)
+        prefs = await async_crud.create_user_preferences(session, current.id)
     return prefs
 
 
@@ -2055,7 +2279,7 @@ def set_sidebar_side(payload: dict, current: models.User = Depends(get_current_u
 async def update_user_preferences(
     payload: schemas.UserPreferencesUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی تنظیمات کاربر فعلی"""
     # Validate language and currency
@@ -2068,21 +2292,21 @@ async def update_user_preferences(
     if payload.currency and payload.currency not in valid_currencies:
         raise HTTPException(status_code=400, detail=f'واحد پولی نامعتبر است. موارد قابل قبول: {valid_currencies}')
     
-    prefs = crud.get_user_preferences(session, current.id)
+    prefs = await async_crud.get_user_preferences(session, current.id)
     if not prefs:
-        prefs = crud.create_user_preferences(session, current.id)
+        prefs = await async_crud.create_user_preferences(session, current.id)
     
-    prefs = crud.update_user_preferences(session, current.id, payload)
+    prefs = await async_crud.update_user_preferences(session, current.id, payload)
     return prefs
 
 
 @app.get('/api/security/devices', response_model=List[schemas.DeviceLoginOut])
 async def get_user_devices(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت دستگاه‌های فعال کاربر"""
-    devices = crud.get_user_active_devices(session, current.id)
+    devices = await async_crud.get_user_active_devices(session, current.id)
     return devices
 
 
@@ -2090,10 +2314,10 @@ async def get_user_devices(
 async def logout_from_device(
     device_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """خروج از دستگاه مشخص"""
-    device = crud.get_device_login(session, device_id)
+    device = await async_crud.get_device_login(session, device_id)
     
     if not device:
         raise HTTPException(status_code=404, detail='دستگاه یافت نشد')
@@ -2101,10 +2325,10 @@ async def logout_from_device(
     if device.user_id != current.id:
         raise HTTPException(status_code=403, detail='مجاز به حذف این دستگاه نیستید')
     
-    success = crud.logout_device(session, device_id)
+    success = await async_crud.logout_device(session, device_id)
     
     if success:
-        log_activity(session, current.id, f'/api/security/devices/{device_id}', 'DELETE', 200, f'خروج از دستگاه {device_id}')
+        await run_in_threadpool(log_activity, None, current.id, f'/api/security/devices/{device_id}', 'DELETE', 200, f'خروج از دستگاه {device_id}')
         return {'detail': 'شما از این دستگاه خارج شدید'}
     
     raise HTTPException(status_code=500, detail='خروج ناموفق بود')
@@ -2113,15 +2337,11 @@ async def logout_from_device(
 @app.get('/api/security/login-history')
 async def get_login_history(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db),
+    session: AsyncSession = Depends(db.get_async_db),
     limit: int = 20
 ):
     """دریافت تاریخچه‌ی ورود کاربر"""
-    devices = session.query(models.DeviceLogin).filter(
-        models.DeviceLogin.user_id == current.id
-    ).order_by(models.DeviceLogin.login_at.desc()).limit(limit).all()
-    
-    return devices
+    return await async_crud.get_login_history(session, current.id, limit)
 
 
 # ==================== Developer API Keys ====================
@@ -2129,10 +2349,10 @@ async def get_login_history(
 @app.get('/api/developer/keys', response_model=List[schemas.DeveloperApiKeyOut])
 async def list_api_keys(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت تمام کلیدهای API کاربر"""
-    keys = crud.get_user_api_keys(session, current.id)
+    keys = await async_crud.get_user_api_keys(session, current.id)
     return keys
 
 
@@ -2140,12 +2360,12 @@ async def list_api_keys(
 async def create_api_key(
     payload: schemas.DeveloperApiKeyCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد کلید API جدید"""
-    api_key, plain_key = crud.create_api_key(session, current.id, payload)
+    api_key, plain_key = await async_crud.create_api_key(session, current.id, payload)
     
-    log_activity(session, current.id, '/api/developer/keys', 'POST', 201, 
+    await run_in_threadpool(log_activity, None, current.id, '/api/developer/keys', 'POST', 201, 
                 f'کلید API جدید {api_key.name} ایجاد شد')
     
     return {
@@ -2169,10 +2389,10 @@ async def update_api_key(
     key_id: int,
     payload: schemas.DeveloperApiKeyUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی تنظیمات کلید API"""
-    api_key = crud.get_api_key(session, key_id)
+    api_key = await async_crud.get_api_key(session, key_id)
     
     if not api_key:
         raise HTTPException(status_code=404, detail='کلید API یافت نشد')
@@ -2180,9 +2400,9 @@ async def update_api_key(
     if api_key.user_id != current.id:
         raise HTTPException(status_code=403, detail='مجاز به ویرایش این کلید نیستید')
     
-    api_key = crud.update_api_key(session, key_id, payload)
+    api_key = await async_crud.update_api_key(session, key_id, payload)
     
-    log_activity(session, current.id, f'/api/developer/keys/{key_id}', 'PUT', 200, 
+    await run_in_threadpool(log_activity, None, current.id, f'/api/developer/keys/{key_id}', 'PUT', 200, 
                 f'کلید API {api_key.name} به‌روزرسانی شد')
     
     return api_key
@@ -2192,10 +2412,10 @@ async def update_api_key(
 async def rotate_api_key(
     key_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """تولید کلید API جدید (لغو کلید قدیم)"""
-    old_key = crud.get_api_key(session, key_id)
+    old_key = await async_crud.get_api_key(session, key_id)
     
     if not old_key:
         raise HTTPException(status_code=404, detail='کلید API یافت نشد')
@@ -2203,9 +2423,9 @@ async def rotate_api_key(
     if old_key.user_id != current.id:
         raise HTTPException(status_code=403, detail='مجاز به چرخش این کلید نیستید')
     
-    new_key, plain_key = crud.rotate_api_key(session, key_id)
+    new_key, plain_key = await async_crud.rotate_api_key(session, key_id)
     
-    log_activity(session, current.id, f'/api/developer/keys/{key_id}/rotate', 'POST', 200, 
+    await run_in_threadpool(log_activity, None, current.id, f'/api/developer/keys/{key_id}/rotate', 'POST', 200, 
                 f'کلید API {old_key.name} چرخش داده شد')
     
     return {
@@ -2220,10 +2440,10 @@ async def rotate_api_key(
 async def revoke_api_key(
     key_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """لغو (حذف) کلید API"""
-    api_key = crud.get_api_key(session, key_id)
+    api_key = await async_crud.get_api_key(session, key_id)
     
     if not api_key:
         raise HTTPException(status_code=404, detail='کلید API یافت نشد')
@@ -2231,10 +2451,10 @@ async def revoke_api_key(
     if api_key.user_id != current.id:
         raise HTTPException(status_code=403, detail='مجاز به حذف این کلید نیستید')
     
-    success = crud.revoke_api_key(session, key_id)
+    success = await async_crud.revoke_api_key(session, key_id)
     
     if success:
-        log_activity(session, current.id, f'/api/developer/keys/{key_id}', 'DELETE', 200, 
+        await run_in_threadpool(log_activity, None, current.id, f'/api/developer/keys/{key_id}', 'DELETE', 200, 
                     f'کلید API {api_key.name} لغو شد')
         return {'detail': 'کلید API لغو شد'}
     
@@ -2243,8 +2463,7 @@ async def revoke_api_key(
 
 @app.get('/api/developer/endpoints')
 async def list_available_endpoints(
-    current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    current: models.User = Depends(get_current_user)
 ):
     """دریافت فهرست endpoints دسترس‌پذیر برای دیولوپرها"""
     endpoints = [
@@ -2298,7 +2517,7 @@ async def list_available_endpoints(
 # ==================== Blockchain Audit Trail ====================
 
 @app.get('/api/blockchain/entries')
-async def get_blockchain_entries(
+def get_blockchain_entries(
     entity_type: Optional[str] = None,
     entity_id: Optional[str] = None,
     current: models.User = Depends(get_current_user),
@@ -2321,7 +2540,7 @@ async def get_blockchain_entries(
 
 
 @app.post('/api/blockchain/verify', response_model=schemas.BlockchainVerifyResponse)
-async def verify_blockchain(
+def verify_blockchain(
     entity_type: str,
     entity_id: str,
     current: models.User = Depends(get_current_user),
@@ -2343,7 +2562,7 @@ async def verify_blockchain(
 
 
 @app.get('/api/blockchain/proof')
-async def get_blockchain_proof(
+def get_blockchain_proof(
     entity_type: str,
     entity_id: str,
     entry_id: int,
@@ -2365,7 +2584,7 @@ async def get_blockchain_proof(
 
 
 @app.get('/api/blockchain/audit-log')
-async def get_audit_log(
+def get_audit_log(
     current: models.User = Depends(get_current_user),
     session: Session = Depends(db.get_db),
     limit: int = 100
@@ -2398,12 +2617,12 @@ async def get_audit_log(
 @app.get('/api/customer-groups', response_model=List[schemas.CustomerGroupOut])
 async def list_customer_groups(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     دریافت لیست گروه‌های مشتری کاربر
     """
-    groups = crud.get_user_customer_groups(session, current.id)
+    groups = await async_crud.get_user_customer_groups(session, current.id)
     return groups
 
 
@@ -2411,12 +2630,12 @@ async def list_customer_groups(
 async def create_customer_group(
     payload: schemas.CustomerGroupCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     ایجاد گروه مشتری جدید
     """
-    group = crud.create_customer_group(session, current.id, payload)
+    group = await async_crud.create_customer_group(session, current.id, payload)
     return group
 
 
@@ -2424,12 +2643,12 @@ async def create_customer_group(
 async def get_customer_group(
     group_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     دریافت اطلاعات گروه مشتری
     """
-    group = crud.get_customer_group(session, group_id)
+    group = await async_crud.get_customer_group(session, group_id)
     if not group:
         raise HTTPException(status_code=404, detail='گروه یافت نشد')
     
@@ -2444,19 +2663,19 @@ async def update_customer_group(
     group_id: int,
     payload: schemas.CustomerGroupUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     به‌روزرسانی گروه مشتری
     """
-    group = crud.get_customer_group(session, group_id)
+    group = await async_crud.get_customer_group(session, group_id)
     if not group:
         raise HTTPException(status_code=404, detail='گروه یافت نشد')
     
     if group.created_by_user_id != current.id:
         raise HTTPException(status_code=403, detail='فقط مالک گروه می‌تواند آن را تغییر دهد')
     
-    updated = crud.update_customer_group(session, group_id, payload)
+    updated = await async_crud.update_customer_group(session, group_id, payload)
     return updated
 
 
@@ -2465,19 +2684,19 @@ async def patch_customer_group(
     group_id: int,
     payload: schemas.CustomerGroupUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     به‌روزرسانی جزئی گروه مشتری
     """
-    group = crud.get_customer_group(session, group_id)
+    group = await async_crud.get_customer_group(session, group_id)
     if not group:
         raise HTTPException(status_code=404, detail='گروه یافت نشد')
     
     if group.created_by_user_id != current.id:
         raise HTTPException(status_code=403, detail='فقط مالک گروه می‌تواند آن را تغییر دهد')
     
-    updated = crud.update_customer_group(session, group_id, payload)
+    updated = await async_crud.update_customer_group(session, group_id, payload)
     return updated
 
 
@@ -2485,19 +2704,19 @@ async def patch_customer_group(
 async def delete_customer_group(
     group_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     حذف گروه مشتری
     """
-    group = crud.get_customer_group(session, group_id)
+    group = await async_crud.get_customer_group(session, group_id)
     if not group:
         raise HTTPException(status_code=404, detail='گروه یافت نشد')
     
     if group.created_by_user_id != current.id:
         raise HTTPException(status_code=403, detail='فقط مالک گروه می‌تواند آن را حذف کند')
     
-    crud.delete_customer_group(session, group_id)
+    await async_crud.delete_customer_group(session, group_id)
     return {'message': 'گروه با موفقیت حذف شد'}
 
 
@@ -2506,12 +2725,12 @@ async def add_member_to_group(
     group_id: int,
     person_id: str,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     افزودن مشتری به گروه
     """
-    group = crud.get_customer_group(session, group_id)
+    group = await async_crud.get_customer_group(session, group_id)
     if not group:
         raise HTTPException(status_code=404, detail='گروه یافت نشد')
     
@@ -2519,11 +2738,11 @@ async def add_member_to_group(
         raise HTTPException(status_code=403, detail='فقط مالک گروه می‌تواند اعضای آن را تغییر دهد')
     
     # بررسی وجود مشتری
-    person = session.query(models.Person).filter(models.Person.id == person_id).first()
+    person = await async_crud.get_person(session, person_id)
     if not person:
         raise HTTPException(status_code=404, detail='مشتری یافت نشد')
     
-    member = crud.add_customer_to_group(session, group_id, person_id)
+    member = await async_crud.add_customer_to_group(session, group_id, person_id)
     return {'message': 'مشتری به گروه اضافه شد', 'member_id': member.id}
 
 
@@ -2532,19 +2751,19 @@ async def remove_member_from_group(
     group_id: int,
     person_id: str,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """
     حذف مشتری از گروه
     """
-    group = crud.get_customer_group(session, group_id)
+    group = await async_crud.get_customer_group(session, group_id)
     if not group:
         raise HTTPException(status_code=404, detail='گروه یافت نشد')
     
     if group.created_by_user_id != current.id:
         raise HTTPException(status_code=403, detail='فقط مالک گروه می‌تواند اعضای آن را تغییر دهد')
     
-    success = crud.remove_customer_from_group(session, group_id, person_id)
+    success = await async_crud.remove_customer_from_group(session, group_id, person_id)
     if not success:
         raise HTTPException(status_code=404, detail='مشتری در این گروه یافت نشد')
     
@@ -2556,10 +2775,10 @@ async def remove_member_from_group(
 @app.get('/api/icc/categories', response_model=List[schemas.IccCategoryOut])
 async def list_icc_categories(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت تمام دسته‌بندی‌های ICC"""
-    categories = crud.get_all_icc_categories(session)
+    categories = await async_crud.get_all_icc_categories(session)
     return categories
 
 
@@ -2567,10 +2786,10 @@ async def list_icc_categories(
 async def create_icc_category(
     payload: schemas.IccCategoryCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد دسته‌بندی ICC"""
-    category = crud.create_icc_category(session, payload)
+    category = await async_crud.create_icc_category(session, payload)
     return category
 
 
@@ -2578,10 +2797,10 @@ async def create_icc_category(
 async def get_icc_category(
     category_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت دسته‌بندی ICC"""
-    category = crud.get_icc_category(session, category_id)
+    category = await async_crud.get_icc_category(session, category_id)
     if not category:
         raise HTTPException(status_code=404, detail='دسته‌بندی یافت نشد')
     return category
@@ -2592,10 +2811,10 @@ async def update_icc_category(
     category_id: int,
     payload: schemas.IccCategoryUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی دسته‌بندی ICC"""
-    category = crud.update_icc_category(session, category_id, payload)
+    category = await async_crud.update_icc_category(session, category_id, payload)
     if not category:
         raise HTTPException(status_code=404, detail='دسته‌بندی یافت نشد')
     return category
@@ -2605,10 +2824,10 @@ async def update_icc_category(
 async def delete_icc_category(
     category_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف دسته‌بندی ICC"""
-    success = crud.delete_icc_category(session, category_id)
+    success = await async_crud.delete_icc_category(session, category_id)
     if not success:
         raise HTTPException(status_code=404, detail='دسته‌بندی یافت نشد')
     return {'message': 'دسته‌بندی با موفقیت حذف شد'}
@@ -2618,24 +2837,20 @@ async def delete_icc_category(
 async def list_icc_centers(
     category_id: Optional[int] = None,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت مراکز ICC"""
-    if category_id:
-        centers = crud.get_icc_centers_by_category(session, category_id)
-    else:
-        centers = session.query(models.IccCenter).order_by(models.IccCenter.name).all()
-    return centers
+    return await async_crud.get_icc_centers(session, category_id)
 
 
 @app.post('/api/icc/centers', response_model=schemas.IccCenterOut)
 async def create_icc_center(
     payload: schemas.IccCenterCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد مرکز ICC"""
-    center = crud.create_icc_center(session, payload)
+    center = await async_crud.create_icc_center(session, payload)
     return center
 
 
@@ -2643,10 +2858,10 @@ async def create_icc_center(
 async def get_icc_center(
     center_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت مرکز ICC"""
-    center = crud.get_icc_center(session, center_id)
+    center = await async_crud.get_icc_center(session, center_id)
     if not center:
         raise HTTPException(status_code=404, detail='مرکز یافت نشد')
     return center
@@ -2657,10 +2872,10 @@ async def update_icc_center(
     center_id: int,
     payload: schemas.IccCenterUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی مرکز ICC"""
-    center = crud.update_icc_center(session, center_id, payload)
+    center = await async_crud.update_icc_center(session, center_id, payload)
     if not center:
         raise HTTPException(status_code=404, detail='مرکز یافت نشد')
     return center
@@ -2670,10 +2885,10 @@ async def update_icc_center(
 async def delete_icc_center(
     center_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف مرکز ICC"""
-    success = crud.delete_icc_center(session, center_id)
+    success = await async_crud.delete_icc_center(session, center_id)
     if not success:
         raise HTTPException(status_code=404, detail='مرکز یافت نشد')
     return {'message': 'مرکز با موفقیت حذف شد'}
@@ -2683,24 +2898,20 @@ async def delete_icc_center(
 async def list_icc_units(
     center_id: Optional[int] = None,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت واحدهای ICC"""
-    if center_id:
-        units = crud.get_icc_units_by_center(session, center_id)
-    else:
-        units = session.query(models.IccUnit).order_by(models.IccUnit.name).all()
-    return units
+    return await async_crud.get_icc_units(session, center_id)
 
 
 @app.post('/api/icc/units', response_model=schemas.IccUnitOut)
 async def create_icc_unit(
     payload: schemas.IccUnitCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد واحد ICC"""
-    unit = crud.create_icc_unit(session, payload)
+    unit = await async_crud.create_icc_unit(session, payload)
     return unit
 
 
@@ -2708,10 +2919,10 @@ async def create_icc_unit(
 async def get_icc_unit(
     unit_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت واحد ICC"""
-    unit = crud.get_icc_unit(session, unit_id)
+    unit = await async_crud.get_icc_unit(session, unit_id)
     if not unit:
         raise HTTPException(status_code=404, detail='واحد یافت نشد')
     return unit
@@ -2722,10 +2933,10 @@ async def update_icc_unit(
     unit_id: int,
     payload: schemas.IccUnitUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی واحد ICC"""
-    unit = crud.update_icc_unit(session, unit_id, payload)
+    unit = await async_crud.update_icc_unit(session, unit_id, payload)
     if not unit:
         raise HTTPException(status_code=404, detail='واحد یافت نشد')
     return unit
@@ -2735,10 +2946,10 @@ async def update_icc_unit(
 async def delete_icc_unit(
     unit_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف واحد ICC"""
-    success = crud.delete_icc_unit(session, unit_id)
+    success = await async_crud.delete_icc_unit(session, unit_id)
     if not success:
         raise HTTPException(status_code=404, detail='واحد یافت نشد')
     return {'message': 'واحد با موفقیت حذف شد'}
@@ -2748,24 +2959,20 @@ async def delete_icc_unit(
 async def list_icc_extensions(
     unit_id: Optional[int] = None,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت شاخه‌های ICC"""
-    if unit_id:
-        extensions = crud.get_icc_extensions_by_unit(session, unit_id)
-    else:
-        extensions = session.query(models.IccExtension).order_by(models.IccExtension.name).all()
-    return extensions
+    return await async_crud.get_icc_extensions(session, unit_id)
 
 
 @app.post('/api/icc/extensions', response_model=schemas.IccExtensionOut)
 async def create_icc_extension(
     payload: schemas.IccExtensionCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد شاخه ICC"""
-    extension = crud.create_icc_extension(session, payload)
+    extension = await async_crud.create_icc_extension(session, payload)
     return extension
 
 
@@ -2773,10 +2980,10 @@ async def create_icc_extension(
 async def get_icc_extension(
     extension_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت شاخه ICC"""
-    extension = crud.get_icc_extension(session, extension_id)
+    extension = await async_crud.get_icc_extension(session, extension_id)
     if not extension:
         raise HTTPException(status_code=404, detail='شاخه یافت نشد')
     return extension
@@ -2787,10 +2994,10 @@ async def update_icc_extension(
     extension_id: int,
     payload: schemas.IccExtensionUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی شاخه ICC"""
-    extension = crud.update_icc_extension(session, extension_id, payload)
+    extension = await async_crud.update_icc_extension(session, extension_id, payload)
     if not extension:
         raise HTTPException(status_code=404, detail='شاخه یافت نشد')
     return extension
@@ -2800,22 +3007,63 @@ async def update_icc_extension(
 async def delete_icc_extension(
     extension_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف شاخه ICC"""
-    success = crud.delete_icc_extension(session, extension_id)
+    success = await async_crud.delete_icc_extension(session, extension_id)
     if not success:
         raise HTTPException(status_code=404, detail='شاخه یافت نشد')
     return {'message': 'شاخه با موفقیت حذف شد'}
 
 
+@app.get('/api/icc/tree')
+def api_icc_tree(
+    request: Request,
+    root: Optional[str] = None,
+    root_id: Optional[int] = None,
+    depth: Optional[int] = None,
+    current: models.User = Depends(get_current_user),
+    session: Session = Depends(db.get_db)
+):
+    """درخت کامل ICC (دسته > مرکز > واحد > شاخه) در حداکثر چهار کوئری؛ root/root_id برای زیردرخت و depth برای تعداد سطوح"""
+    if root is not None and (root not in icc_tree.LEVEL_NAMES or root_id is None):
+        raise HTTPException(status_code=400, detail=f'root باید یکی از {", ".join(icc_tree.LEVEL_NAMES)} و همراه root_id باشد')
+    if depth is not None and not 1 <= depth <= len(icc_tree.LEVELS):
+        raise HTTPException(status_code=400, detail=f'depth باید بین 1 و {len(icc_tree.LEVELS)} باشد')
+    if root is None:
+        root_id = None
+    tag = icc_tree.etag(icc_tree.version(), root, root_id, depth)
+    if tag in [t.strip() for t in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers={'ETag': tag, 'Cache-Control': 'private, no-cache'})
+    tag, body = icc_tree.cached_tree(session, root, root_id, depth)
+    if body is None:
+        raise HTTPException(status_code=404, detail='گره ریشه یافت نشد')
+    return Response(content=body, media_type='application/json', headers={'ETag': tag, 'Cache-Control': 'private, no-cache'})
+
+
+@app.post('/api/icc/sync')
+def api_icc_sync(full: bool = False, current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """همگام‌سازی سلسله‌مراتب ICC از sync_url ها در پس‌زمینه (full=true: بدون توجه به last_synced_at)"""
+    if not icc_sync.ROOT_URL:
+        raise HTTPException(status_code=400, detail='ICC_SYNC_URL تنظیم نشده است')
+    if not icc_sync.run_in_background(full=full):
+        raise HTTPException(status_code=409, detail='همگام‌سازی ICC در حال اجراست')
+    return {'started': True, 'full': full}
+
+
+@app.get('/api/icc/sync')
+def api_icc_sync_status(current: models.User = Depends(require_roles(role_names=['Admin']))):
+    """وضعیت و نتیجه آخرین همگام‌سازی ICC (تعداد درج/به‌روزرسانی هر سطح)"""
+    return icc_sync.status()
+
+
 # ==================== System Settings API ====================
 
 @app.get('/api/admin/settings', response_model=List[schemas.SystemSettingOut])
 async def get_all_settings(
     category: Optional[str] = None,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت تمام تنظیمات سیستم (فقط ادمین)"""
     # Check admin access
@@ -2823,9 +3071,9 @@ async def get_all_settings(
         raise HTTPException(status_code=403, detail='دسترسی محدود')
     
     if category:
-        settings = crud.get_system_settings_by_category(session, category)
+        settings = await async_crud.get_system_settings_by_category(session, category)
     else:
-        settings = crud.get_all_system_settings(session)
+        settings = await async_crud.get_all_system_settings(session)
     
     # Hide secret values if not admin details request
     for setting in settings:
@@ -2839,13 +3087,13 @@ async def get_all_settings(
 async def get_setting(
     key: str,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت تنظیم خاص"""
     if not current.role or current.role != 'Admin':
         raise HTTPException(status_code=403, detail='دسترسی محدود')
     
-    setting = crud.get_system_setting(session, key)
+    setting = await async_crud.get_system_setting(session, key)
     if not setting:
         raise HTTPException(status_code=404, detail='تنظیم یافت نشد')
     
@@ -2859,18 +3107,18 @@ async def get_setting(
 async def create_setting(
     payload: schemas.SystemSettingCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد تنظیم سیستم جدید"""
     if not current.role or current.role != 'Admin':
         raise HTTPException(status_code=403, detail='دسترسی محدود')
     
     # Check if key already exists
-    existing = crud.get_system_setting(session, payload.key)
+    existing = await async_crud.get_system_setting(session, payload.key)
     if existing:
         raise HTTPException(status_code=400, detail='این کلید از قبل وجود دارد')
     
-    setting = crud.create_system_setting(session, payload, current.id)
+    setting = await async_crud.create_system_setting(session, payload, current.id)
     return setting
 
 
@@ -2879,13 +3127,13 @@ async def update_setting(
     key: str,
     payload: schemas.SystemSettingUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی تنظیم سیستم"""
     if not current.role or current.role != 'Admin':
         raise HTTPException(status_code=403, detail='دسترسی محدود')
     
-    setting = crud.update_system_setting(session, key, payload, current.id)
+    setting = await async_crud.update_system_setting(session, key, payload, current.id)
     if not setting:
         raise HTTPException(status_code=404, detail='تنظیم یافت نشد')
     
@@ -2899,13 +3147,13 @@ async def update_setting(
 async def delete_setting(
     key: str,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف تنظیم سیستم"""
     if not current.role or current.role != 'Admin':
         raise HTTPException(status_code=403, detail='دسترسی محدود')
     
-    success = crud.delete_system_setting(session, key)
+    success = await async_crud.delete_system_setting(session, key)
     if not success:
         raise HTTPException(status_code=404, detail='تنظیم یافت نشد')
     
@@ -2917,10 +3165,10 @@ async def delete_setting(
 @app.get('/api/dashboard/widgets', response_model=List[schemas.DashboardWidgetOut])
 async def get_dashboard_widgets(
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت widgets داشبورد کاربر"""
-    widgets = crud.get_user_dashboard_widgets(session, current.id)
+    widgets = await async_crud.get_user_dashboard_widgets(session, current.id)
     return widgets
 
 
@@ -2928,10 +3176,10 @@ async def get_dashboard_widgets(
 async def create_widget(
     payload: schemas.DashboardWidgetCreate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """ایجاد widget جدید"""
-    widget = crud.create_dashboard_widget(session, current.id, payload)
+    widget = await async_crud.create_dashboard_widget(session, current.id, payload)
     return widget
 
 
@@ -2939,10 +3187,10 @@ async def create_widget(
 async def get_widget(
     widget_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """دریافت widget خاص"""
-    widget = crud.get_dashboard_widget(session, widget_id)
+    widget = await async_crud.get_dashboard_widget(session, widget_id)
     if not widget or widget.user_id != current.id:
         raise HTTPException(status_code=404, detail='Widget یافت نشد')
     return widget
@@ -2953,14 +3201,14 @@ async def update_widget(
     widget_id: int,
     payload: schemas.DashboardWidgetUpdate,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """به‌روزرسانی widget"""
-    widget = crud.get_dashboard_widget(session, widget_id)
+    widget = await async_crud.get_dashboard_widget(session, widget_id)
     if not widget or widget.user_id != current.id:
         raise HTTPException(status_code=404, detail='Widget یافت نشد')
     
-    updated = crud.update_dashboard_widget(session, widget_id, payload)
+    updated = await async_crud.update_dashboard_widget(session, widget_id, payload)
     return updated
 
 
@@ -2968,14 +3216,14 @@ async def update_widget(
 async def delete_widget(
     widget_id: int,
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """حذف widget"""
-    widget = crud.get_dashboard_widget(session, widget_id)
+    widget = await async_crud.get_dashboard_widget(session, widget_id)
     if not widget or widget.user_id != current.id:
         raise HTTPException(status_code=404, detail='Widget یافت نشد')
     
-    success = crud.delete_dashboard_widget(session, widget_id)
+    success = await async_crud.delete_dashboard_widget(session, widget_id)
     if not success:
         raise HTTPException(status_code=400, detail='حذف widget ناموفق بود')
     
@@ -2986,11 +3234,11 @@ async def delete_widget(
 async def reorder_widgets(
     payload: dict,  # {'widgets': [{'widget_id': 1, 'position_x': 0, 'position_y': 0, ...}, ...]}
     current: models.User = Depends(get_current_user),
-    session: Session = Depends(db.get_db)
+    session: AsyncSession = Depends(db.get_async_db)
 ):
     """تغییر موقعیت و اندازه widgets (برای drag-and-drop)"""
     widgets = payload.get('widgets', [])
-    success = crud.reorder_dashboard_widgets(session, current.id, widgets)
+    success = await async_crud.reorder_dashboard_widgets(session, current.id, widgets)
     if not success:
         raise HTTPException(status_code=400, detail='تغییر ترتیب ناموفق بود')
     
@@ -2998,7 +3246,7 @@ async def reorder_widgets(
 
 
 @app.post('/api/test/send-sms')
-async def test_send_sms(
+def test_send_sms(
     payload: dict,  # {'mobile': '...', 'message': '...'}
     current: models.User = Depends(get_current_user),
     session: Session = Depends(db.get_db)
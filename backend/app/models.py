@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, UniqueConstraint, Index, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .db import Base
@@ -101,6 +101,8 @@ class Product(Base):
 
 class PriceHistory(Base):
     __tablename__ = 'price_histories'
+    # latest price per product (search docs, stock valuation, facet price ranges)
+    __table_args__ = (Index('ix_price_histories_product_effective', 'product_id', 'effective_at'),)
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(String(128), ForeignKey('products.id'), nullable=False)
     price = Column(Integer, nullable=False)
@@ -143,8 +145,8 @@ class Invoice(Base):
 class InvoiceItem(Base):
     __tablename__ = 'invoice_items'
     id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(Integer, ForeignKey('invoices.id'), nullable=False)
-    product_id = Column(String(128), ForeignKey('products.id'), nullable=True)
+    invoice_id = Column(Integer, ForeignKey('invoices.id'), nullable=False, index=True)
+    product_id = Column(String(128), ForeignKey('products.id'), nullable=True, index=True)
     description = Column(String(1024), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
     unit = Column(String(64), nullable=True)
@@ -222,6 +224,26 @@ class IntegrationConfig(Base):
     api_key = Column(String(512), nullable=True)
     config = Column(Text, nullable=True)  # JSON blob for extra settings (interval, endpoints, flags)
     last_updated = Column(DateTime(timezone=True), nullable=True)
+    # integration_scheduler state: lease / next due time and a summary of the latest run
+    next_run_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    running_since = Column(DateTime(timezone=True), nullable=True)  # claimed by a scheduler worker, until the run ends
+    failure_count = Column(Integer, nullable=False, default=0)
+    last_status = Column(String(64), nullable=True)
+    last_latency_ms = Column(Integer, nullable=True)
+
+
+class IntegrationRun(Base):
+    """One refresh of an integration (scheduled or requested by an admin)."""
+    __tablename__ = 'integration_runs'
+    __table_args__ = (Index('ix_integration_runs_integration_started', 'integration_id', 'started_at'),)
+    id = Column(Integer, primary_key=True, index=True)
+    integration_id = Column(Integer, ForeignKey('integration_configs.id', ondelete='CASCADE'), nullable=False)
+    trigger = Column(String(16), nullable=False, default='schedule')  # schedule or manual
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    latency_ms = Column(Integer, nullable=False)
+    status = Column(String(64), nullable=False)  # ok, disabled, unknown-provider, error:...
+    error = Column(Text, nullable=True)
+    payload = Column(Text, nullable=True)  # JSON sample returned by the provider, truncated
 
 
 class SharedFile(Base):
@@ -277,6 +299,52 @@ class UserSmsConfig(Base):
     user = relationship('User', backref='sms_config')
 
 
+class SmsMessage(Base):
+    """One SMS in the outbox; sent by the background sender (sms_outbox.py)."""
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (Index('ix_sms_outbox_status_next', 'status', 'next_attempt_at'),)
+    id = Column(Integer, primary_key=True, index=True)
+    to = Column(String(32), nullable=False)
+    message = Column(Text, nullable=False)
+    provider = Column(String(50), nullable=True)  # None: the configured provider
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True)  # whose SMS config to use
+    campaign_id = Column(Integer, ForeignKey('sms_campaigns.id', ondelete='SET NULL'), nullable=True, index=True)
+    kind = Column(String(32), nullable=False, default='manual')  # otp, manual, auto, campaign
+    priority = Column(Integer, nullable=False, default=5)  # lower goes first
+    status = Column(String(16), nullable=False, default='queued')  # queued, sending, sent, delivered, undelivered, failed, expired, cancelled
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=True)  # not sent after this (OTPs)
+    claim = Column(String(32), nullable=True)
+    provider_message_id = Column(String(128), nullable=True, index=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class SmsCampaign(Base):
+    """A templated SMS to every member of a customer group (sms_campaigns.py)."""
+    __tablename__ = 'sms_campaigns'
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(128), nullable=True)
+    group_id = Column(Integer, ForeignKey('customer_groups.id', ondelete='SET NULL'), nullable=True, index=True)
+    created_by_user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True, index=True)
+    template = Column(Text, nullable=False)
+    options = Column(JSON, nullable=True)  # within_days, min_balance, only_due_cheques
+    status = Column(String(16), nullable=False, default='pending')  # pending, preparing, queued, done, cancelled, failed
+    members = Column(Integer, nullable=False, default=0)
+    recipients = Column(Integer, nullable=False, default=0)  # after dedup and filters
+    queued = Column(Integer, nullable=False, default=0)  # written to the outbox so far
+    invalid = Column(Integer, nullable=False, default=0)  # no or malformed mobile
+    duplicates = Column(Integer, nullable=False, default=0)
+    filtered = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class UserPreferences(Base):
     __tablename__ = 'user_preferences'
     id = Column(Integer, primary_key=True, index=True)
@@ -482,3 +550,35 @@ class DashboardWidget(Base):
     
     # Relationships
     user = relationship('User', backref='dashboard_widgets')
+
+
+class SearchOutbox(Base):
+    """Search-index changes written in the same transaction as the entity change.
+
+    The relay in search_outbox.py drains unsent rows to Meilisearch; clearing
+    `sent_at` on a range of rows replays them. Unsent rows with `attempts` at
+    search_outbox.MAX_ATTEMPTS are dead: no longer retried until replayed.
+    """
+    __tablename__ = 'search_outbox'
+    id = Column(Integer, primary_key=True, index=True)  # replay position
+    index_name = Column(String(64), nullable=False)  # products, persons, invoices, payments
+    doc_id = Column(String(128), nullable=False)
+    op = Column(String(16), nullable=False, default='upsert')  # upsert or delete
+    attempts = Column(Integer, nullable=False, default=0)  # rejections; given up on at MAX_ATTEMPTS
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # retry backoff after a rejection
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    sent_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+
+class FxRate(Base):
+    """Currency / crypto quotes recorded by the fx_rates refresher, one row per symbol per fetch."""
+    __tablename__ = 'fx_rates'
+    __table_args__ = (Index('ix_fx_rates_kind_symbol_fetched', 'kind', 'symbol', 'fetched_at'),)
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(16), nullable=False)  # fx or crypto
+    symbol = Column(String(32), nullable=False)  # EUR, IRR / bitcoin, ethereum
+    base = Column(String(16), nullable=False)  # quote currency: USD for fx, usd for crypto
+    rate = Column(Float, nullable=False)
+    source = Column(String(64), nullable=True)
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
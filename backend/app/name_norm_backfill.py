@@ -0,0 +1,161 @@
+"""Recompute stored name_norm columns after the normalizer rules change.
+
+products, persons and accounts keep normalize_for_search(name) in name_norm
+for indexed search. When normalizer.NORMALIZER_VERSION is bumped, this job
+walks each table by primary key in chunks, normalizes the names with
+normalize_many and writes only the rows whose value changed. Changed
+products and persons also get a search_outbox row so the search indexes
+follow. The applied version is stored in system_settings; the app starts the
+job in the background when it is behind, in the one worker that claims it in
+the shared store (the claim is renewed per chunk and expires with a dead worker).
+
+    python -m app.name_norm_backfill [products persons accounts] [--chunk-size N] [--force]
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import update
+
+from . import db, models, search_outbox, shared_store
+from .normalizer import NORMALIZER_VERSION, normalize_many
+
+LOGGER = logging.getLogger(__name__)
+
+ON_STARTUP = os.getenv('NAME_NORM_BACKFILL_ON_STARTUP', '1').lower() not in ('0', 'false', 'no')
+VERSION_KEY = 'normalizer_version'
+CLAIM_TTL = 600  # seconds without a finished chunk before another worker may take the backfill over
+
+# table -> (model, search index fed through the outbox or None)
+TABLES = {
+    'products': (models.Product, 'products'),
+    'persons': (models.Person, 'persons'),
+    'accounts': (models.Account, None),
+}
+
+_THREAD: Optional[threading.Thread] = None
+
+
+def applied_version(session) -> Optional[int]:
+    row = session.query(models.SystemSettings).filter(models.SystemSettings.key == VERSION_KEY).first()
+    try:
+        return int(row.value) if row and row.value is not None else None
+    except ValueError:
+        return None
+
+
+def _set_applied_version(session, version: int):
+    row = session.query(models.SystemSettings).filter(models.SystemSettings.key == VERSION_KEY).first()
+    if row is None:
+        row = models.SystemSettings(key=VERSION_KEY, setting_type='int', category='system',
+                                    display_name='Search normalizer version')
+        session.add(row)
+    row.value = str(version)
+    session.commit()
+
+
+def backfill_table(session, name: str, chunk_size: int = 2000, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    model, index_name = TABLES[name]
+    stats = {'table': name, 'scanned': 0, 'updated': 0}
+    started = time.time()
+    last_id = None
+    while True:
+        q = session.query(model.id, model.name, model.name_norm).order_by(model.id)
+        if last_id is not None:
+            q = q.filter(model.id > last_id)
+        rows = q.limit(chunk_size).all()
+        if not rows:
+            break
+        changed = [
+            {'id': row.id, 'name_norm': norm}
+            for row, norm in zip(rows, normalize_many(r.name for r in rows))
+            if norm != row.name_norm
+        ]
+        if changed:
+            session.execute(update(model), changed)
+            if index_name:
+                for row in changed:
+                    search_outbox.record(session, index_name, row['id'])
+        session.commit()
+        stats['scanned'] += len(rows)
+        stats['updated'] += len(changed)
+        stats['rows_per_second'] = round(stats['scanned'] / max(time.time() - started, 1e-6), 1)
+        last_id = rows[-1].id
+        if progress:
+            progress(dict(stats))
+    if stats['updated']:
+        search_outbox.notify()
+    return stats
+
+
+def backfill(session, tables: Optional[List[str]] = None, chunk_size: int = 2000, force: bool = False,
+             progress: Optional[Callable[[dict], None]] = None) -> Dict[str, dict]:
+    """Bring name_norm up to NORMALIZER_VERSION. Returns per-table stats ({} when already current)."""
+    if not force and applied_version(session) == NORMALIZER_VERSION:
+        return {}
+    out = {name: backfill_table(session, name, chunk_size, progress) for name in (tables or list(TABLES))}
+    if tables is None or set(tables) == set(TABLES):
+        _set_applied_version(session, NORMALIZER_VERSION)
+    return out
+
+
+def _claim_key() -> str:
+    return f'name_norm_backfill:v{NORMALIZER_VERSION}'
+
+
+def _claim(store) -> bool:
+    """True for the one worker that runs the startup backfill to this normalizer version."""
+    return store.incr(_claim_key(), ttl=CLAIM_TTL) == 1
+
+
+def _run(session_factory):
+    store = shared_store.get_store()
+    if not _claim(store):
+        return
+    key = _claim_key()
+    session = session_factory()
+    try:
+        stats = backfill(session, progress=lambda _: store.set(key, 1, ttl=CLAIM_TTL))
+        if stats:
+            LOGGER.info('name_norm backfill to normalizer v%d: %s', NORMALIZER_VERSION, stats)
+    except Exception as e:
+        session.rollback()
+        LOGGER.warning('name_norm backfill failed: %s', e)
+        store.delete(key)  # the next worker to start tries again
+    finally:
+        session.close()
+
+
+def start_if_needed(session_factory=None):
+    """Run the backfill in a background thread when the stored version is behind and no other worker has it."""
+    global _THREAD
+    if not ON_STARTUP or _THREAD is not None:
+        return
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='name-norm-backfill', daemon=True)
+    _THREAD.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute name_norm after normalizer rule changes')
+    parser.add_argument('tables', nargs='*', help=f"any of: {', '.join(TABLES)} (default: all)")
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    parser.add_argument('--force', action='store_true', help='run even if the stored normalizer version is current')
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(TABLES)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.INFO)
+    session = db.SessionLocal()
+    try:
+        stats = backfill(session, args.tables or None, args.chunk_size, args.force,
+                         progress=lambda s: print(f"{s['table']}: {s['scanned']} scanned, {s['updated']} updated, {s['rows_per_second']} rows/s"))
+        print(stats or f'name_norm already at normalizer v{NORMALIZER_VERSION} (use --force to rerun)')
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
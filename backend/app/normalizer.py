@@ -1,4 +1,8 @@
 import re
+from typing import Iterable, List, Optional
+
+# bump whenever the rules below change; name_norm_backfill recomputes stored name_norm columns
+NORMALIZER_VERSION = 1
 
 PERSIAN_DIGITS = '۰۱۲۳۴۵۶۷۸۹'
 ARABIC_INDIC_DIGITS = '٠١٢٣٤٥٦٧٨٩'
@@ -15,36 +19,62 @@ ARABIC_TO_PERSIAN = {
     '\u0622': 'ا',
 }
 
+# tatweel, ZWNJ, zero-width space, soft hyphen
+REMOVED_CHARS = '\u0640\u200c\u200b\u00AD'
+
+_DIGITS_TABLE = str.maketrans(PERSIAN_DIGITS + ARABIC_INDIC_DIGITS, LATIN_DIGITS * 2)
+_LETTERS_TABLE = str.maketrans(ARABIC_TO_PERSIAN)
+_REMOVE_TABLE = str.maketrans('', '', REMOVED_CHARS)
+# everything normalize_for_search maps character by character, in one str.translate pass
+_SEARCH_TABLE = {**_DIGITS_TABLE, **_LETTERS_TABLE, **_REMOVE_TABLE}
+
+_REMOVED_RE = re.compile(f'[{REMOVED_CHARS}]')
+_SPACES_RE = re.compile(r'\s+')
+
 
 def digits_to_latin(s: str) -> str:
-    out = []
-    for ch in s:
-        if ch in PERSIAN_DIGITS:
-            out.append(str(PERSIAN_DIGITS.index(ch)))
-        elif ch in ARABIC_INDIC_DIGITS:
-            out.append(str(ARABIC_INDIC_DIGITS.index(ch)))
-        else:
-            out.append(ch)
-    return ''.join(out)
+    return s.translate(_DIGITS_TABLE)
 
 
 def replace_arabic_letters(s: str) -> str:
-    return ''.join(ARABIC_TO_PERSIAN.get(c, c) for c in s)
+    return s.translate(_LETTERS_TABLE)
 
 
 def remove_tatweel_zwnj(s: str) -> str:
-    return re.sub(r'[\u0640\u200c\u200b\u00AD]', '', s)
+    return _REMOVED_RE.sub('', s)
 
 
 def normalize_spaces(s: str) -> str:
-    return re.sub(r'\s+', ' ', s).strip()
+    return _SPACES_RE.sub(' ', s).strip()
 
 
-def normalize_for_search(s: str) -> str:
+def normalize_for_search(s: Optional[str]) -> str:
     if s is None:
         return ''
-    s2 = digits_to_latin(s)
-    s2 = replace_arabic_letters(s2)
-    s2 = remove_tatweel_zwnj(s2)
-    s2 = normalize_spaces(s2)
-    return s2.lower()
+    # str.split() splits on the same whitespace as \s, so this equals normalize_spaces
+    return ' '.join(s.translate(_SEARCH_TABLE).split()).lower()
+
+
+def normalize_many(values: Iterable[Optional[str]]) -> List[str]:
+    """normalize_for_search over a batch (backfills, bulk imports, index builds)."""
+    table = _SEARCH_TABLE
+    return [' '.join(v.translate(table).split()).lower() if v is not None else '' for v in values]
+
+
+_NON_DIGITS_RE = re.compile(r'\D')
+
+
+def normalize_mobile(s: Optional[str]) -> Optional[str]:
+    """An Iranian mobile as 09xxxxxxxxx (from +98 / 0098 / 98 / 9.. forms, any digits); None if it is not one."""
+    if not s:
+        return None
+    digits = _NON_DIGITS_RE.sub('', digits_to_latin(s))
+    if digits.startswith('0098'):
+        digits = digits[4:]
+    elif digits.startswith('98') and len(digits) == 12:
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = digits[1:]
+    if len(digits) != 10 or not digits.startswith('9'):
+        return None
+    return '0' + digits
@@ -0,0 +1,156 @@
+"""Two-level cache for scraped marketplace data (external_search).
+
+Level one is an in-process LRU, level two a SQLite file shared by every
+worker on the host, so a page parsed once is not downloaded again until its
+TTL runs out. Entries are kept on disk past their TTL (up to MAX_AGE) with the
+ETag / Last-Modified the site sent: a stale page is revalidated with a
+conditional request and a 304 just renews it, without a download or a parse.
+
+Keys are namespaced ('page', 'search'); hits, misses, stale lookups and 304
+revalidations are counted per namespace for `stats()`.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any, Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+_BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# empty to keep the cache in memory only
+CACHE_PATH = os.getenv('EXTERNAL_CACHE_PATH', os.path.join(_BASE_DIR, 'hp_external_cache.sqlite3'))
+MEMORY_SIZE = int(os.getenv('EXTERNAL_CACHE_MEMORY', '1024'))
+# stale entries are still worth a conditional request for this long (seconds)
+MAX_AGE = float(os.getenv('EXTERNAL_CACHE_MAX_AGE', str(7 * 86400)))
+_PRUNE_INTERVAL = 300
+
+Entry = namedtuple('Entry', 'value etag last_modified stored_at')
+
+_COUNTERS = ('memory_hits', 'disk_hits', 'stale', 'misses', 'revalidated', 'stores')
+
+
+class PageCache:
+    def __init__(self, path: Optional[str] = CACHE_PATH, memory_size: int = MEMORY_SIZE, max_age: float = MAX_AGE):
+        self.memory_size = memory_size
+        self.max_age = max_age
+        self._memory: 'OrderedDict[str, Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._last_prune = 0.0
+        self._conn = None
+        if path:
+            try:
+                self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                    'etag TEXT, last_modified TEXT, stored_at REAL NOT NULL)'
+                )
+                self._conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_stored_at ON entries (stored_at)')
+            except sqlite3.Error as e:
+                LOGGER.warning('external cache %s unavailable, keeping it in memory only: %s', path, e)
+                self._conn = None
+
+    def _count(self, namespace: str, counter: str):
+        ns = self._stats.get(namespace)
+        if ns is None:
+            ns = self._stats[namespace] = dict.fromkeys(_COUNTERS, 0)
+        ns[counter] += 1
+
+    def _remember(self, key: str, entry: Entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[Entry]:
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute(
+                'SELECT value, etag, last_modified, stored_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            LOGGER.debug('external cache read error: %s', e)
+            return None
+        if row is None:
+            return None
+        return Entry(json.loads(row[0]), row[1], row[2], row[3])
+
+    def _disk_put(self, key: str, entry: Entry):
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, value, etag, last_modified, stored_at) VALUES (?, ?, ?, ?, ?)',
+                (key, json.dumps(entry.value, ensure_ascii=False), entry.etag, entry.last_modified, entry.stored_at),
+            )
+            if entry.stored_at - self._last_prune >= _PRUNE_INTERVAL:
+                self._conn.execute('DELETE FROM entries WHERE stored_at < ?', (entry.stored_at - self.max_age,))
+                self._last_prune = entry.stored_at
+        except sqlite3.Error as e:
+            LOGGER.debug('external cache write error: %s', e)
+
+    def lookup(self, namespace: str, key: str, ttl: float) -> Optional[Entry]:
+        """Cached entry for `key`, fresh or stale (check `is_fresh`); None when nothing usable is stored."""
+        key = f'{namespace}:{key}'
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            level = 'memory_hits'
+            if entry is None:
+                entry = self._disk_get(key)
+                level = 'disk_hits'
+                if entry is not None:
+                    self._remember(key, entry)
+            else:
+                self._memory.move_to_end(key)
+            if entry is None or now - entry.stored_at > self.max_age:
+                self._count(namespace, 'misses')
+                return None
+            self._count(namespace, level if now - entry.stored_at <= ttl else 'stale')
+            return entry
+
+    @staticmethod
+    def is_fresh(entry: Entry, ttl: float) -> bool:
+        return time.time() - entry.stored_at <= ttl
+
+    def put(self, namespace: str, key: str, value: Any, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        key = f'{namespace}:{key}'
+        entry = Entry(value, etag, last_modified, time.time())
+        with self._lock:
+            self._remember(key, entry)
+            self._disk_put(key, entry)
+            self._count(namespace, 'stores')
+
+    def revalidated(self, namespace: str, key: str, entry: Entry) -> Entry:
+        """The site answered 304 for a stale entry: keep its value and restart the TTL."""
+        key = f'{namespace}:{key}'
+        fresh = entry._replace(stored_at=time.time())
+        with self._lock:
+            self._remember(key, fresh)
+            self._disk_put(key, fresh)
+            self._count(namespace, 'revalidated')
+        return fresh
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM entries')
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters per namespace plus hit_ratio (answered without a download / all lookups)."""
+        with self._lock:
+            out: Dict[str, Any] = {'memory_entries': len(self._memory), 'persistent': self._conn is not None}
+            for namespace, counters in self._stats.items():
+                ns = dict(counters)
+                lookups = ns['memory_hits'] + ns['disk_hits'] + ns['stale'] + ns['misses']
+                served = ns['memory_hits'] + ns['disk_hits'] + ns['revalidated']
+                ns['hit_ratio'] = round(served / lookups, 3) if lookups else None
+                out[namespace] = ns
+            return out
@@ -0,0 +1,208 @@
+"""Product data from marketplace pages without building a full DOM.
+
+external_search only needs the og: meta tags, a price and maybe the first
+image, but product pages are hundreds of KB of markup and scripts. The
+streaming extractor feeds the response to a small html.parser handler chunk
+by chunk, stops as soon as everything it looks for has been seen and never
+reads more than BYTE_BUDGET bytes. Only when the budget runs out before a
+price element was found is the rest of the page read (up to MAX_BYTES) and
+parsed with BeautifulSoup as before.
+
+For pages read to the end the results match the BeautifulSoup path: first og: tag of each kind, price from
+the first selector in PRICE_SELECTORS whose first element has text (else a
+price found in the first TEXT_LIMIT characters of page text), first <img>.
+"""
+import codecs
+import os
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Optional
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+    _PARSER = 'lxml'
+except Exception:
+    _PARSER = 'html.parser'
+
+BYTE_BUDGET = int(os.getenv('EXTERNAL_PAGE_BYTE_BUDGET', str(256 * 1024)))
+MAX_BYTES = int(os.getenv('EXTERNAL_PAGE_MAX_BYTES', str(4 * 1024 * 1024)))
+CHUNK_SIZE = 16 * 1024
+TEXT_LIMIT = 2000
+
+OG_FIELDS = {'og:title': 'title', 'og:image': 'image', 'og:description': 'description'}
+# CSS selector and the (attribute, value) the streaming parser matches it with, in priority order
+PRICE_SELECTORS = [
+    ('[itemprop=price]', ('itemprop', 'price')),
+    ('.c-price', ('class', 'c-price')),
+    ('.price', ('class', 'price')),
+    ('.js-price', ('class', 'js-price')),
+    ('.pd-price', ('class', 'pd-price')),
+    ('.dk-product-price', ('class', 'dk-product-price')),
+]
+_VOID = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٫،', '0123456789.,')
+_NUMBER_RE = re.compile(r"(\d[\d,\.\s]{0,20}\d)")
+
+
+def find_price(text: Optional[str]) -> Optional[int]:
+    """First number like 1,234,567 or ۱۲۳۴۵۶۷ in `text`."""
+    if not text:
+        return None
+    m = _NUMBER_RE.search(text.translate(_DIGITS))
+    if m:
+        try:
+            return int(re.sub(r"[^0-9]", "", m.group(1)))
+        except ValueError:
+            return None
+    return None
+
+
+class ProductPageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.og: Dict[str, Optional[str]] = {}
+        self.image: Optional[str] = None
+        self.seen_img = False
+        # selector index -> text of its first element
+        self.prices: Dict[int, str] = {}
+        self._captures = []  # [indexes, tag, depth, parts] of price elements still open
+        self._text = []
+        self._text_len = 0
+        self._skip = 0  # inside <script>/<style>
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        for cap in self._captures:
+            if cap[1] == tag:
+                cap[2] += 1
+        a = dict(attrs)
+        if tag == 'meta':
+            prop = a.get('property')
+            if prop in OG_FIELDS and prop not in self.og:
+                self.og[prop] = a.get('content')
+        elif tag == 'img' and not self.seen_img:
+            self.seen_img = True
+            self.image = a.get('src')
+        classes = (a.get('class') or '').split()
+        matched = []
+        for i, (_, (attr, value)) in enumerate(PRICE_SELECTORS):
+            if i in self.prices:
+                continue
+            if (value in classes) if attr == 'class' else a.get(attr) == value:
+                matched.append(i)
+        if not matched:
+            return
+        if a.get('content') or tag in _VOID:
+            for i in matched:
+                self.prices[i] = (a.get('content') or '').strip()
+        else:
+            for i in matched:
+                self.prices[i] = None  # claimed; filled when the element closes
+            self._captures.append([matched, tag, 1, []])
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip:
+            self._skip -= 1
+        for cap in list(self._captures):
+            if cap[1] == tag:
+                cap[2] -= 1
+                if cap[2] == 0:
+                    self._captures.remove(cap)
+                    text = ''.join(cap[3]).strip()
+                    for i in cap[0]:
+                        self.prices[i] = text
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        for cap in self._captures:
+            cap[3].append(data)
+        if self._text_len < TEXT_LIMIT:
+            data = data.strip()
+            if data:
+                self._text.append(data)
+                self._text_len += len(data) + 1
+
+    def has_price(self) -> bool:
+        return any(self.prices.values())
+
+    @property
+    def complete(self) -> bool:
+        return len(self.og) == len(OG_FIELDS) and bool(self.prices.get(0))
+
+    def result(self) -> Dict:
+        out = {field: self.og[prop] for prop, field in OG_FIELDS.items() if self.og.get(prop)}
+        text = next((t for i, t in sorted(self.prices.items()) if t), None)
+        if not text:
+            text = ' '.join(self._text)[:TEXT_LIMIT]
+        price = find_price(text)
+        if price:
+            out['price'] = price
+        if not out.get('image') and self.image:
+            out['image'] = self.image
+        return out
+
+
+def parse_full(html: str) -> Dict:
+    """The BeautifulSoup path over a whole document."""
+    soup = BeautifulSoup(html, _PARSER)
+    out = {}
+    for prop, field in OG_FIELDS.items():
+        tag = soup.find('meta', property=prop)
+        if tag and tag.get('content'):
+            out[field] = tag.get('content')
+    text = None
+    for sel, _ in PRICE_SELECTORS:
+        el = soup.select_one(sel)
+        if el:
+            text = (el.get('content') or el.get_text() or '').strip()
+            if text:
+                break
+    if not text:
+        text = soup.get_text(separator=' ', strip=True)[:TEXT_LIMIT]
+    price = find_price(text)
+    if price:
+        out['price'] = price
+    if not out.get('image'):
+        img = soup.find('img')
+        if img and img.get('src'):
+            out['image'] = img.get('src')
+    return out
+
+
+def extract(chunks: Iterable[bytes], encoding: str = 'utf-8', budget: int = BYTE_BUDGET,
+            max_bytes: int = MAX_BYTES) -> Dict:
+    """title/image/description/price from a page streamed as byte chunks.
+
+    Reads at most `budget` bytes unless the price element was not reached by
+    then; in that case up to `max_bytes` are read and parsed in full.
+    """
+    parser = ProductPageParser()
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    it = iter(chunks)
+    seen = []
+    read = 0
+    for chunk in it:
+        seen.append(chunk)
+        read += len(chunk)
+        parser.feed(decoder.decode(chunk))
+        if parser.complete:
+            return parser.result()
+        if read >= budget:
+            break
+    else:
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        return parser.result()
+    if parser.has_price():
+        return parser.result()
+    # the price may be further down: fall back to the full document
+    for chunk in it:
+        seen.append(chunk)
+        read += len(chunk)
+        if read >= max_bytes:
+            break
+    return parse_full(b''.join(seen).decode(encoding, errors='replace'))
@@ -61,6 +61,13 @@ class UserOut(BaseModel):
         orm_mode = True
 
 
+class RegisteredUserOut(UserOut):
+    # the temporary password exists only in this SMS; see its status at /api/sms/outbox/{sms_id}
+    sms_id: int
+    sms_status: str
+    detail: str
+
+
 class UserUpdate(BaseModel):
     full_name: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -390,6 +397,24 @@ class IntegrationConfigOut(BaseModel):
     api_key: Optional[str]
     config: Optional[str]
     last_updated: Optional[datetime]
+    next_run_at: Optional[datetime] = None
+    failure_count: Optional[int] = 0
+    last_status: Optional[str] = None
+    last_latency_ms: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
+
+class IntegrationRunOut(BaseModel):
+    id: int
+    integration_id: int
+    trigger: str
+    started_at: datetime
+    latency_ms: int
+    status: str
+    error: Optional[str]
+    payload: Optional[str]
 
     class Config:
         orm_mode = True
@@ -441,6 +466,8 @@ class ExternalSearchRequest(BaseModel):
     q: str
     sources: Optional[List[str]] = None
     limit: Optional[int] = 6
+    # bypass the cached result and fetch the marketplaces again
+    refresh: Optional[bool] = False
 
 
 class SaveExternalProductRequest(BaseModel):
@@ -530,6 +557,58 @@ class SmsTestResponse(BaseModel):
     message: str
 
 
+class SmsMessageOut(BaseModel):
+    id: int
+    to: str
+    message: str
+    provider: Optional[str]
+    kind: str
+    status: str
+    attempts: int
+    next_attempt_at: Optional[datetime]
+    expires_at: Optional[datetime]
+    provider_message_id: Optional[str]
+    error: Optional[str]
+    created_at: datetime
+    sent_at: Optional[datetime]
+    delivered_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
+class SmsCampaignCreate(BaseModel):
+    group_id: int
+    template: str  # e.g. "{name} عزیز، مانده حساب شما {debt} ریال است"
+    name: Optional[str] = None
+    within_days: int = 14  # window of the due_* fields
+    min_balance: Optional[int] = None  # only members whose balance is at least this
+    only_due_cheques: bool = False  # only members with a cheque due in the window
+
+
+class SmsCampaignOut(BaseModel):
+    id: int
+    name: Optional[str]
+    group_id: Optional[int]
+    created_by_user_id: Optional[int]
+    template: str
+    options: Optional[dict]
+    status: str
+    members: int
+    recipients: int
+    queued: int
+    invalid: int
+    duplicates: int
+    filtered: int
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
+
+
 class PhoneLoginRequest(BaseModel):
     phone: str  # mobile number like 09123456789
 
@@ -1,7 +1,13 @@
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 from typing import Any, Dict, List, Optional
 
+from sqlalchemy import func
+
+from . import models
 from .normalizer import normalize_for_search
 
 try:
@@ -13,6 +19,9 @@ LOGGER = logging.getLogger(__name__)
 
 MEILI_URL = os.getenv('MEILI_URL', 'http://127.0.0.1:7700')
 MEILI_KEY = os.getenv('MEILI_KEY', None)
+# time budget per index for a search_multi call; indexes that miss it come back partial
+SEARCH_BUDGET_MS = int(os.getenv('SEARCH_BUDGET_MS', '800'))
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '8'))
 
 client = None
 if Client is not None:
@@ -23,17 +32,60 @@ if Client is not None:
         client = None
 
 
+# (client, uid) -> Index handle; keyed by client so a swapped-in client never gets stale handles
+_index_cache: Dict[Any, Any] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# cleared when the server answers 404 on /multi-search (Meilisearch < 1.1)
+_multi_search_supported = True
+
+
 def _get_index(name: str):
     if client is None:
         return None
+    key = (id(client), name)
+    idx = _index_cache.get(key)
+    if idx is not None:
+        return idx
     try:
-        return client.index(name)
+        idx = client.index(name)
     except Exception:
         try:
-            return client.create_index(uid=name)
+            idx = client.create_index(uid=name)
         except Exception as e:
             LOGGER.warning('Failed to create/get index %s: %s', name, e)
             return None
+    _index_cache[key] = idx
+    return idx
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='search')
+        return _executor
+
+
+# searchable/filterable attributes per index; also applied to reindex shadow indexes
+INDEX_SETTINGS = {
+    'products': {
+        'searchableAttributes': ['name', 'code', 'description', 'name_norm'],
+        'filterableAttributes': ['group', 'unit', 'price', 'inventory'],
+    },
+    'persons': {
+        'searchableAttributes': ['name', 'name_norm', 'mobile'],
+        'filterableAttributes': [],
+    },
+    'invoices': {
+        'searchableAttributes': ['invoice_number', 'party_name', 'lines.description', 'lines.product_code'],
+        'filterableAttributes': ['invoice_type', 'status', 'total'],
+    },
+    'payments': {
+        'searchableAttributes': ['payment_number', 'party_name', 'reference'],
+        'filterableAttributes': ['direction', 'status', 'method'],
+    },
+}
 
 
 def ensure_indexes():
@@ -41,138 +93,238 @@ def ensure_indexes():
     if client is None:
         return
     try:
-        # products
-        idx = _get_index('products')
-        if idx:
-            try:
-                idx.update_settings({
-                    'searchableAttributes': ['name', 'description', 'name_norm'],
-                    'filterableAttributes': ['group', 'unit'],
-                })
-            except Exception:
-                pass
-        # persons
-        idx = _get_index('persons')
-        if idx:
-            try:
-                idx.update_settings({
-                    'searchableAttributes': ['name', 'name_norm', 'mobile'],
-                    'filterableAttributes': [],
-                })
-            except Exception:
-                pass
-        # invoices
-        idx = _get_index('invoices')
-        if idx:
-            try:
-                idx.update_settings({
-                    'searchableAttributes': ['invoice_number', 'party_name'],
-                    'filterableAttributes': ['invoice_type', 'status'],
-                })
-            except Exception:
-                pass
-        # payments
-        idx = _get_index('payments')
-        if idx:
-            try:
-                idx.update_settings({
-                    'searchableAttributes': ['payment_number', 'party_name', 'reference'],
-                    'filterableAttributes': ['direction', 'status', 'method'],
-                })
-            except Exception:
-                pass
+        for name, settings in INDEX_SETTINGS.items():
+            idx = _get_index(name)
+            if idx:
+                try:
+                    idx.update_settings(settings)
+                except Exception:
+                    pass
     except Exception as e:
         LOGGER.warning('ensure_indexes failed: %s', e)
 
 
-# basic index functions: try/except to avoid hard-failing when Meilisearch unavailable
+# ORM row -> Meilisearch document, shared by the outbox relay and full reindex
 
-def index_product(product: Dict[str, Any]):
-    """Accepts a dict with at least id,name,description,unit,group,inventory."""
-    try:
-        idx = _get_index('products')
-        if not idx:
-            return
-        doc = dict(product)
-        doc['name_norm'] = normalize_for_search(doc.get('name') or '')
-        # Meilisearch expects an 'id' field
-        if 'id' not in doc:
-            doc['id'] = doc.get('id') or doc.get('product_id')
-        idx.add_documents([doc], primary_key='id')
-    except Exception as e:
-        LOGGER.warning('index_product error: %s', e)
+def product_doc(p: models.Product, price: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        'id': p.id,
+        'name': p.name,
+        'name_norm': normalize_for_search(p.name or ''),
+        'code': p.code,
+        'description': p.description,
+        'unit': p.unit,
+        'group': p.group,
+        'inventory': p.inventory,
+        'price': price,  # last known price (price history), as in stock valuation
+    }
 
 
-def index_person(person: Dict[str, Any]):
-    try:
-        idx = _get_index('persons')
-        if not idx:
-            return
-        doc = dict(person)
-        doc['name_norm'] = normalize_for_search(doc.get('name') or '')
-        if 'id' not in doc:
-            doc['id'] = doc.get('id') or doc.get('person_id')
-        idx.add_documents([doc], primary_key='id')
-    except Exception as e:
-        LOGGER.warning('index_person error: %s', e)
+def person_doc(p: models.Person) -> Dict[str, Any]:
+    return {
+        'id': p.id,
+        'name': p.name,
+        'name_norm': normalize_for_search(p.name or ''),
+        'mobile': p.mobile,
+        'description': p.description,
+    }
 
 
-def index_invoice(invoice: Dict[str, Any]):
-    try:
-        idx = _get_index('invoices')
-        if not idx:
-            return
-        doc = dict(invoice)
-        if 'id' not in doc:
-            doc['id'] = doc.get('id') or doc.get('invoice_id')
-        idx.add_documents([doc], primary_key='id')
-    except Exception as e:
-        LOGGER.warning('index_invoice error: %s', e)
+def invoice_doc(inv: models.Invoice, lines: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return {
+        'id': inv.id,
+        'invoice_number': inv.invoice_number,
+        'invoice_type': inv.invoice_type,
+        'status': inv.status,
+        'party_id': inv.party_id,
+        'party_name': inv.party_name,
+        'total': inv.total,
+        'lines': lines or [],  # line items of final invoices (see _invoice_extras)
+    }
+
+
+def payment_doc(pay: models.Payment) -> Dict[str, Any]:
+    return {
+        'id': pay.id,
+        'payment_number': pay.payment_number,
+        'direction': pay.direction,
+        'status': pay.status,
+        'party_id': pay.party_id,
+        'party_name': pay.party_name,
+        'method': pay.method,
+        'amount': pay.amount,
+        'reference': pay.reference,
+    }
+
+
+# index name -> (model, document builder)
+DOC_SOURCES = {
+    'products': (models.Product, product_doc),
+    'persons': (models.Person, person_doc),
+    'invoices': (models.Invoice, invoice_doc),
+    'payments': (models.Payment, payment_doc),
+}
+
+
+def latest_prices(session, product_ids: List[Any]) -> Dict[Any, int]:
+    """product id -> price of its most recent price history entry, in one query."""
+    if not product_ids:
+        return {}
+    ph = models.PriceHistory
+    latest = (
+        session.query(ph.product_id, func.max(ph.effective_at).label('at'))
+        .filter(ph.product_id.in_(product_ids))
+        .group_by(ph.product_id)
+        .subquery()
+    )
+    rows = session.query(ph.product_id, ph.price).join(
+        latest, (ph.product_id == latest.c.product_id) & (ph.effective_at == latest.c.at)
+    )
+    return {pid: price for pid, price in rows}
+
+
+def _product_extras(session, products) -> Dict[Any, Dict[str, Any]]:
+    return {pid: {'price': price} for pid, price in latest_prices(session, [p.id for p in products]).items()}
+
+
+def line_doc(item: models.InvoiceItem, product_code: Optional[str]) -> Dict[str, Any]:
+    return {
+        'id': item.id,
+        'description': item.description,
+        'product_id': item.product_id,
+        'product_code': product_code,
+        'quantity': item.quantity,
+        'unit_price': item.unit_price,
+    }
 
 
-def index_payment(payment: Dict[str, Any]):
+def _invoice_extras(session, invoices) -> Dict[Any, Dict[str, Any]]:
+    # lines are indexed once the invoice is final; drafts still change
+    ids = [inv.id for inv in invoices if inv.status == 'final']
+    if not ids:
+        return {}
+    rows = (
+        session.query(models.InvoiceItem, models.Product.code)
+        .outerjoin(models.Product, models.InvoiceItem.product_id == models.Product.id)
+        .filter(models.InvoiceItem.invoice_id.in_(ids))
+        .order_by(models.InvoiceItem.id)
+    )
+    out: Dict[Any, Dict[str, Any]] = {}
+    for item, code in rows:
+        out.setdefault(item.invoice_id, {'lines': []})['lines'].append(line_doc(item, code))
+    return out
+
+
+# index name -> loader of builder keyword arguments for a batch of rows (avoids a query per row)
+DOC_EXTRAS = {
+    'products': _product_extras,
+    'invoices': _invoice_extras,
+}
+
+
+def build_docs(session, index_name: str, rows) -> List[Dict[str, Any]]:
+    """Documents for a batch of ORM rows of `index_name`."""
+    _, build = DOC_SOURCES[index_name]
+    rows = list(rows)
+    loader = DOC_EXTRAS.get(index_name)
+    extras = loader(session, rows) if loader and rows else {}
+    return [build(row, **extras.get(row.id, {})) for row in rows]
+
+
+def apply_batch(index_name: str, docs: List[Dict[str, Any]], delete_ids: List[Any]):
+    """Send a batch of upserts and deletes to one index. Raises on failure so callers can retry."""
+    if client is None:
+        return
+    idx = _get_index(index_name)
+    if not idx:
+        raise RuntimeError(f'index {index_name} unavailable')
+    if docs:
+        idx.add_documents(docs, primary_key='id')
+    if delete_ids:
+        idx.delete_documents(delete_ids)
+
+
+def _local_search(name: str, query: str, limit: int, filters: Optional[str] = None) -> Optional[dict]:
+    # in-process engine (local_search.py) answers while Meilisearch is missing or down
+    from . import local_search
     try:
-        idx = _get_index('payments')
-        if not idx:
-            return
-        doc = dict(payment)
-        if 'id' not in doc:
-            doc['id'] = doc.get('id') or doc.get('payment_id')
-        idx.add_documents([doc], primary_key='id')
+        return local_search.search_index(name, query, limit=limit, filters=filters)
     except Exception as e:
-        LOGGER.warning('index_payment error: %s', e)
+        LOGGER.warning('local search %s error: %s', name, e)
+        return None
 
 
-def delete_doc(index_name: str, doc_id: Any):
+def _search_params(limit: int, filters: Optional[str]) -> Dict[str, Any]:
+    params = {'limit': limit}
+    if filters:
+        params['filter'] = filters
+    return params
+
+
+def _multi_search(query: str, idxs: List[str], filters: Optional[str], limit: int, budget: float) -> Optional[Dict[str, Any]]:
+    """One /multi-search round-trip for all indexes.
+
+    Returns None when the request fails (callers retry per index) and raises
+    FutureTimeout when it misses the budget.
+    """
+    global _multi_search_supported
+    if not _multi_search_supported or not hasattr(client, 'multi_search'):
+        return None
+    queries = [dict(indexUid=name, q=query, **_search_params(limit, filters)) for name in idxs]
+    future = _get_executor().submit(client.multi_search, queries)
     try:
-        idx = _get_index(index_name)
-        if not idx:
-            return
-        idx.delete_document(doc_id)
+        res = future.result(timeout=budget)
+    except FutureTimeout:
+        raise
     except Exception as e:
-        LOGGER.warning('delete_doc %s %s error: %s', index_name, doc_id, e)
+        if getattr(e, 'status_code', None) == 404 and getattr(e, 'code', None) != 'index_not_found':
+            _multi_search_supported = False
+        LOGGER.warning('multi-search error, falling back to per-index requests: %s', e)
+        return None
+    return {r.get('indexUid'): r for r in res.get('results', [])}
 
 
 def search_multi(query: str, indexes: Optional[List[str]] = None, filters: Optional[str] = None, limit: int = 10):
-    """Search across one or more indexes. Returns dict index->hits."""
-    out = {}
-    qn = normalize_for_search(query or '')
+    """Search across one or more indexes. Returns dict index->hits.
+
+    Uses one /multi-search request when the server supports it, otherwise
+    concurrent per-index searches. An index that errors or misses
+    SEARCH_BUDGET_MS (shared by both steps) is answered by the local engine,
+    or empty with `timedOut` set.
+    """
     idxs = indexes or ['products', 'persons', 'invoices', 'payments']
+    if client is None:
+        return {name: _local_search(name, query, limit, filters) or {'hits': []} for name in idxs}
+    budget = SEARCH_BUDGET_MS / 1000.0
+    deadline = time.monotonic() + budget
+    timed_out = set()
+    try:
+        out = _multi_search(query, idxs, filters, limit, budget) or {}
+    except FutureTimeout:
+        # the budget is spent; don't stack per-index requests on top of it
+        LOGGER.warning('multi-search exceeded %d ms', SEARCH_BUDGET_MS)
+        out, timed_out = {}, set(idxs)
+    futures = {}
     for name in idxs:
-        try:
-            idx = _get_index(name)
-            if not idx:
-                out[name] = {'hits': []}
-                continue
-            # try searching both normalized and original fields by sending raw query (Meili will match)
-            params = {'limit': limit}
-            if filters:
-                params['filter'] = filters
-            res = idx.search(query, params)
-            out[name] = res
-        except Exception as e:
-            LOGGER.warning('search_multi %s error: %s', name, e)
-            out[name] = {'hits': []}
+        if name in out or name in timed_out:
+            continue
+        idx = _get_index(name)
+        if idx is not None:
+            futures[name] = _get_executor().submit(idx.search, query, _search_params(limit, filters))
+    # a failed multi-search has used part of the budget; the fallback gets what is left
+    wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            timed_out.add(name)
+            LOGGER.warning('search_multi %s exceeded %d ms', name, SEARCH_BUDGET_MS)
+        elif future.exception() is not None:
+            LOGGER.warning('search_multi %s error: %s', name, future.exception())
+        else:
+            out[name] = future.result()
+    for name in idxs:
+        if name not in out:
+            out[name] = _local_search(name, query, limit, filters) or {'hits': [], 'timedOut': name in timed_out}
     return out
 
 
@@ -180,12 +332,12 @@ def suggest_live(query: str, index: str = 'products', limit: int = 7):
     try:
         idx = _get_index(index)
         if not idx:
-            return []
+            return (_local_search(index, query, limit) or {}).get('hits', [])
         res = idx.search(query, {'limit': limit})
         return res.get('hits', [])
     except Exception as e:
         LOGGER.warning('suggest_live error: %s', e)
-        return []
+        return (_local_search(index, query, limit) or {}).get('hits', [])
 
 
 # Ensure indexes exist at import time (best-effort)
@@ -0,0 +1,167 @@
+"""Faceted search: hits, facet counts and numeric ranges in one call.
+
+Meilisearch answers with `facets` over the filterable attributes in
+search.INDEX_SETTINGS. Without it, or when it errors, the same response is
+built from the database with GROUP BY / MIN / MAX over the filtered rows.
+
+Filters are structured rather than Meilisearch filter strings so both paths
+can apply them:
+
+    {'group': ['موبایل', 'لوازم'], 'price': {'min': 1000, 'max': 50000}}
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from . import db_search, models, search
+from .normalizer import normalize_for_search
+
+LOGGER = logging.getLogger(__name__)
+
+# index -> facet attributes: value counts for `terms`, min/max for `ranges`
+FACETS = {
+    'products': {'terms': ['group', 'unit'], 'ranges': ['price', 'inventory']},
+    'invoices': {'terms': ['invoice_type', 'status'], 'ranges': ['total']},
+}
+
+
+def _latest_price():
+    ph = models.PriceHistory
+    return (
+        select(ph.price).where(ph.product_id == models.Product.id)
+        .order_by(ph.effective_at.desc()).limit(1)
+        .correlate(models.Product).scalar_subquery()
+    )
+
+
+def _columns(index: str) -> Dict[str, Any]:
+    if index == 'products':
+        p = models.Product
+        return {'group': p.group, 'unit': p.unit, 'price': _latest_price(), 'inventory': p.inventory}
+    inv = models.Invoice
+    return {'invoice_type': inv.invoice_type, 'status': inv.status, 'total': inv.total}
+
+
+def _validate(index: str, filters: Dict[str, Any], facets: Optional[List[str]]):
+    if index not in FACETS:
+        raise ValueError(f'faceted search is available for: {", ".join(FACETS)}')
+    if not isinstance(filters, dict):
+        raise ValueError('filters must be an object of facet -> value(s)')
+    if facets is not None and (not isinstance(facets, list) or not all(isinstance(f, str) for f in facets)):
+        raise ValueError('facets must be a list of facet names')
+    spec = FACETS[index]
+    known = spec['terms'] + spec['ranges']
+    for name in list(filters) + list(facets or []):
+        if name not in known:
+            raise ValueError(f'unknown facet {name!r} for {index} (expected one of: {", ".join(known)})')
+    for name, value in filters.items():
+        if name in spec['ranges'] and not isinstance(value, dict):
+            raise ValueError(f'{name} filter must be {{"min": .., "max": ..}}')
+
+
+def _quote(value: Any) -> str:
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def meili_filter(index: str, filters: Dict[str, Any]) -> Optional[str]:
+    """Structured filters -> Meilisearch filter expression."""
+    parts = []
+    for name, value in filters.items():
+        if name in FACETS[index]['ranges']:
+            if value.get('min') is not None:
+                parts.append(f'{name} >= {float(value["min"]):g}')
+            if value.get('max') is not None:
+                parts.append(f'{name} <= {float(value["max"]):g}')
+        else:
+            values = value if isinstance(value, list) else [value]
+            parts.append(f'{name} IN [{", ".join(_quote(v) for v in values)}]')
+    return ' AND '.join(parts) or None
+
+
+def _meili_search(index: str, q: str, filters: Dict[str, Any], terms: List[str], ranges: List[str],
+                  limit: int, offset: int) -> Optional[dict]:
+    idx = search._get_index(index)
+    if idx is None:
+        return None
+    params = {'limit': limit, 'offset': offset, 'facets': terms + ranges}
+    expr = meili_filter(index, filters)
+    if expr:
+        params['filter'] = expr
+    try:
+        res = idx.search(q, params)
+    except Exception as e:
+        LOGGER.warning('faceted search %s error, using the database: %s', index, e)
+        return None
+    dist = res.get('facetDistribution') or {}
+    stats = res.get('facetStats') or {}
+    return {
+        'hits': res.get('hits', []),
+        'estimatedTotalHits': res.get('estimatedTotalHits', 0),
+        'facetDistribution': {t: dist.get(t, {}) for t in terms},
+        'facetStats': {r: stats[r] for r in ranges if r in stats},
+        'engine': 'meilisearch',
+    }
+
+
+def _db_search(session: Session, index: str, q: str, filters: Dict[str, Any], terms: List[str], ranges: List[str],
+               limit: int, offset: int) -> dict:
+    model = models.Product if index == 'products' else models.Invoice
+    cols = _columns(index)
+    qs = session.query(model)
+    if q:
+        qn = normalize_for_search(q)
+        if index == 'products':
+            qs = db_search.filter_by_name(session, qs, model, qn)
+        else:
+            qs = qs.filter(or_(model.invoice_number.contains(q), model.party_name.contains(q)))
+    for name, value in filters.items():
+        col = cols[name]
+        if name in FACETS[index]['ranges']:
+            if value.get('min') is not None:
+                qs = qs.filter(col >= value['min'])
+            if value.get('max') is not None:
+                qs = qs.filter(col <= value['max'])
+        else:
+            qs = qs.filter(col.in_(value if isinstance(value, list) else [value]))
+
+    rows = qs.order_by(model.id).offset(offset).limit(limit).all()
+    dist = {}
+    for name in terms:
+        col = cols[name]
+        counts = qs.with_entities(col, func.count()).group_by(col).all()
+        dist[name] = {str(v): n for v, n in sorted(counts, key=lambda r: -r[1]) if v is not None}
+    stats = {}
+    if ranges:
+        agg = qs.with_entities(*[f(cols[r]) for r in ranges for f in (func.min, func.max)]).one()
+        for i, name in enumerate(ranges):
+            lo, hi = agg[2 * i], agg[2 * i + 1]
+            if lo is not None:
+                stats[name] = {'min': lo, 'max': hi}
+    return {
+        'hits': search.build_docs(session, index, rows),
+        'estimatedTotalHits': qs.order_by(None).count(),
+        'facetDistribution': dist,
+        'facetStats': stats,
+        'engine': 'database',
+    }
+
+
+def faceted_search(session: Session, index: str, q: str = '', filters: Optional[Dict[str, Any]] = None,
+                   facets: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> dict:
+    """Hits plus facetDistribution (term counts) and facetStats (min/max) for `index`.
+
+    `facets` restricts which facets are computed (default: all of FACETS[index]).
+    Raises ValueError for unknown indexes, facets or malformed filters.
+    """
+    filters = filters or {}
+    _validate(index, filters, facets)
+    spec = FACETS[index]
+    terms = [t for t in spec['terms'] if facets is None or t in facets]
+    ranges = [r for r in spec['ranges'] if facets is None or r in facets]
+    res = _meili_search(index, q or '', filters, terms, ranges, limit, offset)
+    if res is None:
+        res = _db_search(session, index, q or '', filters, terms, ranges, limit, offset)
+    res.update({'limit': limit, 'offset': offset})
+    return res
@@ -0,0 +1,425 @@
+"""Transactional outbox for the Meilisearch indexes.
+
+crud adds a `search_outbox` row for every product / person / invoice / payment
+change inside the same transaction as the change itself, so an index update is
+neither lost to a crash between commit and the HTTP call nor silently dropped
+while Meilisearch is down.
+
+The relay reads unsent rows in id order, rebuilds each document from the
+current DB row (a row that no longer exists becomes a delete) and sends them
+per index through search.apply_batch. Since documents always come from the DB
+at send time, sending a row twice or out of order is harmless: the relay can
+stop and restart anywhere, and `replay()` just clears `sent_at` from a given id
+or time onwards.
+
+A batch that Meilisearch rejects, or that fails to build, is split in halves
+until the bad rows are isolated, so one broken document doesn't hold back the
+rest of its index. A rejected row is retried with its own backoff
+(`next_attempt_at`), behind rows that never failed, and given up on (dead,
+until replayed) after MAX_ATTEMPTS. While Meilisearch is unreachable nothing is
+split or counted against the rows; the relay backs off as a whole. `attempts`,
+`last_error` and the dead rows show up in `status()`.
+
+After a wake-up the relay waits SEARCH_OUTBOX_FLUSH_INTERVAL so the writes of
+a burst go out as one batch (a full batch goes at once). Its batch and backoff
+counters are in `status()['relay']` when it runs in this process.
+
+The relay runs inside the app (SEARCH_OUTBOX_RELAY=1, the default) or as its own
+process:
+
+    python -m app.search_outbox relay
+    python -m app.search_outbox replay --from-id 1200
+    python -m app.search_outbox replay --since 2026-10-01T00:00:00
+    python -m app.search_outbox status
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from . import db, models, search
+
+try:
+    from meilisearch.errors import MeilisearchCommunicationError, MeilisearchTimeoutError
+    _UNREACHABLE: Tuple[type, ...] = (OSError, MeilisearchCommunicationError, MeilisearchTimeoutError)
+except Exception:
+    _UNREACHABLE = (OSError,)
+
+LOGGER = logging.getLogger(__name__)
+
+ENABLED = os.getenv('SEARCH_OUTBOX_ENABLED', '1').lower() not in ('0', 'false', 'no')
+RELAY_IN_APP = os.getenv('SEARCH_OUTBOX_RELAY', '1').lower() not in ('0', 'false', 'no')
+BATCH_SIZE = int(os.getenv('SEARCH_OUTBOX_BATCH_SIZE', '200'))
+MAX_BACKOFF = float(os.getenv('SEARCH_OUTBOX_MAX_BACKOFF', '60'))
+MAX_ATTEMPTS = int(os.getenv('SEARCH_OUTBOX_MAX_ATTEMPTS', '8'))
+POLL_INTERVAL = float(os.getenv('SEARCH_OUTBOX_POLL_INTERVAL', '2.0'))
+FLUSH_INTERVAL = float(os.getenv('SEARCH_OUTBOX_FLUSH_INTERVAL', '0.2'))
+RETENTION_DAYS = int(os.getenv('SEARCH_OUTBOX_RETENTION_DAYS', '7'))
+# how long a tail waits for an id it skipped (its transaction still open), and how many it tracks
+GAP_TIMEOUT = 60.0
+MAX_GAPS = 1000
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# set by consumers other than the relay (local_search tails the outbox too), so rows
+# are still recorded when Meilisearch isn't configured
+KEEP_WITHOUT_MEILI = False
+
+_listeners: List[Callable[[], None]] = []
+
+
+def add_listener(fn: Callable[[], None]):
+    """Call `fn` after every commit that recorded index changes."""
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def record(session: Session, index_name: str, doc_id: Any, op: str = UPSERT):
+    """Queue an index change on `session`; it is committed together with the caller's change."""
+    if not ENABLED or (search.client is None and not KEEP_WITHOUT_MEILI):
+        return
+    session.add(models.SearchOutbox(index_name=index_name, doc_id=str(doc_id), op=op))
+
+
+def _pending(session: Session):
+    o = models.SearchOutbox
+    return session.query(o).filter(o.sent_at.is_(None), o.attempts < MAX_ATTEMPTS)
+
+
+def _dead(session: Session):
+    o = models.SearchOutbox
+    return session.query(o).filter(o.sent_at.is_(None), o.attempts >= MAX_ATTEMPTS)
+
+
+def _send(session: Session, index_name: str, ids: List[str]):
+    model, _ = search.DOC_SOURCES[index_name]
+    pk = model.id.type.python_type
+    found = {str(obj.id): obj for obj in session.query(model).filter(model.id.in_([pk(i) for i in ids]))}
+    docs = search.build_docs(session, index_name, [found[i] for i in ids if i in found])
+    gone = [pk(i) for i in ids if i not in found]
+    search.apply_batch(index_name, docs, gone)
+
+
+def _send_isolating(session: Session, index_name: str, ids: List[str]) -> Dict[str, Exception]:
+    """Send `ids`, halving a failed batch down to the documents that fail. Returns doc id -> error."""
+    try:
+        _send(session, index_name, ids)
+        return {}
+    except _UNREACHABLE as e:
+        return {i: e for i in ids}
+    except Exception as e:
+        if len(ids) == 1:
+            return {ids[0]: e}
+        mid = len(ids) // 2
+        errors = _send_isolating(session, index_name, ids[:mid])
+        errors.update(_send_isolating(session, index_name, ids[mid:]))
+        return errors
+
+
+def _retry_delay(attempts: int) -> float:
+    return min(MAX_BACKOFF, 0.5 * 2 ** attempts)
+
+
+def relay_once(session: Session, limit: int = BATCH_SIZE) -> Tuple[int, int]:
+    """Send one batch of due rows, those that never failed first. Returns (sent, failed) row counts."""
+    o = models.SearchOutbox
+    now = datetime.now(timezone.utc)
+    rows = (
+        _pending(session)
+        .filter(or_(o.next_attempt_at.is_(None), o.next_attempt_at <= now))
+        .order_by(o.attempts, o.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not rows:
+        session.commit()
+        return 0, 0
+    by_index: Dict[str, list] = {}
+    for row in rows:
+        by_index.setdefault(row.index_name, []).append(row)
+    sent = failed = 0
+    for index_name, group in by_index.items():
+        errors = _send_isolating(session, index_name, list(dict.fromkeys(r.doc_id for r in group)))
+        if errors:
+            LOGGER.warning('search outbox: %d of %d %s rows failed: %s',
+                           len(errors), len(group), index_name, next(iter(errors.values())))
+        for r in group:
+            e = errors.get(r.doc_id)
+            if e is None:
+                r.sent_at = now
+                sent += 1
+                continue
+            failed += 1
+            r.last_error = str(e)[:1000]
+            if isinstance(e, _UNREACHABLE):
+                continue  # not the row's fault; the relay backs off
+            r.attempts = (r.attempts or 0) + 1
+            r.next_attempt_at = now + timedelta(seconds=_retry_delay(r.attempts))
+            if r.attempts >= MAX_ATTEMPTS:
+                LOGGER.error('search outbox: giving up on %s %s after %d attempts: %s',
+                             index_name, r.doc_id, r.attempts, r.last_error)
+    session.commit()
+    return sent, failed
+
+
+def replay(session: Session, from_id: Optional[int] = None, since: Optional[datetime] = None,
+           index_name: Optional[str] = None) -> int:
+    """Mark already-sent (and dead) rows as pending again so the relay re-sends them."""
+    o = models.SearchOutbox
+    q = session.query(o).filter(or_(o.sent_at.isnot(None), o.attempts >= MAX_ATTEMPTS))
+    if from_id is not None:
+        q = q.filter(models.SearchOutbox.id >= from_id)
+    if since is not None:
+        q = q.filter(models.SearchOutbox.created_at >= since)
+    if index_name:
+        q = q.filter(models.SearchOutbox.index_name == index_name)
+    count = q.update({'sent_at': None, 'attempts': 0, 'last_error': None, 'next_attempt_at': None},
+                     synchronize_session=False)
+    session.commit()
+    notify()
+    return count
+
+
+def prune(session: Session, days: int = RETENTION_DAYS) -> int:
+    """Delete sent and dead rows older than `days`; they can no longer be replayed.
+
+    Without Meilisearch nothing will ever send the pending rows, so old ones go too.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    q = session.query(models.SearchOutbox)
+    if search.client is None:
+        q = q.filter(models.SearchOutbox.created_at < cutoff)
+    else:
+        o = models.SearchOutbox
+        q = q.filter(or_(and_(o.sent_at.isnot(None), o.sent_at < cutoff),
+                         and_(o.sent_at.is_(None), o.attempts >= MAX_ATTEMPTS, o.created_at < cutoff)))
+    count = q.delete(synchronize_session=False)
+    session.commit()
+    return count
+
+
+def status(session: Session) -> Dict[str, Any]:
+    pending, oldest = _pending(session).with_entities(
+        func.count(models.SearchOutbox.id), func.min(models.SearchOutbox.created_at)
+    ).one()
+    failing = _pending(session).filter(models.SearchOutbox.last_error.isnot(None)).count()
+    dead = _dead(session).count()
+    last_error = (
+        session.query(models.SearchOutbox)
+        .filter(models.SearchOutbox.sent_at.is_(None), models.SearchOutbox.last_error.isnot(None))
+        .order_by(models.SearchOutbox.id.desc()).with_entities(models.SearchOutbox.last_error).first()
+    )
+    last_id = session.query(func.max(models.SearchOutbox.id)).scalar()
+    lag = 0.0
+    if oldest is not None:
+        if oldest.tzinfo is None:
+            oldest = oldest.replace(tzinfo=timezone.utc)
+        lag = max(0.0, (datetime.now(timezone.utc) - oldest).total_seconds())
+    return {
+        'enabled': ENABLED and search.client is not None,
+        'relay_running': _RELAY is not None and _RELAY.is_alive(),
+        'relay': _RELAY.metrics() if _RELAY is not None else None,
+        'pending': pending,
+        'failing': failing,
+        'dead': dead,
+        'lag_seconds': round(lag, 3),
+        'last_id': last_id,
+        'last_error': last_error[0] if last_error else None,
+    }
+
+
+class Tail:
+    """Read position of an in-process consumer of the outbox (local_search, autocomplete).
+
+    Ids are taken at INSERT but rows show up at COMMIT, so a row can appear
+    below ids already read: transaction A takes id 10, B takes 11 and commits
+    first. Ids skipped that way are kept as gaps and read again until they
+    appear or GAP_TIMEOUT passes (the transaction rolled back).
+    """
+
+    def __init__(self, watermark: int = 0):
+        self.watermark = watermark  # highest id read
+        self.gaps: Dict[int, float] = {}  # skipped id -> when it was first missed
+
+    @classmethod
+    def at_head(cls, session: Session) -> 'Tail':
+        """A tail after the newest row; recent ids not committed yet are watched as gaps."""
+        o = models.SearchOutbox
+        head = session.query(func.max(o.id)).scalar() or 0
+        tail = cls(max(head - MAX_GAPS, 0))
+        tail.advance(i for (i,) in session.query(o.id).filter(o.id > tail.watermark))
+        return tail
+
+    def condition(self):
+        """Filter for the rows not read yet."""
+        o = models.SearchOutbox
+        cutoff = time.monotonic() - GAP_TIMEOUT
+        self.gaps = {i: t for i, t in self.gaps.items() if t > cutoff}
+        newer = o.id > self.watermark
+        return or_(newer, o.id.in_(sorted(self.gaps))) if self.gaps else newer
+
+    def advance(self, ids: Iterable[int]):
+        """Record the ids read by a query ordered by id."""
+        seen = set(ids)
+        for i in seen:
+            self.gaps.pop(i, None)
+        high = max(seen, default=self.watermark)
+        if high > self.watermark:
+            now = time.monotonic()
+            for i in range(max(self.watermark + 1, high - MAX_GAPS), high):
+                if i not in seen:
+                    self.gaps[i] = now
+            self.watermark = high
+
+    def resume_point(self) -> int:
+        """Watermark to persist: a restart reads again from below the oldest gap."""
+        return min(self.gaps) - 1 if self.gaps else self.watermark
+
+
+class Relay:
+    """Background loop draining the outbox; backs off exponentially while nothing gets through."""
+
+    def __init__(self, session_factory=None, poll_interval: float = POLL_INTERVAL,
+                 max_backoff: float = MAX_BACKOFF, flush_interval: float = FLUSH_INTERVAL):
+        self._session_factory = session_factory or db.SessionLocal
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.flush_interval = flush_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+        self._stats = {'batches': 0, 'rows_sent': 0, 'rows_failed': 0, 'last_batch_size': 0,
+                       'last_sent_at': None, 'consecutive_failures': 0, 'backoff_seconds': 0.0}
+
+    def metrics(self) -> Dict[str, Any]:
+        out = dict(self._stats)
+        out['avg_batch_size'] = round(out['rows_sent'] / out['batches'], 1) if out['batches'] else 0.0
+        return out
+
+    def wake(self):
+        self._wake.set()
+
+    def step(self) -> Tuple[int, int]:
+        session = self._session_factory()
+        try:
+            result = relay_once(session)
+            sent, failed = result
+            if sent:
+                self._stats['batches'] += 1
+                self._stats['rows_sent'] += sent
+                self._stats['last_batch_size'] = sent
+                self._stats['last_sent_at'] = datetime.now(timezone.utc).isoformat()
+            self._stats['rows_failed'] += failed
+            if time.time() - self._last_prune > 3600:
+                prune(session)
+                self._last_prune = time.time()
+            return result
+        except Exception as e:
+            session.rollback()
+            LOGGER.warning('search outbox relay error: %s', e)
+            return 0, 1
+        finally:
+            session.close()
+
+    def run(self):
+        failures = 0
+        while not self._stop.is_set():
+            sent, failed = self.step()
+            if failed and not sent:
+                failures += 1
+                backoff = min(self.max_backoff, 0.5 * 2 ** failures)
+                self._stats.update(consecutive_failures=failures, backoff_seconds=backoff)
+                # sleep through the backoff; new writes don't cut it short
+                self._stop.wait(backoff)
+                continue
+            failures = 0
+            self._stats.update(consecutive_failures=0, backoff_seconds=0.0)
+            if sent >= BATCH_SIZE:
+                continue
+            if sent or self._wake.wait(self.poll_interval):
+                # let the rest of a burst of writes land, then send it as one batch
+                self._stop.wait(self.flush_interval)
+            self._wake.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='search-outbox-relay', daemon=True)
+        self._thread.start()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_RELAY: Optional[Relay] = None
+
+
+def start_relay():
+    global _RELAY
+    if not (ENABLED and RELAY_IN_APP) or search.client is None or _RELAY is not None:
+        return
+    _RELAY = Relay()
+    _RELAY.start()
+
+
+def stop_relay():
+    global _RELAY
+    if _RELAY is not None:
+        _RELAY.stop()
+        _RELAY = None
+
+
+def notify():
+    """Wake the in-process relay (and other outbox consumers) after a commit that recorded index changes."""
+    if _RELAY is not None:
+        _RELAY.wake()
+    for fn in _listeners:
+        fn()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search outbox relay / replay')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('relay', help='drain the outbox to Meilisearch until interrupted')
+    rp = sub.add_parser('replay', help='mark sent rows as pending again')
+    rp.add_argument('--from-id', type=int)
+    rp.add_argument('--since', type=datetime.fromisoformat)
+    rp.add_argument('--index')
+    sub.add_parser('status')
+    args = parser.parse_args()
+
+    if args.command == 'relay':
+        if search.client is None:
+            parser.error('meilisearch client is not available')
+        relay = Relay()
+        try:
+            relay.run()
+        except KeyboardInterrupt:
+            pass
+        return
+    session = db.SessionLocal()
+    try:
+        if args.command == 'replay':
+            print(f'{replay(session, from_id=args.from_id, since=args.since, index_name=args.index)} rows marked for replay')
+        else:
+            print(json.dumps(status(session), indent=2, default=str))
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
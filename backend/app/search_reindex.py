@@ -0,0 +1,239 @@
+"""Full rebuild of the Meilisearch indexes from the database.
+
+Needed after a Meilisearch wipe, a settings change in search.INDEX_SETTINGS or
+a new normalizer rule. For each index:
+
+1. create `<index>__reindex` (the shadow) with the live index's settings;
+2. stream the table in id order with a server-side cursor (yield_per) and send
+   chunks of documents to the shadow from a small thread pool;
+3. swap the shadow with the live index atomically, then drop the old one;
+4. replay the search_outbox rows written while the rebuild ran, so changes
+   that went to the old index aren't lost.
+
+A chunk counts as sent only once Meilisearch has processed its task; a
+failed task fails the job before anything is swapped in. Progress (last id
+whose chunk and all earlier chunks were indexed, documents sent, docs/s) is
+checkpointed in shared_store, so an interrupted run resumes
+into the same shadow instead of starting over. One rebuild runs at a time
+across workers (a shared_store claim, renewed as chunks settle).
+
+    python -m app.search_reindex                    # all indexes
+    python -m app.search_reindex products persons --chunk-size 2000 --concurrency 8
+    python -m app.search_reindex --restart          # ignore checkpoints
+"""
+import argparse
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, select
+
+from . import db, models, search, search_outbox
+from .shared_store import get_store
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CONCURRENCY = 4
+TASK_TIMEOUT_MS = 10 * 60 * 1000
+RUN_LEASE = TASK_TIMEOUT_MS // 1000 + 60  # seconds; a crashed worker's claim runs out after this
+
+_RUN_KEY = 'reindex:running'
+_JOB_LOCK = threading.Lock()
+
+
+def _checkpoint_key(index_name: str) -> str:
+    return f'reindex:{index_name}'
+
+
+def get_progress(index_name: str) -> Optional[dict]:
+    return get_store().get(_checkpoint_key(index_name))
+
+
+def _wait(task):
+    uid = getattr(task, 'task_uid', None)
+    if uid is None:
+        return
+    result = search.client.wait_for_task(uid, timeout_in_ms=TASK_TIMEOUT_MS)
+    if getattr(result, 'status', None) == 'failed':
+        raise RuntimeError(f'meilisearch task {uid} failed: {getattr(result, "error", None)}')
+
+
+def _send(shadow, docs):
+    """Add one chunk and wait until Meilisearch has indexed it."""
+    task = shadow.add_documents(docs, 'id')
+    _wait(task)
+    return task
+
+
+def _prepare_shadow(index_name: str, shadow: str, fresh: bool):
+    if fresh:
+        try:
+            _wait(search.client.delete_index(shadow))
+        except Exception:
+            pass  # no leftover shadow
+        _wait(search.client.create_index(shadow, {'primaryKey': 'id'}))
+    _wait(search.client.index(shadow).update_settings(search.INDEX_SETTINGS.get(index_name, {})))
+
+
+def _swap(index_name: str, shadow: str):
+    try:
+        _wait(search.client.create_index(index_name, {'primaryKey': 'id'}))
+    except Exception:
+        pass  # live index already exists
+    _wait(search.client.swap_indexes([{'indexes': [index_name, shadow]}]))
+    # after the swap the shadow uid holds the old documents
+    _wait(search.client.delete_index(shadow))
+
+
+def reindex(index_name: str, chunk_size: int = CHUNK_SIZE, concurrency: int = CONCURRENCY,
+            restart: bool = False, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """Rebuild one index into its shadow and swap it in. Returns the final checkpoint."""
+    if search.client is None:
+        raise RuntimeError('meilisearch client is not available')
+    model, _ = search.DOC_SOURCES[index_name]
+    store = get_store()
+    key = _checkpoint_key(index_name)
+    state = None if restart else store.get(key)
+    if state and state.get('status') == 'done':
+        state = None
+    fresh = state is None
+    session = db.SessionLocal()
+    try:
+        if fresh:
+            state = {
+                'index': index_name,
+                'shadow': f'{index_name}__reindex',
+                'status': 'running',
+                'last_id': None,
+                'sent': 0,
+                'total': session.query(func.count(model.id)).scalar(),
+                'outbox_from': (session.query(func.max(models.SearchOutbox.id)).scalar() or 0) + 1,
+                'docs_per_second': 0.0,
+            }
+        state['status'] = 'running'
+        store.set(key, state)
+        _prepare_shadow(index_name, state['shadow'], fresh)
+        shadow = search.client.index(state['shadow'])
+
+        stmt = select(model).order_by(model.id).execution_options(yield_per=chunk_size)
+        if state['last_id'] is not None:
+            stmt = stmt.where(model.id > state['last_id'])
+
+        started, sent_this_run = time.time(), 0
+        pending: deque = deque()  # (future, last_id, size) in stream order
+
+        def settle(block: bool):
+            # advance the checkpoint only across a contiguous run of indexed chunks
+            nonlocal sent_this_run
+            while pending and (block or pending[0][0].done()):
+                future, last_id, size = pending.popleft()
+                future.result()  # raises if the chunk's task failed
+                sent_this_run += size
+                state['last_id'] = last_id
+                state['sent'] += size
+                state['docs_per_second'] = round(sent_this_run / max(time.time() - started, 1e-6), 1)
+                store.set(key, state)
+                if progress:
+                    progress(state)
+                block = False
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for rows in session.execute(stmt).scalars().partitions():
+                docs = search.build_docs(session, index_name, rows)
+                pending.append((pool.submit(_send, shadow, docs), rows[-1].id, len(docs)))
+                settle(block=len(pending) >= concurrency * 2)
+            while pending:
+                settle(block=True)
+
+        _swap(index_name, state['shadow'])
+        search_outbox.replay(session, from_id=state['outbox_from'], index_name=index_name)
+        state['status'] = 'done'
+        state['finished_at'] = time.time()
+        store.set(key, state)
+        return state
+    except Exception as e:
+        if state is not None:
+            state['status'] = 'failed'
+            state['error'] = str(e)[:500]
+            store.set(key, state)
+        raise
+    finally:
+        session.close()
+
+
+def _acquire() -> bool:
+    """Claim the rebuild for this process; False when one is running here or in another worker."""
+    if not _JOB_LOCK.acquire(blocking=False):
+        return False
+    if get_store().incr(_RUN_KEY, ttl=RUN_LEASE) != 1:
+        _JOB_LOCK.release()
+        return False
+    return True
+
+
+def _run_all(indexes: Optional[List[str]], progress: Optional[Callable[[dict], None]] = None,
+             **kwargs) -> Dict[str, dict]:
+    """reindex every index; the caller holds the claim, released here."""
+    store = get_store()
+
+    def renew(state):
+        store.set(_RUN_KEY, 1, ttl=RUN_LEASE)
+        if progress:
+            progress(state)
+    try:
+        return {name: reindex(name, progress=renew, **kwargs) for name in (indexes or list(search.DOC_SOURCES))}
+    finally:
+        store.delete(_RUN_KEY)
+        _JOB_LOCK.release()
+
+
+def reindex_all(indexes: Optional[List[str]] = None, **kwargs) -> Dict[str, dict]:
+    if not _acquire():
+        raise RuntimeError('a reindex is already running')
+    return _run_all(indexes, **kwargs)
+
+
+def is_running() -> bool:
+    return _JOB_LOCK.locked() or get_store().get(_RUN_KEY) is not None
+
+
+def start_background(indexes: Optional[List[str]] = None, restart: bool = False) -> bool:
+    """Claim the rebuild and run it in a daemon thread (admin endpoint); False when one is already running."""
+    if not _acquire():
+        return False
+
+    def _job():
+        try:
+            _run_all(indexes, restart=restart)
+        except Exception as e:
+            LOGGER.warning('reindex failed: %s', e)
+    threading.Thread(target=_job, name='search-reindex', daemon=True).start()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild Meilisearch indexes from the database')
+    parser.add_argument('indexes', nargs='*', help=f"any of: {', '.join(search.DOC_SOURCES)} (default: all)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--restart', action='store_true', help='ignore checkpoints and rebuild from scratch')
+    args = parser.parse_args()
+    unknown = set(args.indexes) - set(search.DOC_SOURCES)
+    if unknown:
+        parser.error(f"unknown index: {', '.join(sorted(unknown))}")
+
+    def report(state):
+        print(f"{state['index']}: {state['sent']}/{state['total']} docs, {state['docs_per_second']:.0f} docs/s", flush=True)
+
+    results = reindex_all(args.indexes or None, chunk_size=args.chunk_size, concurrency=args.concurrency,
+                          restart=args.restart, progress=report)
+    for name, state in results.items():
+        print(f"{name}: done, {state['sent']} docs at {state['docs_per_second']:.0f} docs/s")
+
+
+if __name__ == '__main__':
+    main()
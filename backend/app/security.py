@@ -1,4 +1,8 @@
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -64,6 +68,51 @@ try:
 except Exception:
     _FERNET = None
 
+# Decrypted secrets (OTP secrets, SMS / developer API keys) are read on every login
+# and every message. Keep a small in-memory LRU keyed by the SHA-256 of the
+# ciphertext so the plaintext is never used as a key, and never persist it.
+SECRET_CACHE_SIZE = int(os.getenv('SECRET_CACHE_SIZE', '256'))
+SECRET_CACHE_TTL = int(os.getenv('SECRET_CACHE_TTL', '300'))
+_SECRET_CACHE: 'OrderedDict[str, tuple]' = OrderedDict()
+_SECRET_CACHE_LOCK = threading.Lock()
+
+
+def _cache_key(ciphertext: str) -> str:
+    return hashlib.sha256(ciphertext.encode('utf-8')).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _SECRET_CACHE_LOCK:
+        item = _SECRET_CACHE.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if time.monotonic() > expires:
+            del _SECRET_CACHE[key]
+            return None
+        _SECRET_CACHE.move_to_end(key)
+        return value
+
+
+def _cache_put(key: str, value: str):
+    with _SECRET_CACHE_LOCK:
+        _SECRET_CACHE[key] = (value, time.monotonic() + SECRET_CACHE_TTL)
+        _SECRET_CACHE.move_to_end(key)
+        while len(_SECRET_CACHE) > SECRET_CACHE_SIZE:
+            _SECRET_CACHE.popitem(last=False)
+
+
+def clear_secret_cache():
+    with _SECRET_CACHE_LOCK:
+        _SECRET_CACHE.clear()
+
+
+def set_encryption_key(key: Optional[str]):
+    """Switch the Fernet key (key rotation); drops every cached plaintext."""
+    global _FERNET
+    _FERNET = Fernet(key) if key else None
+    clear_secret_cache()
+
 
 def encrypt_value(plaintext: str) -> str:
     if not plaintext:
@@ -81,10 +130,20 @@ def decrypt_value(ciphertext: str) -> str:
         return ciphertext
     if not _FERNET:
         return ciphertext
+    use_cache = SECRET_CACHE_SIZE > 0
+    if use_cache:
+        key = _cache_key(ciphertext)
+        cached = _cache_get(key)
+        if cached is not None:
+            return cached
     try:
-        return _FERNET.decrypt(ciphertext.encode('utf-8')).decode('utf-8')
+        plaintext = _FERNET.decrypt(ciphertext.encode('utf-8')).decode('utf-8')
     except Exception:
+        # not encrypted (legacy plaintext) or wrong key: don't cache
         return ciphertext
+    if use_cache:
+        _cache_put(key, plaintext)
+    return plaintext
 
 
 def generate_otp_secret() -> str:
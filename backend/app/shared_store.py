@@ -0,0 +1,230 @@
+"""Small key/value store shared between uvicorn workers.
+
+`cache.py` is process-local; state that must be visible to every worker (OTP
+sessions, attempt counters, throttling windows) goes through here instead.
+
+Backends are picked from SHARED_STORE_URL:
+- redis://host:6379/0   shared Redis (requires the `redis` package)
+- sqlite:///path.db     single-host stand-in; every worker opens the same file
+- memory://             per-process dict, for tests
+
+All backends store JSON values with a TTL and offer an atomic `incr` and `pop`
+so read-modify-write sequences stay correct across workers.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+try:
+    import redis
+except Exception:
+    redis = None
+
+_BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_URL = 'sqlite:///' + os.path.join(_BASE_DIR, 'hp_shared_store.db')
+
+# sweep expired SQLite rows at most this often (seconds)
+_SWEEP_INTERVAL = 60
+
+
+class MemoryStore:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] < time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._live(key)
+            return item[0] if item else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._live(key)
+            self._data.pop(key, None)
+            return item[0] if item else None
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """Increment a counter; `ttl` is applied only when the counter is created."""
+        with self._lock:
+            item = self._live(key)
+            if item is None:
+                value, expires = amount, (time.time() + ttl if ttl else None)
+            else:
+                value, expires = int(item[0]) + amount, item[1]
+            self._data[key] = (value, expires)
+            return value
+
+    def sweep(self) -> int:
+        with self._lock:
+            now = time.time()
+            dead = [k for k, (_, exp) in self._data.items() if exp is not None and exp < now]
+            for k in dead:
+                del self._data[k]
+            return len(dead)
+
+
+class SqliteStore:
+    """File-backed store; BEGIN IMMEDIATE makes incr/pop atomic across processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_kv_expires_at ON kv (expires_at)')
+        self._last_sweep = 0.0
+
+    def _tx(self, fn):
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(cur, time.time())
+                cur.execute('COMMIT')
+                return result
+            except Exception:
+                cur.execute('ROLLBACK')
+                raise
+
+    @staticmethod
+    def _read(cur, key: str, now: float):
+        row = cur.execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] < now:
+            cur.execute('DELETE FROM kv WHERE key = ?', (key,))
+            return None
+        return row
+
+    def _maybe_sweep(self, cur, now: float):
+        if now - self._last_sweep >= _SWEEP_INTERVAL:
+            cur.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+            self._last_sweep = now
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._tx(lambda cur, now: self._read(cur, key, now))
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        def op(cur, now):
+            self._maybe_sweep(cur, now)
+            cur.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                        (key, json.dumps(value), now + ttl if ttl else None))
+        self._tx(op)
+
+    def delete(self, key: str):
+        self._tx(lambda cur, now: cur.execute('DELETE FROM kv WHERE key = ?', (key,)))
+
+    def pop(self, key: str) -> Optional[Any]:
+        def op(cur, now):
+            row = self._read(cur, key, now)
+            cur.execute('DELETE FROM kv WHERE key = ?', (key,))
+            return row
+        row = self._tx(op)
+        return json.loads(row[0]) if row else None
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """Increment a counter; `ttl` is applied only when the counter is created."""
+        def op(cur, now):
+            row = self._read(cur, key, now)
+            if row is None:
+                value, expires = amount, (now + ttl if ttl else None)
+            else:
+                value, expires = int(json.loads(row[0])) + amount, row[1]
+            cur.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)', (key, json.dumps(value), expires))
+            return value
+        return self._tx(op)
+
+    def sweep(self) -> int:
+        def op(cur, now):
+            cur.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+            self._last_sweep = now
+            return cur.rowcount
+        return self._tx(op)
+
+
+class RedisStore:
+    def __init__(self, url: str):
+        self._r = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self._r.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        self._r.set(key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, key: str):
+        self._r.delete(key)
+
+    def pop(self, key: str) -> Optional[Any]:
+        pipe = self._r.pipeline()
+        pipe.get(key)
+        pipe.delete(key)
+        raw, _ = pipe.execute()
+        return json.loads(raw) if raw is not None else None
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
+        """Increment a counter; `ttl` is applied only when the counter is created."""
+        pipe = self._r.pipeline()
+        pipe.incrby(key, amount)
+        if ttl:
+            pipe.expire(key, ttl, nx=True)
+        return int(pipe.execute()[0])
+
+    def sweep(self) -> int:
+        # Redis expires keys itself
+        return 0
+
+
+def create_store(url: Optional[str] = None):
+    url = url or os.getenv('SHARED_STORE_URL') or DEFAULT_URL
+    if url.startswith('memory://'):
+        return MemoryStore()
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        if redis is None:
+            raise RuntimeError('SHARED_STORE_URL points at Redis but the redis package is not installed')
+        return RedisStore(url)
+    if url.startswith('sqlite:///'):
+        return SqliteStore(url[len('sqlite:///'):])
+    raise ValueError(f'unsupported SHARED_STORE_URL: {url}')
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = create_store()
+    return _STORE
+
+
+def set_store(store):
+    """Swap the process-wide store (tests, or wiring a custom backend at startup)."""
+    global _STORE
+    _STORE = store
@@ -1,19 +1,25 @@
-from typing import Optional, Tuple
+import os
+from typing import List, NamedTuple, Optional, Tuple
 import requests
 import random
 import string
-import time
 from urllib.parse import quote
 
 from sqlalchemy.orm import Session
-from . import models
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from . import http_client, models
 from .security import decrypt_value
+from .shared_store import get_store
 
 
-SUPPORTED_PROVIDERS = {"ippanel"}
+IPPANEL_SEND_URL = "https://api.ippanel.com/api/v1/sms/send"
+IPPANEL_BULK_URL = os.getenv('SMS_IPPANEL_BULK_URL', "https://api2.ippanel.com/api/v1/sms/send/webservice/single")
 
-# OTP sessions: {session_id: {phone, otp_code, expires_at, attempts}}
-_otp_sessions = {}
+# OTP sessions live in the shared store so any worker can verify them:
+#   otp:<session_id>           -> {phone, otp_code}     (TTL = OTP_TTL_SECONDS)
+#   otp:<session_id>:attempts  -> verification attempts (same TTL)
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 3
 
 
 def _get_sms_config(session: Session) -> dict:
@@ -51,47 +57,99 @@ def _get_sms_config(session: Session) -> dict:
     return config
 
 
-def send_sms(session: Session, to: str, message: str) -> Tuple[bool, str]:
-    """
-    SMS پیغام بھیجیں۔
-    تنظیمات system_settings ٹیبل سے حاصل کی جاتی ہیں۔
-    """
-    config = _get_sms_config(session)
-    
-    if not config.get('api_key'):
-        return False, "SMS API کنفیگریشن دستیاب نہیں"
-    
-    provider = (config.get('provider') or "ippanel").lower()
-    api_key = config.get('api_key')
-    sender = config.get('sender', '')
-    
+def get_sms_config(session: Session, user_id: Optional[int] = None, provider: Optional[str] = None) -> dict:
+    """The user's own SMS config when enabled, else the system one; `provider` overrides the provider name."""
+    config = None
+    if user_id is not None:
+        own = session.query(models.UserSmsConfig).filter(models.UserSmsConfig.user_id == user_id).first()
+        if own is not None and own.enabled and own.api_key:
+            config = {'provider': own.provider, 'api_key': decrypt_value(own.api_key), 'sender': own.sender_name or ''}
+    if config is None:
+        config = _get_sms_config(session)
+    config['provider'] = (provider or config.get('provider') or 'ippanel').lower()
+    return config
+
+
+class SendResult(NamedTuple):
+    ok: bool
+    info: str
+    message_id: Optional[str] = None
+    # the provider never got the request, so sending again cannot duplicate it
+    retry: bool = False
+
+
+def _never_sent(e: requests.ConnectionError) -> bool:
+    """True when the connection was never opened, so the provider cannot have the request."""
+    if isinstance(e, (requests.ConnectTimeout, http_client.CircuitOpenError)):
+        return True
+    reason = e.args[0] if e.args else None
+    reason = getattr(reason, 'reason', reason)  # urllib3's MaxRetryError wraps the cause
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _ippanel_send(config: dict, recipients: List[str], message: str) -> SendResult:
+    # iPanel API - https://ippanelcom.github.io/Edge-Document/
     try:
-        if provider == "ippanel":
-            # iPanel API - https://ippanelcom.github.io/Edge-Document/
-            url = "https://api.ippanel.com/api/v1/sms/send"
+        if len(recipients) == 1:
             params = {
-                "apikey": api_key,
-                "recipient": to,
+                "apikey": config['api_key'],
+                "recipient": recipients[0],
                 "message": message,
-                "sender": sender
+                "sender": config.get('sender', '')
             }
-            response = requests.get(url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('result') == True:
-                    return True, "SMS کامیابی سے بھیجا گیا"
-                else:
-                    return False, f"iPanel خرابی: {data.get('message', 'نامعلوم')}"
-            else:
-                return False, f"iPanel سرور خرابی ({response.status_code})"
-        
-        return False, f"نامعاون فراہم کنندہ: {provider}"
-    
-    except requests.Timeout:
-        return False, "درخواست ختم ہو گئی"
+            # never repeated once sent: a retry could deliver the message twice
+            response = http_client.get(IPPANEL_SEND_URL, params=params, timeout=10, provider='ippanel', idempotent=False)
+        else:
+            body = {"recipient": recipients, "sender": config.get('sender', ''), "message": message}
+            response = http_client.post(IPPANEL_BULK_URL, json=body, headers={"apikey": config['api_key']},
+                                        timeout=10, provider='ippanel', idempotent=False)
+    except requests.ReadTimeout:
+        return SendResult(False, "درخواست ختم ہو گئی")
+    except requests.ConnectionError as e:
+        # a dropped connection (e.g. RemoteDisconnected) may come after the request was written
+        return SendResult(False, f"iPanel سے رابطہ نہیں ہو سکا: {e}", retry=_never_sent(e))
     except Exception as e:
-        return False, f"خرابی: {str(e)}"
+        return SendResult(False, f"خرابی: {str(e)}")
+
+    if response.status_code != 200:
+        return SendResult(False, f"iPanel سرور خرابی ({response.status_code})",
+                          retry=response.status_code >= 500 or response.status_code == 429)
+    try:
+        data = response.json()
+    except ValueError:
+        return SendResult(False, "iPanel: نامعلوم جواب")
+    if data.get('result') is True or str(data.get('status', '')).lower() == 'ok':
+        inner = data.get('data') if isinstance(data.get('data'), dict) else {}
+        message_id = inner.get('message_id') or data.get('messageId') or data.get('message_id')
+        return SendResult(True, "SMS کامیابی سے بھیجا گیا", str(message_id) if message_id else None)
+    return SendResult(False, f"iPanel خرابی: {data.get('message') or data.get('error_message') or 'نامعلوم'}")
+
+
+# provider -> (send(config, recipients, message), most recipients per call)
+PROVIDERS = {
+    "ippanel": (_ippanel_send, int(os.getenv('SMS_IPPANEL_BULK_SIZE', '100'))),
+}
+SUPPORTED_PROVIDERS = set(PROVIDERS)
+
+
+def send(config: dict, recipients: List[str], message: str) -> SendResult:
+    """One provider call sending `message` to every recipient."""
+    if not config.get('api_key'):
+        return SendResult(False, "SMS API کنفیگریشن دستیاب نہیں")
+    provider = PROVIDERS.get(config.get('provider') or 'ippanel')
+    if provider is None:
+        return SendResult(False, f"نامعاون فراہم کنندہ: {config.get('provider')}")
+    return provider[0](config, recipients, message)
+
+
+def send_sms(session: Session, to: str, message: str, provider: Optional[str] = None,
+             user_id: Optional[int] = None) -> Tuple[bool, str]:
+    """
+    SMS پیغام فوراً بھیجیں (صرف ٹیسٹ کے لیے؛ باقی سب sms_outbox.enqueue استعمال کریں)۔
+    تنظیمات system_settings ٹیبل سے حاصل کی جاتی ہیں۔
+    """
+    result = send(get_sms_config(session, user_id, provider), [to], message)
+    return result.ok, result.info
 
 
 def generate_otp() -> str:
@@ -107,12 +165,7 @@ def create_otp_session(phone: str) -> Tuple[str, str]:
     session_id = ''.join(random.choices(string.ascii_letters + string.digits, k=32))
     otp_code = generate_otp()
     
-    _otp_sessions[session_id] = {
-        'phone': phone,
-        'otp_code': otp_code,
-        'expires_at': time.time() + 300,  # 5 منٹ
-        'attempts': 0
-    }
+    get_store().set(f'otp:{session_id}', {'phone': phone, 'otp_code': otp_code}, ttl=OTP_TTL_SECONDS)
     
     return session_id, otp_code
 
@@ -122,27 +175,24 @@ def verify_otp_session(session_id: str, otp_code: str) -> Tuple[bool, Optional[s
     OTP کوڈ کی تصدیق کریں۔
     واپسی: (is_valid, phone)
     """
-    if session_id not in _otp_sessions:
-        return False, None
-    
-    session_data = _otp_sessions[session_id]
+    store = get_store()
+    key = f'otp:{session_id}'
     
-    # کی توسیع پذیری چیک کریں
-    if time.time() > session_data['expires_at']:
-        del _otp_sessions[session_id]
+    # میعاد ختم ہونے پر اسٹور خود ہی کلید ہٹا دیتا ہے
+    session_data = store.get(key)
+    if not session_data:
         return False, None
     
-    # کوششوں کی تعداد چیک کریں
-    if session_data['attempts'] >= 3:
-        del _otp_sessions[session_id]
+    # کوششوں کی تعداد چیک کریں (تمام workers کے درمیان atomic)
+    attempts = store.incr(f'{key}:attempts', ttl=OTP_TTL_SECONDS)
+    if attempts > OTP_MAX_ATTEMPTS:
+        store.delete(key)
+        store.delete(f'{key}:attempts')
         return False, None
     
-    session_data['attempts'] += 1
-    
-    # کوڈ کی تصدیق کریں
-    if session_data['otp_code'] == otp_code:
-        phone = session_data['phone']
-        del _otp_sessions[session_id]
-        return True, phone
+    # کوڈ کی تصدیق کریں؛ pop یقینی بناتا ہے کہ سیشن صرف ایک بار استعمال ہو
+    if session_data['otp_code'] == otp_code and store.pop(key):
+        store.delete(f'{key}:attempts')
+        return True, session_data['phone']
     
     return False, None
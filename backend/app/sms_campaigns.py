@@ -0,0 +1,310 @@
+"""SMS campaigns: one templated message to every member of a customer group.
+
+Creating a campaign only stores it; `prepare` runs on a background thread
+and turns it into sms_outbox rows:
+
+1. the group's members with their mobiles, in one query;
+2. mobiles normalized to 09xxxxxxxxx; members without a valid one are
+   counted as invalid, a number shared by several members gets one message;
+3. what the template uses, for all members at once: balances in one grouped
+   query over the ledger, due cheques in one over payments;
+4. messages rendered and bulk-inserted into the outbox (kind `campaign`, the
+   lowest priority) CHUNK rows per transaction, `queued` counting up as it goes.
+
+From there the outbox sender does the provider calls: identical texts go
+through the provider's bulk call, under the provider rate limit and behind
+OTPs. `progress` counts the campaign's outbox rows by status.
+
+A campaign whose worker died while preparing is taken up again (`resume`)
+after PREPARE_LEASE; mobiles already queued for it are not queued twice.
+
+Template fields: {name} {mobile} {balance} {debt} {due_count} {due_amount}
+{due_date}. balance > 0 means the customer owes us; debt is that or 0. The
+due_* fields cover the customer's cheques (incoming payments) due within
+`within_days`; due_date is the earliest, in the Jalali calendar.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from string import Formatter
+from typing import Dict, List, Optional, Set, Tuple
+
+import jdatetime
+from sqlalchemy import and_, case, func, insert, or_, select, update
+
+from . import db, models, sms_outbox
+from .normalizer import normalize_mobile
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK = int(os.getenv('SMS_CAMPAIGN_CHUNK', '1000'))  # outbox rows per transaction
+PREPARE_LEASE = float(os.getenv('SMS_CAMPAIGN_LEASE', '900'))  # seconds before a stuck preparation is retried
+DEFAULT_WITHIN_DAYS = 14
+MAX_LENGTH = 1000
+
+FIELDS = {'name', 'mobile', 'balance', 'debt', 'due_count', 'due_amount', 'due_date'}
+BALANCE_FIELDS = {'balance', 'debt'}
+CHEQUE_FIELDS = {'due_count', 'due_amount', 'due_date'}
+RECEIVABLE = 'AccountsReceivable'
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timezone=True columns back naive; they were written in UTC
+    if dt is None:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def template_fields(template: str) -> Set[str]:
+    """The fields `template` uses; ValueError for a malformed template or an unknown field."""
+    if not template or not template.strip():
+        raise ValueError('empty template')
+    if len(template) > MAX_LENGTH:
+        raise ValueError(f'template longer than {MAX_LENGTH} characters')
+    used = set()
+    for _, field, spec, _ in Formatter().parse(template):
+        if field is None:
+            continue
+        if field not in FIELDS or (spec and '{' in spec):
+            raise ValueError(f'unknown field: {{{field}}}; use one of ' + ', '.join(sorted(FIELDS)))
+        used.add(field)
+    return used
+
+
+def _members(session, group_id: int) -> List[Tuple[str, str, Optional[str]]]:
+    m, p = models.CustomerGroupMember, models.Person
+    q = session.query(p.id, p.name, p.mobile).join(m, m.person_id == p.id).filter(m.group_id == group_id)
+    return q.order_by(m.id).all()
+
+
+def _member_ids(group_id: int):
+    m = models.CustomerGroupMember
+    return select(m.person_id).where(m.group_id == group_id)
+
+
+def _balances(session, group_id: int) -> Dict[str, int]:
+    le = models.LedgerEntry
+    debit = func.sum(case((le.debit_account == RECEIVABLE, le.amount), else_=0))
+    credit = func.sum(case((le.credit_account == RECEIVABLE, le.amount), else_=0))
+    q = (session.query(le.party_id, debit - credit)
+         .filter(le.party_id.in_(_member_ids(group_id)),
+                 or_(le.debit_account == RECEIVABLE, le.credit_account == RECEIVABLE))
+         .group_by(le.party_id))
+    return {party_id: int(balance or 0) for party_id, balance in q}
+
+
+def _due_cheques(session, group_id: int, within_days: int) -> Dict[str, Tuple[int, int, datetime]]:
+    """party id -> (count, amount, earliest due date) of their cheques due within `within_days`."""
+    p = models.Payment
+    now = _now()
+    q = (session.query(p.party_id, func.count(p.id), func.sum(p.amount), func.min(p.due_date))
+         .filter(p.party_id.in_(_member_ids(group_id)), p.direction == 'in',
+                 p.due_date.isnot(None), p.due_date >= now, p.due_date <= now + timedelta(days=within_days))
+         .group_by(p.party_id))
+    out = {}
+    for party_id, count, amount, first in q:
+        if isinstance(first, str):  # SQLite returns the aggregate unparsed
+            first = datetime.fromisoformat(first)
+        out[party_id] = (int(count), int(amount or 0), first)
+    return out
+
+
+def _jalali(dt: datetime) -> str:
+    return jdatetime.date.fromgregorian(date=dt.date()).strftime('%Y/%m/%d')
+
+
+def plan(session, group_id: int, template: str, options: Optional[dict] = None,
+         skip: Optional[Set[str]] = None) -> Tuple[List[Tuple[str, str]], Dict[str, int]]:
+    """Rendered (mobile, text) per recipient, and the counts; mobiles in `skip` are left out of the list."""
+    options = options or {}
+    used = template_fields(template)
+    min_balance = options.get('min_balance')
+    only_due = bool(options.get('only_due_cheques'))
+    within_days = int(options.get('within_days') or DEFAULT_WITHIN_DAYS)
+
+    members = _members(session, group_id)
+    balances = _balances(session, group_id) if used & BALANCE_FIELDS or min_balance is not None else {}
+    cheques = _due_cheques(session, group_id, within_days) if used & CHEQUE_FIELDS or only_due else {}
+
+    counts = {'members': len(members), 'recipients': 0, 'invalid': 0, 'duplicates': 0, 'filtered': 0}
+    seen: Set[str] = set()
+    out = []
+    for party_id, name, mobile in members:
+        to = normalize_mobile(mobile)
+        if to is None:
+            counts['invalid'] += 1
+            continue
+        if to in seen:
+            counts['duplicates'] += 1
+            continue
+        seen.add(to)
+        balance = balances.get(party_id, 0)
+        due = cheques.get(party_id)
+        if (min_balance is not None and balance < min_balance) or (only_due and due is None):
+            counts['filtered'] += 1
+            continue
+        counts['recipients'] += 1
+        if skip and to in skip:
+            continue
+        count, amount, first = due or (0, 0, None)
+        values = {
+            'name': name or '', 'mobile': to, 'balance': f'{balance:,}', 'debt': f'{max(balance, 0):,}',
+            'due_count': str(count), 'due_amount': f'{amount:,}', 'due_date': _jalali(first) if first else '',
+        }
+        out.append((to, template.format_map(values)))
+    return out, counts
+
+
+def create(session, user_id: int, group_id: int, template: str, name: Optional[str] = None,
+           options: Optional[dict] = None) -> models.SmsCampaign:
+    template_fields(template)
+    campaign = models.SmsCampaign(name=name, group_id=group_id, created_by_user_id=user_id, template=template,
+                                  options=options or {}, status='pending')
+    session.add(campaign)
+    session.commit()
+    return campaign
+
+
+def _claim(session, campaign_id: int) -> Optional[models.SmsCampaign]:
+    """Take the campaign for preparing: pending, or preparing by a worker whose lease ran out."""
+    c = models.SmsCampaign
+    now = _now()
+    res = session.execute(
+        update(c).where(c.id == campaign_id, or_(
+            c.status == 'pending',
+            and_(c.status == 'preparing', c.started_at < now - timedelta(seconds=PREPARE_LEASE))))
+        .values(status='preparing', started_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return session.get(c, campaign_id) if res.rowcount else None
+
+
+def _fill(session, campaign: models.SmsCampaign):
+    m = models.SmsMessage
+    already = {to for (to,) in session.query(m.to).filter(m.campaign_id == campaign.id)}
+    rows, counts = plan(session, campaign.group_id, campaign.template, campaign.options, skip=already)
+    for key, value in counts.items():
+        setattr(campaign, key, value)
+    queued = campaign.queued = len(already)
+    session.commit()
+
+    c = models.SmsCampaign
+    campaign_id = campaign.id
+    now = _now()
+    base = {'kind': 'campaign', 'priority': sms_outbox.PRIORITIES['campaign'], 'status': 'queued', 'attempts': 0,
+            'next_attempt_at': now, 'user_id': campaign.created_by_user_id, 'campaign_id': campaign_id}
+    for i in range(0, len(rows), CHUNK):
+        chunk = rows[i:i + CHUNK]
+        # the guard locks the campaign row: a cancel either committed before it (the chunk is dropped)
+        # or waits for this commit and then cancels the chunk with the rest
+        res = session.execute(
+            update(c).where(c.id == campaign_id, c.status == 'preparing')
+            .values(queued=c.queued + len(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        if not res.rowcount:
+            session.rollback()
+            return
+        session.execute(insert(m), [dict(base, to=to, message=text) for to, text in chunk])
+        session.commit()
+        queued += len(chunk)
+        sms_outbox.wake()
+
+    done = queued == 0
+    session.execute(
+        update(c).where(c.id == campaign_id, c.status == 'preparing')
+        .values(status='done' if done else 'queued', finished_at=_now() if done else None)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+
+
+def prepare(campaign_id: int, session_factory=None) -> bool:
+    """Resolve, render and queue one campaign; False when it was not ours to prepare."""
+    session = (session_factory or db.SessionLocal)()
+    try:
+        campaign = _claim(session, campaign_id)
+        if campaign is None:
+            return False
+        try:
+            _fill(session, campaign)
+        except Exception as e:
+            LOGGER.exception('sms campaign %s: preparing failed', campaign_id)
+            session.rollback()
+            session.execute(
+                update(models.SmsCampaign).where(models.SmsCampaign.id == campaign_id)
+                .values(status='failed', error=str(e)[:500], finished_at=_now())
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        return True
+    finally:
+        session.close()
+
+
+def prepare_in_background(campaign_id: int, session_factory=None):
+    threading.Thread(target=prepare, args=(campaign_id, session_factory),
+                     name=f'sms-campaign-{campaign_id}', daemon=True).start()
+
+
+def resume(session_factory=None) -> List[int]:
+    """Prepare campaigns left pending, or stuck preparing, e.g. by a restart."""
+    c = models.SmsCampaign
+    session = (session_factory or db.SessionLocal)()
+    try:
+        stale = _now() - timedelta(seconds=PREPARE_LEASE)
+        ids = [i for (i,) in session.query(c.id).filter(or_(
+            c.status == 'pending', and_(c.status == 'preparing', c.started_at < stale))).order_by(c.id)]
+    finally:
+        session.close()
+    for campaign_id in ids:
+        prepare(campaign_id, session_factory)
+    return ids
+
+
+def cancel(session, campaign: models.SmsCampaign) -> int:
+    """Stop the campaign; messages not yet handed to the provider are dropped. Returns how many."""
+    m = models.SmsMessage
+    if campaign.status in ('done', 'cancelled', 'failed'):
+        return 0
+    campaign.status = 'cancelled'
+    campaign.finished_at = _now()
+    # write the campaign row first: it waits for a chunk being queued, whose messages the update below then sees
+    session.flush()
+    res = session.execute(
+        update(m).where(m.campaign_id == campaign.id, m.status == 'queued')
+        .values(status='cancelled', claim=None)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return res.rowcount
+
+
+def progress(session, campaign: models.SmsCampaign) -> Dict:
+    """Outbox counts by status; marks a queued campaign done once nothing is left to send."""
+    m = models.SmsMessage
+    by_status = dict(session.query(m.status, func.count(m.id)).filter(m.campaign_id == campaign.id).group_by(m.status).all())
+    pending = by_status.get('queued', 0) + by_status.get('sending', 0)
+    if campaign.status == 'queued' and pending == 0:
+        campaign.status = 'done'
+        campaign.finished_at = _now()
+        session.commit()
+    handled = sum(by_status.values()) - pending
+    if campaign.recipients:
+        percent = min(100, int(100 * handled / campaign.recipients))
+    else:
+        percent = 100 if campaign.status == 'done' else 0
+    return {'by_status': by_status, 'pending': pending, 'percent': percent}
+
+
+def start(session_factory=None):
+    """Pick up unfinished preparations on a thread, so startup does not wait for them."""
+    if not sms_outbox.ENABLED:
+        return
+    threading.Thread(target=resume, args=(session_factory,), name='sms-campaign-resume', daemon=True).start()
@@ -0,0 +1,318 @@
+"""Persistent SMS outbox and its background sender.
+
+Request handlers only `enqueue` (an INSERT into sms_outbox) and return; the
+sender thread does the provider calls. Every SMS_OUTBOX_TICK seconds, or as
+soon as something is queued in this process, it claims a batch of due
+messages, OTPs first. Claiming is a conditional UPDATE that marks the rows
+with a random token and a lease, so several workers never take the same row.
+A row whose lease runs out (its worker died) is claimed again.
+
+Claimed messages are grouped by SMS config (system, or the user's own) and
+text. Identical texts go out through the provider's bulk call, up to its
+batch size in one request. Provider calls are rate limited per provider
+(SMS_RATE_LIMITS, calls per second, counted in the shared store across
+workers); over the limit the rest wait for the next second.
+
+Outcome per message:
+- sent: recorded with the provider's message id.
+- retried with exponential backoff, up to SMS_MAX_ATTEMPTS: the provider was
+  never reached (connection error, open circuit breaker, 5xx / 429).
+- failed: the provider refused the message, or the request may have reached
+  it (read timeout). Sending again could deliver it twice.
+- expired: an OTP that was not sent before expires_at.
+
+OTPs and credentials (kind `credential`, e.g. a new user's password) are
+masked wherever the outbox is shown, and their text is blanked once the
+message is sent, failed or expired, so it is not kept for the retention
+period.
+
+Providers report delivery to POST /api/sms/delivery (`record_delivery`),
+which moves sent messages to delivered / undelivered.
+"""
+import hmac
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, or_, update
+
+from . import db, models, shared_store, sms
+
+LOGGER = logging.getLogger(__name__)
+
+ENABLED = os.getenv('SMS_OUTBOX_ENABLED', '1').lower() not in ('0', 'false', 'no')
+TICK = float(os.getenv('SMS_OUTBOX_TICK', '2'))
+BATCH = int(os.getenv('SMS_OUTBOX_BATCH', '200'))
+MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', '5'))
+BACKOFF_BASE = float(os.getenv('SMS_BACKOFF_BASE', '30'))
+BACKOFF_MAX = 3600.0
+RETENTION_DAYS = int(os.getenv('SMS_OUTBOX_RETENTION_DAYS', '90'))
+DLR_TOKEN = os.getenv('SMS_DLR_TOKEN', '')
+DEFAULT_RATE = 5
+# provider calls per second, e.g. "ippanel=5,kavenegar=3"
+RATE_LIMITS = {
+    name.strip(): int(limit)
+    for name, _, limit in (item.partition('=') for item in os.getenv('SMS_RATE_LIMITS', '').split(','))
+    if name.strip() and limit.strip().isdigit()
+}
+# a claimed message not settled by then is claimed again
+LEASE = 120.0
+
+PRIORITIES = {'otp': 0, 'credential': 1, 'manual': 3, 'auto': 5, 'campaign': 8}
+# text masked when shown and blanked once settled
+SECRET_KINDS = {'otp', 'credential'}
+DELIVERED = {'delivered', 'deliver', 'success', 'sent_to_handset', '1'}
+UNDELIVERED = {'failed', 'undelivered', 'rejected', 'expired', 'blocked', '0'}
+
+_WAKE = threading.Event()
+_STOP = threading.Event()
+_THREAD: Optional[threading.Thread] = None
+_last_prune = 0.0
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands timezone=True columns back naive; they were written in UTC
+    if dt is None:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def enqueue(session, to: str, message: str, kind: str = 'manual', user_id: Optional[int] = None,
+            provider: Optional[str] = None, expires_in: Optional[float] = None, commit: bool = True) -> models.SmsMessage:
+    """Queue one SMS; the sender picks it up within a tick."""
+    now = _now()
+    msg = models.SmsMessage(
+        to=to.strip(), message=message, kind=kind, user_id=user_id, provider=provider,
+        priority=PRIORITIES.get(kind, 5), status='queued', attempts=0, next_attempt_at=now,
+        expires_at=now + timedelta(seconds=expires_in) if expires_in else None,
+    )
+    session.add(msg)
+    if commit:
+        session.commit()
+        wake()
+    return msg
+
+
+def notify_party(session, user_id: int, party_id: Optional[str], message: str) -> Optional[models.SmsMessage]:
+    """Queue `message` to the party's mobile when the user turned on automatic SMS."""
+    if not party_id:
+        return None
+    cfg = session.query(models.UserSmsConfig).filter(models.UserSmsConfig.user_id == user_id).first()
+    if cfg is None or not cfg.auto_sms_enabled:
+        return None
+    mobile = session.query(models.Person.mobile).filter(models.Person.id == party_id).scalar()
+    if not mobile:
+        return None
+    return enqueue(session, mobile, message, kind='auto', user_id=user_id)
+
+
+def wake():
+    _WAKE.set()
+
+
+def backoff_delay(attempts: int) -> float:
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def _claim(session, now: datetime, limit: int) -> List[models.SmsMessage]:
+    m = models.SmsMessage
+    due = (m.status.in_(('queued', 'sending')), or_(m.next_attempt_at.is_(None), m.next_attempt_at <= now))
+    ids = [i for (i,) in session.query(m.id).filter(*due).order_by(m.priority, m.id).limit(limit)]
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    session.execute(
+        update(m).where(m.id.in_(ids), *due)
+        .values(status='sending', claim=token, next_attempt_at=now + timedelta(seconds=LEASE))
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return session.query(m).filter(m.claim == token).order_by(m.priority, m.id).all()
+
+
+def _take(store, provider: str) -> bool:
+    """One provider call within the provider's per-second limit."""
+    slot = int(time.time())
+    return store.incr(f'sms:rate:{provider}:{slot}', ttl=3) <= RATE_LIMITS.get(provider, DEFAULT_RATE)
+
+
+def _forget(msg: models.SmsMessage):
+    if msg.kind in SECRET_KINDS:
+        msg.message = ''
+
+
+def _settle(msg: models.SmsMessage, result: sms.SendResult, now: datetime):
+    msg.attempts = (msg.attempts or 0) + 1
+    msg.claim = None
+    if result.ok:
+        msg.status = 'sent'
+        msg.sent_at = now
+        msg.provider_message_id = result.message_id
+        msg.error = None
+    elif result.retry and msg.attempts < MAX_ATTEMPTS:
+        msg.status = 'queued'
+        msg.next_attempt_at = now + timedelta(seconds=backoff_delay(msg.attempts))
+        msg.error = result.info[:500]
+    else:
+        msg.status = 'failed'
+        msg.error = result.info[:500]
+    if msg.status != 'queued':
+        _forget(msg)
+
+
+def _postpone(msgs: List[models.SmsMessage], until: datetime):
+    for msg in msgs:
+        msg.status = 'queued'
+        msg.claim = None
+        msg.next_attempt_at = until
+
+
+def deliver(session, msgs: List[models.SmsMessage], store=None) -> Dict[str, int]:
+    """Send claimed messages, bulk where the text is shared; returns counts by outcome."""
+    store = store or shared_store.get_store()
+    now = _now()
+    counts = {'sent': 0, 'retry': 0, 'failed': 0, 'expired': 0, 'postponed': 0}
+    configs: Dict[tuple, dict] = {}
+    groups: 'OrderedDict[tuple, List[models.SmsMessage]]' = OrderedDict()
+    for msg in msgs:
+        if msg.expires_at is not None and _aware(msg.expires_at) < now:
+            msg.status, msg.claim = 'expired', None
+            _forget(msg)
+            counts['expired'] += 1
+            continue
+        key = (msg.user_id, msg.provider)
+        if key not in configs:
+            configs[key] = sms.get_sms_config(session, msg.user_id, msg.provider)
+        groups.setdefault(key + (msg.message,), []).append(msg)
+    session.commit()
+
+    limited = set()
+    for (user_id, provider, text), group in groups.items():
+        config = configs[(user_id, provider)]
+        name = config['provider']
+        size = max(sms.PROVIDERS.get(name, (None, 1))[1], 1)
+        for i in range(0, len(group), size):
+            batch = group[i:i + size]
+            if name in limited or not _take(store, name):
+                limited.add(name)
+                _postpone(batch, now + timedelta(seconds=1))
+                counts['postponed'] += len(batch)
+                continue
+            result = sms.send(config, [msg.to for msg in batch], text)
+            for msg in batch:
+                _settle(msg, result, _now())
+                counts['sent' if msg.status == 'sent' else 'retry' if msg.status == 'queued' else 'failed'] += 1
+            session.commit()
+    session.commit()
+    return counts
+
+
+def tick(session_factory=None, store=None) -> Dict[str, int]:
+    """Claim and send one batch; returns deliver's counts plus `claimed`."""
+    session = (session_factory or db.SessionLocal)()
+    # results are committed after every provider call; keep the batch loaded across those commits
+    session.expire_on_commit = False
+    try:
+        msgs = _claim(session, _now(), BATCH)
+        counts = deliver(session, msgs, store) if msgs else {}
+        counts['claimed'] = len(msgs)
+        if msgs:
+            LOGGER.debug('sms outbox: %s', counts)
+        _prune(session)
+        return counts
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def record_delivery(session, message_id: str, status: str, recipient: Optional[str] = None) -> int:
+    """Delivery report from the provider; returns the number of messages updated."""
+    m = models.SmsMessage
+    status = str(status).strip().lower()
+    if status in DELIVERED:
+        values = {'status': 'delivered', 'delivered_at': _now()}
+    elif status in UNDELIVERED:
+        values = {'status': 'undelivered', 'error': f'delivery report: {status}'}
+    else:
+        return 0
+    q = update(m).where(m.provider_message_id == str(message_id), m.status.in_(('sent', 'delivered', 'undelivered')))
+    if recipient:
+        q = q.where(m.to == recipient)
+    res = session.execute(q.values(**values).execution_options(synchronize_session=False))
+    session.commit()
+    return res.rowcount
+
+
+def valid_dlr_token(token: Optional[str]) -> bool:
+    """Delivery reports are accepted only with SMS_DLR_TOKEN (none without it)."""
+    return bool(DLR_TOKEN) and hmac.compare_digest((token or '').encode(), DLR_TOKEN.encode())
+
+
+def redact(out):
+    """Hide the code of an OTP, or a whole credential message, before it is shown to anyone."""
+    if out.kind == 'otp':
+        out.message = re.sub(r'[0-9۰-۹]', '•', out.message)
+    elif out.kind == 'credential' and out.message:
+        out.message = '••••••'
+    return out
+
+
+def summary(session) -> Dict[str, int]:
+    m = models.SmsMessage
+    return dict(session.query(m.status, func.count(m.id)).group_by(m.status).all())
+
+
+def _prune(session):
+    global _last_prune
+    if time.time() - _last_prune < 3600:
+        return
+    _last_prune = time.time()
+    cutoff = _now() - timedelta(days=RETENTION_DAYS)
+    m = models.SmsMessage
+    session.query(m).filter(m.created_at < cutoff, m.status.notin_(('queued', 'sending'))).delete(synchronize_session=False)
+    session.commit()
+
+
+def _run(session_factory):
+    while not _STOP.is_set():
+        try:
+            counts = tick(session_factory)
+            if counts['claimed'] >= BATCH and not counts.get('postponed'):
+                continue  # more waiting and no rate limit hit
+        except Exception as e:
+            LOGGER.warning('sms outbox tick failed: %s', e)
+        _WAKE.wait(TICK)
+        _WAKE.clear()
+
+
+def start(session_factory=None):
+    global _THREAD
+    if not ENABLED or _THREAD is not None:
+        return
+    _STOP.clear()
+    _THREAD = threading.Thread(target=_run, args=(session_factory or db.SessionLocal,), name='sms-outbox', daemon=True)
+    _THREAD.start()
+
+
+def stop(timeout: float = 10.0):
+    global _THREAD
+    if _THREAD is None:
+        return
+    _STOP.set()
+    _WAKE.set()
+    _THREAD.join(timeout)
+    _THREAD = None
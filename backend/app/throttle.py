@@ -0,0 +1,89 @@
+"""Sliding-window request throttling backed by the shared store.
+
+Used on the auth / OTP / SMS endpoints so a single client can't trigger
+unbounded PBKDF2 work or outbound SMS. Checks run before any DB or crypto
+work and raise HTTP 429 with a Retry-After header.
+
+The window is the usual two-bucket approximation: the count of the current
+fixed bucket plus the previous bucket weighted by how much of it still falls
+inside the sliding window. Only `incr`/`get` are needed, so it works on every
+shared_store backend and is consistent across workers.
+
+Limits are `<count>/<seconds>` and can be overridden per scope with env vars,
+e.g. THROTTLE_LOGIN_IP=20/60.
+"""
+import math
+import os
+import time
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from .shared_store import get_store
+
+DEFAULT_LIMITS = {
+    'login_ip': '20/60',
+    'login_user': '5/60',
+    'otp_ip': '10/300',
+    'otp_phone': '3/300',
+    'sms_ip': '60/60',
+    'sms_user': '30/60',
+}
+
+
+def _parse(spec: str) -> Tuple[int, int]:
+    count, seconds = spec.split('/', 1)
+    return int(count), int(seconds)
+
+
+def get_limit(scope: str) -> Tuple[int, int]:
+    return _parse(os.getenv(f'THROTTLE_{scope.upper()}') or DEFAULT_LIMITS[scope])
+
+
+def hit(scope: str, identity: str, now: Optional[float] = None) -> Optional[int]:
+    """Record one request; return None if allowed, else seconds until retry."""
+    limit, window = get_limit(scope)
+    if limit <= 0:
+        return None
+    now = time.time() if now is None else now
+    bucket = int(now // window)
+    elapsed = (now % window) / window
+    store = get_store()
+    prefix = f'rl:{scope}:{identity}:'
+    current = store.incr(prefix + str(bucket), ttl=window * 2)
+    previous = int(store.get(prefix + str(bucket - 1)) or 0)
+    if previous * (1 - elapsed) + current <= limit:
+        return None
+    # time until the previous bucket's weight has decayed enough (or the bucket rolls over)
+    if previous and current <= limit:
+        wait = window * (1 - elapsed - (limit - current) / previous)
+    else:
+        wait = window * (1 - elapsed)
+    return max(1, math.ceil(wait))
+
+
+def enforce(scope: str, identity: Optional[str]):
+    if not identity:
+        return
+    retry_after = hit(scope, identity)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail='تعداد درخواست‌ها بیش از حد مجاز است. لطفاً بعداً تلاش کنید',
+            headers={'Retry-After': str(retry_after)},
+        )
+
+
+def client_ip(request: Request) -> str:
+    if os.getenv('THROTTLE_TRUST_PROXY', '').lower() in ('1', 'true', 'yes'):
+        fwd = request.headers.get('x-forwarded-for')
+        if fwd:
+            return fwd.split(',')[0].strip()
+    return request.client.host if request.client else 'unknown'
+
+
+def by_ip(scope: str):
+    """Dependency factory: throttle the endpoint per client IP."""
+    def _dependency(request: Request):
+        enforce(scope, client_ip(request))
+    return _dependency
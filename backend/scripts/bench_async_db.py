@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Concurrency benchmark: sync Session inside `async def` vs AsyncSession.
+
+Runs the same query from N concurrent coroutines and reports requests/second.
+With the sync Session every query blocks the event loop, so throughput stays
+flat as concurrency grows; with the AsyncSession it should scale until the
+pool or the database saturates.
+
+On Postgres each query is `SELECT pg_sleep(latency)` to emulate a slow round-trip.
+On SQLite a recursive CTE is used instead (no sleep function available).
+
+Usage:
+    python scripts/bench_async_db.py [--requests 200] [--latency 0.01] [--concurrency 1,8,32,64]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import text
+
+from app import db
+
+
+def _query(latency: float):
+    if db.engine.dialect.name == 'postgresql':
+        return text('SELECT pg_sleep(:d)').bindparams(d=latency)
+    n = int(latency * 2_000_000) or 1
+    return text('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) SELECT count(*) FROM c').bindparams(n=n)
+
+
+async def _sync_request(stmt):
+    # what the old `async def` endpoints did: a blocking Session call on the loop
+    session = db.SessionLocal()
+    try:
+        session.execute(stmt).all()
+    finally:
+        session.close()
+
+
+async def _async_request(stmt):
+    async with db.AsyncSessionLocal() as session:
+        (await session.execute(stmt)).all()
+
+
+async def _run(handler, stmt, total: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await handler(stmt)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--concurrency', default='1,8,32,64')
+    args = parser.parse_args()
+
+    if db.AsyncSessionLocal is None:
+        raise SystemExit('async driver not installed (pip install asyncpg aiosqlite)')
+
+    stmt = _query(args.latency)
+    print(f'database: {db.engine.dialect.name}  requests: {args.requests}  latency: {args.latency}s')
+    print(f"{'in-flight':>10} {'sync req/s':>12} {'async req/s':>12} {'speedup':>8}")
+    for c in [int(x) for x in args.concurrency.split(',')]:
+        sync_rps = await _run(_sync_request, stmt, args.requests, c)
+        async_rps = await _run(_async_request, stmt, args.requests, c)
+        print(f'{c:>10} {sync_rps:>12.1f} {async_rps:>12.1f} {async_rps / sync_rps:>7.2f}x')
+    await db.async_engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
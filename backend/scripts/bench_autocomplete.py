@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Benchmark: per-keystroke latency of the product autocomplete (app/autocomplete.py).
+
+Loads synthetic Persian product names with a skewed sales distribution and
+"types" a set of queries one character at a time, timing every keystroke.
+For comparison each keystroke is also run as the DB prefix query
+(name_norm LIKE 'q%' OR name_norm LIKE '% q%' OR code LIKE 'q%') on SQLite.
+
+Usage:
+    python scripts/bench_autocomplete.py [--products 200000] [--skip-db]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, or_
+from sqlalchemy.orm import sessionmaker
+
+from app import autocomplete, db, models
+from app.normalizer import normalize_for_search
+
+WORDS = ['گوشی', 'سامسونگ', 'شیائومی', 'کابل', 'شارژر', 'هدفون', 'بلوتوث', 'لپ‌تاپ', 'ماوس', 'کیبورد',
+         'مانیتور', 'اسپیکر', 'پاوربانک', 'فلش', 'مموری', 'قاب', 'محافظ', 'صفحه', 'ساعت', 'هوشمند',
+         'تبلت', 'روتر', 'مودم', 'پرینتر', 'کارتریج', 'برنج', 'روغن', 'چای', 'قند', 'شکر']
+TYPED = ['گوشی سامسونگ', 'کابل شارژر', 'هدفون بلوتوث', 'P-12345', 'چای', 'مدل 42']
+
+
+def _products(n: int):
+    rnd = random.Random(11)
+    for i in range(n):
+        name = ' '.join(rnd.sample(WORDS, 3)) + f' مدل {rnd.randint(1, 999)}'
+        yield {'id': f'p{i}', 'name': name, 'code': f'P-{i}'}
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--skip-db', action='store_true', help='only time the in-memory index')
+    args = parser.parse_args()
+
+    docs = list(_products(args.products))
+    rnd = random.Random(5)
+    sales = {d['id']: int(rnd.paretovariate(1.2)) for d in docs}
+
+    started = time.perf_counter()
+    ac = autocomplete.Autocomplete()
+    ac.load(docs, sales)
+    print(f'loaded {len(ac)} products ({len(ac.entries)} keys) in {time.perf_counter() - started:.2f}s')
+
+    keystrokes = [q[:i] for q in TYPED for i in range(1, len(q) + 1)]
+    cold, warm = [], []
+    for ks in keystrokes:
+        t = time.perf_counter()
+        ac.suggest(ks)
+        cold.append((time.perf_counter() - t) * 1e6)
+    for _ in range(20):
+        for ks in keystrokes:
+            t = time.perf_counter()
+            ac.suggest(ks)
+            warm.append((time.perf_counter() - t) * 1e6)
+    print(f'{len(keystrokes)} keystrokes')
+    print(f'in-memory first pass  p50 {statistics.median(cold):8.1f} us  p99 {_pct(cold, 0.99):8.1f} us  max {max(cold):8.1f} us')
+    print(f'in-memory steady      p50 {statistics.median(warm):8.1f} us  p99 {_pct(warm, 0.99):8.1f} us')
+
+    t = time.perf_counter()
+    ac.upsert({'id': 'new', 'name': 'گوشی سامسونگ جدید', 'code': 'NEW-1'}, sales=0)
+    print(f'incremental upsert {(time.perf_counter() - t) * 1e6:.0f} us')
+
+    if args.skip_db:
+        return
+    path = os.path.join(tempfile.mkdtemp(), 'bench_autocomplete.db')
+    engine = create_engine(f'sqlite:///{path}')
+    db.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.bulk_insert_mappings(models.Product, [
+        dict(d, name_norm=normalize_for_search(d['name']), inventory=0) for d in docs
+    ])
+    session.commit()
+    timings = []
+    for ks in keystrokes:
+        qn = normalize_for_search(ks)
+        t = time.perf_counter()
+        session.query(models.Product).filter(or_(
+            models.Product.name_norm.like(f'{qn}%'), models.Product.name_norm.like(f'% {qn}%'), models.Product.code.like(f'{qn}%')
+        )).limit(7).all()
+        timings.append((time.perf_counter() - t) * 1e6)
+    print(f'DB LIKE prefix        p50 {statistics.median(timings):8.1f} us  p99 {_pct(timings, 0.99):8.1f} us')
+    session.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Benchmark: external_search.aggregate_search against local fake marketplaces.
+
+Starts three local HTTP servers that mimic a marketplace: a search page
+linking to product pages, and product pages with og: tags and a price, each
+answered after --latency seconds. Then runs the same aggregate search
+- sequentially (one worker, one request per host at a time), as before
+- with the concurrent engine (shared pools, per-host limit, keep-alive)
+- with a deadline shorter than one slow site, to show partial results
+
+Usage:
+    python scripts/bench_external_search.py [--latency 0.3] [--limit 6]
+"""
+import argparse
+import functools
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app import external_search, page_cache
+
+PRODUCT_PAGE = ('<html><head><meta property="og:title" content="کالای {n}">'
+                '<meta property="og:image" content="/img/{n}.jpg"></head>'
+                '<body><span itemprop="price" content="{price}"></span></body></html>')
+
+
+def _server(latency: float, links: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith('/search'):
+                body = '<html><body>' + ''.join(f'<a href="/p/{i}">کالا {i}</a>' for i in range(links)) + '</body></html>'
+            else:
+                n = self.path.rsplit('/', 1)[-1]
+                body = PRODUCT_PAGE.format(n=n, price=1000 + int(n))
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def _install_sources(servers):
+    external_search.SOURCES.clear()
+    for i, srv in enumerate(servers):
+        host = f'127.0.0.1:{srv.server_address[1]}'
+        external_search.SOURCES[f'site{i}'] = functools.partial(
+            lambda q, limit, deadline, url, hosts: external_search._search_generic_site(url, q, hosts, limit, deadline),
+            url=f'http://{host}/search?q={{q}}', hosts=[f'{host}/p/'])
+
+
+def _run(label, **kw):
+    external_search._cache = page_cache.PageCache(path=None)  # measure fetching, not the cache
+    started = time.perf_counter()
+    res = external_search.aggregate_search('گوشی', **kw)
+    elapsed = time.perf_counter() - started
+    pages = sum(len(v) for v in res['results'].values())
+    priced = sum(1 for v in res['results'].values() for r in v if r.get('price'))
+    print(f'{label:<42} {elapsed:6.2f}s  {pages:3d} results  {priced:3d} with price  timed out: {res["timed_out"] or "-"}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.3, help='seconds each fake request takes')
+    parser.add_argument('--limit', type=int, default=6)
+    args = parser.parse_args()
+
+    servers = [_server(args.latency, 20) for _ in range(3)]
+    _install_sources(servers)
+
+    pools = (external_search._site_pool, external_search._fetch_pool, external_search.PER_HOST_LIMIT)
+    external_search._site_pool = ThreadPoolExecutor(max_workers=1)
+    external_search._fetch_pool = ThreadPoolExecutor(max_workers=1)
+    _run('sequential (previous behaviour)', limit=args.limit, timeout=120)
+
+    external_search._site_pool, external_search._fetch_pool, _ = pools
+    external_search._host_slots.clear()
+    _run('concurrent', limit=args.limit, timeout=120)
+
+    slow = _server(args.latency * 10, 20)
+    _install_sources(servers[:2] + [slow])
+    _run(f'concurrent, one slow site, {args.latency * 4:.1f}s deadline', limit=args.limit, timeout=args.latency * 4)
+    for srv in servers + [slow]:
+        srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
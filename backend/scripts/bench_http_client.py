@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark: per-call requests.get vs the shared http_client session.
+
+Starts a local keep-alive HTTP server and sends the same number of
+sequential GETs both ways, reporting the time taken and how many TCP
+connections the server accepted. Against real providers each new connection
+also costs a TLS handshake, so the gap is wider there.
+
+Usage:
+    python scripts/bench_http_client.py [--requests 300]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app import http_client
+
+
+def _server():
+    state = {'connections': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body in one segment; otherwise delayed ACKs dominate keep-alive timings
+        wbufsize = 64 * 1024
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            state['connections'] += 1
+            super().setup()
+
+        def do_GET(self):
+            data = b'{"rates": {"EUR": 0.9}}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, state
+
+
+def _run(label, fn, url, n, state):
+    state['connections'] = 0
+    started = time.perf_counter()
+    for _ in range(n):
+        fn(url).json()
+    elapsed = time.perf_counter() - started
+    print(f'{label:<28} {elapsed * 1000 / n:6.2f} ms/request  {state["connections"]:4d} connections')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+    srv, state = _server()
+    url = f'http://127.0.0.1:{srv.server_address[1]}/latest'
+    _run('requests.get per call', lambda u: requests.get(u, timeout=5), url, args.requests, state)
+    _run('http_client.get (shared)', http_client.get, url, args.requests, state)
+    print(http_client.stats()['hosts'])
+    srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Benchmark: icc_sync against the fake ICC server over HTTP.
+
+Runs a full sync of a generated hierarchy (100k units by default) into a
+fresh SQLite file, then an incremental sync after a handful of changes, and
+prints per-level timings and row counts.
+
+Usage:
+    python scripts/bench_icc_sync.py [--units 500] [--centers 20] [--categories 10] [--changes 100]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from app import db, icc_sync  # noqa: E402
+from fake_icc_server import FakeIcc  # noqa: E402
+
+
+def _report(label, result, elapsed, requests):
+    print(f'{label}: {elapsed:.2f}s, {requests} requests')
+    for name, lvl in result['levels'].items():
+        if 'error' in lvl:
+            print(f'  {name:<11} error: {lvl["error"]}')
+            continue
+        print(f'  {name:<11} sources={lvl["sources"]:<5} fetched={lvl["fetched"]:<7} inserted={lvl["inserted"]:<7} '
+              f'updated={lvl["updated"]:<5} failed={lvl["failed"]:<3} {lvl["ms"]} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--centers', type=int, default=20, help='per category')
+    parser.add_argument('--units', type=int, default=500, help='per center')
+    parser.add_argument('--changes', type=int, default=100)
+    args = parser.parse_args()
+
+    fake = FakeIcc(args.categories, args.centers, args.units)
+    srv = fake.serve()
+    icc_sync.ROOT_URL = fake.root_url
+    print(f'{fake.total_units} units at {fake.root_url}')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "icc.db")}')
+        session = db.create_test_session(engine)
+        try:
+            started = time.perf_counter()
+            result = icc_sync.sync(session)
+            _report('full sync', result, time.perf_counter() - started, fake.requests)
+
+            for n in range(args.changes):
+                i, j, k = n % args.categories, n % args.centers, n % args.units
+                fake.change(f'unit-{i}-{j}-{k}', f'Changed unit {n}')
+            fake.requests = 0
+            started = time.perf_counter()
+            result = icc_sync.sync(session)
+            _report('incremental sync', result, time.perf_counter() - started, fake.requests)
+        finally:
+            session.close()
+            engine.dispose()
+    srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
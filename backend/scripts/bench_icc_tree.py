@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Benchmark: ICC tree per node (one list query per parent, like the drill-down
+UI) vs icc_tree.build (one query per level) vs a cached hit.
+
+Usage:
+    python scripts/bench_icc_tree.py [--categories 10] [--centers 20] [--units 50] [--extensions 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app import crud, db, icc_tree, models  # noqa: E402
+
+
+def _seed(session, categories, centers, units, extensions):
+    session.execute(insert(models.IccCategory), [
+        {'id': i + 1, 'external_id': f'cat-{i}', 'name': f'Category {i}'} for i in range(categories)])
+    session.execute(insert(models.IccCenter), [
+        {'id': i * centers + j + 1, 'external_id': f'ctr-{i}-{j}', 'name': f'Center {j}', 'category_id': i + 1}
+        for i in range(categories) for j in range(centers)])
+    n_centers = categories * centers
+    session.execute(insert(models.IccUnit), [
+        {'id': c * units + k + 1, 'external_id': f'unit-{c}-{k}', 'name': f'Unit {k}', 'center_id': c + 1}
+        for c in range(n_centers) for k in range(units)])
+    session.execute(insert(models.IccExtension), [
+        {'external_id': f'ext-{u}-{m}', 'name': f'Ext {m}', 'unit_id': u + 1, 'status': 'active'}
+        for u in range(n_centers * units) for m in range(extensions)])
+    session.commit()
+
+
+def _per_node(session):
+    tree = []
+    for cat in crud.get_all_icc_categories(session):
+        centers = []
+        for center in crud.get_icc_centers_by_category(session, cat.id):
+            units = []
+            for unit in crud.get_icc_units_by_center(session, center.id):
+                exts = session.query(models.IccExtension).filter(models.IccExtension.unit_id == unit.id).all()
+                units.append((unit, exts))
+            centers.append((center, units))
+        tree.append((cat, centers))
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--centers', type=int, default=20)
+    parser.add_argument('--units', type=int, default=50)
+    parser.add_argument('--extensions', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "icc.db")}')
+        session = db.create_test_session(engine)
+        _seed(session, args.categories, args.centers, args.units, args.extensions)
+        queries = [0]
+        event.listen(engine, 'before_cursor_execute', lambda *a: queries.__setitem__(0, queries[0] + 1))
+
+        for label, fn in (('per node', lambda: _per_node(session)),
+                          ('icc_tree.build', lambda: icc_tree.build(session)),
+                          ('cached_tree (miss)', lambda: icc_tree.cached_tree(session)),
+                          ('cached_tree (hit)', lambda: icc_tree.cached_tree(session))):
+            session.expunge_all()
+            queries[0] = 0
+            started = time.perf_counter()
+            fn()
+            print(f'{label:<20} {(time.perf_counter() - started) * 1000:9.1f} ms  {queries[0]:>6} queries')
+        session.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Benchmark: in-process search engine (app/local_search.py) vs the ILIKE fallback.
+
+Fills a temporary SQLite DB with synthetic Persian product names, then times
+the same queries through
+- the `/api/search` DB fallback (OR'ed ILIKE '%q%' over name/name_norm/code/group)
+- LocalIndex.search (inverted index + prefix + trigram)
+
+Usage:
+    python scripts/bench_local_search.py [--products 50000] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import db, local_search, models
+from app.normalizer import normalize_for_search
+
+WORDS = ['گوشی', 'سامسونگ', 'شیائومی', 'کابل', 'شارژر', 'هدفون', 'بلوتوث', 'لپ‌تاپ', 'ماوس', 'کیبورد',
+         'مانیتور', 'اسپیکر', 'پاوربانک', 'فلش', 'مموری', 'قاب', 'محافظ', 'صفحه', 'ساعت', 'هوشمند',
+         'تبلت', 'روتر', 'مودم', 'پرینتر', 'کارتریج', 'برنج', 'روغن', 'چای', 'قند', 'شکر']
+GROUPS = ['موبایل', 'لوازم جانبی', 'کامپیوتر', 'شبکه', 'خوراکی']
+QUERIES = ['سامسونگ', 'گوشی سامس', 'کابل', 'شارژ', 'هدفون بلو', 'کی', 'P-1234', 'ربانک', 'ساعت هوشمند', 'روغن']
+
+
+def _populate(session, n: int):
+    rnd = random.Random(42)
+    batch = []
+    for i in range(n):
+        name = ' '.join(rnd.sample(WORDS, 3)) + f' مدل {rnd.randint(1, 999)}'
+        batch.append(models.Product(id=f'p{i}', name=name, name_norm=normalize_for_search(name), code=f'P-{i}',
+                                    group=rnd.choice(GROUPS), unit='عدد', inventory=rnd.randint(0, 50)))
+        if len(batch) == 5000:
+            session.add_all(batch)
+            session.commit()
+            batch = []
+    session.add_all(batch)
+    session.commit()
+
+
+def _ilike(session, q: str, limit: int = 10):
+    qlike = f'%{q}%'
+    return session.query(models.Product).filter(
+        (models.Product.name.ilike(qlike)) |
+        (models.Product.name_norm.ilike(qlike)) |
+        (models.Product.code.ilike(qlike)) |
+        (models.Product.group.ilike(qlike))
+    ).limit(limit).all()
+
+
+def _time(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench_local_search.db')
+    engine = create_engine(f'sqlite:///{path}')
+    db.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    _populate(session, args.products)
+
+    started = time.perf_counter()
+    engine_local = local_search.LocalSearch()
+    engine_local.build_from_db(session)
+    print(f'built local index for {args.products} products in {time.perf_counter() - started:.2f}s')
+    index = engine_local.indexes['products']
+
+    print(f"{'query':<16} {'ILIKE ms':>9} {'local ms':>9} {'speedup':>8} {'hits':>5}")
+    for q in QUERIES:
+        ilike_ms = _time(lambda: _ilike(session, q), max(1, args.repeat // 20))
+        local_ms = _time(lambda: index.search(q, limit=10), args.repeat)
+        hits = index.search(q, limit=10)['estimatedTotalHits']
+        print(f'{q:<16} {ilike_ms:>9.3f} {local_ms:>9.3f} {ilike_ms / local_ms:>7.0f}x {hits:>5}')
+    session.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark: crud.get_products name search, LIKE '%q%' vs the indexed path
+(unordered, and ranked best first as get_products runs it).
+
+Fills a temporary SQLite DB (FTS5 trigram) with synthetic products and times
+the product name filter with and without db_search. Pass --url to run against
+a throwaway PostgreSQL database migrated to 0035 (pg_trgm GIN indexes).
+
+Usage:
+    python scripts/bench_name_search.py [--products 500000] [--repeat 20] [--url postgresql://...]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import db, db_search, models
+from app.normalizer import normalize_for_search
+
+WORDS = ['گوشی', 'سامسونگ', 'شیائومی', 'کابل', 'شارژر', 'هدفون', 'بلوتوث', 'لپ‌تاپ', 'ماوس', 'کیبورد',
+         'مانیتور', 'اسپیکر', 'پاوربانک', 'فلش', 'مموری', 'قاب', 'محافظ', 'صفحه', 'ساعت', 'هوشمند',
+         'تبلت', 'روتر', 'مودم', 'پرینتر', 'کارتریج', 'برنج', 'روغن', 'چای', 'قند', 'شکر']
+QUERIES = ['سامسونگ', 'گوشی سامس', 'ربانک', 'مدل 777', 'p-123456', 'ناموجود']
+
+
+def _populate(session, n: int):
+    rnd = random.Random(7)
+    rows = []
+    for i in range(n):
+        name = ' '.join(rnd.sample(WORDS, 3)) + f' مدل {rnd.randint(1, 9999)}'
+        rows.append({'id': f'p{i}', 'name': name, 'name_norm': normalize_for_search(name), 'code': f'P-{i}', 'inventory': 0})
+        if len(rows) == 20000:
+            session.bulk_insert_mappings(models.Product, rows)
+            session.commit()
+            rows = []
+    if rows:
+        session.bulk_insert_mappings(models.Product, rows)
+        session.commit()
+
+
+def _time(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--url', help='database URL (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    url = args.url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_name_search.db')
+    engine = create_engine(url)
+    db.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    if session.query(models.Product).count() < args.products:
+        started = time.perf_counter()
+        _populate(session, args.products)
+        print(f'inserted {args.products} products in {time.perf_counter() - started:.1f}s')
+    db_search.ensure_sqlite_fts(engine)
+
+    def like(qn):
+        return session.query(models.Product).filter(models.Product.name_norm.contains(qn)).limit(50).all()
+
+    def indexed(qn):
+        qs = db_search.filter_by_name(session, session.query(models.Product), models.Product, qn)
+        return qs.limit(50).all()
+
+    def ranked(qn):
+        qs = db_search.filter_by_name(session, session.query(models.Product), models.Product, qn, rank=True)
+        return qs.limit(50).all()
+
+    print(f"{'query':<14} {'LIKE ms':>9} {'indexed ms':>11} {'ranked ms':>10} {'speedup':>8} {'hits':>5}")
+    for q in QUERIES:
+        qn = normalize_for_search(q)
+        like_ms = _time(lambda: like(qn), args.repeat)
+        idx_ms = _time(lambda: indexed(qn), args.repeat)
+        rank_ms = _time(lambda: ranked(qn), args.repeat)
+        print(f'{q:<14} {like_ms:>9.2f} {idx_ms:>11.2f} {rank_ms:>10.2f} {like_ms / idx_ms:>7.1f}x {len(indexed(qn)):>5}')
+    session.close()
+
+
+if __name__ == '__main__':
+    main()
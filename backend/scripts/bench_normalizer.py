@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: normalize_for_search throughput, per-call and batch.
+
+Compares the table-driven normalizer (one str.translate pass) with the
+previous implementation (per-character str.index lookups and a regex
+recompiled on every call), kept here as `legacy_normalize`.
+
+Usage:
+    python scripts/bench_normalizer.py [--count 200000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app.normalizer import ARABIC_INDIC_DIGITS, ARABIC_TO_PERSIAN, PERSIAN_DIGITS, normalize_for_search, normalize_many
+
+SAMPLES = ['گوشي سامسونگ A۵۴ مدل ۱۲۸ گیگ', 'كابل شارژ تایپ‌سی  ۱ متری', 'شركت بازرگانی  آريا', 'P-12345',
+           'روغن موتور ۴ ليتري', 'پاوربانک شیائومی ۲۰۰۰۰', 'مهندسـی الكترونيک', 'Ali Rezaei 0912 123 4567']
+
+
+def legacy_normalize(s):
+    out = []
+    for ch in s:
+        if ch in PERSIAN_DIGITS:
+            out.append(str(PERSIAN_DIGITS.index(ch)))
+        elif ch in ARABIC_INDIC_DIGITS:
+            out.append(str(ARABIC_INDIC_DIGITS.index(ch)))
+        else:
+            out.append(ch)
+    s2 = ''.join(out)
+    s2 = ''.join(ARABIC_TO_PERSIAN.get(c, c) for c in s2)
+    s2 = re.sub(r'[\u0640\u200c\u200b\u00AD]', '', s2)
+    s2 = re.sub(r'\s+', ' ', s2).strip()
+    return s2.lower()
+
+
+def _rate(fn, values) -> float:
+    started = time.perf_counter()
+    fn(values)
+    return len(values) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=200000)
+    args = parser.parse_args()
+
+    rnd = random.Random(3)
+    values = [rnd.choice(SAMPLES) + f' {rnd.randint(1, 9999)}' for _ in range(args.count)]
+    assert [legacy_normalize(v) for v in values[:1000]] == normalize_many(values[:1000])
+
+    legacy = _rate(lambda vs: [legacy_normalize(v) for v in vs], values)
+    single = _rate(lambda vs: [normalize_for_search(v) for v in vs], values)
+    batch = _rate(normalize_many, values)
+    print(f'{"legacy":<22} {legacy:>12,.0f} strings/s')
+    print(f'{"normalize_for_search":<22} {single:>12,.0f} strings/s  ({single / legacy:.1f}x)')
+    print(f'{"normalize_many":<22} {batch:>12,.0f} strings/s  ({batch / legacy:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Benchmark: streaming product page extraction vs a full BeautifulSoup parse.
+
+Runs page_extract.extract (chunked, byte budget, head-first) and
+page_extract.parse_full (the previous full-DOM path) over fixture pages and
+reports CPU time and peak Python memory (tracemalloc) per page, and whether
+both give the same fields.
+
+Without --pages, fixture pages shaped like the marketplaces' product pages
+are generated (large inline state scripts, long bodies); --save writes them
+out so real pages saved from the sites can sit next to them.
+
+Usage:
+    python scripts/bench_page_extract.py [--pages DIR] [--save DIR] [--repeat 20]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app import page_extract
+
+
+def _body(blocks: int) -> str:
+    return ''.join(
+        f'<div class="card"><a href="/p/{i}"><img src="/img/{i}.jpg" alt="پیشنهاد {i}"></a>'
+        f'<h3>محصول مرتبط شماره {i}</h3><span class="old">{i * 1000:,}</span></div>'
+        for i in range(blocks)
+    )
+
+
+def _state_script(kb: int) -> str:
+    return '<script>window.__STATE__=' + '{"k":"' + 'x' * (kb * 1024) + '"}</script>'
+
+
+def fixtures():
+    head = ('<head><meta charset="utf-8"><title>گوشی موبایل نمونه</title>'
+            '<meta property="og:title" content="گوشی موبایل نمونه مدل A">'
+            '<meta property="og:image" content="https://cdn.example/a.jpg">'
+            '<meta property="og:description" content="توضیحات کالا">'
+            + '<link rel="stylesheet" href="/s.css">' * 40 + _state_script(120) + '</head>')
+    return {
+        # price element near the top: the stream stops there
+        'digikala_like.html': f'<html>{head}<body><div class="pd-price"><span itemprop="price" content="12500000">۱۲٬۵۰۰٬۰۰۰ تومان</span></div>{_body(3000)}</body></html>',
+        # price only as a class, after a large body part: read to the budget, then lower-priority selector
+        'torob_like.html': f'<html>{head}<body>{_body(400)}<div class="price">۸٬۹۰۰٬۰۰۰ تومان</div>{_body(2500)}</body></html>',
+        # no price markup within the budget: full-parse fallback
+        'late_price.html': f'<html>{head}<body>{_body(4000)}<span itemprop="price">۳٬۲۰۰٬۰۰۰</span></body></html>',
+        # no price markup at all, price only in text: whole page streamed
+        'text_price.html': f'<html><head><meta property="og:title" content="کالا"></head><body><p>قیمت: ۴۵۰٬۰۰۰ تومان</p>{_body(200)}</body></html>',
+    }
+
+
+def _chunks(data: bytes):
+    for i in range(0, len(data), page_extract.CHUNK_SIZE):
+        yield data[i:i + page_extract.CHUNK_SIZE]
+
+
+def _measure(fn, repeat: int):
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return result, (time.process_time() - started) / repeat * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', help='directory of saved .html pages (default: generated fixtures)')
+    parser.add_argument('--save', help='write the generated fixtures to this directory')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = {os.path.basename(p): open(p, 'rb').read() for p in sorted(glob.glob(os.path.join(args.pages, '*.html')))}
+    else:
+        pages = {name: html.encode('utf-8') for name, html in fixtures().items()}
+        if args.save:
+            os.makedirs(args.save, exist_ok=True)
+            for name, data in pages.items():
+                with open(os.path.join(args.save, name), 'wb') as f:
+                    f.write(data)
+
+    print(f'parser for the full path: {page_extract._PARSER}, byte budget {page_extract.BYTE_BUDGET // 1024} KB')
+    print(f'{"page":<20} {"size":>8} {"full ms":>8} {"full KB":>8} {"stream ms":>10} {"stream KB":>10}  same')
+    for name, data in pages.items():
+        full, full_ms, full_kb = _measure(lambda: page_extract.parse_full(data.decode('utf-8', 'replace')), args.repeat)
+        stream, stream_ms, stream_kb = _measure(lambda: page_extract.extract(_chunks(data)), args.repeat)
+        print(f'{name:<20} {len(data) // 1024:>6}KB {full_ms:>8.1f} {full_kb:>8.0f} {stream_ms:>10.2f} {stream_kb:>10.0f}  '
+              f'{"yes" if full == stream else f"no: {full} / {stream}"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark: preparing an SMS campaign for a large customer group (resolve,
+dedupe, render balances and due cheques, queue into the outbox).
+
+Usage:
+    python scripts/bench_sms_campaign.py [--members 50000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, event, func, insert
+from sqlalchemy.orm import sessionmaker
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, ROOT)
+
+from app import db, models, sms_campaigns  # noqa: E402
+
+TEMPLATE = '{name} عزیز، مانده حساب شما {debt} ریال است. {due_count} چک به مبلغ {due_amount} از {due_date} سررسید می‌شود.'
+
+
+def _seed(session, members):
+    user = models.User(username='bench', hashed_password='x')
+    session.add(user)
+    session.commit()
+    group = models.CustomerGroup(name='all', created_by_user_id=user.id)
+    session.add(group)
+    session.commit()
+    # every 20th person shares the previous one's number, every 50th has none
+    session.execute(insert(models.Person), [
+        {'id': f'p{i}', 'name': f'Customer {i}', 'name_norm': f'customer {i}',
+         'mobile': None if i % 50 == 0 else f'+98 912 {(i - (i % 20 == 0)):07d}'} for i in range(members)])
+    session.execute(insert(models.CustomerGroupMember), [
+        {'group_id': group.id, 'person_id': f'p{i}'} for i in range(members)])
+    session.execute(insert(models.LedgerEntry), [
+        {'debit_account': 'AccountsReceivable', 'credit_account': 'Sales', 'amount': 1000 * (i % 97), 'party_id': f'p{i}'}
+        for i in range(members) for _ in range(2)])
+    due = datetime.now(timezone.utc) + timedelta(days=3)
+    session.execute(insert(models.Payment), [
+        {'direction': 'in', 'party_id': f'p{i}', 'amount': 50000, 'due_date': due} for i in range(0, members, 7)])
+    session.commit()
+    return user.id, group.id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f'sqlite:///{os.path.join(tmp, "campaign.db")}')
+        session = db.create_test_session(engine)
+        user_id, group_id = _seed(session, args.members)
+        campaign_id = sms_campaigns.create(session, user_id, group_id, TEMPLATE).id
+        session.close()
+
+        queries = [0]
+        event.listen(engine, 'before_cursor_execute', lambda *a: queries.__setitem__(0, queries[0] + 1))
+        factory = sessionmaker(bind=engine, autoflush=False)
+        started = time.perf_counter()
+        sms_campaigns.prepare(campaign_id, factory)
+        elapsed = time.perf_counter() - started
+
+        session = factory()
+        c = session.get(models.SmsCampaign, campaign_id)
+        rows = session.query(func.count(models.SmsMessage.id)).scalar()
+        print(f'members {c.members}  recipients {c.recipients}  invalid {c.invalid}  duplicates {c.duplicates}')
+        print(f'prepare  {elapsed * 1000:9.1f} ms  {queries[0]:>6} queries  {rows} outbox rows  status {c.status}')
+        session.close()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""A local stand-in for the ICC source, for icc_sync tests and benchmarks.
+
+Serves a generated hierarchy in the format icc_sync expects:
+
+    /categories                      categories  cat-<i>
+    /categories/cat-<i>/centers      centers     ctr-<i>-<j>
+    /centers/ctr-<i>-<j>/units       units       unit-<i>-<j>-<k>
+    /units/unit-<i>-<j>-<k>/extensions
+
+with `since` filtering and `next` paging. Items are generated on request,
+so 100k units cost no memory until asked for. `change()` renames an item
+(it then shows up for a later `since`) and `fail()` makes a path answer 503.
+
+Use it in-process through http_client.stub (`with fake.mounted(): ...`) or
+over a real socket:
+
+    python scripts/fake_icc_server.py --port 8765 --units 500
+    ICC_SYNC_URL=http://127.0.0.1:8765/categories python -m app.icc_sync
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeIcc:
+    def __init__(self, categories=4, centers=5, units=10, extensions=0, page_size=1000,
+                 base_url='http://icc.test'):
+        self.categories, self.centers, self.units, self.extensions = categories, centers, units, extensions
+        self.page_size = page_size
+        self.base_url = base_url.rstrip('/')
+        self.created_at = datetime.now(timezone.utc) - timedelta(days=1)
+        self.names = {}
+        self.changed_at = {}
+        self.failing = set()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def root_url(self) -> str:
+        return f'{self.base_url}/categories'
+
+    @property
+    def total_units(self) -> int:
+        return self.categories * self.centers * self.units
+
+    def change(self, external_id: str, name: str):
+        self.names[external_id] = name
+        self.changed_at[external_id] = datetime.now(timezone.utc)
+
+    def fail(self, path: str):
+        self.failing.add(path)
+
+    def _item(self, external_id: str, default_name: str, **fields) -> dict:
+        return dict(external_id=external_id, name=self.names.get(external_id, default_name), **fields)
+
+    def _children(self, path: str):
+        """(external_id, item factory) for every child listed at `path`, or None for an unknown path."""
+        parts = path.strip('/').split('/')
+        if parts == ['categories']:
+            return [(f'cat-{i}', lambda i=i: self._item(
+                f'cat-{i}', f'Category {i}', description=None, parent_external_id=None,
+                sync_url=f'{self.base_url}/categories/cat-{i}/centers'))
+                for i in range(self.categories)]
+        if len(parts) != 3:
+            return None
+        kind, parent, child = parts
+        ids = parent.split('-')[1:]
+        if kind == 'categories' and child == 'centers' and len(ids) == 1:
+            (i,) = ids
+            return [(f'ctr-{i}-{j}', lambda j=j: self._item(
+                f'ctr-{i}-{j}', f'Center {i}-{j}', address=f'Street {j}', phone=f'021{j:08d}',
+                sync_url=f'{self.base_url}/centers/ctr-{i}-{j}/units'))
+                for j in range(self.centers)]
+        if kind == 'centers' and child == 'units' and len(ids) == 2:
+            i, j = ids
+            sync = self.extensions > 0
+            return [(f'unit-{i}-{j}-{k}', lambda k=k: self._item(
+                f'unit-{i}-{j}-{k}', f'Unit {i}-{j}-{k}', unit_type='store', capacity=k % 50 + 1,
+                sync_url=f'{self.base_url}/units/unit-{i}-{j}-{k}/extensions' if sync else None))
+                for k in range(self.units)]
+        if kind == 'units' and child == 'extensions' and len(ids) == 3:
+            i, j, k = ids
+            return [(f'ext-{i}-{j}-{k}-{m}', lambda m=m: self._item(
+                f'ext-{i}-{j}-{k}-{m}', f'Extension {i}-{j}-{k}-{m}', responsible_name=None,
+                responsible_mobile=f'0912{m:07d}', status='active'))
+                for m in range(self.extensions)]
+        return None
+
+    def respond(self, url: str):
+        """(status, body) for a GET of `url`."""
+        with self._lock:
+            self.requests += 1
+        parts = urlsplit(url)
+        if parts.path in self.failing:
+            return 503, {'detail': 'unavailable'}
+        children = self._children(parts.path)
+        if children is None:
+            return 404, {'detail': 'not found'}
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if query.get('since'):
+            since = datetime.fromisoformat(query['since'])
+            children = [c for c in children if self.changed_at.get(c[0], self.created_at) > since]
+        offset = int(query.get('cursor') or 0)
+        page = children[offset:offset + self.page_size]
+        nxt = None
+        if offset + self.page_size < len(children):
+            nxt = f'{parts.path}?{urlencode(dict(query, cursor=offset + self.page_size))}'
+        return 200, {'items': [make() for _, make in page], 'next': nxt}
+
+    def __call__(self, request):
+        # http_client.stub handler
+        return self.respond(request.url)
+
+    def mounted(self):
+        from app import http_client
+        return http_client.stub(self.base_url, self)
+
+    def serve(self, host='127.0.0.1', port=0) -> ThreadingHTTPServer:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, body = fake.respond(self.path)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        srv = ThreadingHTTPServer((host, port), Handler)
+        srv.daemon_threads = True
+        self.base_url = f'http://{host}:{srv.server_address[1]}'
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        return srv
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a generated ICC hierarchy')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--centers', type=int, default=20)
+    parser.add_argument('--units', type=int, default=500, help='units per center')
+    parser.add_argument('--extensions', type=int, default=0, help='extensions per unit')
+    args = parser.parse_args()
+    fake = FakeIcc(args.categories, args.centers, args.units, args.extensions)
+    srv = fake.serve(port=args.port)
+    print(f'{fake.total_units} units; root {fake.root_url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -28,6 +28,8 @@ interface Integration {
   provider: string
   enabled: boolean
   last_synced_at: string | null
+  last_status?: string | null
+  last_latency_ms?: number | null
 }
 
 interface ActivityLog {
@@ -265,7 +267,7 @@ export default function SystemModule({ smartDate, onSmartDateChange, sync }: Mod
   async function sendTestSms() {
     try {
       await apiPost('/api/sms/send', { ...smsTest })
-      alert('ارسال شد')
+      alert('در صف ارسال قرار گرفت')
     } catch (err) {
       console.error(err)
       setError('ارسال پیامک ناموفق بود.')
@@ -274,8 +276,8 @@ export default function SystemModule({ smartDate, onSmartDateChange, sync }: Mod
 
   async function registerUserViaSms() {
     try {
-      await apiPost('/api/sms/register-user', { ...smsReg })
-      alert('کاربر ایجاد و پیامک ارسال شد')
+      const res = await apiPost<{ detail: string }>('/api/sms/register-user', { ...smsReg })
+      alert(`کاربر ایجاد شد و پیامک در صف ارسال قرار گرفت.\n${res.detail}`)
       setSmsReg({ username: '', full_name: '', mobile: '', role_id: 2 })
       await loadData()
     } catch (err) {
@@ -512,6 +514,7 @@ export default function SystemModule({ smartDate, onSmartDateChange, sync }: Mod
                 <th className={retroTableHeader}>نام</th>
                 <th className={retroTableHeader}>سرویس</th>
                 <th className={retroTableHeader}>وضعیت</th>
+                <th className={retroTableHeader}>آخرین اجرا</th>
                 <th className={retroTableHeader}>آخرین همگام‌سازی</th>
               </tr>
             </thead>
@@ -525,6 +528,11 @@ export default function SystemModule({ smartDate, onSmartDateChange, sync }: Mod
                       {intg.enabled ? 'فعال' : 'غیرفعال'}
                     </span>
                   </td>
+                  <td className="px-3 py-2 text-left">
+                    {intg.last_status
+                      ? `${intg.last_status}${intg.last_latency_ms != null ? ` (${intg.last_latency_ms}ms)` : ''}`
+                      : '---'}
+                  </td>
                   <td className="px-3 py-2 text-left">
                     {intg.last_synced_at ? isoToJalali(intg.last_synced_at) : '---'}
                   </td>
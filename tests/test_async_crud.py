@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    import aiosqlite  # noqa: F401
+    from app import db as app_db
+    from app import async_crud, models, schemas, shared_store
+except Exception:
+    pytest.skip('backend async deps not installed (skipping async DB tests)', allow_module_level=True)
+
+
+def _run(coro_fn):
+    async def wrapper():
+        engine = app_db.create_test_async_engine()
+        session = await app_db.create_test_async_session(engine)
+        try:
+            return await coro_fn(session)
+        finally:
+            await session.close()
+            await engine.dispose()
+    return asyncio.run(wrapper())
+
+
+def test_role_permissions_are_eager_loaded():
+    async def scenario(s):
+        perm = await async_crud.create_permission(s, schemas.PermissionCreate(name='sales_view', module='sales'))
+        role = await async_crud.create_role(s, schemas.RoleCreate(name='Seller'))
+        assert await async_crud.set_role_permissions(s, role.id, [perm.id]) == 1
+        roles = await async_crud.get_all_roles(s)
+        # accessing the relationship must not trigger a lazy load on the AsyncSession
+        return [(r.name, [p.name for p in r.permissions]) for r in roles]
+
+    assert _run(scenario) == [('Seller', ['sales_view'])]
+
+
+def test_customer_group_members_roundtrip():
+    async def scenario(s):
+        s.add(models.User(id=1, username='u', hashed_password='x'))
+        s.add(models.Person(id='p1', name='Alice', name_norm='alice'))
+        await s.commit()
+        group = await async_crud.create_customer_group(s, 1, schemas.CustomerGroupCreate(name='VIP'))
+        await async_crud.add_customer_to_group(s, group.id, 'p1')
+        groups = await async_crud.get_user_customer_groups(s, 1)
+        return [(g.name, [m.person_id for m in g.members]) for g in groups]
+
+    assert _run(scenario) == [('VIP', ['p1'])]
+
+
+def test_users_keyset_pagination():
+    async def scenario(s):
+        for i in range(1, 6):
+            s.add(models.User(id=i, username=f'u{i}', hashed_password='x'))
+        await s.commit()
+        first = await async_crud.get_users(s, limit=2)
+        rest = await async_crud.get_users(s, limit=10, after_id=first[-1].id)
+        return [u.id for u in first], [u.id for u in rest]
+
+    assert _run(scenario) == ([1, 2], [3, 4, 5])
+
+
+def test_role_access_cache_is_invalidated_on_change():
+    shared_store.set_store(shared_store.MemoryStore())
+
+    async def scenario(s):
+        sales = await async_crud.create_permission(s, schemas.PermissionCreate(name='sales_view', module='sales'))
+        report = await async_crud.create_permission(s, schemas.PermissionCreate(name='report_view', module='finance'))
+        role = await async_crud.create_role(s, schemas.RoleCreate(name='Seller'))
+        await async_crud.set_role_permissions(s, role.id, [sales.id])
+        before = (await async_crud.get_role_access(s, role.id))['modules']
+        await async_crud.set_role_permissions(s, role.id, [sales.id, report.id])
+        after = (await async_crud.get_role_access(s, role.id))['modules']
+        return before, after
+
+    try:
+        assert _run(scenario) == (['sales'], ['finance', 'sales', 'reports'])
+    finally:
+        shared_store.set_store(None)
+
+
+def test_role_version_is_read_off_the_event_loop():
+    threads = []
+
+    class Store(shared_store.MemoryStore):
+        def get(self, key):
+            threads.append(threading.current_thread())
+            return super().get(key)
+
+    shared_store.set_store(Store())
+
+    async def scenario(s):
+        role = await async_crud.create_role(s, schemas.RoleCreate(name='Clerk'))
+        return await async_crud.get_role_access(s, role.id)
+
+    try:
+        assert _run(scenario) == {'permissions': [], 'modules': []}
+        assert threads and threading.main_thread() not in threads
+    finally:
+        shared_store.set_store(None)
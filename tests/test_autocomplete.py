@@ -0,0 +1,96 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import autocomplete, crud, models, schemas, search_outbox
+except Exception:
+    pytest.skip('backend deps not installed (skipping autocomplete tests)', allow_module_level=True)
+
+
+def _names(hits):
+    return [h['name'] for h in hits]
+
+
+def test_prefix_at_word_starts_and_codes():
+    ac = autocomplete.Autocomplete()
+    ac.load([
+        {'id': 'a', 'name': 'گوشی سامسونگ', 'code': 'P-100'},
+        {'id': 'b', 'name': 'كابل شارژ سامسونگ', 'code': 'P-200'},
+        {'id': 'c', 'name': 'پاوربانک', 'code': 'X-1'},
+    ], sales={'b': 3})
+    assert _names(ac.suggest('سامس')) == ['كابل شارژ سامسونگ', 'گوشی سامسونگ']  # more sales first
+    assert _names(ac.suggest('کابل')) == ['كابل شارژ سامسونگ']                  # Arabic kaf normalized
+    assert _names(ac.suggest('p-1')) == ['گوشی سامسونگ']
+    assert ac.suggest('ربانک') == []                                             # not a word start
+
+    ac.upsert({'id': 'c', 'name': 'پاوربانک سامسونگ', 'code': 'X-1'}, sales=10)
+    assert _names(ac.suggest('سام'))[0] == 'پاوربانک سامسونگ'
+    ac.delete('c')
+    assert 'پاوربانک سامسونگ' not in _names(ac.suggest('سام'))
+
+
+def test_rank_walk_and_memo_stay_correct_across_writes(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'WALK_FACTOR', 0)   # always walk the rank order
+    monkeypatch.setattr(autocomplete, 'MEMO_TOP', 3)
+    ac = autocomplete.Autocomplete()
+    ac.load([{'id': str(i), 'name': f'کالا {i}', 'code': f'C{i}'} for i in range(20)], sales={'7': 5, '8': 4, '9': 3})
+    assert [h['id'] for h in ac.suggest('کا', limit=3)] == ['7', '8', '9']
+    assert ac._memo['کا'] == ['7', '8', '9']
+
+    ac.upsert({'id': '3', 'name': 'کالا 3', 'code': 'C3'}, sales=9)   # patched in place
+    assert ac._memo['کا'] == ['3', '7', '8']
+    ac.delete('7')                                                    # full entry lost one: rebuilt
+    assert 'کا' not in ac._memo
+    assert [h['id'] for h in ac.suggest('کا', limit=3)] == ['3', '8', '9']
+
+
+def test_follows_product_writes_and_sales_through_outbox(monkeypatch):
+    monkeypatch.setattr(search_outbox, 'KEEP_WITHOUT_MEILI', True)
+    session = app_db.create_test_session(app_db.create_test_engine())
+    p1 = crud.create_product(session, schemas.ProductCreate(name='چای سبز', code='T1'))
+    ac = autocomplete.Autocomplete()
+    ac.build_from_db(session)
+    assert _names(ac.suggest('چای')) == ['چای سبز']
+
+    p2 = crud.create_product(session, schemas.ProductCreate(name='چای سیاه', code='T2'))
+    inv = crud.create_invoice_manual(session, schemas.InvoiceCreate(invoice_type='sale', items=[
+        schemas.InvoiceItemCreate(description='چای', unit_price=100, product_id=p2.id),
+    ]))
+    crud.finalize_invoice(session, inv.id)
+    assert ac.sync(session) > 0
+    hits = ac.suggest('چای')
+    assert [h['id'] for h in hits] == [p2.id, p1.id]
+    assert hits[0]['sales'] == 1
+    session.close()
+
+
+def test_outbox_rows_committed_out_of_order_are_not_skipped():
+    session = app_db.create_test_session(app_db.create_test_engine())
+    ac = autocomplete.Autocomplete()
+    ac.build_from_db(session)
+    head = ac.tail.watermark
+
+    def write(outbox_id, product_id, name):
+        session.add(models.Product(id=product_id, name=name, name_norm=name, code=product_id))
+        session.add(models.SearchOutbox(id=outbox_id, index_name='products', doc_id=product_id, op='upsert'))
+        session.commit()
+
+    # a person write between them is not mistaken for a gap
+    session.add(models.SearchOutbox(id=head + 2, index_name='persons', doc_id='x', op='upsert'))
+    write(head + 3, 'b', 'قهوه')
+    assert ac.sync(session) == 2
+    assert ac.tail.gaps.keys() == {head + 1}
+
+    write(head + 1, 'a', 'قند')
+    assert ac.sync(session) == 1
+    assert _names(ac.suggest('قن')) == ['قند']
+    assert ac.tail.gaps == {}
+    session.close()
@@ -0,0 +1,62 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import crud, db_search, models, schemas
+except Exception:
+    pytest.skip('backend deps not installed (skipping db search tests)', allow_module_level=True)
+
+
+def _session():
+    engine = app_db.create_test_engine()
+    session = app_db.create_test_session(engine)
+    db_search.ensure_sqlite_fts(engine)
+    return session
+
+
+def test_fts_serves_infix_and_code_queries():
+    session = _session()
+    crud.create_product(session, schemas.ProductCreate(name='گوشی سامسونگ', code='P-100'))
+    crud.create_product(session, schemas.ProductCreate(name='پاوربانک شیائومی', code='P-200'))
+
+    assert [p.code for p in crud.get_products(session, q='امسو')] == ['P-100']
+    assert [p.code for p in crud.get_products(session, q='p-200')] == ['P-200']
+    # shorter than a trigram: plain LIKE still matches
+    assert [p.code for p in crud.get_products(session, q='ئو')] == ['P-200']
+    session.close()
+
+
+def test_triggers_follow_updates_and_deletes():
+    session = _session()
+    crud.create_person(session, schemas.PersonCreate(name='مریم', code='M1', mobile='09120000000'))
+    assert len(crud.get_persons(session, q='0912000')) == 1
+
+    person = session.query(models.Person).filter_by(code='M1').one()
+    person.name_norm = 'مرجان'
+    session.commit()
+    assert crud.get_persons(session, q='مریم') == []
+    assert len(crud.get_persons(session, q='مرجان')) == 1
+
+    session.delete(person)
+    session.commit()
+    assert crud.get_persons(session, q='مرجان') == []
+    session.close()
+
+
+def test_ranked_search_keeps_the_exact_name_within_the_limit():
+    session = _session()
+    for i in range(30):
+        crud.create_product(session, schemas.ProductCreate(name=f'چای سبز ممتاز بسته {i}', code=f'T-{i}'))
+    crud.create_product(session, schemas.ProductCreate(name='چای', code='TEA'))
+
+    assert crud.get_products(session, q='چای', limit=3)[0].code == 'TEA'   # FTS5 bm25
+    assert crud.get_products(session, q='چا', limit=1)[0].code == 'TEA'    # LIKE: prefix, then shorter
+    session.close()
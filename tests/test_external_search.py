@@ -0,0 +1,95 @@
+import functools
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import external_search
+except Exception:
+    pytest.skip('backend deps not installed (skipping external search tests)', allow_module_level=True)
+
+from app.page_cache import PageCache
+
+
+@pytest.fixture(autouse=True)
+def _memory_cache(monkeypatch):
+    monkeypatch.setattr(external_search, '_cache', PageCache(path=None))
+
+
+def _marketplace(page_delay):
+    state = {'active': 0, 'peak': 0, 'lock': threading.Lock()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with state['lock']:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            try:
+                if self.path.startswith('/search'):
+                    body = ''.join(f'<a href="/p/{i}" title="کالا {i}">x</a>' for i in range(6))
+                else:
+                    time.sleep(page_delay)
+                    body = '<meta property="og:title" content="T"><span itemprop="price" content="1200"></span>'
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            finally:
+                with state['lock']:
+                    state['active'] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    host = f'127.0.0.1:{srv.server_address[1]}'
+    source = functools.partial(
+        lambda q, limit, deadline, url, hosts: external_search._search_generic_site(url, q, hosts, limit, deadline),
+        url=f'http://{host}/search?q={{q}}', hosts=[f'{host}/p/'])
+    return srv, source, state
+
+
+def test_concurrent_pages_per_host_limit_and_deadline(monkeypatch):
+    fast, fast_source, fast_state = _marketplace(0.2)
+    slow, slow_source, _ = _marketplace(5)
+    monkeypatch.setattr(external_search, 'SOURCES', {'fast': fast_source, 'slow': slow_source})
+    monkeypatch.setattr(external_search, 'PER_HOST_LIMIT', 2)
+    monkeypatch.setattr(external_search, '_host_slots', {})
+    try:
+        started = time.monotonic()
+        res = external_search.aggregate_search('q', limit=6, timeout=1.5)
+        elapsed = time.monotonic() - started
+    finally:
+        fast.shutdown()
+        slow.shutdown()
+
+    assert elapsed < 2.2                       # 6 pages x 0.2s would be 1.2s+ sequentially per site
+    assert fast_state['peak'] <= 2             # per-host limit
+    assert [r['price'] for r in res['results']['fast']] == [1200] * 6
+    slow_results = res['results']['slow']      # listing data only, pages missed the deadline
+    assert len(slow_results) == 6 and all(r.get('partial') and not r.get('price') for r in slow_results)
+    assert slow_results[0]['title'] == 'کالا 0'
+
+
+def test_listing_data_does_not_leak_into_the_page_cache():
+    srv, source, _ = _marketplace(page_delay=0)
+    try:
+        first = source('x', limit=1, deadline=time.monotonic() + 5)[0]
+    finally:
+        srv.shutdown()
+    assert first['link'] == first['source_url']
+    cached = external_search._cache.lookup('page', first['source_url'], external_search.PAGE_TTL).value
+    assert 'link' not in cached
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import fx_rates, models, shared_store
+except Exception:
+    pytest.skip('backend deps not installed (skipping fx rates tests)', allow_module_level=True)
+
+
+def _providers(monkeypatch, quotes):
+    def fetch(kind):
+        if quotes.get(kind) is None:
+            raise RuntimeError('provider down')
+        return quotes[kind]
+    monkeypatch.setattr(fx_rates, 'fetch', fetch)
+
+
+def _no_network(*args, **kwargs):
+    raise AssertionError('dashboard read went to the network')
+
+
+def test_refresh_records_series_and_serves_last_good_value(monkeypatch):
+    monkeypatch.setattr(fx_rates.http_client, 'request', _no_network)
+    engine = app_db.create_test_engine()
+    session = app_db.create_test_session(engine)
+    store = shared_store.MemoryStore()
+
+    _providers(monkeypatch, {'fx': {'EUR': 0.9, 'IRR': 42000.0}, 'crypto': {'bitcoin': 60000.0}})
+    assert fx_rates.refresh(session, store) == {'fx': True, 'crypto': True}
+    prices = fx_rates.current_prices(store)
+    assert prices['fx'] == {'EUR': 0.9, 'IRR': 42000.0}
+    assert prices['crypto'] == {'bitcoin': {'usd': 60000.0}}
+    assert prices['stale'] is False
+
+    # providers down: last good quotes, marked stale, and nothing new in the series
+    _providers(monkeypatch, {})
+    assert fx_rates.refresh(session, store) == {'fx': False, 'crypto': False}
+    prices = fx_rates.current_prices(store)
+    assert prices['fx']['IRR'] == 42000.0 and prices['stale'] is True
+    assert session.query(models.FxRate).count() == 3
+
+    _providers(monkeypatch, {'fx': {'EUR': 0.95, 'IRR': 43000.0}, 'crypto': {'bitcoin': 61000.0}})
+    fx_rates.refresh(session, store)
+    assert [p['rate'] for p in fx_rates.history(session, 'fx', 'IRR')] == [42000.0, 43000.0]
+
+    # empty shared store (restart, Redis flush): rebuilt from the newest rows
+    empty = shared_store.MemoryStore()
+    prices = fx_rates.current_prices(empty, session_factory=lambda: app_db.create_test_session(engine))
+    assert prices['fx'] == {'EUR': 0.95, 'IRR': 43000.0} and prices['stale'] is False
+    assert empty.get(fx_rates.SNAPSHOT_KEY)['crypto']['quotes'] == {'bitcoin': 61000.0}
+    session.close()
+
+
+def test_old_snapshot_is_stale(monkeypatch):
+    store = shared_store.MemoryStore()
+    old = (datetime.now(timezone.utc) - timedelta(seconds=fx_rates.STALE_AFTER + 60)).isoformat()
+    store.set(fx_rates.SNAPSHOT_KEY, {
+        kind: {'quotes': {'X': 1.0}, 'base': 'USD', 'source': 's', 'fetched_at': old, 'error': None}
+        for kind in fx_rates.PROVIDERS
+    })
+    assert fx_rates.current_prices(store)['stale'] is True
+
+
+def test_one_refresh_per_interval_across_workers():
+    store = shared_store.MemoryStore()
+    assert [fx_rates._claim(store) for _ in range(3)] == [True, False, False]
+
+
+def test_empty_dashboard_wakes_a_refresher_that_fetches(monkeypatch):
+    engine = app_db.create_test_engine()
+    store = shared_store.MemoryStore()
+    shared_store.set_store(store)
+    opened, refreshed = [], []
+
+    def lookup():
+        opened.append(1)
+        return app_db.create_test_session(engine)
+    monkeypatch.setattr(fx_rates, 'ENABLED', True)
+    monkeypatch.setattr(fx_rates, 'INTERVAL', 3600.0)
+    monkeypatch.setattr(fx_rates, 'refresh', lambda session, store: refreshed.append(1))
+    assert fx_rates._claim(store)  # this interval's fetch already ran (and failed)
+    try:
+        fx_rates.start(lambda: app_db.create_test_session(engine))
+        for _ in range(3):
+            assert fx_rates.current_prices(store, session_factory=lookup)['stale'] is True
+        assert len(opened) == 1  # one table lookup and one wake per cooldown, not one per request
+        for _ in range(100):
+            if refreshed:
+                break
+            time.sleep(0.02)
+        assert refreshed == [1]
+    finally:
+        fx_rates.stop()
+        shared_store.set_store(None)
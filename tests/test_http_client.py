@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    import requests
+    from app import http_client
+except Exception:
+    pytest.skip('backend deps not installed (skipping http client tests)', allow_module_level=True)
+
+
+@pytest.fixture(autouse=True)
+def _fresh(monkeypatch):
+    http_client.reset()
+    monkeypatch.setattr(http_client.time, 'sleep', lambda s: None)
+    yield
+    http_client.reset()
+
+
+def _sequence(*answers):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        answer = answers[min(len(calls), len(answers)) - 1]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    return handler, calls
+
+
+def test_retries_idempotent_calls_and_records_metrics():
+    handler, calls = _sequence((503, 'busy'), requests.ConnectionError('reset'), (200, {'ok': True}))
+    with http_client.stub('https://fx.test/', handler):
+        r = http_client.get('https://fx.test/latest')
+    assert r.status_code == 200 and r.json() == {'ok': True} and len(calls) == 3
+    host = http_client.stats()['hosts']['fx.test']
+    assert host['requests'] == 1 and host['retries'] == 2 and host['status'] == {'2xx': 1}
+
+
+def test_non_idempotent_calls_are_not_repeated():
+    handler, calls = _sequence(requests.ReadTimeout('slow'))
+    with http_client.stub('https://sms.test/', handler):
+        with pytest.raises(requests.Timeout):
+            http_client.get('https://sms.test/send', idempotent=False)
+        assert len(calls) == 1
+    handler2, calls2 = _sequence((503, ''), (200, ''))
+    with http_client.stub('https://sms.test/', handler2):
+        assert http_client.post('https://sms.test/send').status_code == 503
+    assert len(calls2) == 1
+
+
+def test_long_retry_after_is_returned_to_the_caller():
+    handler, calls = _sequence((429, '', {'Retry-After': '120'}), (200, ''))
+    with http_client.stub('https://cg.test/', handler):
+        assert http_client.get('https://cg.test/price').status_code == 429
+    assert len(calls) == 1
+
+
+def test_circuit_breaker_opens_and_half_opens(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(http_client.time, 'monotonic', lambda: clock[0])
+    handler, calls = _sequence(requests.ConnectionError('down'))
+    with http_client.stub('https://nav.test/', handler):
+        for _ in range(http_client.BREAKER_FAILURES):
+            with pytest.raises(requests.ConnectionError):
+                http_client.get('https://nav.test/', provider='navasan', retries=0)
+        with pytest.raises(http_client.CircuitOpenError):
+            http_client.get('https://nav.test/', provider='navasan')
+        assert len(calls) == http_client.BREAKER_FAILURES
+        assert http_client.stats()['breakers']['navasan']['state'] == 'open'
+
+    clock[0] += http_client.BREAKER_COOLDOWN
+    ok, _ = _sequence((200, 'fine'))
+    with http_client.stub('https://nav.test/', ok):
+        assert http_client.get('https://nav.test/', provider='navasan').text == 'fine'
+    assert http_client.stats()['breakers']['navasan']['state'] == 'closed'
+
+
+def test_deadline_timeouts_do_not_trip_the_breaker():
+    handler, _ = _sequence(requests.ReadTimeout('deadline'))
+    with http_client.stub('https://shop.test/', handler):
+        for _ in range(http_client.BREAKER_FAILURES + 1):
+            with pytest.raises(requests.Timeout):
+                http_client.get('https://shop.test/p/1', retries=0, deadline_bound=True)
+    assert http_client.stats()['breakers']['shop.test']['state'] == 'closed'
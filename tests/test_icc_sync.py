@@ -0,0 +1,106 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+for path in (BACKEND, os.path.join(BACKEND, 'scripts')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+try:
+    from app import db as app_db
+    from app import http_client, icc_sync, models
+    from fake_icc_server import FakeIcc
+except Exception:
+    pytest.skip('backend deps not installed (skipping icc sync tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def session():
+    s = app_db.create_test_session(app_db.create_test_engine())
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    http_client.reset()
+    f = FakeIcc(categories=2, centers=3, units=4, extensions=2, page_size=5)
+    monkeypatch.setattr(icc_sync, 'ROOT_URL', f.root_url)
+    with f.mounted():
+        yield f
+
+
+def _counts(session):
+    return [session.query(m).count() for m in (models.IccCategory, models.IccCenter, models.IccUnit, models.IccExtension)]
+
+
+def test_full_sync_builds_the_hierarchy(session, fake):
+    result = icc_sync.sync(session)
+    assert _counts(session) == [2, 6, 24, 48]
+    assert {name: lvl['inserted'] for name, lvl in result['levels'].items()} == {
+        'categories': 2, 'centers': 6, 'units': 24, 'extensions': 48}
+    unit = session.query(models.IccUnit).filter_by(external_id='unit-1-2-3').one()
+    assert unit.center.external_id == 'ctr-1-2'
+    assert unit.center.category.external_id == 'cat-1'
+    assert unit.capacity == 4
+    assert unit.last_synced_at is not None
+    assert all(c.last_synced_at is not None for c in session.query(models.IccCenter))
+
+
+def test_incremental_sync_pulls_only_changes(session, fake):
+    icc_sync.sync(session)
+    before = session.query(models.IccCenter.id, models.IccCenter.last_synced_at).all()
+    fake.change('unit-0-1-2', 'Renamed unit')
+    fake.change('cat-1', 'Renamed category')
+
+    result = icc_sync.sync(session)
+    levels = result['levels']
+    assert levels['categories']['fetched'] == 1 and levels['categories']['updated'] == 1
+    assert levels['units']['fetched'] == 1 and levels['units']['updated'] == 1
+    assert levels['units']['inserted'] == 0
+    assert levels['extensions']['fetched'] == 0
+    session.expire_all()
+    assert session.query(models.IccUnit).filter_by(external_id='unit-0-1-2').one().name == 'Renamed unit'
+    assert session.query(models.IccCategory).filter_by(external_id='cat-1').one().name == 'Renamed category'
+    after = dict(session.query(models.IccCenter.id, models.IccCenter.last_synced_at).all())
+    assert all(after[cid] > synced for cid, synced in before)
+    assert _counts(session) == [2, 6, 24, 48]
+
+
+def test_full_flag_ignores_the_cursors(session, fake):
+    icc_sync.sync(session)
+    result = icc_sync.sync(session, full=True)
+    assert result['levels']['units']['fetched'] == 24
+    assert result['levels']['units']['unchanged'] == 24
+
+
+def test_failed_source_keeps_its_cursor(session, fake):
+    icc_sync.sync(session)
+    center = session.query(models.IccCenter).filter_by(external_id='ctr-0-0').one()
+    synced = center.last_synced_at
+    fake.fail('/centers/ctr-0-0/units')
+    fake.change('unit-0-0-1', 'Missed')
+    fake.change('unit-0-1-1', 'Seen')
+
+    result = icc_sync.sync(session)
+    assert result['levels']['units']['failed'] == 1
+    session.expire_all()
+    assert session.query(models.IccCenter).filter_by(external_id='ctr-0-0').one().last_synced_at == synced
+    assert session.query(models.IccUnit).filter_by(external_id='unit-0-1-1').one().name == 'Seen'
+
+    fake.failing.clear()
+    icc_sync.sync(session)
+    session.expire_all()
+    assert session.query(models.IccUnit).filter_by(external_id='unit-0-0-1').one().name == 'Missed'
+
+
+def test_invalid_items_are_skipped(session, monkeypatch):
+    monkeypatch.setattr(icc_sync, 'ROOT_URL', 'http://icc.bad/categories')
+    items = [{'external_id': 'a', 'name': 'A'}, {'external_id': 'b'}, {'name': 'no id'}, 'junk']
+    with http_client.stub('http://icc.bad', lambda request: (200, items)):
+        result = icc_sync.sync(session)
+    assert result['levels']['categories']['inserted'] == 1
+    assert result['levels']['categories']['skipped'] == 3
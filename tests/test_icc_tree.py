@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from sqlalchemy import event
+
+    from app import db as app_db
+    from app import icc_tree, models, shared_store
+except Exception:
+    pytest.skip('backend deps not installed (skipping icc tree tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    s = shared_store.MemoryStore()
+    monkeypatch.setattr(shared_store, 'get_store', lambda: s)
+    icc_tree.clear()
+    return s
+
+
+@pytest.fixture
+def session():
+    engine = app_db.create_test_engine()
+    s = app_db.create_test_session(engine)
+    for i in range(2):
+        cat = models.IccCategory(external_id=f'cat-{i}', name=f'Category {i}')
+        s.add(cat)
+        for j in range(3):
+            center = models.IccCenter(external_id=f'ctr-{i}-{j}', name=f'Center {i}-{j}', category=cat)
+            s.add(center)
+            for k in range(2):
+                unit = models.IccUnit(external_id=f'unit-{i}-{j}-{k}', name=f'Unit {i}-{j}-{k}', capacity=k, center=center)
+                s.add(unit)
+                s.add(models.IccExtension(external_id=f'ext-{i}-{j}-{k}', name=f'Ext {i}-{j}-{k}', unit=unit))
+    s.commit()
+    s.queries = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: s.queries.append(args[2]))
+    yield s
+    s.close()
+
+
+def _walk(nodes):
+    for node in nodes:
+        yield node
+        yield from _walk(node.get('children', []))
+
+
+def test_whole_tree_in_four_queries(session):
+    tree = icc_tree.build(session)
+    assert len(session.queries) == 4
+    assert [c['external_id'] for c in tree] == ['cat-0', 'cat-1']
+    levels = [n['level'] for n in _walk(tree)]
+    assert levels.count('center') == 6 and levels.count('unit') == 12 and levels.count('extension') == 12
+    unit = next(n for n in _walk(tree) if n['external_id'] == 'unit-1-2-1')
+    assert unit['capacity'] == 1
+    assert [e['external_id'] for e in unit['children']] == ['ext-1-2-1']
+    assert all('children' not in n for n in _walk(tree) if n['level'] == 'extension')
+
+
+def test_subtree_and_depth(session):
+    center = session.query(models.IccCenter).filter_by(external_id='ctr-1-0').one()
+    session.queries.clear()
+    tree = icc_tree.build(session, 'center', center.id)
+    assert len(session.queries) == 3
+    assert [n['external_id'] for n in tree] == ['ctr-1-0']
+    assert sorted(n['external_id'] for n in _walk(tree) if n['level'] == 'unit') == ['unit-1-0-0', 'unit-1-0-1']
+
+    shallow = icc_tree.build(session, depth=2)
+    assert {n['level'] for n in _walk(shallow)} == {'category', 'center'}
+    assert all('children' not in n for n in _walk(shallow) if n['level'] == 'center')
+    assert icc_tree.build(session, 'unit', 999) is None
+
+
+def test_cache_follows_the_version(session, store):
+    tag, body = icc_tree.cached_tree(session)
+    session.queries.clear()
+    assert icc_tree.cached_tree(session) == (tag, body)
+    assert session.queries == []
+
+    session.query(models.IccUnit).filter_by(external_id='unit-0-0-0').one().name = 'Renamed'
+    session.commit()
+    icc_tree.invalidate()
+    new_tag, new_body = icc_tree.cached_tree(session)
+    assert new_tag != tag
+    assert 'Renamed' in new_body.decode('utf-8')
+    assert icc_tree.etag(icc_tree.version(), None, None, None) == new_tag
+
+
+def test_async_crud_writes_invalidate(store):
+    aiosqlite = pytest.importorskip('aiosqlite')  # noqa: F841
+    from app import async_crud, schemas
+
+    async def scenario():
+        engine = app_db.create_test_async_engine()
+        s = await app_db.create_test_async_session(engine)
+        try:
+            before = icc_tree.version()
+            cat = await async_crud.create_icc_category(s, schemas.IccCategoryCreate(external_id='c', name='C'))
+            after_create = icc_tree.version()
+            await async_crud.update_icc_category(s, cat.id, schemas.IccCategoryUpdate(name='D'))
+            after_update = icc_tree.version()
+            await async_crud.delete_icc_category(s, 12345)  # missing: nothing written
+            return before, after_create, after_update, icc_tree.version()
+        finally:
+            await s.close()
+            await engine.dispose()
+
+    before, after_create, after_update, after_missing = asyncio.run(scenario())
+    assert before < after_create < after_update == after_missing
+
+
+def test_async_crud_invalidates_off_the_event_loop(monkeypatch):
+    aiosqlite = pytest.importorskip('aiosqlite')  # noqa: F841
+    from app import async_crud, schemas
+    threads = []
+
+    class Store(shared_store.MemoryStore):
+        def incr(self, key, amount=1, ttl=None):
+            threads.append(threading.current_thread())
+            return super().incr(key, amount, ttl)
+
+    monkeypatch.setattr(shared_store, 'get_store', Store)
+    icc_tree.clear()
+
+    async def scenario():
+        engine = app_db.create_test_async_engine()
+        s = await app_db.create_test_async_session(engine)
+        try:
+            await async_crud.create_icc_category(s, schemas.IccCategoryCreate(external_id='c', name='C'))
+        finally:
+            await s.close()
+            await engine.dispose()
+
+    asyncio.run(scenario())
+    assert threads and threading.main_thread() not in threads
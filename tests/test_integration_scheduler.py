@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import integration_scheduler as sched
+    from app import models
+except Exception:
+    pytest.skip('backend deps not installed (skipping integration scheduler tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def factory(tmp_path, monkeypatch):
+    # file-backed so the pool threads see the same database
+    engine = create_engine(f'sqlite:///{tmp_path / "integrations.db"}')
+    monkeypatch.setattr(sched, '_POOL', None)
+    monkeypatch.setattr(sched, '_INFLIGHT', set())
+    yield lambda: app_db.create_test_session(engine)
+    if sched._POOL is not None:
+        sched._POOL.shutdown(wait=True)
+
+
+def _wait_idle(timeout=5):
+    deadline = time.time() + timeout
+    while sched._INFLIGHT and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def _add(session, n, **kw):
+    rows = [models.IntegrationConfig(name=f'i{i}', provider='navasan', enabled=True, **kw) for i in range(n)]
+    session.add_all(rows)
+    session.commit()
+    return [r.id for r in rows]
+
+
+def test_runs_in_parallel_under_the_cap_and_records_results(factory, monkeypatch):
+    monkeypatch.setattr(sched, 'CONCURRENCY', 2)
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def fetch(session, integ):
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(0.1)
+        with lock:
+            state['active'] -= 1
+        return {'status': 'ok', 'sample': {'usd': 1}}
+
+    monkeypatch.setattr(sched.integrations, 'fetch_integration_status', fetch)
+    session = factory()
+    ids = _add(session, 3, config=json.dumps({'interval': 120}))
+
+    first = sched.tick(factory)
+    assert len(first) == 2 and sched.tick(factory) == []   # cap reached
+    _wait_idle()
+    assert len(sched.tick(factory)) == 1
+    _wait_idle()
+    assert state['peak'] == 2
+
+    session.expire_all()
+    for iid in ids:
+        integ = session.get(models.IntegrationConfig, iid)
+        assert integ.last_status == 'ok' and integ.failure_count == 0 and integ.last_latency_ms >= 100
+        delay = (integ.next_run_at - integ.last_updated).total_seconds()
+        assert 108 <= delay <= 132
+        run, = sched.recent_runs(session, iid)
+        assert run.status == 'ok' and sched.run_sample(run) == {'usd': 1}
+    assert sched.tick(factory) == []                      # nothing due until the interval passes
+    session.close()
+
+
+def test_failures_back_off_with_jitter_and_manual_refresh(factory, monkeypatch):
+    monkeypatch.setattr(sched.integrations, 'fetch_integration_status', lambda s, i: {'status': 'error:503'})
+    session = factory()
+    iid, = _add(session, 1)
+    for failures in (1, 2, 3):
+        assert sched.tick(factory) == [iid]
+        _wait_idle()
+        session.expire_all()
+        integ = session.get(models.IntegrationConfig, iid)
+        assert integ.failure_count == failures
+        delay = (integ.next_run_at - integ.last_updated).total_seconds()
+        base = sched.BACKOFF_BASE * 2 ** (failures - 1)
+        assert base * 0.5 <= delay <= base
+        assert sched.request_run(session, integ) is False  # a refresh does not cut the backoff short
+        integ.next_run_at = sched._now()                     # the backoff has passed
+        session.commit()
+    assert [r.error for r in sched.recent_runs(session, iid)] == ['error:503'] * 3
+
+    monkeypatch.setattr(sched.integrations, 'fetch_integration_status', lambda s, i: {'status': 'ok'})
+    from app import integrations
+    assert integrations.refresh_integration(session, iid)['status'] == 'ok'
+    integ = session.get(models.IntegrationConfig, iid)
+    assert integ.failure_count == 0 and sched.recent_runs(session, iid, 1)[0].trigger == 'manual'
+    session.close()
+
+
+def test_claim_is_exclusive(factory):
+    session = factory()
+    iid, = _add(session, 1)
+    now = sched._now()
+    assert sched._claim(session, iid, now) is True
+    assert sched._claim(factory(), iid, now + timedelta(seconds=1)) is False
+    session.close()
+
+
+def test_refresh_leaves_a_run_in_flight_alone_and_keeps_the_min_interval(factory, monkeypatch):
+    monkeypatch.setattr(sched.integrations, 'fetch_integration_status', lambda s, i: {'status': 'ok'})
+    session = factory()
+    iid, = _add(session, 1, config=json.dumps({'interval': 3600}))
+    now = sched._now()
+    assert sched._claim(session, iid, now) is True
+    integ = session.get(models.IntegrationConfig, iid)
+    leased = integ.next_run_at
+    assert sched.request_run(session, integ) is False
+    session.expire_all()
+    integ = session.get(models.IntegrationConfig, iid)
+    assert integ.next_run_at == leased
+    assert sched._claim(factory(), iid, now + timedelta(seconds=1)) is False  # still nobody else's to run
+
+    sched.run_integration(session, integ)
+    assert integ.running_since is None
+    assert sched.request_run(session, integ) is True
+    session.expire_all()
+    integ = session.get(models.IntegrationConfig, iid)
+    assert (integ.next_run_at - integ.last_updated).total_seconds() == pytest.approx(sched.MIN_INTERVAL, abs=1)
+    assert sched.request_run(session, integ) is False  # already as early as allowed
+    session.close()
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import crud, db_search, invoice_line_search, local_search, schemas, search
+except Exception:
+    pytest.skip('backend deps not installed (skipping invoice line search tests)', allow_module_level=True)
+
+
+def _invoice(session, lines, finalize=True):
+    inv = crud.create_invoice_manual(session, schemas.InvoiceCreate(invoice_type='sale', items=[
+        schemas.InvoiceItemCreate(description=d, unit_price=100, product_id=pid) for d, pid in lines
+    ]))
+    if finalize:
+        crud.finalize_invoice(session, inv.id)
+    return inv
+
+
+@pytest.mark.parametrize('fts', [True, False])
+def test_database_path_returns_invoices_with_matching_lines(monkeypatch, fts):
+    monkeypatch.setattr(search, 'client', None)
+    engine = app_db.create_test_engine()
+    session = app_db.create_test_session(engine)
+    if fts:
+        db_search.ensure_sqlite_fts(engine)
+    phone = crud.create_product(session, schemas.ProductCreate(name='گوشی', code='SN-7781'))
+    inv1 = _invoice(session, [('گوشی سریال ABC12345', None), ('کابل', None)])
+    inv2 = _invoice(session, [('کالای کددار', phone.id)])
+    _invoice(session, [('سریال ABC12345 پیش‌نویس', None)], finalize=False)
+
+    res = invoice_line_search.search_invoice_lines(session, 'ABC123')
+    assert res['engine'] == 'database'
+    assert [h['id'] for h in res['hits']] == [inv1.id]
+    assert [line['description'] for line in res['hits'][0]['matched_lines']] == ['گوشی سریال ABC12345']
+    assert len(res['hits'][0]['lines']) == 2
+
+    res = invoice_line_search.search_invoice_lines(session, 'SN-778')
+    assert [h['id'] for h in res['hits']] == [inv2.id]
+    assert res['hits'][0]['matched_lines'][0]['product_code'] == 'SN-7781'
+    session.close()
+
+
+def test_meili_path_restricts_to_line_fields_and_marks_matches(monkeypatch):
+    seen = {}
+    doc = {'id': 1, 'status': 'final', 'lines': [
+        {'id': 1, 'description': 'هارد سریال X9', 'product_code': None},
+        {'id': 2, 'description': 'کیس', 'product_code': 'X9-CASE'},
+        {'id': 3, 'description': 'ماوس', 'product_code': None},
+    ]}
+
+    class Index:
+        def search(self, q, params):
+            seen.update(params)
+            return {'hits': [doc]}
+
+    monkeypatch.setattr(search, '_get_index', lambda name: Index())
+    res = invoice_line_search.search_invoice_lines(None, 'x9')
+    assert seen['attributesToSearchOn'] == invoice_line_search.LINE_FIELDS
+    assert [line['id'] for line in res['hits'][0]['matched_lines']] == [1, 2]
+
+
+def test_local_index_tokenizes_nested_line_fields():
+    idx = local_search.LocalIndex('invoices', search.INDEX_SETTINGS['invoices']['searchableAttributes'])
+    idx.upsert({'id': 5, 'invoice_number': 'F-1', 'lines': [{'description': 'سریال QW88', 'product_code': 'P-9'}]})
+    assert [h['id'] for h in idx.search('qw88')['hits']] == [5]
+    assert [h['id'] for h in idx.search('p-9')['hits']] == [5]
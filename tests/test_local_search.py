@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import crud, local_search, models, schemas, search_outbox
+except Exception:
+    pytest.skip('backend deps not installed (skipping local search tests)', allow_module_level=True)
+
+
+def _ids(result):
+    return [h['id'] for h in result['hits']]
+
+
+def test_persian_normalized_prefix_and_infix_matching():
+    idx = local_search.LocalIndex('products', ['name', 'code'])
+    idx.upsert({'id': 'a', 'name': 'گوشی سامسونگ A۵۴', 'code': 'P-1', 'group': 'موبایل'})
+    idx.upsert({'id': 'b', 'name': 'كابل شارژ', 'code': 'P-2', 'group': 'لوازم'})  # Arabic kaf
+    idx.upsert({'id': 'c', 'name': 'پاوربانک شیائومی', 'code': 'P-3', 'group': 'لوازم'})
+
+    assert _ids(idx.search('سامس')) == ['a']          # word prefix
+    assert _ids(idx.search('a54')) == ['a']           # Persian digits
+    assert _ids(idx.search('کابل')) == ['b']          # Arabic/Persian letter variants
+    assert _ids(idx.search('ربانک')) == ['c']         # middle of a word (trigrams)
+    assert _ids(idx.search('گوشی شارژ')) == []        # every word must match
+    assert _ids(idx.search('p', filters='group = "لوازم"')) == ['b', 'c']
+
+
+def test_exact_word_ranks_before_prefix_and_updates_reindex():
+    idx = local_search.LocalIndex('persons', ['name'])
+    idx.upsert({'id': 1, 'name': 'علی‌رضا'})
+    idx.upsert({'id': 2, 'name': 'علی'})
+    assert _ids(idx.search('علی')) == [2, 1]
+    idx.upsert({'id': 2, 'name': 'محمد'})
+    assert _ids(idx.search('علی')) == [1]
+    idx.delete(1)
+    assert idx.search('علی')['estimatedTotalHits'] == 0
+
+
+def test_engine_builds_from_db_and_tails_outbox(monkeypatch):
+    monkeypatch.setattr(search_outbox, 'KEEP_WITHOUT_MEILI', True)
+    session = app_db.create_test_session(app_db.create_test_engine())
+    crud.create_person(session, schemas.PersonCreate(name='مریم', code='M1'))
+    engine = local_search.LocalSearch()
+    engine.build_from_db(session)
+    assert _ids(engine.search('persons', 'مریم', 5)) != []
+
+    crud.create_person(session, schemas.PersonCreate(name='مرتضی', code='M2'))
+    assert engine.search('persons', 'مرت', 5)['hits'] == []
+    assert engine.sync(session) == 1
+    assert sorted(h['name'] for h in engine.search('persons', 'مر', 5)['hits']) == sorted(['مریم', 'مرتضی'])
+    session.close()
+
+
+def test_outbox_rows_committed_out_of_order_are_not_skipped(tmp_path):
+    session = app_db.create_test_session(app_db.create_test_engine())
+    engine = local_search.LocalSearch()
+    engine.build_from_db(session)
+    head = engine.tail.watermark
+
+    def write(outbox_id, person_id, name):
+        session.add(models.Person(id=person_id, name=name, name_norm=name))
+        session.add(models.SearchOutbox(id=outbox_id, index_name='persons', doc_id=person_id, op='upsert'))
+        session.commit()
+
+    # transaction A took head + 1, B took head + 2 and committed first
+    write(head + 2, 'b', 'بهرام')
+    assert engine.sync(session) == 1
+    assert engine.tail.gaps.keys() == {head + 1}
+    engine.save_snapshot(str(tmp_path / 'snap.json.gz'))
+
+    write(head + 1, 'a', 'آرش')
+    assert engine.sync(session) == 1
+    assert _ids(engine.search('persons', 'آرش', 5)) == ['a']
+    assert engine.tail.gaps == {} and engine.tail.watermark == head + 2
+
+    # the snapshot was taken while head + 1 was missing: a restart reads it again
+    restarted = local_search.LocalSearch()
+    assert restarted.load_snapshot(str(tmp_path / 'snap.json.gz'))
+    assert restarted.sync(session) == 2
+    assert _ids(restarted.search('persons', 'آرش', 5)) == ['a']
+    session.close()
+
+
+def test_concurrent_snapshot_saves_leave_one_readable_file(tmp_path):
+    session = app_db.create_test_session(app_db.create_test_engine())
+    crud.create_person(session, schemas.PersonCreate(name='مریم', code='M1'))
+    engine = local_search.LocalSearch()
+    engine.build_from_db(session)
+    session.close()
+    path = str(tmp_path / 'snap.json.gz')
+    errors = []
+
+    def save():
+        try:
+            for _ in range(20):
+                engine.save_snapshot(path)
+        except Exception as e:
+            errors.append(e)
+    workers = [threading.Thread(target=save) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert errors == []
+    assert os.listdir(tmp_path) == ['snap.json.gz']
+    assert local_search.LocalSearch().load_snapshot(path)
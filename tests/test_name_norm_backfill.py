@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import models, name_norm_backfill, normalizer, search_outbox, shared_store
+except Exception:
+    pytest.skip('backend deps not installed (skipping normalizer tests)', allow_module_level=True)
+
+
+def test_normalizer_rules():
+    assert normalizer.normalize_for_search('  كتاب   ۱۲٣ مهـندسی‌ها ') == 'کتاب 123 مهندسیها'
+    assert normalizer.normalize_for_search(None) == ''
+    assert normalizer.normalize_many(['ALI  ي', None]) == ['ali ی', '']
+    assert normalizer.digits_to_latin('۰٩x') == '09x'
+    assert normalizer.normalize_spaces(' a \t b ') == 'a b'
+
+
+def test_backfill_rewrites_stale_rows_once(monkeypatch):
+    monkeypatch.setattr(search_outbox, 'KEEP_WITHOUT_MEILI', True)
+    session = app_db.create_test_session(app_db.create_test_engine())
+    session.add_all([
+        models.Product(id=f'p{i}', name=f'كالا {i}', name_norm=f'stale {i}' if i % 2 else f'کالا {i}', code=f'C{i}')
+        for i in range(5)
+    ])
+    session.add(models.Account(id='a1', code='A1', name='بانك', name_norm='بانك', kind='bank'))
+    session.commit()
+
+    stats = name_norm_backfill.backfill(session, chunk_size=2)
+    assert stats['products'] == {'table': 'products', 'scanned': 5, 'updated': 2, 'rows_per_second': stats['products']['rows_per_second']}
+    assert stats['accounts']['updated'] == 1
+    assert session.get(models.Product, 'p1').name_norm == 'کالا 1'
+    assert session.get(models.Account, 'a1').name_norm == 'بانک'
+    assert sorted(r.doc_id for r in session.query(models.SearchOutbox)) == ['p1', 'p3']
+
+    assert name_norm_backfill.applied_version(session) == normalizer.NORMALIZER_VERSION
+    assert name_norm_backfill.backfill(session) == {}
+    session.close()
+
+
+def test_startup_backfill_runs_in_one_worker(monkeypatch):
+    store = shared_store.MemoryStore()
+    monkeypatch.setattr(shared_store, 'get_store', lambda: store)
+    runs = []
+    monkeypatch.setattr(name_norm_backfill, 'backfill', lambda session, **kw: runs.append(1) or {})
+    for _ in range(3):  # three workers starting at once
+        name_norm_backfill._run(lambda: app_db.create_test_session(app_db.create_test_engine()))
+    assert runs == [1]
+
+
+def test_failed_backfill_releases_the_claim(monkeypatch):
+    store = shared_store.MemoryStore()
+    monkeypatch.setattr(shared_store, 'get_store', lambda: store)
+
+    def broken(session, **kw):
+        raise RuntimeError('db gone')
+    monkeypatch.setattr(name_norm_backfill, 'backfill', broken)
+    name_norm_backfill._run(lambda: app_db.create_test_session(app_db.create_test_engine()))
+    assert name_norm_backfill._claim(store)
@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import external_search
+    from app.page_cache import PageCache
+except Exception:
+    pytest.skip('backend deps not installed (skipping page cache tests)', allow_module_level=True)
+
+
+def test_lru_and_disk_levels(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = PageCache(path, memory_size=2)
+    for i in range(3):
+        cache.put('page', f'u{i}', {'n': i})
+    assert cache.lookup('page', 'u2', 60).value == {'n': 2}   # memory
+    assert cache.lookup('page', 'u0', 60).value == {'n': 0}   # evicted from memory, read from disk
+    assert cache.lookup('page', 'missing', 60) is None
+
+    other = PageCache(path, memory_size=2)                    # another worker / a restart
+    assert other.lookup('page', 'u1', 60).value == {'n': 1}
+    stats = cache.stats()['page']
+    assert (stats['memory_hits'], stats['disk_hits'], stats['misses']) == (1, 1, 1)
+    assert stats['hit_ratio'] == round(2 / 3, 3)
+
+
+def test_stale_entries_are_returned_for_revalidation(tmp_path):
+    cache = PageCache(str(tmp_path / 'c.sqlite3'), max_age=3600)
+    cache.put('page', 'u', {'title': 'T'}, etag='"v1"')
+    entry = cache.lookup('page', 'u', ttl=0)
+    time.sleep(0.01)
+    assert entry is not None and not cache.is_fresh(entry, 0.001)
+    renewed = cache.revalidated('page', 'u', entry)
+    assert renewed.etag == '"v1"' and renewed.stored_at > entry.stored_at
+    assert cache.stats()['page']['stale'] == 1 and cache.stats()['page']['revalidated'] == 1
+
+
+def _site():
+    state = {'pages': 0, 'conditional': 0, 'searches': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if self.path.startswith('/search'):
+                state['searches'] += 1
+                body = '<a href="/p/1" title="کالا">x</a>'
+            elif self.headers.get('If-None-Match') == '"v1"':
+                state['conditional'] += 1
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            else:
+                state['pages'] += 1
+                body = '<meta property="og:title" content="T"><span itemprop="price" content="1200"></span>'
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f'127.0.0.1:{srv.server_address[1]}', state
+
+
+def test_pages_and_searches_are_cached(monkeypatch, tmp_path):
+    srv, host, state = _site()
+    monkeypatch.setattr(external_search, '_cache', PageCache(str(tmp_path / 'c.sqlite3')))
+    monkeypatch.setattr(external_search, 'SOURCES', {
+        'local': lambda q, limit, deadline: external_search._search_generic_site(
+            f'http://{host}/search?q={{q}}', q, [f'{host}/p/'], limit, deadline),
+    })
+    try:
+        first = external_search.aggregate_search('گوشی', limit=3, timeout=5)
+        second = external_search.aggregate_search('  گوشی ', limit=3, timeout=5)
+        assert first['cached'] is False and second['cached'] is True
+        assert second['results'] == first['results'] and first['results']['local'][0]['price'] == 1200
+        assert state['searches'] == 1 and state['pages'] == 1
+
+        # refresh skips the search cache but the page is still fresh
+        external_search.aggregate_search('گوشی', limit=3, timeout=5, use_cache=False)
+        assert state['searches'] == 2 and state['pages'] == 1
+
+        # once stale, the page is revalidated with If-None-Match and not downloaded again
+        monkeypatch.setattr(external_search, 'PAGE_TTL', 0)
+        page = external_search._parse_product_page(f'http://{host}/p/1')
+        assert page['price'] == 1200 and state['conditional'] == 1 and state['pages'] == 1
+    finally:
+        srv.shutdown()
+    stats = external_search.cache_stats()
+    assert stats['search']['hit_ratio'] == 0.5
+    assert stats['page']['revalidated'] == 1
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import page_extract
+except Exception:
+    pytest.skip('backend deps not installed (skipping page extraction tests)', allow_module_level=True)
+
+PAGES = [
+    '<html><head><meta property="og:title" content="گوشی"><meta property="og:image" content="/a.jpg">'
+    '<meta property="og:description" content="d"></head><body><span itemprop="price" content="1200"></span></body></html>',
+    '<html><head><title>t</title><script>var p = "9999";</script></head><body><img src="/first.jpg">'
+    '<div class="box price"><b>۱۲٬۵۰۰</b> تومان</div><div class="c-price"> </div></body></html>',
+    '<html><body><p>قیمت نهایی</p><style>.x{width:100px}</style><p>۴۵۰,۰۰۰ ریال</p><img alt="no src"><img src="/b.jpg"></body></html>',
+    '<html><head><meta property="og:title" content=""></head><body><div class="js-price"><div>1</div>'
+    '<div>2</div></div><span itemprop="price">&#1777;&#1778;</span></body></html>',
+]
+
+
+def _chunks(html, size):
+    data = html.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('html', PAGES)
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_stream_matches_full_parse(html, size):
+    # 1-byte chunks also split multi-byte UTF-8 characters
+    assert page_extract.extract(_chunks(html, size)) == page_extract.parse_full(html)
+
+
+def test_stops_reading_once_everything_is_found():
+    html = PAGES[0] + '<div>' + 'x' * 100000 + '</div>'
+    consumed = []
+
+    def chunks():
+        for chunk in _chunks(html, 64):
+            consumed.append(chunk)
+            yield chunk
+
+    assert page_extract.extract(chunks())['price'] == 1200
+    assert sum(map(len, consumed)) < 1000
+
+
+def test_full_parse_fallback_when_price_is_past_the_budget():
+    html = ('<html><head><meta property="og:title" content="T"></head><body>'
+            + '<p>متن طولانی</p>' * 2000 + '<span itemprop="price">۳۲۰۰</span></body></html>')
+    assert page_extract.extract(_chunks(html, 512), budget=4096) == {'title': 'T', 'price': 3200}
+    # without the fallback the byte budget caps what is read
+    assert 'price' not in page_extract.extract(_chunks(html, 512), budget=4096, max_bytes=4096)
@@ -0,0 +1,77 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import db as app_db
+    from app import crud, models, schemas, search, search_facets
+except Exception:
+    pytest.skip('backend deps not installed (skipping facet tests)', allow_module_level=True)
+
+
+def _catalogue():
+    session = app_db.create_test_session(app_db.create_test_engine())
+    rows = [('گوشی A', 'موبایل', 'عدد', 5, 1000), ('گوشی B', 'موبایل', 'عدد', 0, 3000),
+            ('کابل', 'لوازم', 'متر', 40, 200), ('قاب گوشی', 'لوازم', 'عدد', 12, None)]
+    now = datetime.utcnow()
+    for i, (name, group, unit, inventory, price) in enumerate(rows):
+        p = crud.create_product(session, schemas.ProductCreate(name=name, code=f'C{i}', group=group, unit=unit))
+        p.inventory = inventory
+        if price:
+            # an older price must not win over the latest one
+            session.add(models.PriceHistory(product_id=p.id, price=price * 9, type='sell', effective_at=now - timedelta(days=3)))
+            session.add(models.PriceHistory(product_id=p.id, price=price, type='sell', effective_at=now))
+    session.commit()
+    return session
+
+
+def test_database_fallback_returns_hits_counts_and_ranges(monkeypatch):
+    monkeypatch.setattr(search, 'client', None)
+    session = _catalogue()
+
+    res = search_facets.faceted_search(session, 'products')
+    assert res['engine'] == 'database'
+    assert res['estimatedTotalHits'] == 4
+    assert res['facetDistribution']['group'] == {'موبایل': 2, 'لوازم': 2}
+    assert res['facetDistribution']['unit'] == {'عدد': 3, 'متر': 1}
+    assert res['facetStats'] == {'price': {'min': 200, 'max': 3000}, 'inventory': {'min': 0, 'max': 40}}
+    assert {h['name']: h['price'] for h in res['hits']}['گوشی B'] == 3000
+
+    res = search_facets.faceted_search(session, 'products', q='گوشی', filters={'price': {'min': 500}}, facets=['group'])
+    assert sorted(h['name'] for h in res['hits']) == ['گوشی A', 'گوشی B']
+    assert res['facetDistribution'] == {'group': {'موبایل': 2}}
+    assert res['facetStats'] == {}
+    session.close()
+
+
+def test_meili_request_and_validation(monkeypatch):
+    seen = {}
+
+    class Index:
+        def search(self, q, params):
+            seen.update(params, q=q)
+            return {'hits': [{'id': 'x'}], 'estimatedTotalHits': 1,
+                    'facetDistribution': {'group': {'a': 1}, 'price': {'10': 1}}, 'facetStats': {'price': {'min': 10, 'max': 10}}}
+
+    monkeypatch.setattr(search, '_get_index', lambda name: Index())
+    res = search_facets.faceted_search(None, 'products', q='x', filters={'group': ['a', 'b "c"'], 'price': {'max': 50}})
+    assert seen['filter'] == 'group IN ["a", "b \\"c\\""] AND price <= 50'
+    assert seen['facets'] == ['group', 'unit', 'price', 'inventory']
+    assert res['engine'] == 'meilisearch'
+    assert res['facetDistribution'] == {'group': {'a': 1}, 'unit': {}}
+    assert res['facetStats'] == {'price': {'min': 10, 'max': 10}}
+
+    with pytest.raises(ValueError):
+        search_facets.faceted_search(None, 'products', filters={'color': ['red']})
+    with pytest.raises(ValueError):
+        search_facets.faceted_search(None, 'persons')
+    for bad in ({'filters': ['group']}, {'facets': 'group'}, {'facets': [['group']]}):
+        with pytest.raises(ValueError):
+            search_facets.faceted_search(None, 'products', **bad)
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import search
+except Exception:
+    pytest.skip('backend deps not installed (skipping search_multi tests)', allow_module_level=True)
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, code):
+        super().__init__(code)
+        self.status_code = status_code
+        self.code = code
+
+
+class FakeClient:
+    def __init__(self, multi=True, delays=None):
+        self.multi = multi
+        self.delays = delays or {}
+        self.calls = []
+
+    def _hits(self, uid, q):
+        time.sleep(self.delays.get(uid, 0))
+        return {'indexUid': uid, 'hits': [{'id': f'{uid}-{q}'}]}
+
+    def multi_search(self, queries):
+        self.calls.append('multi')
+        time.sleep(self.delays.get('multi', 0))
+        if not self.multi:
+            raise ApiError(404, 'not_found')
+        return {'results': [self._hits(q['indexUid'], q['q']) for q in queries]}
+
+    def index(self, uid):
+        self.calls.append(('index', uid))
+        client = self
+
+        class Index:
+            def search(self, q, params):
+                client.calls.append(('search', uid))
+                return client._hits(uid, q)
+        return Index()
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    def install(**kw):
+        fc = FakeClient(**kw)
+        monkeypatch.setattr(search, 'client', fc)
+        monkeypatch.setattr(search, '_multi_search_supported', True)
+        monkeypatch.setattr(search, '_local_search', lambda *a, **k: None)
+        return fc
+    return install
+
+
+def test_single_round_trip_for_all_indexes(fake):
+    fc = fake()
+    res = search.search_multi('x', indexes=['products', 'persons'])
+    assert fc.calls == ['multi']
+    assert res['products']['hits'] == [{'id': 'products-x'}]
+    assert res['persons']['hits'] == [{'id': 'persons-x'}]
+
+
+def test_concurrent_fallback_caches_handles_and_remembers_missing_route(fake):
+    fc = fake(multi=False)
+    search.search_multi('a', indexes=['products', 'persons'])
+    search.search_multi('b', indexes=['products', 'persons'])
+    assert fc.calls.count('multi') == 1
+    assert fc.calls.count(('index', 'products')) == 1
+    assert fc.calls.count(('search', 'products')) == 2
+
+
+def test_slow_index_returns_partial_results(fake, monkeypatch):
+    fake(multi=False, delays={'invoices': 0.5})
+    monkeypatch.setattr(search, 'SEARCH_BUDGET_MS', 100)
+    started = time.perf_counter()
+    res = search.search_multi('q', indexes=['products', 'invoices'])
+    assert time.perf_counter() - started < 0.4
+    assert res['products']['hits'] == [{'id': 'products-q'}]
+    assert res['invoices'] == {'hits': [], 'timedOut': True}
+
+
+def test_fallback_after_a_failed_multi_search_gets_the_rest_of_the_budget(fake, monkeypatch):
+    fake(multi=False, delays={'multi': 0.15, 'invoices': 0.1})
+    monkeypatch.setattr(search, 'SEARCH_BUDGET_MS', 200)
+    started = time.perf_counter()
+    res = search.search_multi('q', indexes=['products', 'invoices'])
+    assert time.perf_counter() - started < 0.24
+    assert res['products']['hits'] == [{'id': 'products-q'}]
+    assert res['invoices'] == {'hits': [], 'timedOut': True}
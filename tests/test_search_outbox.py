@@ -0,0 +1,158 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from sqlalchemy import create_engine
+
+    from app import db as app_db
+    from app import crud, models, schemas, search, search_outbox
+except Exception:
+    pytest.skip('backend deps not installed (skipping search outbox tests)', allow_module_level=True)
+
+
+class FakeMeili:
+    def __init__(self):
+        self.down = False
+        self.bad = set()
+        self.calls = 0
+        self.docs = {}
+
+    def __call__(self, index_name, docs, delete_ids):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError('meili down')
+        if self.bad & {d['id'] for d in docs}:
+            raise ValueError('invalid document')
+        index = self.docs.setdefault(index_name, {})
+        for d in docs:
+            index[d['id']] = d
+        for i in delete_ids:
+            index.pop(i, None)
+
+
+@pytest.fixture
+def env(monkeypatch):
+    meili = FakeMeili()
+    monkeypatch.setattr(search, 'client', object())
+    monkeypatch.setattr(search, 'apply_batch', meili)
+    session = app_db.create_test_session(app_db.create_test_engine())
+    yield session, meili
+    session.close()
+
+
+def test_outbox_row_commits_with_entity_and_survives_outage(env):
+    session, meili = env
+    person = crud.create_person(session, schemas.PersonCreate(name='علی رضایی', mobile='09120000000'))
+    assert search_outbox.status(session)['pending'] == 1
+
+    meili.down = True
+    assert search_outbox.relay_once(session) == (0, 1)
+    st = search_outbox.status(session)
+    assert st['pending'] == 1 and st['failing'] == 1 and 'meili down' in st['last_error']
+
+    meili.down = False
+    assert search_outbox.relay_once(session) == (1, 0)
+    assert meili.docs['persons'][person.id]['name'] == 'علی رضایی'
+    assert search_outbox.status(session)['pending'] == 0
+
+
+def test_relay_sends_current_state_and_deletes_missing_rows(env):
+    session, meili = env
+    person = crud.create_person(session, schemas.PersonCreate(name='old'))
+    search_outbox.relay_once(session)
+    person.name = 'new'
+    search_outbox.record(session, 'persons', person.id)
+    search_outbox.record(session, 'persons', person.id)
+    session.commit()
+    assert search_outbox.relay_once(session) == (2, 0)
+    assert meili.docs['persons'][person.id]['name'] == 'new'
+
+    session.delete(person)
+    search_outbox.record(session, 'persons', person.id, op=search_outbox.DELETE)
+    session.commit()
+    search_outbox.relay_once(session)
+    assert person.id not in meili.docs['persons']
+
+
+def test_replay_from_id_resends(env):
+    session, meili = env
+    a = crud.create_person(session, schemas.PersonCreate(name='a', code='A1'))
+    b = crud.create_person(session, schemas.PersonCreate(name='b', code='B1'))
+    search_outbox.relay_once(session)
+    meili.docs.clear()
+    second = session.query(models.SearchOutbox).order_by(models.SearchOutbox.id).all()[1]
+    assert search_outbox.replay(session, from_id=second.id) == 1
+    search_outbox.relay_once(session)
+    assert list(meili.docs['persons']) == [b.id]
+    assert a.id not in meili.docs['persons']
+
+
+def test_bad_row_is_isolated_backed_off_and_given_up_on(env, monkeypatch):
+    session, meili = env
+    monkeypatch.setattr(search_outbox, 'MAX_ATTEMPTS', 2)
+    people = [crud.create_person(session, schemas.PersonCreate(name=f'p{i}', code=f'C{i}')) for i in range(5)]
+    meili.bad = {people[2].id}
+    assert search_outbox.relay_once(session) == (4, 1)
+    assert sorted(meili.docs['persons']) == sorted(p.id for p in people if p.id not in meili.bad)
+    st = search_outbox.status(session)
+    assert st['pending'] == 1 and st['failing'] == 1 and 'invalid document' in st['last_error']
+
+    # not due yet; a newer row goes out on its own
+    newer = crud.create_person(session, schemas.PersonCreate(name='newer', code='N1'))
+    assert search_outbox.relay_once(session) == (1, 0)
+    assert newer.id in meili.docs['persons']
+
+    o = models.SearchOutbox
+    session.query(o).update({'next_attempt_at': None})
+    session.commit()
+    assert search_outbox.relay_once(session) == (0, 1)
+    st = search_outbox.status(session)
+    assert st['pending'] == 0 and st['dead'] == 1
+    assert search_outbox.relay_once(session) == (0, 0)
+
+    meili.bad = set()
+    assert search_outbox.replay(session, from_id=0) == 6
+    assert search_outbox.relay_once(session) == (6, 0)
+    assert people[2].id in meili.docs['persons']
+
+
+def test_outage_is_not_split_or_counted_against_rows(env):
+    session, meili = env
+    for i in range(4):
+        crud.create_person(session, schemas.PersonCreate(name=f'p{i}', code=f'C{i}'))
+    meili.down = True
+    assert search_outbox.relay_once(session) == (0, 4)
+    assert meili.calls == 1
+    assert {r.attempts for r in session.query(models.SearchOutbox)} == {0}
+
+
+def test_relay_sends_a_burst_as_one_batch_and_reports_it(env, tmp_path):
+    _, meili = env
+    engine = create_engine(f'sqlite:///{tmp_path / "outbox.db"}')  # shared with the relay thread
+    session = app_db.create_test_session(engine)
+    relay = search_outbox.Relay(lambda: app_db.create_test_session(engine), poll_interval=5, flush_interval=0.3)
+    relay.start()
+    try:
+        time.sleep(0.1)  # relay idle, waiting for a wake-up
+        for i in range(5):
+            crud.create_person(session, schemas.PersonCreate(name=f'p{i}', code=f'C{i}'))
+            relay.wake()
+        for _ in range(100):
+            if relay.metrics()['rows_sent'] == 5:
+                break
+            time.sleep(0.02)
+    finally:
+        relay.stop()
+    m = relay.metrics()
+    assert (m['batches'], m['rows_sent'], m['avg_batch_size']) == (1, 5, 5.0)
+    assert m['consecutive_failures'] == 0 and m['last_sent_at'] is not None
+    assert len(meili.docs['persons']) == 5
+    session.close()
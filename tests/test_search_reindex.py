@@ -0,0 +1,140 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app import db as app_db
+    from app import models, search, search_reindex, shared_store
+except Exception:
+    pytest.skip('backend deps not installed (skipping reindex tests)', allow_module_level=True)
+
+
+class Task:
+    _next = 0
+
+    def __init__(self):
+        Task._next += 1
+        self.task_uid = Task._next
+
+
+class FakeClient:
+    def __init__(self):
+        self.indexes = {}
+        self.fail_on_add = None
+        self.fail_task_of_add = None
+        self.failed_tasks = set()
+        self.gate = None
+        self.adds = 0
+
+    def index(self, uid):
+        client = self
+
+        class Index:
+            def add_documents(self, docs, primary_key=None):
+                client.adds += 1
+                if client.gate is not None:
+                    client.gate.wait(5)
+                if client.adds == client.fail_on_add:
+                    raise ConnectionError('meili down')
+                task = Task()
+                if client.adds == client.fail_task_of_add:
+                    client.failed_tasks.add(task.task_uid)  # accepted, but fails when processed
+                else:
+                    client.indexes.setdefault(uid, {}).update({d['id']: d for d in docs})
+                return task
+
+            def update_settings(self, settings):
+                return Task()
+        return Index()
+
+    def create_index(self, uid, options=None):
+        if uid in self.indexes:
+            raise ValueError('index_already_exists')
+        self.indexes[uid] = {}
+        return Task()
+
+    def delete_index(self, uid):
+        self.indexes.pop(uid, None)
+        return Task()
+
+    def swap_indexes(self, pairs):
+        a, b = pairs[0]['indexes']
+        self.indexes[a], self.indexes[b] = self.indexes[b], self.indexes[a]
+        return Task()
+
+    def wait_for_task(self, uid, timeout_in_ms=None):
+        status = 'failed' if uid in self.failed_tasks else 'succeeded'
+        return type('Result', (), {'status': status, 'error': 'invalid document'})()
+
+
+@pytest.fixture
+def env(monkeypatch):
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    app_db.Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    monkeypatch.setattr(app_db, 'SessionLocal', factory)
+    client = FakeClient()
+    monkeypatch.setattr(search, 'client', client)
+    shared_store.set_store(shared_store.MemoryStore())
+    session = factory()
+    for i in range(25):
+        session.add(models.Person(id=f'p{i:02d}', name=f'person {i}', name_norm=f'person {i}', code=f'C{i}'))
+    session.commit()
+    session.close()
+    yield client
+    shared_store.set_store(None)
+
+
+def test_reindex_resumes_into_shadow_and_swaps(env):
+    client = env
+    client.indexes['persons'] = {'stale': {'id': 'stale'}}
+    client.fail_on_add = 2
+    with pytest.raises(ConnectionError):
+        search_reindex.reindex('persons', chunk_size=10, concurrency=1)
+    state = search_reindex.get_progress('persons')
+    assert state['status'] == 'failed' and state['last_id'] == 'p09' and state['sent'] == 10
+    # the live index is untouched until the swap
+    assert list(client.indexes['persons']) == ['stale']
+
+    state = search_reindex.reindex('persons', chunk_size=10, concurrency=2)
+    assert state['status'] == 'done' and state['sent'] == 25
+    assert sorted(client.indexes['persons']) == [f'p{i:02d}' for i in range(25)]
+    assert 'persons__reindex' not in client.indexes
+
+
+def test_failed_task_fails_the_job_before_the_swap(env):
+    client = env
+    client.indexes['persons'] = {'stale': {'id': 'stale'}}
+    client.fail_task_of_add = 2
+    with pytest.raises(RuntimeError, match='failed'):
+        search_reindex.reindex('persons', chunk_size=10, concurrency=2)
+    state = search_reindex.get_progress('persons')
+    assert state['status'] == 'failed' and state['last_id'] == 'p09' and state['sent'] == 10
+    assert list(client.indexes['persons']) == ['stale']
+
+
+def test_only_one_rebuild_is_started(env):
+    client = env
+    client.gate = threading.Event()
+    assert search_reindex.start_background(['persons']) is True
+    assert search_reindex.start_background(['persons']) is False
+    # another worker sees the shared claim, not this process's lock
+    assert shared_store.get_store().get('reindex:running') is not None
+    client.gate.set()
+    for _ in range(100):
+        if not search_reindex.is_running():
+            break
+        time.sleep(0.05)
+    assert not search_reindex.is_running()
+    assert search_reindex.get_progress('persons')['status'] == 'done'
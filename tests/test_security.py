@@ -0,0 +1,81 @@
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from cryptography.fernet import Fernet
+
+    from app import security
+except Exception:
+    pytest.skip('backend deps not installed (skipping security tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def fernet(monkeypatch):
+    """A fresh key, a clock the test moves, and a count of real decryptions."""
+    monkeypatch.setattr(security, '_FERNET', security._FERNET)  # restored after the test
+    security.set_encryption_key(Fernet.generate_key().decode())
+    clock = [1000.0]
+    monkeypatch.setattr(security, 'time', types.SimpleNamespace(monotonic=lambda: clock[0]))
+    calls = []
+    real = security._FERNET.decrypt
+    monkeypatch.setattr(security._FERNET, 'decrypt', lambda token: calls.append(token) or real(token))
+    yield types.SimpleNamespace(clock=clock, calls=calls)
+    security.clear_secret_cache()
+
+
+def test_hit_returns_the_plaintext_without_decrypting(fernet):
+    token = security.encrypt_value('otp-secret')
+    assert security.decrypt_value(token) == 'otp-secret'
+    assert security.decrypt_value(token) == 'otp-secret'
+    assert len(fernet.calls) == 1
+
+
+def test_entries_expire_after_the_ttl(fernet, monkeypatch):
+    monkeypatch.setattr(security, 'SECRET_CACHE_TTL', 60)
+    token = security.encrypt_value('api-key')
+    security.decrypt_value(token)
+    fernet.clock[0] += 59
+    security.decrypt_value(token)
+    assert len(fernet.calls) == 1
+    fernet.clock[0] += 2
+    assert security.decrypt_value(token) == 'api-key'
+    assert len(fernet.calls) == 2
+
+
+def test_least_recently_used_is_evicted_at_the_size_limit(fernet, monkeypatch):
+    monkeypatch.setattr(security, 'SECRET_CACHE_SIZE', 2)
+    a, b, c = (security.encrypt_value(v) for v in 'abc')
+    security.decrypt_value(a)
+    security.decrypt_value(b)
+    security.decrypt_value(a)  # a is now the most recent
+    security.decrypt_value(c)  # evicts b
+    assert len(security._SECRET_CACHE) == 2
+    fernet.calls.clear()
+    security.decrypt_value(a)
+    security.decrypt_value(c)
+    assert fernet.calls == []
+    assert security.decrypt_value(b) == 'b'
+    assert fernet.calls == [b.encode('utf-8')]
+
+
+def test_rotating_the_key_drops_cached_plaintexts(fernet):
+    token = security.encrypt_value('old')
+    assert security.decrypt_value(token) == 'old'
+    security.set_encryption_key(Fernet.generate_key().decode())
+    assert not security._SECRET_CACHE
+    assert security.decrypt_value(token) == token  # the new key cannot read it, and the old answer is gone
+
+
+def test_legacy_plaintext_and_wrong_key_are_not_cached(fernet):
+    assert security.decrypt_value('stored-before-encryption') == 'stored-before-encryption'
+    other = Fernet(Fernet.generate_key()).encrypt(b'someone else').decode()
+    assert security.decrypt_value(other) == other
+    assert not security._SECRET_CACHE
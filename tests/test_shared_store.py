@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import shared_store, sms
+except Exception:
+    pytest.skip('backend deps not installed (skipping shared store tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def two_workers(tmp_path):
+    """Two independent SqliteStore instances on one file, like two uvicorn workers."""
+    path = str(tmp_path / 'shared.db')
+    a = shared_store.SqliteStore(path)
+    b = shared_store.SqliteStore(path)
+    yield a, b
+    shared_store.set_store(None)
+
+
+def test_otp_created_on_one_worker_verifies_on_another(two_workers):
+    a, b = two_workers
+    shared_store.set_store(a)
+    sid, code = sms.create_otp_session('09120000000')
+    shared_store.set_store(b)
+    assert sms.verify_otp_session(sid, code) == (True, '09120000000')
+    # single use
+    assert sms.verify_otp_session(sid, code) == (False, None)
+
+
+def test_otp_attempts_are_counted_across_workers(two_workers):
+    a, b = two_workers
+    shared_store.set_store(a)
+    sid, code = sms.create_otp_session('09120000000')
+    for store in (a, b, a):
+        shared_store.set_store(store)
+        assert sms.verify_otp_session(sid, 'wrong') == (False, None)
+    shared_store.set_store(b)
+    assert sms.verify_otp_session(sid, code) == (False, None)
+
+
+def test_ttl_expiry_and_sweep(two_workers):
+    a, _ = two_workers
+    a.set('k', {'x': 1}, ttl=1)
+    a.incr('n', ttl=1)
+    assert a.get('k') == {'x': 1}
+    time.sleep(1.1)
+    assert a.sweep() == 2
+    assert a.get('k') is None
+    assert a.incr('n', ttl=1) == 1
@@ -0,0 +1,206 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from sqlalchemy import event
+    from sqlalchemy.orm import sessionmaker
+
+    from app import db as app_db
+    from app import http_client, models, shared_store, sms_campaigns, sms_outbox
+    from app.normalizer import normalize_mobile
+except Exception:
+    pytest.skip('backend deps not installed (skipping sms campaign tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    engine = app_db.create_test_engine()
+    s = app_db.create_test_session(engine)
+    s.add(models.SystemSettings(key='sms_api_key', value='key', category='sms'))
+    owner = models.User(username='owner', hashed_password='x')
+    s.add(owner)
+    s.commit()
+    group = models.CustomerGroup(name='VIP', created_by_user_id=owner.id)
+    s.add(group)
+    people = [
+        ('p1', 'Ali', '09120000001'),
+        ('p2', 'Sara', '+98 912 000 0002'),
+        ('p3', 'Reza', '۰۹۱۲۰۰۰۰۰۰۱'),  # same number as Ali
+        ('p4', 'Nima', None),
+        ('p5', 'Mina', '12345'),
+        ('p6', 'Omid', '00989120000006'),
+    ]
+    for pid, name, mobile in people:
+        s.add(models.Person(id=pid, name=name, name_norm=name.lower(), mobile=mobile))
+        s.add(models.CustomerGroupMember(group=group, person_id=pid))
+    s.add(models.Person(id='outsider', name='X', name_norm='x', mobile='09129999999'))
+    now = datetime.now(timezone.utc)
+    s.add_all([
+        models.LedgerEntry(debit_account='AccountsReceivable', credit_account='Sales', amount=1500000, party_id='p1'),
+        models.LedgerEntry(debit_account='Cash', credit_account='AccountsReceivable', amount=500000, party_id='p1'),
+        models.LedgerEntry(debit_account='Cash', credit_account='AccountsReceivable', amount=200000, party_id='p2'),
+        models.Payment(direction='in', party_id='p6', amount=300000, due_date=now + timedelta(days=3)),
+        models.Payment(direction='in', party_id='p6', amount=100000, due_date=now + timedelta(days=5)),
+        models.Payment(direction='in', party_id='p6', amount=900000, due_date=now + timedelta(days=60)),
+        models.Payment(direction='out', party_id='p2', amount=700000, due_date=now + timedelta(days=2)),
+    ])
+    s.commit()
+    f = sessionmaker(bind=engine, autoflush=False)
+    f.group_id, f.owner_id, f.engine = group.id, owner.id, engine
+    s.close()
+    http_client.reset()
+    monkeypatch.setattr(sms_outbox, 'RATE_LIMITS', {})
+    return f
+
+
+def _campaign(factory, template, **options):
+    s = factory()
+    c = sms_campaigns.create(s, factory.owner_id, factory.group_id, template, options=options)
+    campaign_id = c.id
+    s.close()
+    return campaign_id
+
+
+def _messages(factory, campaign_id):
+    s = factory()
+    try:
+        m = models.SmsMessage
+        return [(r.to, r.message, r.kind) for r in s.query(m).filter(m.campaign_id == campaign_id).order_by(m.to)]
+    finally:
+        s.close()
+
+
+def test_normalize_mobile():
+    assert normalize_mobile('0912 000 0001') == '09120000001'
+    assert normalize_mobile('+989120000001') == '09120000001'
+    assert normalize_mobile('00989120000001') == '09120000001'
+    assert normalize_mobile('9120000001') == '09120000001'
+    assert normalize_mobile('۰۹۱۲-۰۰۰-۰۰۰۱') == '09120000001'
+    assert normalize_mobile('02188776655') is None
+    assert normalize_mobile('12345') is None
+    assert normalize_mobile(None) is None
+
+
+def test_template_fields_are_checked():
+    assert sms_campaigns.template_fields('{name}: {debt}') == {'name', 'debt'}
+    for bad in ('', '{nam}', '{name.__class__}', '{}', '{name'):
+        with pytest.raises(ValueError):
+            sms_campaigns.template_fields(bad)
+
+
+def test_prepare_dedupes_and_renders_in_a_few_queries(factory):
+    campaign_id = _campaign(factory, '{name}: {balance} / {due_count} cheques {due_amount} from {due_date}')
+    queries = []
+    event.listen(factory.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+    assert sms_campaigns.prepare(campaign_id, factory) is True
+    selects = [q for q in queries if q.lstrip().upper().startswith('SELECT')]
+    assert len(selects) <= 8  # independent of the group size
+
+    rows = _messages(factory, campaign_id)
+    assert [r[0] for r in rows] == ['09120000001', '09120000002', '09120000006']
+    assert {r[2] for r in rows} == {'campaign'}
+    texts = {to: text for to, text, _ in rows}
+    assert texts['09120000001'].startswith('Ali: 1,000,000 / 0 cheques 0 from')
+    assert texts['09120000002'].startswith('Sara: -200,000 / 0 cheques')  # her outgoing payment is not a due cheque
+    assert texts['09120000006'].startswith('Omid: 0 / 2 cheques 400,000 from 14')
+
+    s = factory()
+    c = s.get(models.SmsCampaign, campaign_id)
+    assert (c.status, c.members, c.recipients, c.queued, c.invalid, c.duplicates) == ('queued', 6, 3, 3, 2, 1)
+    s.close()
+    assert sms_campaigns.prepare(campaign_id, factory) is False  # already prepared
+
+
+def test_filters(factory):
+    debtors = _campaign(factory, 'pay {debt}', min_balance=1)
+    sms_campaigns.prepare(debtors, factory)
+    assert _messages(factory, debtors) == [('09120000001', 'pay 1,000,000', 'campaign')]
+
+    cheques = _campaign(factory, 'cheque due', only_due_cheques=True, within_days=30)
+    sms_campaigns.prepare(cheques, factory)
+    assert [r[0] for r in _messages(factory, cheques)] == ['09120000006']
+
+
+def test_progress_follows_the_outbox(factory):
+    campaign_id = _campaign(factory, 'sale today')
+    sms_campaigns.prepare(campaign_id, factory)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return 200, {'status': 'OK', 'data': {'message_id': 9}}
+
+    s = factory()
+    c = s.get(models.SmsCampaign, campaign_id)
+    assert sms_campaigns.progress(s, c) == {'by_status': {'queued': 3}, 'pending': 3, 'percent': 0}
+    s.close()
+
+    with http_client.stub('https://api2.ippanel.com', handler):
+        sms_outbox.tick(factory, store=shared_store.MemoryStore())
+    assert len(calls) == 1  # one shared text: one bulk call
+
+    s = factory()
+    c = s.get(models.SmsCampaign, campaign_id)
+    assert sms_campaigns.progress(s, c) == {'by_status': {'sent': 3}, 'pending': 0, 'percent': 100}
+    assert c.status == 'done' and c.finished_at is not None
+    s.close()
+
+
+def test_cancel_drops_queued_messages(factory):
+    campaign_id = _campaign(factory, 'sale today')
+    sms_campaigns.prepare(campaign_id, factory)
+    s = factory()
+    c = s.get(models.SmsCampaign, campaign_id)
+    assert sms_campaigns.cancel(s, c) == 3
+    assert sms_campaigns.cancel(s, c) == 0
+    s.close()
+    assert sms_outbox.tick(factory, store=shared_store.MemoryStore())['claimed'] == 0
+
+
+def test_resume_skips_what_was_already_queued(factory):
+    campaign_id = _campaign(factory, 'hello {name}')
+    s = factory()
+    sms_outbox.enqueue(s, '09120000002', 'hello Sara', kind='campaign').campaign_id = campaign_id
+    s.query(models.SmsCampaign).filter_by(id=campaign_id).update(
+        {'status': 'preparing', 'started_at': datetime.now(timezone.utc) - timedelta(hours=1)})
+    s.commit()
+    s.close()
+
+    assert sms_campaigns.resume(factory) == [campaign_id]
+    assert [r[0] for r in _messages(factory, campaign_id)] == ['09120000001', '09120000002', '09120000006']
+    s = factory()
+    c = s.get(models.SmsCampaign, campaign_id)
+    assert (c.status, c.recipients, c.queued) == ('queued', 3, 3)
+    s.close()
+
+
+def test_cancel_between_chunks_queues_nothing_after_it(factory, monkeypatch):
+    monkeypatch.setattr(sms_campaigns, 'CHUNK', 2)
+    campaign_id = _campaign(factory, 'sale today')
+    chunks = []
+
+    def cancel_after_first_chunk():
+        chunks.append(1)
+        if len(chunks) == 1:
+            s = factory()
+            sms_campaigns.cancel(s, s.get(models.SmsCampaign, campaign_id))
+            s.close()
+    monkeypatch.setattr(sms_outbox, 'wake', cancel_after_first_chunk)
+
+    assert sms_campaigns.prepare(campaign_id, factory) is True
+    assert len(chunks) == 1
+    s = factory()
+    m = models.SmsMessage
+    assert [st for (st,) in s.query(m.status).filter(m.campaign_id == campaign_id)] == ['cancelled', 'cancelled']
+    c = s.get(models.SmsCampaign, campaign_id)
+    assert (c.status, c.queued) == ('cancelled', 2)
+    s.close()
+    assert sms_outbox.tick(factory, store=shared_store.MemoryStore())['claimed'] == 0
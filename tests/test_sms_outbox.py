@@ -0,0 +1,242 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from sqlalchemy.orm import sessionmaker
+
+    from app import db as app_db
+    from app import http_client, models, shared_store, sms, sms_outbox
+except Exception:
+    pytest.skip('backend deps not installed (skipping sms outbox tests)', allow_module_level=True)
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    engine = app_db.create_test_engine()
+    s = app_db.create_test_session(engine)
+    s.add(models.SystemSettings(key='sms_api_key', value='key', category='sms'))
+    s.add(models.SystemSettings(key='sms_sender', value='3000', category='sms'))
+    s.commit()
+    s.close()
+    http_client.reset()
+    monkeypatch.setattr(sms_outbox, 'RATE_LIMITS', {})
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+@pytest.fixture
+def provider():
+    """Fake IPPanel: records calls, answers with `provider.reply` (status, body)."""
+    calls = []
+
+    def handler(request):
+        if request.method == 'GET':
+            q = parse_qs(urlsplit(request.url).query)
+            calls.append({'recipients': q['recipient'], 'message': q['message'][0]})
+        else:
+            body = json.loads(request.body)
+            calls.append({'recipients': body['recipient'], 'message': body['message']})
+        return handler.reply
+
+    handler.calls = calls
+    handler.reply = (200, {'result': True, 'messageId': 'm-1'})
+    with http_client.stub('https://api.ippanel.com', handler), http_client.stub('https://api2.ippanel.com', handler):
+        yield handler
+
+
+def _tick(factory):
+    return sms_outbox.tick(factory, store=shared_store.MemoryStore())
+
+
+def _all(factory):
+    s = factory()
+    try:
+        return s.query(models.SmsMessage).order_by(models.SmsMessage.id).all()
+    finally:
+        s.close()
+
+
+def test_enqueue_only_writes_and_sender_sends(factory, provider):
+    s = factory()
+    msg = sms_outbox.enqueue(s, ' 09120000001 ', 'hello')
+    assert msg.status == 'queued'
+    s.close()
+    assert provider.calls == []
+
+    counts = _tick(factory)
+    assert counts['claimed'] == 1 and counts['sent'] == 1
+    assert provider.calls == [{'recipients': ['09120000001'], 'message': 'hello'}]
+    (row,) = _all(factory)
+    assert row.status == 'sent' and row.provider_message_id == 'm-1' and row.attempts == 1
+    assert _tick(factory)['claimed'] == 0
+
+
+def test_same_text_goes_out_in_one_bulk_call(factory, provider):
+    s = factory()
+    for i in range(3):
+        sms_outbox.enqueue(s, f'0912000000{i}', 'sale today')
+    sms_outbox.enqueue(s, '09129999999', 'other text')
+    s.close()
+    provider.reply = (200, {'status': 'OK', 'data': {'message_id': 77}})
+
+    _tick(factory)
+    assert sorted(len(c['recipients']) for c in provider.calls) == [1, 3]
+    assert {r.status for r in _all(factory)} == {'sent'}
+    assert [r.provider_message_id for r in _all(factory)][:3] == ['77', '77', '77']
+
+
+def test_otps_go_first(factory, provider, monkeypatch):
+    monkeypatch.setattr(sms_outbox, 'BATCH', 1)
+    s = factory()
+    sms_outbox.enqueue(s, '09120000001', 'campaign', kind='campaign')
+    sms_outbox.enqueue(s, '09120000002', 'code 1234', kind='otp', expires_in=300)
+    s.close()
+    _tick(factory)
+    assert provider.calls[0]['message'] == 'code 1234'
+
+
+def test_unreachable_provider_is_retried_then_failed(factory, provider, monkeypatch):
+    monkeypatch.setattr(sms_outbox, 'MAX_ATTEMPTS', 2)
+    provider.reply = (503, 'down')
+    s = factory()
+    sms_outbox.enqueue(s, '09120000001', 'hello')
+    s.close()
+
+    _tick(factory)
+    (row,) = _all(factory)
+    assert row.status == 'queued' and row.attempts == 1
+    assert sms_outbox._aware(row.next_attempt_at) > datetime.now(timezone.utc)
+
+    s = factory()
+    s.query(models.SmsMessage).update({'next_attempt_at': datetime.now(timezone.utc) - timedelta(seconds=1)})
+    s.commit()
+    s.close()
+    _tick(factory)
+    (row,) = _all(factory)
+    assert row.status == 'failed' and row.attempts == 2
+
+
+def test_refused_message_is_not_retried(factory, provider):
+    provider.reply = (200, {'result': False, 'message': 'bad number'})
+    s = factory()
+    sms_outbox.enqueue(s, '0000', 'hello')
+    s.close()
+    _tick(factory)
+    (row,) = _all(factory)
+    assert row.status == 'failed' and 'bad number' in row.error
+
+
+def test_rate_limit_postpones_the_rest(factory, provider, monkeypatch):
+    monkeypatch.setattr(sms_outbox, 'RATE_LIMITS', {'ippanel': 1})
+    s = factory()
+    for i in range(3):
+        sms_outbox.enqueue(s, f'0912000000{i}', f'text {i}')
+    s.close()
+    counts = _tick(factory)
+    assert counts['sent'] == 1 and counts['postponed'] == 2
+    assert len(provider.calls) == 1
+    assert [r.status for r in _all(factory)] == ['sent', 'queued', 'queued']
+
+
+def test_expired_otp_is_not_sent(factory, provider):
+    s = factory()
+    msg = sms_outbox.enqueue(s, '09120000001', 'code 1234', kind='otp', expires_in=60)
+    msg.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    s.commit()
+    s.close()
+    assert _tick(factory)['expired'] == 1
+    assert provider.calls == []
+    assert _all(factory)[0].status == 'expired'
+
+
+def test_delivery_reports(factory, provider):
+    s = factory()
+    sms_outbox.enqueue(s, '09120000001', 'hello')
+    sms_outbox.enqueue(s, '09120000002', 'hello')
+    s.close()
+    _tick(factory)
+
+    s = factory()
+    assert sms_outbox.record_delivery(s, 'm-1', 'delivered', recipient='09120000001') == 1
+    assert sms_outbox.record_delivery(s, 'm-1', 'failed', recipient='09120000002') == 1
+    assert sms_outbox.record_delivery(s, 'm-1', 'whatever') == 0
+    s.close()
+    assert [r.status for r in _all(factory)] == ['delivered', 'undelivered']
+
+
+def test_send_sms_uses_the_users_own_config(factory, provider):
+    s = factory()
+    user = models.User(username='u', hashed_password='x')
+    s.add(user)
+    s.commit()
+    s.add(models.UserSmsConfig(user_id=user.id, provider='ippanel', api_key='own-key', sender_name='5000', enabled=True))
+    s.commit()
+    assert sms.get_sms_config(s, user.id)['api_key'] == 'own-key'
+    assert sms.get_sms_config(s)['api_key'] == 'key'
+    assert sms.send_sms(s, '09120000001', 'hi', None, user_id=user.id) == (True, 'SMS کامیابی سے بھیجا گیا')
+    s.close()
+
+
+def test_otp_codes_are_redacted():
+    class Out:
+        kind, message = 'otp', 'کد ورود شما: 123456'
+    assert sms_outbox.redact(Out()).message == 'کد ورود شما: ••••••'
+
+
+def test_credentials_are_masked_and_forgotten_once_sent(factory, provider):
+    s = factory()
+    sms_outbox.enqueue(s, '09120000001', 'نام کاربری: ali\nرمز عبور: Xy7pQ2', kind='credential')
+    s.close()
+    (queued,) = _all(factory)
+    assert sms_outbox.redact(queued).message == '••••••'
+
+    _tick(factory)
+    assert 'Xy7pQ2' in provider.calls[0]['message']
+    (row,) = _all(factory)
+    assert row.status == 'sent' and row.message == ''
+
+
+def test_failed_otp_text_is_not_kept(factory, provider):
+    provider.reply = (200, {'result': False, 'message': 'bad number'})
+    s = factory()
+    sms_outbox.enqueue(s, '09120000001', 'code 1234', kind='otp', expires_in=300)
+    s.close()
+    _tick(factory)
+    (row,) = _all(factory)
+    assert row.status == 'failed' and row.message == ''
+
+
+def test_dropped_connection_is_not_retried(factory):
+    """A connection dropped after the request was written may have reached the provider."""
+    from http.client import RemoteDisconnected
+
+    import requests
+    from urllib3.connection import HTTPConnection
+    from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+    errors = {
+        '09120000001': requests.ConnectionError(ProtocolError('Connection aborted.', RemoteDisconnected('closed'))),
+        '09120000002': requests.ConnectionError(MaxRetryError(None, '/', NewConnectionError(HTTPConnection('x'), 'refused'))),
+        '09120000003': requests.ConnectTimeout('connect timed out'),
+    }
+
+    def handler(request):
+        raise errors[parse_qs(urlsplit(request.url).query)['recipient'][0]]
+
+    s = factory()
+    for i, to in enumerate(errors):
+        sms_outbox.enqueue(s, to, f'text {i}')
+    s.close()
+    with http_client.stub('https://api.ippanel.com', handler):
+        _tick(factory)
+    assert [(r.to, r.status) for r in _all(factory)] == [
+        ('09120000001', 'failed'), ('09120000002', 'queued'), ('09120000003', 'queued')]
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND = os.path.join(ROOT, 'backend')
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+try:
+    from app import shared_store, throttle
+except Exception:
+    pytest.skip('backend deps not installed (skipping throttle tests)', allow_module_level=True)
+
+
+@pytest.fixture(autouse=True)
+def memory_store(monkeypatch):
+    shared_store.set_store(shared_store.MemoryStore())
+    monkeypatch.setenv('THROTTLE_LOGIN_USER', '3/60')
+    yield
+    shared_store.set_store(None)
+
+
+def test_rejects_after_limit_within_window():
+    t0 = 6000.0  # start of a bucket
+    assert [throttle.hit('login_user', 'alice', now=t0 + i) for i in range(3)] == [None, None, None]
+    retry = throttle.hit('login_user', 'alice', now=t0 + 3)
+    assert retry is not None and 1 <= retry <= 60
+    # other identities are unaffected
+    assert throttle.hit('login_user', 'bob', now=t0 + 3) is None
+
+
+def test_previous_bucket_decays():
+    t0 = 6000.0
+    for i in range(3):
+        throttle.hit('login_user', 'alice', now=t0 + i)
+    # 10s into the next bucket most of the previous burst still counts
+    assert throttle.hit('login_user', 'alice', now=t0 + 70) is not None
+    # near the end of the next bucket the old burst has mostly slid out
+    assert throttle.hit('login_user', 'alice', now=t0 + 115) is None
+
+
+def test_enforce_raises_429_with_retry_after():
+    from fastapi import HTTPException
+    for _ in range(3):
+        throttle.enforce('login_user', 'carol')
+    with pytest.raises(HTTPException) as exc:
+        throttle.enforce('login_user', 'carol')
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers['Retry-After']) >= 1